@@ -40,6 +40,7 @@ from .services import (
   ServicesService
 )
 from common.enums import AppointmentStatus
+from users.authentication import get_auth_context
 
 logger = logging.getLogger(__name__) 
 
@@ -115,7 +116,9 @@ class AppointmentViewSet(viewsets.ModelViewSet):
 
   @action(detail=False, methods=['get'], url_path='my')
   def my_appointments(self, request):
-      patient_id = request.user.patient.id
+      patient_id = get_auth_context(request.user).patient_id
+      if patient_id is None:
+          return Response({"error": _("Không tìm thấy bệnh nhân")}, status=status.HTTP_404_NOT_FOUND)
 
       query_serializer = AppointmentPatientFilterSerializer(data=request.query_params)
       query_serializer.is_valid(raise_exception=True)
@@ -142,7 +145,9 @@ class AppointmentViewSet(viewsets.ModelViewSet):
 
   @action(detail=False, methods=['get'], url_path='upcoming')
   def upcoming_appointments(self, request):
-      patient_id = request.user.patient.id
+      patient_id = get_auth_context(request.user).patient_id
+      if patient_id is None:
+          return Response({"error": _("Không tìm thấy bệnh nhân")}, status=status.HTTP_404_NOT_FOUND)
 
       queryset_data = AppointmentService.get_appointments_by_patient_id_optimized(
           patient_id,
@@ -259,7 +264,9 @@ class AppointmentViewSet(viewsets.ModelViewSet):
 
   @action(detail=False, methods=['get'], url_path='upcoming')
   def upcoming_appointments(self, request):
-      patient_id = request.user.patient.id
+      patient_id = get_auth_context(request.user).patient_id
+      if patient_id is None:
+          return Response({"error": _("Không tìm thấy bệnh nhân")}, status=status.HTTP_404_NOT_FOUND)
 
       queryset_data = AppointmentService.get_appointments_by_patient_id_optimized(
           patient_id,
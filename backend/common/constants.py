@@ -48,6 +48,7 @@ COMMON_LENGTH = {
     "INSURANCE_NUMBER": 50,
     "OTP": 6,
     "RESET_TOKEN": 6,
+    "STORE_KEY": 255,
 }
 
 # ======================
@@ -69,6 +70,7 @@ PATIENT_LENGTH = {
     "BLOOD_TYPE": 10,
     "RELATIONSHIP": 50,
     "AVATAR": 255,
+    "SEARCH_NAME": 201,
 }
 
 # ======================
@@ -98,6 +100,9 @@ PAYMENT_LENGTH = {
     "STATUS": 2,
 }
 
+# Mã đơn PayOS cũ có dạng bill_id * 1000 + x; mã mới bắt đầu từ mốc này để không trùng
+PAYMENT_ORDER_CODE_OFFSET = 10 ** 12
+
 # ======================
 # Pharmacy & Prescription domain
 # ======================
@@ -108,6 +113,7 @@ PHARMACY_LENGTH = {
     "FREQUENCY": 50,
     "DURATION": 50,
     "PRESCRIPTION_NOTE": 255,
+    "BATCH_NUMBER": 50,
 }
 
 ALL_SLOTS = [
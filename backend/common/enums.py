@@ -81,3 +81,25 @@ class Relationship(Enum):
 class RoomType(Enum):
     EXAMINATION = "E"
     TEST = "T"
+
+class StockMovementType(Enum):
+    OPENING = "O"
+    RECEIPT = "R"
+    RESERVE = "S"
+    RELEASE = "L"
+    ADJUSTMENT = "A"
+
+class WebhookEventStatus(Enum):
+    PENDING = "P"
+    PROCESSED = "S"
+    FAILED = "F"
+
+class PushDeliveryStatus(Enum):
+    PENDING = "P"
+    SENT = "S"
+    FAILED = "F"
+
+class EmailStatus(Enum):
+    PENDING = "P"
+    SENT = "S"
+    FAILED = "F"
@@ -0,0 +1,26 @@
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Phân trang theo con trỏ (keyset) dùng chung: ?cursor, ?pageSize, trả {content, next, previous, pageSize}.
+    Lớp con khai báo `sorts` (tên sort -> ordering) để chọn thứ tự qua tham số `sort`.
+    """
+    page_size = 20
+    page_size_query_param = 'pageSize'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+    sorts = {}
+
+    def __init__(self, sort=None):
+        if sort:
+            self.ordering = self.sorts[sort]
+
+    def get_paginated_response(self, data):
+        return Response({
+            "content": data,
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "pageSize": self.page_size,
+        })
@@ -1,5 +1,103 @@
+import csv
+import json
+import unicodedata
+import zipfile
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
 from django.utils.translation import gettext_lazy as _
 
 def enum_to_choices(enum_class):
     """Chuyển Enum thành tuple choices (value, Label)"""
     return [(e.value, _(str(e.name).capitalize())) for e in enum_class]
+
+
+def normalize_search_text(value):
+    """Chuỗi để tìm kiếm: bỏ dấu tiếng Việt, chữ thường, gộp khoảng trắng ('Nguyễn  Văn Đức' -> 'nguyen van duc')"""
+    if not value:
+        return ''
+    value = unicodedata.normalize('NFKD', value.replace('đ', 'd').replace('Đ', 'D'))
+    value = ''.join(char for char in value if not unicodedata.combining(char))
+    return ' '.join(value.lower().split())
+
+
+class _StreamBuffer:
+    """File-like object chỉ ghi, gom dữ liệu để trả dần ra generator"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(entries):
+    """
+    Sinh từng khúc bytes của một file ZIP từ iterable (tên file, date_time, nội dung),
+    bộ nhớ chỉ giữ một file tại một thời điểm
+    """
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, mode='w', compression=zipfile.ZIP_STORED) as archive:
+        for name, date_time, content in entries:
+            archive.writestr(zipfile.ZipInfo(name, date_time=date_time), content)
+            yield buffer.pop()
+    yield buffer.pop()
+
+
+class _Echo:
+    """File-like object trả lại ngay chuỗi được ghi, dùng cho csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(header, rows, batch_size=500):
+    """Sinh từng khúc CSV từ iterable các dict (vd. queryset.values().iterator()), gom batch_size dòng mỗi khúc"""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(header)
+    batch = []
+    for row in rows:
+        batch.append(writer.writerow([row[key] for key in header]))
+        if len(batch) >= batch_size:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+def stream_ndjson(rows, batch_size=500):
+    """Sinh từng khúc NDJSON (mỗi dòng một object JSON) từ iterable các dict"""
+    batch = []
+    for row in rows:
+        batch.append(json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n')
+        if len(batch) >= batch_size:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+def estimate_count(queryset, exact_below=1000):
+    """
+    Số dòng ước lượng theo planner của PostgreSQL (EXPLAIN, không quét bảng). Khi ước lượng nhỏ hơn
+    `exact_below` hoặc CSDL khác PostgreSQL thì đếm chính xác vì chi phí không đáng kể.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    estimate = int(plan[0]['Plan']['Plan Rows'])
+    return queryset.count() if estimate < exact_below else estimate
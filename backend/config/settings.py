@@ -53,11 +53,14 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.StatelessJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'core.throttling.TokenBucketThrottle',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 30,
 }
@@ -116,6 +119,28 @@ DATABASES = {
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
+# Chính sách băm mật khẩu (users/hashers.py). Đổi thuật toán hoặc tham số: hash cũ được băm lại khi đăng nhập thành công.
+# Đo chi phí mỗi cấu hình bằng `python manage.py benchmark_password_hashing`.
+PASSWORD_HASHING = {
+    'algorithm': config('PASSWORD_HASHER', default='argon2'),
+    'argon2_time_cost': config('ARGON2_TIME_COST', default=2, cast=int),
+    'argon2_memory_cost': config('ARGON2_MEMORY_COST', default=19456, cast=int),
+    'argon2_parallelism': config('ARGON2_PARALLELISM', default=1, cast=int),
+    'bcrypt_rounds': config('BCRYPT_ROUNDS', default=12, cast=int),
+    'pbkdf2_iterations': config('PBKDF2_ITERATIONS', default=600000, cast=int),
+}
+
+_PASSWORD_HASHERS = {
+    'argon2': 'users.hashers.TunedArgon2PasswordHasher',
+    'bcrypt': 'users.hashers.TunedBCryptSHA256PasswordHasher',
+    'pbkdf2': 'users.hashers.TunedPBKDF2PasswordHasher',
+}
+# Hasher đầu tiên dùng để băm, các hasher còn lại chỉ để kiểm tra hash cũ
+PASSWORD_HASHERS = [_PASSWORD_HASHERS.pop(PASSWORD_HASHING['algorithm'])] + list(_PASSWORD_HASHERS.values()) + [
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -167,6 +192,42 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+    # Rendered prescription PDFs, keyed by prescription updated_at
+    'prescription_pdfs': {
+        'BACKEND': config('PRESCRIPTION_PDF_STORAGE', default='django.core.files.storage.FileSystemStorage'),
+        'OPTIONS': {
+            'location': config('PRESCRIPTION_PDF_CACHE_DIR', default=str(BASE_DIR / 'cache' / 'prescription_pdfs')),
+        },
+    },
+}
+
+# Number of processes used to render prescription PDFs for bulk export
+PDF_EXPORT_WORKERS = config('PDF_EXPORT_WORKERS', default=4, cast=int)
+
+# Nhập bệnh nhân hàng loạt từ CSV: số dòng mỗi lô và số process băm mật khẩu
+PATIENT_IMPORT = {
+    'chunk_size': config('PATIENT_IMPORT_CHUNK_SIZE', default=1000, cast=int),
+    'workers': config('PATIENT_IMPORT_WORKERS', default=4, cast=int),
+}
+
+# Hồ sơ tổng hợp bệnh nhân (/patients/{id}/overview/): thời gian cache mỗi phần và số bản ghi gần nhất mỗi phần.
+# Việc xóa cache khi dữ liệu đổi chỉ có tác dụng trên mọi worker khi dùng cache chung (Redis); với cache riêng từng
+# process (LocMem) worker khác vẫn trả dữ liệu cũ tới khi hết cache_ttl, nên giữ cache_ttl ngắn.
+PATIENT_OVERVIEW = {
+    'cache_ttl': config('PATIENT_OVERVIEW_CACHE_TTL', default=60, cast=int),
+    'appointments': 10,
+    'prescriptions': 5,
+    'bills': 20,
+    'results': 10,
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -198,6 +259,8 @@ SIMPLE_JWT = {
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
     'TOKEN_TYPE_CLAIM': 'token_type',
     'TOKEN_USER_CLASS': 'rest_framework_simplejwt.models.TokenUser',
+    'TOKEN_OBTAIN_SERIALIZER': 'users.tokens.IdentityTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'users.tokens.IdentityTokenRefreshSerializer',
 
     'JTI_CLAIM': 'jti',
 
@@ -206,14 +269,52 @@ SIMPLE_JWT = {
     'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=1),
 }
 
+# Số giây giữ doanh thu của các khoảng đã đóng (/transactions/revenue/). Sửa dữ liệu ngày cũ đổi version cache; với cache
+# riêng từng process (LocMem) chỉ process ghi thấy version mới, process khác tính lại sau chừng đó giây.
+REVENUE_ANALYTICS_CACHE_TTL = config('REVENUE_ANALYTICS_CACHE_TTL', default=300, cast=int)
+
 AUTH_USER_MODEL = 'users.User'
 
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# Số giây giữ User (kèm patient_id, doctor_id) và mốc thu hồi token trong cache. Với cache riêng từng process
+# (LocMem), worker khác nhận biết tài khoản bị khóa/đổi vai trò chậm nhất sau chừng đó giây; refresh luôn kiểm tra DB.
+AUTH_CONTEXT_CACHE_TTL = config('AUTH_CONTEXT_CACHE_TTL', default=300, cast=int)
+
+# Giới hạn tần suất (core/throttling.py). CacheBucketStore cần cache dùng chung (Redis) để giới hạn trên mọi worker;
+# với cache mặc định (LocMem) mỗi process có bucket riêng.
+THROTTLING = {
+    'enabled': config('THROTTLE_ENABLED', default=True, cast=bool),
+    'backend': config('THROTTLE_BACKEND', default='core.throttling.CacheBucketStore'),
+    'policies': {
+        'login': {'ip': '30/min', 'identifier': '10/min'},
+        'register': {'ip': '20/hour', 'identifier': '5/hour'},
+        # Các endpoint gửi email (OTP, quên mật khẩu)
+        'otp': {'ip': '20/hour', 'identifier': '5/hour'},
+        'otp_verify': {'ip': '60/hour', 'identifier': '10/hour'},
+        'public': {'ip': '120/min'},
+        'default': {'user': '600/min'},
+    },
+}
+
+# Kho OTP, đăng ký chờ xác thực và mã đặt lại mật khẩu; dùng CacheExpiringStore khi đã cấu hình cache dùng chung (Redis)
+EXPIRING_STORE = {
+    'backend': config('EXPIRING_STORE_BACKEND', default='users.stores.DatabaseExpiringStore'),
+}
+
+# Có thể dùng django.core.mail.backends.filebased.EmailBackend (EMAIL_FILE_PATH) hoặc locmem khi phát triển
+EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.smtp.EmailBackend')
+EMAIL_FILE_PATH = config('EMAIL_FILE_PATH', default=str(BASE_DIR / 'cache' / 'emails'))
 EMAIL_HOST = config('EMAIL_HOST', default='sandbox.smtp.mailtrap.io')
 EMAIL_PORT = config('EMAIL_PORT', default=2525, cast=int)
 EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=True, cast=bool)
 EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
+EMAIL_TIMEOUT = config('EMAIL_TIMEOUT', default=10, cast=int)
+
+EMAIL_OUTBOX = {
+    'max_attempts': config('EMAIL_MAX_ATTEMPTS', default=5, cast=int),
+    'backoff': config('EMAIL_RETRY_BACKOFF', default=30.0, cast=float),
+    'lease': config('EMAIL_LEASE_SECONDS', default=300.0, cast=float),
+}
 
 PAYOS = {
     'client_id': config('PAYOS_CLIENT_ID'),
@@ -221,6 +322,30 @@ PAYOS = {
     'checksum_key': config('PAYOS_CHECKSUM_KEY'),
 }
 
+PAYOS_HTTP = {
+    'base_url': config('PAYOS_BASE_URL', default='https://api-merchant.payos.vn'),
+    'timeout': config('PAYOS_TIMEOUT', default=10.0, cast=float),
+    'connect_timeout': config('PAYOS_CONNECT_TIMEOUT', default=3.0, cast=float),
+    'max_retries': config('PAYOS_MAX_RETRIES', default=2, cast=int),
+    'backoff': config('PAYOS_RETRY_BACKOFF', default=0.2, cast=float),
+    'pool_size': config('PAYOS_POOL_SIZE', default=20, cast=int),
+    'breaker_threshold': config('PAYOS_BREAKER_THRESHOLD', default=5, cast=int),
+    'breaker_reset': config('PAYOS_BREAKER_RESET', default=30.0, cast=float),
+}
+
+PAYMENT_WEBHOOKS = {
+    'max_attempts': config('PAYMENT_WEBHOOK_MAX_ATTEMPTS', default=8, cast=int),
+    'backoff': config('PAYMENT_WEBHOOK_RETRY_BACKOFF', default=5.0, cast=float),
+}
+
+PUSH_NOTIFICATIONS = {
+    'backend': config('PUSH_BACKEND', default='notifications.backends.FCMBackend'),
+    'max_attempts': config('PUSH_MAX_ATTEMPTS', default=5, cast=int),
+    'backoff': config('PUSH_RETRY_BACKOFF', default=30.0, cast=float),
+    'lease': config('PUSH_LEASE_SECONDS', default=300.0, cast=float),
+    'workers': config('PUSH_WORKERS', default=8, cast=int),
+}
+
 CLOUDINARY = {
     'cloud_name': config('CLOUDINARY_CLOUD_NAME'),
     'api_key': config('CLOUDINARY_API_KEY'),
@@ -0,0 +1,203 @@
+"""
+Giới hạn tần suất request theo token bucket, khóa theo IP, định danh đăng nhập (email/số điện thoại) và người dùng.
+
+Chính sách nằm trong settings.THROTTLING['policies']: mỗi scope gồm các loại key -> "số request/khoảng thời gian".
+Bucket chứa tối đa "số request" token và nạp lại đều trong "khoảng thời gian". View chọn scope qua
+`throttle_scopes` (theo action) hoặc `throttle_scope`; không khai báo thì dùng scope 'default'.
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from rest_framework.throttling import BaseThrottle
+
+logger = logging.getLogger(__name__)
+
+DURATIONS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'10/min' -> (10, 60): sức chứa bucket và số giây để nạp đầy."""
+    num, period = rate.split('/')
+    return int(num), DURATIONS[period[0]]
+
+
+def take_token(state, capacity, refill_rate, now):
+    """
+    Tính lại bucket `state` = (tokens, updated_at) tại thời điểm `now`.
+    Trả về (state mới, số giây phải chờ; 0 nếu được phép).
+    """
+    tokens, updated_at = state if state else (capacity, now)
+    tokens = min(capacity, tokens + max(0.0, now - updated_at) * refill_rate)
+    if tokens >= 1:
+        return (tokens - 1, now), 0.0
+    return (tokens, now), (1 - tokens) / refill_rate
+
+
+def take_tokens(current, buckets, now):
+    """
+    Tính lại mọi bucket (key, capacity, refill_rate) từ `current` (key -> state).
+    Trả về (key -> state mới, số giây chờ lâu nhất); chỉ ghi lại state khi số giây chờ bằng 0.
+    """
+    states, wait = {}, 0.0
+    for key, capacity, refill_rate in buckets:
+        states[key], key_wait = take_token(current.get(key), capacity, refill_rate, now)
+        wait = max(wait, key_wait)
+    return states, wait
+
+
+class LocalBucketStore:
+    """Bucket trong bộ nhớ của process, giới hạn số key (bỏ key ít dùng nhất)."""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, refill_rate):
+        return self.consume_all([(key, capacity, refill_rate)])
+
+    def consume_all(self, buckets):
+        """
+        Lấy một token từ mỗi bucket (key, capacity, refill_rate) hoặc không lấy từ bucket nào.
+        Trả về số giây chờ lâu nhất trong các bucket đã hết token; 0 nếu được phép.
+        """
+        now = time.monotonic()
+        with self._lock:
+            states, wait = take_tokens(self.buckets, buckets, now)
+            if wait:
+                return wait
+            for key, state in states.items():
+                self.buckets[key] = state
+                self.buckets.move_to_end(key)
+            while len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        return 0.0
+
+    def clear(self):
+        with self._lock:
+            self.buckets.clear()
+
+
+class CacheBucketStore:
+    """
+    Bucket trong cache dùng chung (Redis, Memcached) để mọi worker cùng giới hạn. Đọc-ghi không nguyên tử:
+    request đồng thời có thể lọt thêm vài token, chấp nhận được cho mục đích chống lạm dụng.
+    Khi cache lỗi, tạm dùng LocalBucketStore để không chặn request.
+    """
+
+    def __init__(self, alias='default', max_local_keys=100000):
+        self.cache = caches[alias]
+        self.fallback = LocalBucketStore(max_keys=max_local_keys)
+
+    def consume(self, key, capacity, refill_rate):
+        return self.consume_all([(key, capacity, refill_rate)])
+
+    def consume_all(self, buckets):
+        try:
+            now = time.time()
+            states, wait = take_tokens(self.cache.get_many([key for key, _, _ in buckets]), buckets, now)
+            if wait:
+                return wait
+            for key, capacity, refill_rate in buckets:
+                # Hết thời gian nạp đầy, bucket không còn key cũng tương đương bucket đầy
+                self.cache.set(key, states[key], timeout=int(capacity / refill_rate) + 1)
+            return 0.0
+        except Exception:
+            logger.warning("Throttle cache unavailable, using local buckets", exc_info=True)
+            return self.fallback.consume_all(buckets)
+
+    def clear(self):
+        self.fallback.clear()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_bucket_store():
+    """Kho bucket dùng chung cho cả process, chọn theo THROTTLING['backend']."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                options = dict(settings.THROTTLING.get('options', {}))
+                _store = import_string(settings.THROTTLING['backend'])(**options)
+    return _store
+
+
+def reset_bucket_store():
+    global _store
+    with _store_lock:
+        _store = None
+
+
+def _digest(value):
+    return hashlib.sha1(value.encode('utf-8')).hexdigest()
+
+
+def ip_key(request):
+    return BaseThrottle().get_ident(request)
+
+
+def identifier_key(request):
+    """Email hoặc số điện thoại trong body, đã chuẩn hóa; băm để không lưu dữ liệu cá nhân làm key."""
+    data = request.data if hasattr(request.data, 'get') else {}
+    identifier = data.get('email') or data.get('phone')
+    if not identifier or not isinstance(identifier, str):
+        return None
+    return _digest(identifier.strip().lower())
+
+
+def user_key(request):
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return None
+    return str(user.id)
+
+
+KEY_FUNCTIONS = {
+    'ip': ip_key,
+    'identifier': identifier_key,
+    'user': user_key,
+}
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Throttle của DRF: request bị từ chối nhận 429 kèm Retry-After (từ wait())."""
+
+    def __init__(self):
+        self.wait_time = 0.0
+
+    @staticmethod
+    def get_scope(view):
+        scopes = getattr(view, 'throttle_scopes', {})
+        action = getattr(view, 'action', None)
+        return scopes.get(action) or getattr(view, 'throttle_scope', None) or 'default'
+
+    def allow_request(self, request, view):
+        if not settings.THROTTLING.get('enabled', True):
+            return True
+        scope = self.get_scope(view)
+        policy = settings.THROTTLING['policies'].get(scope)
+        if not policy:
+            return True
+
+        buckets = []
+        for kind, rate in policy.items():
+            ident = KEY_FUNCTIONS[kind](request)
+            if ident is None:
+                continue
+            capacity, duration = parse_rate(rate)
+            buckets.append((f"throttle:{scope}:{kind}:{ident}", capacity, capacity / duration))
+        # Kiểm tra mọi bucket trước khi lấy token: bị từ chối thì không bucket nào bị trừ
+        self.wait_time = get_bucket_store().consume_all(buckets) if buckets else 0.0
+        return not self.wait_time
+
+    def wait(self):
+        return self.wait_time
@@ -16,6 +16,8 @@ class DoctorViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
     parser_classes = [MultiPartParser, JSONParser]
     
+    throttle_scopes = {action: 'public' for action in ['list', 'retrieve', 'search', 'filter', 'get_doctor_by_user_id']}
+
     def get_permissions(self):
         if self.action in ['list', 'retrieve', 'search', 'filter', 'get_doctor_by_user_id']:
             return [AllowAny()]
@@ -401,6 +403,8 @@ class DepartmentViewSet(viewsets.ViewSet):
         except Department.DoesNotExist:
             raise Http404
         
+    throttle_scopes = {action: 'public' for action in ['list', 'retrieve', 'doctors']}
+
     def get_permissions(self):
         if self.action in ['list', 'retrieve', 'doctors']:
             return [AllowAny()]
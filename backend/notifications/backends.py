@@ -0,0 +1,137 @@
+"""Backend gửi push notification: FCM thật và bản giả lập chạy trong bộ nhớ cho test, đo hiệu năng."""
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# FCM giới hạn tối đa 500 token cho một MulticastMessage
+FCM_MULTICAST_LIMIT = 500
+
+# Mã lỗi tạm thời: gửi lại sau; các mã khác là lỗi vĩnh viễn của token
+TRANSIENT_ERROR_CODES = {'UNAVAILABLE', 'INTERNAL', 'RESOURCE_EXHAUSTED', 'QUOTA_EXCEEDED', 'DEADLINE_EXCEEDED', 'UNKNOWN'}
+
+# Mã lỗi cho biết token không còn hiệu lực (app đã gỡ, token thuộc project khác): xóa token khỏi danh sách
+DEAD_TOKEN_ERROR_CODES = {'UNREGISTERED', 'SENDER_ID_MISMATCH'}
+
+PushResult = namedtuple('PushResult', ['token', 'success', 'message_id', 'error_code', 'error'])
+
+
+def is_transient(error_code):
+    return error_code in TRANSIENT_ERROR_CODES
+
+
+class PushBackendError(Exception):
+    """Cả lần gửi multicast thất bại (mất kết nối, lỗi xác thực, ...)."""
+
+    def __init__(self, message, code='UNKNOWN'):
+        super().__init__(message)
+        self.code = code
+
+    @property
+    def transient(self):
+        return is_transient(self.code)
+
+
+class FCMBackend:
+    def __init__(self):
+        from .firebase_config import initialize_firebase
+        initialize_firebase()
+
+    @staticmethod
+    def _error_code(exception):
+        from firebase_admin import messaging
+        if isinstance(exception, messaging.UnregisteredError):
+            return 'UNREGISTERED'
+        if isinstance(exception, messaging.SenderIdMismatchError):
+            return 'SENDER_ID_MISMATCH'
+        if isinstance(exception, messaging.QuotaExceededError):
+            return 'QUOTA_EXCEEDED'
+        return getattr(exception, 'code', None) or 'UNKNOWN'
+
+    def send_multicast(self, tokens, title, body, data=None):
+        """Gửi tới tối đa 500 token, trả về kết quả theo từng token (cùng thứ tự với `tokens`)."""
+        from firebase_admin import messaging
+        message = messaging.MulticastMessage(
+            notification=messaging.Notification(title=title, body=body),
+            data=data,
+            tokens=list(tokens),
+        )
+        try:
+            response = messaging.send_each_for_multicast(message)
+        except Exception as e:
+            raise PushBackendError(str(e), code=self._error_code(e)) from e
+
+        results = []
+        for token, item in zip(tokens, response.responses):
+            if item.success:
+                results.append(PushResult(token, True, item.message_id, None, None))
+            else:
+                results.append(PushResult(token, False, None, self._error_code(item.exception), str(item.exception)))
+        return results
+
+
+class FakeFCMBackend:
+    """FCM giả lập: không gọi mạng, ghi lại các lần gửi và cho phép cấu hình độ trễ, lỗi theo token."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = []
+        self.token_errors = {}
+        self._failures = []
+        self._lock = threading.Lock()
+
+    @property
+    def sent_tokens(self):
+        return [token for call in self.calls for token in call['tokens']]
+
+    def fail_token(self, token, error_code='UNREGISTERED'):
+        """Mọi lần gửi tới `token` đều trả lỗi `error_code`."""
+        self.token_errors[token] = error_code
+
+    def fail_next(self, count, error_code='UNAVAILABLE'):
+        """`count` lần gọi tiếp theo ném PushBackendError với mã `error_code`."""
+        with self._lock:
+            self._failures.extend([error_code] * count)
+
+    def send_multicast(self, tokens, title, body, data=None):
+        if len(tokens) > FCM_MULTICAST_LIMIT:
+            raise PushBackendError(f"Multicast message has more than {FCM_MULTICAST_LIMIT} tokens", code='INVALID_ARGUMENT')
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            if self._failures:
+                code = self._failures.pop(0)
+                raise PushBackendError(f"Fake FCM error {code}", code=code)
+            self.calls.append({'tokens': list(tokens), 'title': title, 'body': body, 'data': data})
+
+        results = []
+        for token in tokens:
+            error_code = self.token_errors.get(token)
+            if error_code:
+                results.append(PushResult(token, False, None, error_code, f"Fake FCM error {error_code}"))
+            else:
+                results.append(PushResult(token, True, f"projects/fake/messages/{uuid.uuid4().hex}", None, None))
+        return results
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_push_backend():
+    """Backend dùng chung cho cả process, chọn theo PUSH_NOTIFICATIONS['backend']."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = import_string(settings.PUSH_NOTIFICATIONS['backend'])()
+    return _backend
+
+
+def reset_push_backend():
+    global _backend
+    with _backend_lock:
+        _backend = None
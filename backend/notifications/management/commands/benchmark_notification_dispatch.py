@@ -0,0 +1,60 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from common.enums import NotificationType
+from notifications.backends import FakeFCMBackend
+from notifications.models import Token
+from notifications.services import NotificationService, NotificationDispatchService
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Đo thời gian tạo notification và tốc độ gửi của dispatcher với FCM giả lập (dữ liệu được rollback)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--notifications', type=int, default=200)
+        parser.add_argument('--tokens-per-user', type=int, default=3)
+        parser.add_argument('--latency-ms', type=float, default=100)
+
+    def handle(self, *args, **options):
+        user = User.objects.order_by('id').first()
+        if user is None:
+            raise CommandError("Cần ít nhất một người dùng trong cơ sở dữ liệu")
+        backend = FakeFCMBackend(latency=options['latency_ms'] / 1000)
+        count = options['notifications']
+
+        with transaction.atomic():
+            Token.objects.bulk_create([
+                Token(user=user, token=f"benchmark-{i}") for i in range(options['tokens_per_user'])
+            ])
+            data = {'user': user, 'title': "Benchmark", 'message': "Benchmark", 'type': NotificationType.SYSTEM.value}
+
+            # Cách cũ: mỗi request chờ một lần gọi multicast tới FCM
+            started = time.perf_counter()
+            for _ in range(count):
+                backend.send_multicast([f"benchmark-{i}" for i in range(options['tokens_per_user'])], data['title'], data['message'])
+            inline = time.perf_counter() - started
+
+            started = time.perf_counter()
+            for _ in range(count):
+                NotificationService.create(data)
+            enqueue = time.perf_counter() - started
+
+            backend.calls.clear()
+            service = NotificationDispatchService(backend=backend)
+            started = time.perf_counter()
+            sent = 0
+            while True:
+                result = service.dispatch_pending()
+                if not result['sent']:
+                    break
+                sent += result['sent']
+            dispatch = time.perf_counter() - started
+
+            self.stdout.write(f"inline send: {inline / count * 1000:.1f} ms/request")
+            self.stdout.write(f"outbox enqueue: {enqueue / count * 1000:.1f} ms/request")
+            self.stdout.write(
+                f"dispatcher: {sent} push(es) in {len(backend.calls)} multicast call(s), {dispatch:.2f}s"
+            )
+            transaction.set_rollback(True)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from notifications.services import TokenService
+
+
+class Command(BaseCommand):
+    help = "Xóa token FCM đăng ký trùng và token đã bị FCM báo không còn hiệu lực"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Chỉ đếm, không xóa")
+
+    def handle(self, *args, **options):
+        result = TokenService.compact_tokens(dry_run=options['dry_run'])
+        verb = "Would remove" if options['dry_run'] else "Removed"
+        self.stdout.write(f"{verb} {result['duplicates']} duplicate token(s), {result['dead']} dead token(s)")
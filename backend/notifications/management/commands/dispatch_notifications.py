@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+from notifications.services import NotificationDispatchService
+
+
+class Command(BaseCommand):
+    help = "Gửi push notification trong outbox tới FCM theo lô multicast"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--watch', action='store_true', help="Chạy liên tục, chờ notification mới")
+        parser.add_argument('--interval', type=float, default=1.0, help="Số giây chờ khi outbox rỗng")
+        parser.add_argument('--retry-failed', action='store_true', help="Đưa các delivery lỗi tạm thời về hàng đợi trước khi gửi")
+
+    def handle(self, *args, **options):
+        service = NotificationDispatchService()
+        if options['retry_failed']:
+            self.stdout.write(f"Requeued {service.retry_failed()} failed delivery(ies)")
+
+        while True:
+            result = service.dispatch_pending(batch_size=options['batch_size'])
+            if any(result.values()):
+                self.stdout.write(
+                    f"Sent {result['sent']} push(es), {result['retried']} to retry, {result['failed']} failed"
+                )
+                continue
+            if not options['watch']:
+                break
+            time.sleep(options['interval'])
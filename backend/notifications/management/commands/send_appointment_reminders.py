@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from common.enums import NotificationType
+from notifications.services import NotificationService
+
+
+class Command(BaseCommand):
+    help = "Tạo thông báo nhắc lịch hẹn cho các bệnh nhân có lịch hẹn trong ngày (mặc định là ngày mai)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=parse_date, help="Ngày hẹn, định dạng YYYY-MM-DD")
+
+    def handle(self, *args, **options):
+        date = options['date'] or timezone.localdate() + timedelta(days=1)
+        users = NotificationService.get_audience('appointments', date=date)
+        result = NotificationService.create_bulk(
+            users,
+            "Nhắc lịch hẹn",
+            f"Bạn có lịch hẹn khám vào ngày {date:%d/%m/%Y}. Vui lòng đến đúng giờ.",
+            NotificationType.APPOINTMENT.value
+        )
+        self.stdout.write(f"Queued {result['notifications']} notification(s), {result['deliveries']} push(es) for {date}")
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+from notifications.services import EmailOutboxService
+
+
+class Command(BaseCommand):
+    help = "Gửi các email trong hàng đợi, mỗi lô dùng chung một kết nối SMTP"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--watch', action='store_true', help="Chạy liên tục, chờ email mới")
+        parser.add_argument('--interval', type=float, default=1.0, help="Số giây chờ khi hàng đợi rỗng")
+
+    def handle(self, *args, **options):
+        service = EmailOutboxService()
+        while True:
+            result = service.send_pending(batch_size=options['batch_size'])
+            if any(result.values()):
+                self.stdout.write(
+                    f"Sent {result['sent']} email(s), {result['retried']} to retry, {result['failed']} failed"
+                )
+                continue
+            if not options['watch']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:16
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notifications", "0004_alter_notification_type"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="NotificationDelivery",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("token", models.CharField(max_length=255)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("P", "PENDING"), ("S", "SENT"), ("F", "FAILED")],
+                        default="P",
+                        max_length=20,
+                    ),
+                ),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                (
+                    "next_attempt_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("message_id", models.CharField(blank=True, max_length=255, null=True)),
+                ("error_code", models.CharField(blank=True, max_length=20, null=True)),
+                ("last_error", models.TextField(blank=True, null=True)),
+                ("sent_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "notification",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="deliveries",
+                        to="notifications.notification",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["status", "next_attempt_at"],
+                        name="notificatio_status_e1aed1_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:19
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef
+
+
+def remove_duplicate_tokens(apps, schema_editor):
+    # Giữ lại bản đăng ký mới nhất của mỗi cặp (user, token) trước khi thêm ràng buộc unique
+    Token = apps.get_model("notifications", "Token")
+    newer = Token.objects.filter(user_id=OuterRef("user_id"), token=OuterRef("token"), id__gt=OuterRef("id"))
+    Token.objects.filter(Exists(newer)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notifications", "0005_notification_delivery"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_tokens, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="token",
+            index=models.Index(fields=["token"], name="notificatio_token_3a595a_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="token",
+            constraint=models.UniqueConstraint(
+                fields=("user", "token"), name="unique_token_user_token"
+            ),
+        ),
+    ]
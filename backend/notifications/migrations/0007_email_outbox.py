@@ -0,0 +1,57 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:23
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notifications", "0006_token_unique"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EmailOutbox",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("subject", models.CharField(max_length=100)),
+                ("body", models.TextField()),
+                ("from_email", models.CharField(blank=True, max_length=100, null=True)),
+                ("recipients", models.JSONField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("P", "PENDING"), ("S", "SENT"), ("F", "FAILED")],
+                        default="P",
+                        max_length=20,
+                    ),
+                ),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                (
+                    "next_attempt_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("last_error", models.TextField(blank=True, null=True)),
+                ("sent_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["status", "next_attempt_at"],
+                        name="notificatio_status_1fc719_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+def redact_finished_emails(apps, schema_editor):
+    EmailOutbox = apps.get_model('notifications', 'EmailOutbox')
+    # Email đã gửi hoặc đã bỏ hẳn không cần nội dung nữa (chứa mã OTP / mã đặt lại mật khẩu)
+    EmailOutbox.objects.filter(status__in=['S', 'F']).exclude(body='').update(body='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notifications", "0007_email_outbox"),
+    ]
+
+    operations = [
+        migrations.RunPython(redact_finished_emails, migrations.RunPython.noop),
+    ]
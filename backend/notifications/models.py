@@ -1,8 +1,9 @@
 from django.db import models
+from django.utils import timezone
 from core.models import BaseModel
 from users.models import User
-from common.enums import NotificationType
-from common.constants import COMMON_LENGTH, ENUM_LENGTH
+from common.enums import NotificationType, PushDeliveryStatus, EmailStatus
+from common.constants import COMMON_LENGTH, ENUM_LENGTH, USER_LENGTH
 
 class Notification(BaseModel):
     user = models.ForeignKey(User, on_delete=models.RESTRICT)
@@ -21,6 +22,55 @@ class Token(BaseModel):
     user = models.ForeignKey(User, on_delete=models.RESTRICT)
     token = models.CharField(max_length=COMMON_LENGTH["TOKEN"])
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'token'], name='unique_token_user_token'),
+        ]
+        indexes = [
+            models.Index(fields=['token']),
+        ]
+
     def __str__(self):
         return f"Token {self.pk}"
 
+
+class NotificationDelivery(BaseModel):
+    """Outbox gửi push: mỗi dòng là một lần gửi notification tới một token, do dispatcher xử lý nền."""
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name='deliveries')
+    token = models.CharField(max_length=COMMON_LENGTH["TOKEN"])
+    status = models.CharField(max_length=ENUM_LENGTH["DEFAULT"], choices=[(s.value, s.name) for s in PushDeliveryStatus], default=PushDeliveryStatus.PENDING.value)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    message_id = models.CharField(max_length=COMMON_LENGTH["TOKEN"], blank=True, null=True)
+    error_code = models.CharField(max_length=ENUM_LENGTH["DEFAULT"], blank=True, null=True)
+    last_error = models.TextField(blank=True, null=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"NotificationDelivery {self.notification_id} ({self.status})"
+
+
+class EmailOutbox(BaseModel):
+    """Email chờ gửi (OTP, đặt lại mật khẩu, ...); request chỉ ghi vào đây, việc gửi SMTP chạy nền."""
+    subject = models.CharField(max_length=COMMON_LENGTH["TITLE"])
+    body = models.TextField()
+    from_email = models.CharField(max_length=USER_LENGTH["EMAIL"], blank=True, null=True)
+    recipients = models.JSONField()
+    status = models.CharField(max_length=ENUM_LENGTH["DEFAULT"], choices=[(s.value, s.name) for s in EmailStatus], default=EmailStatus.PENDING.value)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, null=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"EmailOutbox {self.pk} ({self.status})"
@@ -1,4 +1,7 @@
+from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
+from common.constants import COMMON_LENGTH
+from common.enums import NotificationType
 from .models import Notification, Token
 
 class NotificationSerializer(serializers.ModelSerializer):
@@ -10,3 +13,23 @@ class TokenSerializer(serializers.ModelSerializer):
     class Meta:
         model = Token
         fields = "__all__"
+        # Token trùng được xử lý bằng upsert trong TokenService.add_token thay vì báo lỗi
+        validators = []
+
+class BroadcastNotificationSerializer(serializers.Serializer):
+    title = serializers.CharField(max_length=COMMON_LENGTH["TITLE"])
+    message = serializers.CharField()
+    type = serializers.ChoiceField(choices=[(n.value, n.name) for n in NotificationType])
+    user_ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False)
+    audience = serializers.ChoiceField(choices=['doctors', 'patients', 'department', 'appointments'], required=False)
+    department_id = serializers.IntegerField(required=False)
+    date = serializers.DateField(required=False)
+
+    def validate(self, data):
+        if ('user_ids' in data) == ('audience' in data):
+            raise serializers.ValidationError(_("Cần chọn một trong hai: user_ids hoặc audience"))
+        if data.get('audience') == 'department' and 'department_id' not in data:
+            raise serializers.ValidationError({'department_id': _("Cần chọn khoa")})
+        if data.get('audience') == 'appointments' and 'date' not in data:
+            raise serializers.ValidationError({'date': _("Cần chọn ngày hẹn")})
+        return data
@@ -1,35 +1,198 @@
 # notifications/services.py
 
-from datetime import datetime
-from .models import Notification, Token
-from .firebase_config import initialize_firebase
-from .fcm_utils import send_to_devices
+import logging
+import smtplib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, QuerySet
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from common.enums import AppointmentStatus, EmailStatus, PushDeliveryStatus, UserRole
+from users.models import User
+from .models import EmailOutbox, Notification, NotificationDelivery, Token
+from .backends import FCM_MULTICAST_LIMIT, DEAD_TOKEN_ERROR_CODES, TRANSIENT_ERROR_CODES, PushBackendError, get_push_backend, is_transient
 
-# Đảm bảo Firebase được khởi tạo
-initialize_firebase()
+logger = logging.getLogger(__name__)
 
 class NotificationService:
     @staticmethod
     def create(data: dict) -> Notification:
-        tokens = TokenService.get_tokens_by_user_id(data['user'].id)
-
-        firebase_response = send_to_devices(tokens, data['title'], data['message']) if tokens else None
+        """
+        Lưu notification và đưa vào outbox; việc gửi push do dispatcher chạy nền đảm nhận
+        """
+        with transaction.atomic():
+            notification = Notification.objects.create(
+                user=data['user'],
+                title=data['title'],
+                message=data['message'],
+                type=data['type'],
+                sent_at=timezone.now()
+            )
+            tokens = TokenService.get_tokens_by_user_id(data['user'].id)
+            NotificationDelivery.objects.bulk_create([
+                NotificationDelivery(notification=notification, token=token) for token in tokens
+            ])
+        return notification
 
-        notification = Notification.objects.create(
-            user=data['user'],
-            title=data['title'],
-            message=data['message'],
-            type=data['type'],
-            sent_at=datetime.now(),
-            response=firebase_response.__dict__ if firebase_response else None
+    @staticmethod
+    def create_bulk(users, title: str, message: str, type: str) -> dict:
+        """
+        Tạo notification cho nhiều người dùng cùng lúc (queryset User hoặc danh sách ID).
+        Token được lấy bằng một truy vấn, notification và delivery được ghi bằng bulk_create.
+        """
+        if not isinstance(users, QuerySet):
+            users = User.objects.filter(id__in=list(users))
+        user_ids = list(users.order_by('id').values_list('id', flat=True).distinct())
+        tokens = list(
+            Token.objects.filter(user_id__in=users.values('id')).order_by('id').values_list('user_id', 'token')
         )
-        return notification
+        now = timezone.now()
+        with transaction.atomic():
+            notifications = Notification.objects.bulk_create([
+                Notification(user_id=user_id, title=title, message=message, type=type, sent_at=now)
+                for user_id in user_ids
+            ], batch_size=1000)
+            notification_by_user = {n.user_id: n for n in notifications}
+            deliveries = NotificationDelivery.objects.bulk_create([
+                NotificationDelivery(notification=notification_by_user[user_id], token=token)
+                for user_id, token in tokens
+            ], batch_size=1000)
+        return {'notifications': len(notifications), 'deliveries': len(deliveries)}
+
+    @staticmethod
+    def get_audience(audience: str, department_id=None, date=None):
+        """
+        Queryset người dùng theo nhóm nhận: doctors, patients, department (bác sĩ của khoa)
+        hoặc appointments (bệnh nhân có lịch hẹn trong ngày `date`)
+        """
+        users = User.objects.filter(is_active=True, is_deleted=False)
+        if audience == 'doctors':
+            return users.filter(role=UserRole.DOCTOR.value)
+        if audience == 'patients':
+            return users.filter(role=UserRole.PATIENT.value)
+        if audience == 'department':
+            return users.filter(doctor__department_id=department_id)
+        if audience == 'appointments':
+            return users.filter(
+                patient__appointment__schedule__work_date=date,
+                patient__appointment__status__in=[AppointmentStatus.PENDING.value, AppointmentStatus.CONFIRMED.value]
+            )
+        raise ValueError(_("Nhóm người nhận không hợp lệ"))
 
     @staticmethod
     def get_all_notifications():
         return Notification.objects.all().order_by('-sent_at') 
 
 
+class NotificationDispatchService:
+    def __init__(self, backend=None):
+        self.backend = backend or get_push_backend()
+        self.max_attempts = settings.PUSH_NOTIFICATIONS['max_attempts']
+        self.backoff = settings.PUSH_NOTIFICATIONS['backoff']
+        self.lease = settings.PUSH_NOTIFICATIONS['lease']
+        self.workers = settings.PUSH_NOTIFICATIONS['workers']
+
+    def dispatch_pending(self, batch_size=FCM_MULTICAST_LIMIT * 4):
+        """
+        Gửi một lô push đang chờ, gom các token cùng nội dung thành multicast tối đa 500 token
+        và gửi song song các multicast với số luồng giới hạn.
+        """
+        result = {'sent': 0, 'failed': 0, 'retried': 0}
+        deliveries = self.claim(batch_size)
+        if not deliveries:
+            return result
+
+        groups = defaultdict(list)
+        for delivery in deliveries:
+            notification = delivery.notification
+            groups[(notification.title, notification.message, notification.type)].append(delivery)
+
+        chunks = [
+            (items[start:start + FCM_MULTICAST_LIMIT], title, message, {'type': notification_type})
+            for (title, message, notification_type), items in groups.items()
+            for start in range(0, len(items), FCM_MULTICAST_LIMIT)
+        ]
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(chunks))) as executor:
+            for chunk_result in executor.map(lambda args: self._send_chunk(*args), chunks):
+                for key, value in chunk_result.items():
+                    result[key] += value
+
+        NotificationDelivery.objects.bulk_update(
+            deliveries, ['status', 'next_attempt_at', 'message_id', 'error_code', 'last_error', 'sent_at', 'updated_at']
+        )
+        dead_tokens = {d.token for d in deliveries if d.error_code in DEAD_TOKEN_ERROR_CODES}
+        if dead_tokens:
+            TokenService.prune_tokens(dead_tokens)
+        return result
+
+    def claim(self, batch_size):
+        """
+        Nhận một lô delivery đến hạn gửi. Dời next_attempt_at thêm một khoảng lease để worker khác
+        không lấy trùng; nếu worker dừng giữa chừng, delivery sẽ được gửi lại khi hết lease.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            deliveries = list(
+                NotificationDelivery.objects.select_for_update(skip_locked=True, of=('self',))
+                .select_related('notification')
+                .filter(status=PushDeliveryStatus.PENDING.value, next_attempt_at__lte=now)
+                .order_by('next_attempt_at', 'id')[:batch_size]
+            )
+            if deliveries:
+                NotificationDelivery.objects.filter(id__in=[d.id for d in deliveries]).update(
+                    attempts=F('attempts') + 1, next_attempt_at=now + timedelta(seconds=self.lease), updated_at=now
+                )
+        for delivery in deliveries:
+            delivery.attempts += 1
+        return deliveries
+
+    def _send_chunk(self, chunk, title, message, data):
+        result = {'sent': 0, 'failed': 0, 'retried': 0}
+        now = timezone.now()
+        try:
+            responses = self.backend.send_multicast([d.token for d in chunk], title, message, data)
+        except Exception as e:
+            code = e.code if isinstance(e, PushBackendError) else 'UNKNOWN'
+            logger.error(f"Error sending push to {len(chunk)} token(s): {str(e)}")
+            for delivery in chunk:
+                self._record_failure(delivery, code, str(e), now, result)
+            return result
+
+        for delivery, response in zip(chunk, responses):
+            delivery.updated_at = now
+            if response.success:
+                delivery.status = PushDeliveryStatus.SENT.value
+                delivery.message_id = response.message_id
+                delivery.error_code = None
+                delivery.last_error = None
+                delivery.sent_at = now
+                result['sent'] += 1
+            else:
+                self._record_failure(delivery, response.error_code, response.error, now, result)
+        return result
+
+    def _record_failure(self, delivery, error_code, error, now, result):
+        delivery.error_code = error_code
+        delivery.last_error = error
+        delivery.updated_at = now
+        if is_transient(error_code) and delivery.attempts < self.max_attempts:
+            delivery.next_attempt_at = now + timedelta(seconds=self.backoff * 2 ** (delivery.attempts - 1))
+            result['retried'] += 1
+        else:
+            delivery.status = PushDeliveryStatus.FAILED.value
+            result['failed'] += 1
+
+    def retry_failed(self):
+        """Đưa các delivery đã hết lượt thử do lỗi tạm thời về hàng đợi; lỗi vĩnh viễn của token thì giữ nguyên."""
+        return NotificationDelivery.objects.filter(
+            status=PushDeliveryStatus.FAILED.value, error_code__in=TRANSIENT_ERROR_CODES
+        ).update(status=PushDeliveryStatus.PENDING.value, attempts=0, next_attempt_at=timezone.now(), updated_at=timezone.now())
+
+
 class TokenService:
     @staticmethod
     def get_tokens_by_user_id(user_id: int) -> list[str]:
@@ -41,10 +204,153 @@ class TokenService:
     @staticmethod
     def add_token(user, token_str: str) -> Token:
         """
-        Lưu 1 token mới cho người dùng
+        Lưu token cho người dùng; đăng ký lại cùng token chỉ cập nhật thời điểm đăng ký.
+        Token đang gắn với người dùng khác (thiết bị đổi tài khoản) sẽ bị gỡ khỏi người dùng đó
+        """
+        with transaction.atomic():
+            Token.objects.filter(token=token_str).exclude(user=user).delete()
+            token, = Token.objects.bulk_create(
+                [Token(user=user, token=token_str)],
+                update_conflicts=True, unique_fields=['user', 'token'], update_fields=['updated_at']
+            )
+        return token
+
+    @staticmethod
+    def update_token(token: Token, user, token_str: str) -> Token:
+        """
+        Đổi người dùng/giá trị của token; dòng khác đang giữ cùng token sẽ bị gỡ như khi add_token
+        """
+        with transaction.atomic():
+            Token.objects.filter(token=token_str).exclude(pk=token.pk).delete()
+            token.user = user
+            token.token = token_str
+            token.save()
+        return token
+
+    @staticmethod
+    def prune_tokens(tokens) -> int:
+        """
+        Xóa các token FCM báo không còn hiệu lực và hủy các push đang chờ gửi tới chúng
+        """
+        tokens = list(tokens)
+        with transaction.atomic():
+            deleted = Token.objects.filter(token__in=tokens).delete()[0]
+            NotificationDelivery.objects.filter(token__in=tokens, status=PushDeliveryStatus.PENDING.value).update(
+                status=PushDeliveryStatus.FAILED.value, error_code='UNREGISTERED', updated_at=timezone.now()
+            )
+        if deleted:
+            logger.info(f"Pruned {deleted} dead FCM token(s)")
+        return deleted
+
+    @staticmethod
+    def compact_tokens(dry_run=False) -> dict:
+        """
+        Dọn danh sách token: token đăng ký trùng (cùng token ở nhiều dòng, giữ dòng mới nhất)
+        và token đã bị FCM báo chết sau lần đăng ký gần nhất
         """
-        return Token.objects.create(user=user, token=token_str)
+        duplicates = Token.objects.filter(Exists(
+            Token.objects.filter(token=OuterRef('token'), id__gt=OuterRef('id'))
+        ))
+        dead = Token.objects.filter(Exists(
+            NotificationDelivery.objects.filter(
+                token=OuterRef('token'), error_code__in=DEAD_TOKEN_ERROR_CODES, updated_at__gt=OuterRef('updated_at')
+            )
+        ))
+        if dry_run:
+            return {'duplicates': duplicates.count(), 'dead': dead.exclude(id__in=duplicates.values('id')).count()}
+        with transaction.atomic():
+            duplicate_count = duplicates.delete()[0]
+            dead_count = dead.delete()[0]
+        return {'duplicates': duplicate_count, 'dead': dead_count}
     
     @staticmethod
     def get_all_tokens():
         return Token.objects.all().order_by('-id')
+
+
+class EmailOutboxService:
+    # Lỗi do địa chỉ người nhận/người gửi bị từ chối: gửi lại cũng không thành công
+    PERMANENT_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused)
+    # Nội dung chứa mã OTP / mã đặt lại mật khẩu: xóa ngay khi email đã gửi hoặc bỏ hẳn, không lưu lâu trong DB
+    REDACTED_BODY = ''
+
+    def __init__(self):
+        self.max_attempts = settings.EMAIL_OUTBOX['max_attempts']
+        self.backoff = settings.EMAIL_OUTBOX['backoff']
+        self.lease = settings.EMAIL_OUTBOX['lease']
+
+    @staticmethod
+    def queue(subject, body, recipients, from_email=None) -> EmailOutbox:
+        """
+        Đưa email vào hàng đợi; email được gửi sau khi transaction hiện tại commit
+        """
+        return EmailOutbox.objects.create(
+            subject=str(subject),
+            body=str(body),
+            from_email=from_email or settings.EMAIL_HOST_USER,
+            recipients=list(recipients)
+        )
+
+    def send_pending(self, batch_size=100):
+        """Gửi một lô email đến hạn qua một kết nối SMTP duy nhất."""
+        result = {'sent': 0, 'failed': 0, 'retried': 0}
+        emails = self.claim(batch_size)
+        if not emails:
+            return result
+
+        connection = get_connection(fail_silently=False)
+        try:
+            connection.open()
+        except Exception as e:
+            logger.error(f"Error opening email connection: {str(e)}")
+            for email in emails:
+                self._record_failure(email, e, result)
+        else:
+            try:
+                for email in emails:
+                    message = EmailMessage(email.subject, email.body, email.from_email, email.recipients, connection=connection)
+                    try:
+                        connection.send_messages([message])
+                    except Exception as e:
+                        logger.error(f"Error sending email {email.id}: {str(e)}")
+                        self._record_failure(email, e, result)
+                    else:
+                        email.status = EmailStatus.SENT.value
+                        email.body = self.REDACTED_BODY
+                        email.last_error = None
+                        email.sent_at = email.updated_at = timezone.now()
+                        result['sent'] += 1
+            finally:
+                connection.close()
+
+        EmailOutbox.objects.bulk_update(emails, ['status', 'body', 'next_attempt_at', 'last_error', 'sent_at', 'updated_at'])
+        return result
+
+    def claim(self, batch_size):
+        """Nhận một lô email đến hạn và giữ chỗ (lease) để worker khác không gửi trùng."""
+        now = timezone.now()
+        with transaction.atomic():
+            emails = list(
+                EmailOutbox.objects.select_for_update(skip_locked=True)
+                .filter(status=EmailStatus.PENDING.value, next_attempt_at__lte=now)
+                .order_by('next_attempt_at', 'id')[:batch_size]
+            )
+            if emails:
+                EmailOutbox.objects.filter(id__in=[e.id for e in emails]).update(
+                    attempts=F('attempts') + 1, next_attempt_at=now + timedelta(seconds=self.lease), updated_at=now
+                )
+        for email in emails:
+            email.attempts += 1
+        return emails
+
+    def _record_failure(self, email, error, result):
+        now = timezone.now()
+        email.last_error = str(error)
+        email.updated_at = now
+        if not isinstance(error, self.PERMANENT_ERRORS) and email.attempts < self.max_attempts:
+            email.next_attempt_at = now + timedelta(seconds=self.backoff * 2 ** (email.attempts - 1))
+            result['retried'] += 1
+        else:
+            email.status = EmailStatus.FAILED.value
+            email.body = self.REDACTED_BODY
+            result['failed'] += 1
@@ -0,0 +1,407 @@
+import smtplib
+from datetime import date, time, timedelta
+from decimal import Decimal
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from unittest.mock import patch
+from appointments.models import Appointment
+from doctors.models import Doctor, Department, ExaminationRoom, Schedule
+from patients.models import Patient
+from notifications.backends import FakeFCMBackend, FCM_MULTICAST_LIMIT
+from notifications.models import EmailOutbox, Notification, NotificationDelivery, Token
+from notifications.services import EmailOutboxService, NotificationService, NotificationDispatchService, TokenService
+from users.models import User
+from common.enums import EmailStatus, NotificationType, PushDeliveryStatus, UserRole, Gender, AcademicDegree, DoctorType, RoomType, Shift, AppointmentStatus
+from common.constants import SCHEDULE_DEFAULTS
+
+PUSH_SETTINGS = {'backend': 'notifications.backends.FakeFCMBackend', 'max_attempts': 3, 'backoff': 30.0, 'lease': 300.0, 'workers': 4}
+
+
+@override_settings(PUSH_NOTIFICATIONS=PUSH_SETTINGS)
+class NotificationServiceTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='patient@example.com',
+            password='testpass123',
+            role=UserRole.PATIENT.value
+        )
+        Token.objects.bulk_create([Token(user=cls.user, token=f"token-{i}") for i in range(3)])
+
+    def setUp(self):
+        self.backend = FakeFCMBackend()
+        self.dispatcher = NotificationDispatchService(backend=self.backend)
+
+    def _create(self, user=None, title="Lịch hẹn"):
+        return NotificationService.create({
+            'user': user or self.user,
+            'title': title,
+            'message': "Bạn có lịch hẹn vào ngày mai",
+            'type': NotificationType.APPOINTMENT.value,
+        })
+
+    def _statuses(self):
+        return sorted(NotificationDelivery.objects.values_list('token', 'status'))
+
+    def test_create_enqueues_without_sending(self):
+        notification = self._create()
+
+        self.assertIsNotNone(notification.sent_at)
+        self.assertEqual(notification.deliveries.count(), 3)
+        self.assertEqual(set(notification.deliveries.values_list('status', flat=True)), {PushDeliveryStatus.PENDING.value})
+        self.assertEqual(self.backend.calls, [])
+
+    def test_create_without_tokens(self):
+        user = User.objects.create_user(email='notoken@example.com', password='testpass123', role=UserRole.PATIENT.value)
+        notification = self._create(user=user)
+
+        self.assertTrue(Notification.objects.filter(id=notification.id).exists())
+        self.assertFalse(notification.deliveries.exists())
+
+    def test_dispatch_sends_pending_deliveries(self):
+        self._create()
+        result = self.dispatcher.dispatch_pending()
+
+        self.assertEqual(result, {'sent': 3, 'failed': 0, 'retried': 0})
+        self.assertEqual(len(self.backend.calls), 1)
+        self.assertEqual(self.backend.calls[0]['data'], {'type': NotificationType.APPOINTMENT.value})
+        delivery = NotificationDelivery.objects.first()
+        self.assertEqual(delivery.status, PushDeliveryStatus.SENT.value)
+        self.assertEqual(delivery.attempts, 1)
+        self.assertIsNotNone(delivery.message_id)
+        self.assertIsNotNone(delivery.sent_at)
+        self.assertEqual(self.dispatcher.dispatch_pending(), {'sent': 0, 'failed': 0, 'retried': 0})
+
+    def test_dispatch_batches_by_multicast_limit(self):
+        users = User.objects.bulk_create([
+            User(email=f'bulk{i}@example.com', role=UserRole.PATIENT.value) for i in range(FCM_MULTICAST_LIMIT + 50)
+        ])
+        Token.objects.bulk_create([Token(user=user, token=f"bulk-{user.id}") for user in users])
+        for user in users:
+            self._create(user=user, title="Thông báo chung")
+
+        result = self.dispatcher.dispatch_pending(batch_size=FCM_MULTICAST_LIMIT * 2)
+
+        self.assertEqual(result['sent'], FCM_MULTICAST_LIMIT + 50)
+        self.assertEqual(sorted(len(call['tokens']) for call in self.backend.calls), [50, FCM_MULTICAST_LIMIT])
+
+    def test_per_token_results_are_recorded(self):
+        self.backend.fail_token('token-0', 'UNREGISTERED')
+        self.backend.fail_token('token-1', 'UNAVAILABLE')
+        self._create()
+
+        result = self.dispatcher.dispatch_pending()
+
+        self.assertEqual(result, {'sent': 1, 'failed': 1, 'retried': 1})
+        self.assertEqual(self._statuses(), [
+            ('token-0', PushDeliveryStatus.FAILED.value),
+            ('token-1', PushDeliveryStatus.PENDING.value),
+            ('token-2', PushDeliveryStatus.SENT.value),
+        ])
+        failed = NotificationDelivery.objects.get(token='token-0')
+        self.assertEqual(failed.error_code, 'UNREGISTERED')
+        retried = NotificationDelivery.objects.get(token='token-1')
+        self.assertGreater(retried.next_attempt_at, timezone.now() + timedelta(seconds=20))
+
+    def test_transient_backend_error_is_retried_with_backoff(self):
+        self._create()
+        self.backend.fail_next(1)
+
+        self.assertEqual(self.dispatcher.dispatch_pending(), {'sent': 0, 'failed': 0, 'retried': 3})
+        # Chưa tới hạn gửi lại
+        self.assertEqual(self.dispatcher.dispatch_pending(), {'sent': 0, 'failed': 0, 'retried': 0})
+
+        NotificationDelivery.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(self.dispatcher.dispatch_pending(), {'sent': 3, 'failed': 0, 'retried': 0})
+        self.assertEqual(set(NotificationDelivery.objects.values_list('attempts', flat=True)), {2})
+
+    def test_gives_up_after_max_attempts_and_requeues(self):
+        self._create()
+        self.backend.fail_next(3)
+        for _ in range(3):
+            NotificationDelivery.objects.update(next_attempt_at=timezone.now())
+            self.dispatcher.dispatch_pending()
+
+        self.assertEqual(set(NotificationDelivery.objects.values_list('status', flat=True)), {PushDeliveryStatus.FAILED.value})
+        self.assertEqual(self.dispatcher.retry_failed(), 3)
+        self.assertEqual(self.dispatcher.dispatch_pending()['sent'], 3)
+
+    def test_permanent_backend_error_fails_immediately(self):
+        self._create()
+        self.backend.fail_next(1, 'INVALID_ARGUMENT')
+
+        self.assertEqual(self.dispatcher.dispatch_pending(), {'sent': 0, 'failed': 3, 'retried': 0})
+        self.assertEqual(self.dispatcher.retry_failed(), 0)
+
+    def test_claimed_deliveries_are_leased(self):
+        self._create()
+        deliveries = self.dispatcher.claim(10)
+
+        self.assertEqual(len(deliveries), 3)
+        # Worker khác không lấy lại các delivery đang được gửi
+        self.assertEqual(self.dispatcher.claim(10), [])
+        self.assertTrue(all(d.next_attempt_at > timezone.now() for d in NotificationDelivery.objects.all()))
+
+
+@override_settings(PUSH_NOTIFICATIONS=PUSH_SETTINGS)
+class BulkNotificationServiceTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient_users = User.objects.bulk_create([
+            User(email=f'patient{i}@example.com', role=UserRole.PATIENT.value) for i in range(20)
+        ])
+        cls.doctor_user = User.objects.create_user(email='doctor@example.com', password='testpass123', role=UserRole.DOCTOR.value)
+        Token.objects.bulk_create(
+            [Token(user=user, token=f"patient-{user.id}-{i}") for user in cls.patient_users for i in range(2)]
+            + [Token(user=cls.doctor_user, token="doctor-token")]
+        )
+
+        cls.department = Department.objects.create(department_name="Cardiology")
+        cls.doctor = Doctor.objects.create(
+            user=cls.doctor_user,
+            first_name="John",
+            last_name="Doe",
+            identity_number="123456789",
+            birthday=date(1980, 1, 1),
+            gender=Gender.MALE.value,
+            academic_degree=AcademicDegree.BS_CKI.value,
+            specialization="Cardiologist",
+            type=DoctorType.EXAMINATION.value,
+            department=cls.department,
+            price=Decimal('100.00')
+        )
+        room = ExaminationRoom.objects.create(
+            department=cls.department, type=RoomType.EXAMINATION.value, building="A", floor=1, note="Room 101"
+        )
+        cls.work_date = date(2025, 8, 26)
+        schedule = Schedule.objects.create(
+            doctor=cls.doctor,
+            room=room,
+            work_date=cls.work_date,
+            start_time=time(8, 0),
+            end_time=time(12, 0),
+            shift=Shift.MORNING.value,
+            max_patients=SCHEDULE_DEFAULTS["MAX_PATIENTS"],
+            current_patients=SCHEDULE_DEFAULTS["CURRENT_PATIENTS"],
+            status="AVAILABLE",
+            default_appointment_duration_minutes=SCHEDULE_DEFAULTS["APPOINTMENT_DURATION_MINUTES"]
+        )
+        for i, (user, appointment_status) in enumerate(zip(cls.patient_users[:3], [
+            AppointmentStatus.PENDING.value, AppointmentStatus.CONFIRMED.value, AppointmentStatus.CANCELLED.value
+        ])):
+            patient = Patient.objects.create(
+                user=user,
+                first_name='Test',
+                last_name=f'Patient {i}',
+                identity_number=f'11122233{i}',
+                insurance_number=f'INS12345{i}',
+                birthday=date(1990, 1, 1),
+                gender=Gender.FEMALE.value
+            )
+            Appointment.objects.create(
+                doctor=cls.doctor, patient=patient, schedule=schedule,
+                slot_start=time(8, 0), slot_end=time(8, 30), status=appointment_status
+            )
+
+    def test_create_bulk_uses_constant_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            result = NotificationService.create_bulk(
+                [user.id for user in self.patient_users], "Thông báo", "Phòng khám nghỉ lễ", NotificationType.SYSTEM.value
+            )
+        self.assertEqual(result, {'notifications': 20, 'deliveries': 40})
+        self.assertLessEqual(len(context.captured_queries), 6)
+        self.assertEqual(Notification.objects.count(), 20)
+        self.assertEqual(NotificationDelivery.objects.filter(notification__user=self.patient_users[0]).count(), 2)
+
+    def test_create_bulk_ignores_unknown_users(self):
+        result = NotificationService.create_bulk(
+            [self.doctor_user.id, 999999], "Thông báo", "Họp khoa", NotificationType.SYSTEM.value
+        )
+        self.assertEqual(result, {'notifications': 1, 'deliveries': 1})
+
+    def test_audiences(self):
+        self.assertEqual(list(NotificationService.get_audience('doctors')), [self.doctor_user])
+        self.assertEqual(list(NotificationService.get_audience('department', department_id=self.department.id)), [self.doctor_user])
+        self.assertEqual(NotificationService.get_audience('patients').count(), 20)
+        self.assertEqual(
+            set(NotificationService.get_audience('appointments', date=self.work_date)),
+            set(self.patient_users[:2])
+        )
+        self.assertFalse(NotificationService.get_audience('appointments', date=self.work_date + timedelta(days=1)).exists())
+        with self.assertRaises(ValueError):
+            NotificationService.get_audience('everyone')
+
+    def test_broadcast_is_sent_in_parallel_multicasts(self):
+        NotificationService.create_bulk(NotificationService.get_audience('patients'), "Thông báo", "Phòng khám nghỉ lễ", NotificationType.SYSTEM.value)
+        backend = FakeFCMBackend()
+        with patch('notifications.services.FCM_MULTICAST_LIMIT', 8):
+            result = NotificationDispatchService(backend=backend).dispatch_pending()
+
+        self.assertEqual(result, {'sent': 40, 'failed': 0, 'retried': 0})
+        self.assertEqual(sorted(len(call['tokens']) for call in backend.calls), [8, 8, 8, 8, 8])
+
+
+@override_settings(PUSH_NOTIFICATIONS=PUSH_SETTINGS)
+class TokenServiceTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='patient@example.com', password='testpass123', role=UserRole.PATIENT.value)
+        cls.other_user = User.objects.create_user(email='other@example.com', password='testpass123', role=UserRole.PATIENT.value)
+
+    def test_add_token_is_idempotent(self):
+        first = TokenService.add_token(self.user, "device-token")
+        second = TokenService.add_token(self.user, "device-token")
+
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(Token.objects.filter(token="device-token").count(), 1)
+        self.assertGreaterEqual(Token.objects.get().updated_at, first.updated_at)
+
+    def test_add_token_moves_device_to_new_user(self):
+        TokenService.add_token(self.user, "device-token")
+        TokenService.add_token(self.other_user, "device-token")
+
+        self.assertEqual(TokenService.get_tokens_by_user_id(self.user.id), [])
+        self.assertEqual(TokenService.get_tokens_by_user_id(self.other_user.id), ["device-token"])
+
+    def test_dispatch_prunes_dead_tokens(self):
+        TokenService.add_token(self.user, "dead-token")
+        TokenService.add_token(self.user, "live-token")
+        data = {'user': self.user, 'title': "Hóa đơn", 'message': "Bạn có hóa đơn mới", 'type': NotificationType.BILL.value}
+        NotificationService.create(data)
+        backend = FakeFCMBackend()
+        backend.fail_token("dead-token", 'UNREGISTERED')
+
+        NotificationDispatchService(backend=backend).dispatch_pending(batch_size=2)
+        self.assertEqual(TokenService.get_tokens_by_user_id(self.user.id), ["live-token"])
+
+        NotificationService.create(data)
+        NotificationDispatchService(backend=backend).dispatch_pending()
+        self.assertEqual(backend.sent_tokens, ["dead-token", "live-token", "live-token"])
+
+    def test_prune_tokens_cancels_pending_deliveries(self):
+        TokenService.add_token(self.user, "dead-token")
+        NotificationService.create({'user': self.user, 'title': "Hóa đơn", 'message': "Bạn có hóa đơn mới", 'type': NotificationType.BILL.value})
+
+        self.assertEqual(TokenService.prune_tokens(["dead-token"]), 1)
+        delivery = NotificationDelivery.objects.get()
+        self.assertEqual(delivery.status, PushDeliveryStatus.FAILED.value)
+        self.assertEqual(delivery.error_code, 'UNREGISTERED')
+
+    def test_compact_tokens(self):
+        Token.objects.bulk_create([
+            Token(user=self.user, token="shared-token"),
+            Token(user=self.other_user, token="shared-token"),
+            Token(user=self.user, token="dead-token"),
+            Token(user=self.user, token="live-token"),
+        ])
+        notification = Notification.objects.create(user=self.user, title="Hóa đơn", message="x", type=NotificationType.BILL.value)
+        NotificationDelivery.objects.create(
+            notification=notification, token="dead-token", status=PushDeliveryStatus.FAILED.value, error_code='UNREGISTERED'
+        )
+
+        self.assertEqual(TokenService.compact_tokens(dry_run=True), {'duplicates': 1, 'dead': 1})
+        self.assertEqual(Token.objects.count(), 4)
+        self.assertEqual(TokenService.compact_tokens(), {'duplicates': 1, 'dead': 1})
+        self.assertEqual(
+            sorted(Token.objects.values_list('user_id', 'token')),
+            sorted([(self.other_user.id, "shared-token"), (self.user.id, "live-token")])
+        )
+
+
+class FlakyEmailBackend(BaseEmailBackend):
+    """Backend email cho test: đếm số kết nối và làm lỗi các email gửi tới địa chỉ chỉ định."""
+    opened = 0
+    sent = []
+    fail_addresses = {}
+
+    def open(self):
+        FlakyEmailBackend.opened += 1
+        return True
+
+    def send_messages(self, email_messages):
+        for message in email_messages:
+            error = self.fail_addresses.get(message.to[0])
+            if error:
+                raise error
+            FlakyEmailBackend.sent.append(message)
+        return len(email_messages)
+
+
+@override_settings(
+    EMAIL_BACKEND='notifications.tests.test_services.FlakyEmailBackend',
+    EMAIL_OUTBOX={'max_attempts': 2, 'backoff': 30.0, 'lease': 300.0}
+)
+class EmailOutboxServiceTest(TestCase):
+    def setUp(self):
+        FlakyEmailBackend.opened = 0
+        FlakyEmailBackend.sent = []
+        FlakyEmailBackend.fail_addresses = {}
+        self.service = EmailOutboxService()
+
+    def test_queue_does_not_send(self):
+        email = EmailOutboxService.queue("Xác nhận email", "Mã OTP của bạn là: 123456", ['a@example.com'])
+
+        self.assertEqual(email.status, EmailStatus.PENDING.value)
+        self.assertEqual(FlakyEmailBackend.opened, 0)
+
+    def test_batch_uses_one_connection(self):
+        for i in range(5):
+            EmailOutboxService.queue("Xác nhận email", f"Mã OTP {i}", [f'user{i}@example.com'])
+
+        self.assertEqual(self.service.send_pending(), {'sent': 5, 'failed': 0, 'retried': 0})
+        self.assertEqual(FlakyEmailBackend.opened, 1)
+        self.assertEqual([m.to for m in FlakyEmailBackend.sent], [[f'user{i}@example.com'] for i in range(5)])
+        self.assertFalse(EmailOutbox.objects.exclude(status=EmailStatus.SENT.value).exists())
+        self.assertEqual(self.service.send_pending(), {'sent': 0, 'failed': 0, 'retried': 0})
+
+    def test_transient_error_is_retried_with_backoff(self):
+        FlakyEmailBackend.fail_addresses = {'a@example.com': smtplib.SMTPServerDisconnected("Connection unexpectedly closed")}
+        EmailOutboxService.queue("Xác nhận email", "Mã OTP", ['a@example.com'])
+        EmailOutboxService.queue("Xác nhận email", "Mã OTP", ['b@example.com'])
+
+        self.assertEqual(self.service.send_pending(), {'sent': 1, 'failed': 0, 'retried': 1})
+        email = EmailOutbox.objects.get(recipients=['a@example.com'])
+        self.assertEqual(email.status, EmailStatus.PENDING.value)
+        self.assertGreater(email.next_attempt_at, timezone.now() + timedelta(seconds=20))
+        self.assertEqual(self.service.send_pending(), {'sent': 0, 'failed': 0, 'retried': 0})
+
+        EmailOutbox.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(self.service.send_pending(), {'sent': 0, 'failed': 1, 'retried': 0})
+        email.refresh_from_db()
+        self.assertEqual(email.status, EmailStatus.FAILED.value)
+        self.assertEqual(email.attempts, 2)
+
+    def test_body_is_redacted_once_sent_or_failed(self):
+        FlakyEmailBackend.fail_addresses = {
+            'b@example.com': smtplib.SMTPServerDisconnected("Connection unexpectedly closed"),
+            'c@example.com': smtplib.SMTPRecipientsRefused({'c@example.com': (550, b'No such user')}),
+        }
+        for address in ('a@example.com', 'b@example.com', 'c@example.com'):
+            EmailOutboxService.queue("Xác nhận email", "Mã OTP của bạn là: 123456", [address])
+
+        self.assertEqual(self.service.send_pending(), {'sent': 1, 'failed': 1, 'retried': 1})
+        self.assertEqual(FlakyEmailBackend.sent[0].body, "Mã OTP của bạn là: 123456")
+        bodies = {email.recipients[0]: email.body for email in EmailOutbox.objects.all()}
+        # Email còn chờ gửi lại vẫn cần nội dung; email đã gửi / bỏ hẳn thì không
+        self.assertEqual(bodies, {'a@example.com': '', 'b@example.com': "Mã OTP của bạn là: 123456", 'c@example.com': ''})
+
+    def test_redact_email_outbox_migration(self):
+        from importlib import import_module
+        from django.apps import apps
+        migration = import_module('notifications.migrations.0008_redact_email_outbox')
+        pending = EmailOutboxService.queue("Xác nhận email", "Mã OTP 1", ['a@example.com'])
+        sent = EmailOutboxService.queue("Xác nhận email", "Mã OTP 2", ['b@example.com'])
+        EmailOutbox.objects.filter(id=sent.id).update(status=EmailStatus.SENT.value)
+
+        migration.redact_finished_emails(apps, None)
+        self.assertEqual(EmailOutbox.objects.get(id=pending.id).body, "Mã OTP 1")
+        self.assertEqual(EmailOutbox.objects.get(id=sent.id).body, '')
+
+    def test_refused_recipient_is_not_retried(self):
+        FlakyEmailBackend.fail_addresses = {'a@example.com': smtplib.SMTPRecipientsRefused({'a@example.com': (550, b'No such user')})}
+        EmailOutboxService.queue("Xác nhận email", "Mã OTP", ['a@example.com'])
+
+        self.assertEqual(self.service.send_pending(), {'sent': 0, 'failed': 1, 'retried': 0})
@@ -0,0 +1,77 @@
+from rest_framework import status
+from rest_framework.test import APITestCase
+from notifications.models import Notification, NotificationDelivery, Token
+from users.models import User
+from common.enums import NotificationType, UserRole
+
+
+class BroadcastNotificationViewTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(email='admin@example.com', password='testpass123', role=UserRole.ADMIN.value)
+        cls.doctor_user = User.objects.create_user(email='doctor@example.com', password='testpass123', role=UserRole.DOCTOR.value)
+        cls.patient_user = User.objects.create_user(email='patient@example.com', password='testpass123', role=UserRole.PATIENT.value)
+        Token.objects.create(user=cls.doctor_user, token="doctor-token")
+        Token.objects.create(user=cls.patient_user, token="patient-token")
+
+    def setUp(self):
+        self.client.force_authenticate(user=self.admin)
+        self.url = '/api/v1/notifications/broadcast/'
+        self.data = {'title': "Thông báo", 'message': "Họp giao ban", 'type': NotificationType.SYSTEM.value}
+
+    def test_broadcast_to_audience(self):
+        response = self.client.post(self.url, {**self.data, 'audience': 'doctors'}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data, {'notifications': 1, 'deliveries': 1})
+        self.assertEqual(NotificationDelivery.objects.get().token, "doctor-token")
+
+    def test_broadcast_to_user_ids(self):
+        response = self.client.post(self.url, {**self.data, 'user_ids': [self.doctor_user.id, self.patient_user.id]}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(Notification.objects.count(), 2)
+
+    def test_broadcast_requires_one_target(self):
+        response = self.client.post(self.url, self.data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(self.url, {**self.data, 'audience': 'department'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('department_id', response.data)
+
+    def test_broadcast_requires_admin(self):
+        self.client.force_authenticate(user=self.patient_user)
+        response = self.client.post(self.url, {**self.data, 'audience': 'doctors'}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(Notification.objects.exists())
+
+
+class TokenViewTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='patient@example.com', password='testpass123', role=UserRole.PATIENT.value)
+
+    def setUp(self):
+        self.client.force_authenticate(user=self.user)
+
+    def test_register_token_twice_keeps_one_row(self):
+        for _ in range(2):
+            response = self.client.post('/api/v1/tokens/', {'user': self.user.id, 'token': "device-token"}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        self.assertEqual(Token.objects.filter(user=self.user, token="device-token").count(), 1)
+        self.assertEqual(response.data['id'], Token.objects.get().id)
+
+    def test_update_token_to_existing_value(self):
+        Token.objects.create(user=self.user, token="device-token")
+        token = Token.objects.create(user=self.user, token="old-token")
+        response = self.client.patch(f'/api/v1/tokens/{token.id}/', {'token': "device-token"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['id'], token.id)
+        self.assertEqual(list(Token.objects.values_list('id', 'token')), [(token.id, "device-token")])
+
+        response = self.client.put(f'/api/v1/tokens/{token.id}/', {'user': self.user.id, 'token': "device-token"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Token.objects.count(), 1)
@@ -1,6 +1,9 @@
-from rest_framework import viewsets
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
 from .models import Notification, Token
-from .serializers import NotificationSerializer, TokenSerializer
+from .serializers import BroadcastNotificationSerializer, NotificationSerializer, TokenSerializer
 from django.test import TestCase
 from .services import NotificationService, TokenService
 
@@ -10,8 +13,36 @@ class NotificationViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return NotificationService.get_all_notifications()
 
+    @action(detail=False, methods=['post'], url_path='broadcast')
+    def broadcast(self, request):
+        if request.user.role != 'A':
+            return Response({"error": _("Bạn không có quyền gửi thông báo hàng loạt")}, status=status.HTTP_403_FORBIDDEN)
+        serializer = BroadcastNotificationSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        if 'user_ids' in data:
+            users = data['user_ids']
+        else:
+            users = NotificationService.get_audience(data['audience'], department_id=data.get('department_id'), date=data.get('date'))
+        result = NotificationService.create_bulk(users, data['title'], data['message'], data['type'])
+        return Response(result, status=status.HTTP_202_ACCEPTED)
+
 class TokenViewSet(viewsets.ModelViewSet):
     serializer_class = TokenSerializer
 
     def get_queryset(self):
         return TokenService.get_all_tokens()
+
+    def perform_create(self, serializer):
+        # Đăng ký lại token đã có không tạo dòng mới
+        serializer.instance = TokenService.add_token(serializer.validated_data['user'], serializer.validated_data['token'])
+
+    def perform_update(self, serializer):
+        # validators=[] nên token trùng phải được gỡ ở service, tránh vi phạm unique (user, token)
+        instance = serializer.instance
+        serializer.instance = TokenService.update_token(
+            instance,
+            serializer.validated_data.get('user', instance.user),
+            serializer.validated_data.get('token', instance.token),
+        )
@@ -0,0 +1,41 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from patients.services import PatientImportService
+
+
+class Command(BaseCommand):
+    help = "Nhập bệnh nhân hàng loạt từ file CSV, ghi báo cáo lỗi theo từng dòng"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File CSV có dòng tiêu đề")
+        parser.add_argument('--chunk-size', type=int, default=None)
+        parser.add_argument('--workers', type=int, default=None, help="Số process băm mật khẩu")
+        parser.add_argument('--report', help="Ghi các dòng lỗi ra file CSV (row, field, message)")
+
+    def handle(self, *args, **options):
+        service = PatientImportService(chunk_size=options['chunk_size'], workers=options['workers'])
+        started = time.perf_counter()
+        try:
+            with open(options['path'], encoding='utf-8-sig', newline='') as file:
+                result = service.import_csv(file)
+        except OSError as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - started
+
+        if options['report']:
+            with open(options['report'], 'w', encoding='utf-8', newline='') as report:
+                writer = csv.writer(report)
+                writer.writerow(['row', 'field', 'message'])
+                for error in result['errors']:
+                    for field, messages in error['errors'].items():
+                        for message in messages:
+                            writer.writerow([error['row'], field, message])
+
+        for error in result['errors']:
+            for message in error['errors'].get('file', []):
+                self.stderr.write(f"Stopped at row {error['row']}: {message}")
+        self.stdout.write(
+            f"Created {result['created']} patient(s), {result['failed']} row(s) failed in {elapsed:.1f}s"
+        )
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+from common.utils import normalize_search_text
+
+
+def fill_search_name(apps, schema_editor):
+    Patient = apps.get_model("patients", "Patient")
+    batch = []
+    for patient in Patient.objects.only("id", "first_name", "last_name").iterator(chunk_size=2000):
+        patient.search_name = normalize_search_text(f"{patient.first_name or ''} {patient.last_name or ''}")
+        batch.append(patient)
+        if len(batch) >= 2000:
+            Patient.objects.bulk_update(batch, ["search_name"])
+            batch = []
+    if batch:
+        Patient.objects.bulk_update(batch, ["search_name"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("patients", "0003_patient_avatar_alter_patient_gender"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="patient",
+            name="search_name",
+            field=models.CharField(
+                blank=True, default="", editable=False, max_length=201
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="patient",
+            index=models.Index(
+                fields=["search_name", "id"], name="patient_search_name_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="patient",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="patient_created_idx"
+            ),
+        ),
+        migrations.RunPython(fill_search_name, migrations.RunPython.noop),
+    ]
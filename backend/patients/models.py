@@ -3,6 +3,7 @@ from core.models import BaseModel
 from common.enums import Gender
 from common.constants import PATIENT_LENGTH, COMMON_LENGTH, USER_LENGTH, ENUM_LENGTH
 from users.models import User
+from common.utils import normalize_search_text
 
 class Patient(BaseModel):
     user = models.OneToOneField(User, on_delete=models.RESTRICT)
@@ -33,6 +34,25 @@ class Patient(BaseModel):
         blank=True, null=True
     )
     avatar = models.CharField(max_length=PATIENT_LENGTH["AVATAR"], blank=True, null=True)
+    # Họ tên không dấu, chữ thường để tìm kiếm và sắp xếp; cập nhật trong save()
+    search_name = models.CharField(max_length=PATIENT_LENGTH["SEARCH_NAME"], blank=True, default='', editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['search_name', 'id'], name='patient_search_name_idx'),
+            models.Index(fields=['-created_at', '-id'], name='patient_created_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.search_name = self.build_search_name(self.first_name, self.last_name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'first_name', 'last_name'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'search_name'}
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def build_search_name(first_name, last_name):
+        return normalize_search_text(f"{first_name or ''} {last_name or ''}")
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
@@ -1,7 +1,14 @@
 from rest_framework import serializers
 from .models import Patient, EmergencyContact
 from common.enums import Gender
-from common.constants import PATIENT_LENGTH, COMMON_LENGTH, USER_LENGTH, ENUM_LENGTH, DOCTOR_LENGTH
+from common.pagination import KeysetPagination
+from common.constants import (
+    PATIENT_LENGTH, COMMON_LENGTH, USER_LENGTH, ENUM_LENGTH, DOCTOR_LENGTH, REGEX_PATTERNS,
+    DECIMAL_MAX_DIGITS, DECIMAL_DECIMAL_PLACES
+)
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.validators import RegexValidator
 from django.utils.translation import gettext_lazy as _
 
 
@@ -76,5 +83,184 @@ class PatientSerializer(serializers.ModelSerializer):
         }
     
     def get_emergency_contacts(self, obj):
-        emergency_contacts = EmergencyContact.objects.filter(patient=obj)
-        return EmergencyContactSerializer(emergency_contacts, many=True).data
+        # Dùng kết quả prefetch_related('emergencycontact_set') nếu có, tránh một truy vấn mỗi bệnh nhân
+        return EmergencyContactSerializer(obj.emergencycontact_set.all(), many=True).data
+
+
+# Giá trị ?sort -> cột sắp xếp; luôn kèm id để thứ tự ổn định cho phân trang con trỏ
+PATIENT_DIRECTORY_SORTS = {
+    'name': ('search_name', 'id'),
+    '-name': ('-search_name', '-id'),
+    'createdAt': ('created_at', 'id'),
+    '-createdAt': ('-created_at', '-id'),
+    'birthday': ('birthday', 'id'),
+    '-birthday': ('-birthday', '-id'),
+}
+
+
+class PatientDirectoryFilterSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=PATIENT_LENGTH["SEARCH_NAME"], required=False)
+    identityNumber = serializers.CharField(
+        max_length=PATIENT_LENGTH["IDENTITY"], required=False, source='identity_number'
+    )
+    insuranceNumber = serializers.CharField(
+        max_length=PATIENT_LENGTH["INSURANCE"], required=False, source='insurance_number'
+    )
+    phone = serializers.CharField(max_length=USER_LENGTH["PHONE"], required=False)
+    sort = serializers.ChoiceField(choices=list(PATIENT_DIRECTORY_SORTS), default='-createdAt')
+    view = serializers.ChoiceField(choices=['summary', 'full'], default='summary')
+
+
+class PatientSummarySerializer(serializers.Serializer):
+    """Một dòng danh bạ bệnh nhân, đọc từ dict của PatientService.DIRECTORY_FIELDS"""
+    id = serializers.IntegerField()
+    first_name = serializers.CharField()
+    last_name = serializers.CharField()
+    birthday = serializers.DateField()
+    gender = serializers.CharField()
+    identity_number = serializers.CharField()
+    insurance_number = serializers.CharField()
+    phone = serializers.CharField()
+    email = serializers.CharField()
+    avatar = serializers.CharField(allow_null=True)
+    created_at = serializers.DateTimeField()
+
+
+class PatientCursorPagination(KeysetPagination):
+    ordering = PATIENT_DIRECTORY_SORTS['-createdAt']
+    sorts = PATIENT_DIRECTORY_SORTS
+
+
+class PatientImportRowSerializer(serializers.Serializer):
+    """Một dòng của file CSV nhập bệnh nhân; người liên hệ khẩn cấp (tùy chọn) nằm trên cùng dòng"""
+    phone_validator = RegexValidator(REGEX_PATTERNS["PHONE"], message=_("Số điện thoại không hợp lệ"))
+
+    email = serializers.EmailField(max_length=USER_LENGTH["EMAIL"])
+    phone = serializers.CharField(max_length=USER_LENGTH["PHONE"], validators=[phone_validator])
+    password = serializers.CharField(max_length=USER_LENGTH["PASSWORD"], required=False)
+    identity_number = serializers.CharField(max_length=PATIENT_LENGTH["IDENTITY"])
+    insurance_number = serializers.CharField(max_length=PATIENT_LENGTH["INSURANCE"])
+    first_name = serializers.CharField(max_length=COMMON_LENGTH["NAME"])
+    last_name = serializers.CharField(max_length=COMMON_LENGTH["NAME"])
+    birthday = serializers.DateField()
+    gender = serializers.ChoiceField(choices=[(g.value, g.name) for g in Gender])
+    address = serializers.CharField(max_length=COMMON_LENGTH["ADDRESS"], required=False)
+    allergies = serializers.CharField(required=False)
+    height = serializers.IntegerField(required=False)
+    weight = serializers.IntegerField(required=False)
+    blood_type = serializers.CharField(max_length=PATIENT_LENGTH["BLOOD_TYPE"], required=False)
+    contact_name = serializers.CharField(max_length=COMMON_LENGTH["NAME"], required=False)
+    contact_phone = serializers.CharField(max_length=USER_LENGTH["PHONE"], required=False)
+    relationship = serializers.CharField(max_length=PATIENT_LENGTH["RELATIONSHIP"], required=False)
+
+    def validate_email(self, value):
+        return value.lower()
+
+    def validate_password(self, value):
+        try:
+            validate_password(value)
+        except DjangoValidationError as e:
+            raise serializers.ValidationError(list(e.messages))
+        return value
+
+    def validate(self, data):
+        contact = [data.get(field) for field in ('contact_name', 'contact_phone', 'relationship')]
+        if any(contact) and not all(contact):
+            raise serializers.ValidationError(
+                {"contact": _("Cần đủ tên, số điện thoại và quan hệ của người liên hệ khẩn cấp")}
+            )
+        return data
+
+
+class PatientOverviewQuerySerializer(serializers.Serializer):
+    """?sections=profile,appointments,... (mặc định: tất cả)"""
+    SECTIONS = ('profile', 'appointments', 'prescriptions', 'bills', 'results')
+
+    sections = serializers.CharField(required=False)
+
+    def validate_sections(self, value):
+        sections = [section.strip() for section in value.split(',') if section.strip()]
+        invalid = [section for section in sections if section not in self.SECTIONS]
+        if invalid:
+            raise serializers.ValidationError(
+                _("Phần không hợp lệ: %(sections)s") % {'sections': ', '.join(invalid)}
+            )
+        return sections
+
+
+class OverviewAppointmentSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    status = serializers.CharField()
+    symptoms = serializers.CharField(allow_null=True)
+    slot_start = serializers.TimeField(allow_null=True)
+    slot_end = serializers.TimeField(allow_null=True)
+    created_at = serializers.DateTimeField()
+    schedule_id = serializers.IntegerField()
+    work_date = serializers.DateField(source='schedule.work_date')
+    shift = serializers.CharField(source='schedule.shift')
+    room_id = serializers.IntegerField(source='schedule.room_id')
+    doctor_id = serializers.IntegerField()
+    doctor_name = serializers.SerializerMethodField()
+    department_name = serializers.CharField(source='doctor.department.department_name')
+
+    def get_doctor_name(self, obj):
+        return f"{obj.doctor.first_name} {obj.doctor.last_name}"
+
+
+class OverviewPrescriptionDetailSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    medicine_id = serializers.IntegerField()
+    medicine_name = serializers.CharField(source='medicine.medicine_name')
+    unit = serializers.CharField(source='medicine.unit')
+    dosage = serializers.CharField()
+    frequency = serializers.CharField()
+    duration = serializers.CharField()
+    quantity = serializers.IntegerField()
+    prescription_notes = serializers.CharField(allow_null=True)
+
+
+class OverviewPrescriptionSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    appointment_id = serializers.IntegerField()
+    diagnosis = serializers.CharField()
+    follow_up_date = serializers.DateField(allow_null=True)
+    is_follow_up = serializers.BooleanField()
+    note = serializers.CharField(allow_null=True)
+    created_at = serializers.DateTimeField()
+    prescription_details = OverviewPrescriptionDetailSerializer(many=True)
+
+
+class OverviewBillDetailSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    item_type = serializers.CharField()
+    quantity = serializers.IntegerField()
+    unit_price = serializers.DecimalField(max_digits=DECIMAL_MAX_DIGITS, decimal_places=DECIMAL_DECIMAL_PLACES)
+    total_price = serializers.DecimalField(max_digits=DECIMAL_MAX_DIGITS, decimal_places=DECIMAL_DECIMAL_PLACES)
+    insurance_discount = serializers.DecimalField(
+        max_digits=DECIMAL_MAX_DIGITS, decimal_places=DECIMAL_DECIMAL_PLACES, allow_null=True
+    )
+
+
+class OverviewBillSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    appointment_id = serializers.IntegerField()
+    status = serializers.CharField()
+    total_cost = serializers.DecimalField(max_digits=DECIMAL_MAX_DIGITS, decimal_places=DECIMAL_DECIMAL_PLACES)
+    insurance_discount = serializers.DecimalField(
+        max_digits=DECIMAL_MAX_DIGITS, decimal_places=DECIMAL_DECIMAL_PLACES, allow_null=True
+    )
+    amount = serializers.DecimalField(max_digits=DECIMAL_MAX_DIGITS, decimal_places=DECIMAL_DECIMAL_PLACES)
+    created_at = serializers.DateTimeField()
+    details = OverviewBillDetailSerializer(many=True)
+
+
+class OverviewResultSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    appointment_id = serializers.IntegerField()
+    service_id = serializers.IntegerField()
+    service_name = serializers.CharField(source='service.service_name')
+    service_type = serializers.CharField(source='service.service_type')
+    room_id = serializers.IntegerField()
+    result = serializers.CharField(allow_null=True)
+    result_time = serializers.DateTimeField(allow_null=True)
+    result_file_url = serializers.CharField(allow_null=True)
@@ -1,7 +1,19 @@
+import csv
+import io
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
 from django.shortcuts import get_object_or_404
-from django.db import transaction
+from django.db import transaction, IntegrityError
+from django.core.cache import cache
+from django.db.models import F, Prefetch
 from django.utils import timezone
+from django.utils.translation import gettext as _
 from .models import Patient, EmergencyContact
+from .serializers import (
+    PatientImportRowSerializer, PatientSerializer, PatientOverviewQuerySerializer, OverviewAppointmentSerializer,
+    OverviewPrescriptionSerializer, OverviewBillSerializer, OverviewResultSerializer
+)
+from common.utils import normalize_search_text
 import cloudinary.uploader
 class PatientService:
     def create_patient(self, data):
@@ -48,6 +60,37 @@ class PatientService:
 
         return patient
     
+    # Cột của một dòng danh bạ (view=summary); search_name, created_at, birthday dùng làm vị trí con trỏ
+    DIRECTORY_FIELDS = (
+        'id', 'first_name', 'last_name', 'birthday', 'gender', 'identity_number', 'insurance_number',
+        'avatar', 'created_at', 'search_name',
+    )
+
+    def search_patients(self, name=None, identity_number=None, insurance_number=None, phone=None):
+        """
+        Lọc bệnh nhân: tên không phân biệt dấu/hoa thường (khớp một phần), các trường còn lại khớp chính xác
+        """
+        patients = Patient.objects.all()
+        name = normalize_search_text(name)
+        if name:
+            patients = patients.filter(search_name__contains=name)
+        if identity_number:
+            patients = patients.filter(identity_number=identity_number.strip())
+        if insurance_number:
+            patients = patients.filter(insurance_number=insurance_number.strip())
+        if phone:
+            patients = patients.filter(user__phone=phone.strip())
+        return patients
+
+    def get_directory(self, view='summary', **filters):
+        """
+        summary: chỉ lấy các cột của danh bạ (dict, một truy vấn), full: Patient kèm user và người liên hệ khẩn cấp
+        """
+        patients = self.search_patients(**filters)
+        if view == 'full':
+            return patients.select_related('user').prefetch_related('emergencycontact_set')
+        return patients.values(*self.DIRECTORY_FIELDS, phone=F('user__phone'), email=F('user__email'))
+
     def upload_avatar(self, patient, file):
         try:
             # Upload file lên Cloudinary
@@ -124,3 +167,274 @@ class EmergencyContactService:
     def delete_emergency_contact(self, contact_id, patient_id):
         contact = self.get_contact_by_id_and_patient_id(contact_id, patient_id)
         contact.delete()
+
+
+class PatientImportService:
+    """
+    Nhập bệnh nhân từ CSV theo lô: kiểm tra từng dòng, kiểm tra trùng email, SĐT, CCCD, BHYT bằng một truy vấn
+    cho mỗi cột mỗi lô, băm mật khẩu song song bằng process pool rồi bulk_create user, bệnh nhân và người liên hệ.
+    Mỗi lô ghi trong một transaction; lô trước đã ghi nên trùng lặp giữa các lô được phát hiện khi kiểm tra CSDL.
+    """
+    UNIQUE_FIELDS = ('email', 'phone', 'identity_number', 'insurance_number')
+
+    def __init__(self, chunk_size=None, workers=None):
+        self.chunk_size = chunk_size or settings.PATIENT_IMPORT['chunk_size']
+        self.workers = workers or settings.PATIENT_IMPORT['workers']
+        self._pool = None
+
+    def import_csv(self, file):
+        """
+        `file` là file CSV (văn bản hoặc nhị phân UTF-8) có dòng tiêu đề theo tên trường của PatientImportRowSerializer.
+        Trả về {'created', 'failed', 'errors': [{'row': số dòng trong file, 'errors': {trường: [thông báo]}}]}.
+        File không đọc được (sai mã hóa, CSV hỏng) dừng tại chỗ lỗi và được báo bằng một lỗi trường `file`.
+        """
+        if not isinstance(file, io.TextIOBase):
+            file = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+        result = {'created': 0, 'failed': 0, 'errors': []}
+        try:
+            chunk = []
+            file_error = None
+            # Dòng 1 là tiêu đề
+            row_number = 1
+            try:
+                for row_number, row in enumerate(csv.DictReader(file), start=2):
+                    chunk.append((row_number, row))
+                    if len(chunk) >= self.chunk_size:
+                        self._import_chunk(chunk, result)
+                        chunk = []
+            except (UnicodeDecodeError, csv.Error) as e:
+                file_error = {
+                    'row': row_number + 1,
+                    'errors': {'file': [str(_("Không đọc được file CSV: %(error)s") % {'error': e})]},
+                }
+            if chunk:
+                self._import_chunk(chunk, result)
+            if file_error:
+                result['errors'].append(file_error)
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+        return result
+
+    @staticmethod
+    def _fail(result, row_number, errors):
+        result['failed'] += 1
+        result['errors'].append({
+            'row': row_number,
+            'errors': {
+                field: [str(message) for message in (messages if isinstance(messages, list) else [messages])]
+                for field, messages in errors.items()
+            },
+        })
+
+    def _validate(self, chunk, result):
+        rows = []
+        seen = {field: {} for field in self.UNIQUE_FIELDS}
+        for row_number, row in chunk:
+            data = {key.strip(): value.strip() for key, value in row.items() if key and value and value.strip()}
+            serializer = PatientImportRowSerializer(data=data)
+            if not serializer.is_valid():
+                self._fail(result, row_number, serializer.errors)
+                continue
+            data = serializer.validated_data
+            errors = {
+                field: _("Trùng với dòng %(row)s") % {'row': seen[field][data[field]]}
+                for field in self.UNIQUE_FIELDS if data[field] in seen[field]
+            }
+            if errors:
+                self._fail(result, row_number, errors)
+                continue
+            for field in self.UNIQUE_FIELDS:
+                seen[field][data[field]] = row_number
+            rows.append((row_number, data))
+        return rows
+
+    def _existing_values(self, rows):
+        from users.models import User
+        users = User.objects.all_with_deleted()
+        patients = Patient.objects.all()
+        values = {field: [data[field] for _row, data in rows] for field in self.UNIQUE_FIELDS}
+        return {
+            'email': set(users.filter(email__in=values['email']).values_list('email', flat=True)),
+            'phone': set(users.filter(phone__in=values['phone']).values_list('phone', flat=True)),
+            'identity_number': set(
+                patients.filter(identity_number__in=values['identity_number']).values_list('identity_number', flat=True)
+            ),
+            'insurance_number': set(
+                patients.filter(insurance_number__in=values['insurance_number']).values_list('insurance_number', flat=True)
+            ),
+        }
+
+    def _hash_passwords(self, passwords):
+        from users.hashers import hash_password, init_hash_worker
+        if self.workers > 1 and len(passwords) > 1:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=init_hash_worker)
+            return list(self._pool.map(hash_password, passwords, chunksize=max(1, len(passwords) // (self.workers * 4))))
+        return [hash_password(password) for password in passwords]
+
+    def _import_chunk(self, chunk, result):
+        rows = self._validate(chunk, result)
+        if not rows:
+            return
+
+        existing = self._existing_values(rows)
+        messages = {
+            'email': _("Email đã được sử dụng"),
+            'phone': _("Số điện thoại đã được sử dụng"),
+            'identity_number': _("CCCD đã tồn tại"),
+            'insurance_number': _("Số BHYT đã tồn tại"),
+        }
+        new_rows = []
+        for row_number, data in rows:
+            errors = {field: messages[field] for field in self.UNIQUE_FIELDS if data[field] in existing[field]}
+            if errors:
+                self._fail(result, row_number, errors)
+            else:
+                new_rows.append((row_number, data))
+        if not new_rows:
+            return
+
+        passwords = self._hash_passwords([data.get('password') for _row, data in new_rows])
+        rows = [(row_number, data, password) for (row_number, data), password in zip(new_rows, passwords)]
+        try:
+            with transaction.atomic():
+                self._create(rows)
+            result['created'] += len(rows)
+        except IntegrityError:
+            # Dữ liệu được tạo bởi request khác giữa lúc kiểm tra và lúc ghi: ghi lại từng dòng để tách dòng lỗi
+            for row in rows:
+                try:
+                    with transaction.atomic():
+                        self._create([row])
+                    result['created'] += 1
+                except IntegrityError:
+                    self._fail(result, row[0], {'non_field_errors': _("Dữ liệu bệnh nhân đã tồn tại")})
+
+    @staticmethod
+    def _create(rows):
+        from users.models import User
+        from common.enums import UserRole
+        users = User.objects.bulk_create([
+            User(email=data['email'], phone=data['phone'], password=password, role=UserRole.PATIENT.value)
+            for _row, data, password in rows
+        ])
+        patients = Patient.objects.bulk_create([
+            Patient(
+                user=user,
+                identity_number=data['identity_number'],
+                insurance_number=data['insurance_number'],
+                first_name=data['first_name'],
+                last_name=data['last_name'],
+                birthday=data['birthday'],
+                gender=data['gender'],
+                address=data.get('address'),
+                allergies=data.get('allergies'),
+                height=data.get('height'),
+                weight=data.get('weight'),
+                blood_type=data.get('blood_type'),
+                search_name=Patient.build_search_name(data['first_name'], data['last_name']),
+            )
+            for user, (_row, data, _password) in zip(users, rows)
+        ])
+        EmergencyContact.objects.bulk_create([
+            EmergencyContact(
+                patient=patient,
+                contact_name=data['contact_name'],
+                contact_phone=data['contact_phone'],
+                relationship=data['relationship'],
+            )
+            for patient, (_row, data, _password) in zip(patients, rows) if data.get('contact_name')
+        ])
+
+
+class PatientOverviewService:
+    """
+    Hồ sơ tổng hợp của bệnh nhân: thông tin, lịch hẹn, đơn thuốc, hóa đơn chưa thanh toán xong và kết quả dịch vụ.
+    Mỗi phần được nạp bằng số truy vấn cố định (tối đa 8 cho cả hồ sơ) rồi lưu cache theo bệnh nhân;
+    ghi dữ liệu ở các app (patients/signals.py) chỉ xóa phần bị ảnh hưởng. Việc xóa chỉ tới được các worker khác
+    khi dùng cache chung (Redis); với LocMem dữ liệu cũ tồn tại tối đa PATIENT_OVERVIEW['cache_ttl'] giây.
+    """
+    SECTIONS = PatientOverviewQuerySerializer.SECTIONS
+    KEY = 'patient_overview:{patient_id}:{section}'
+
+    @classmethod
+    def make_key(cls, patient_id, section):
+        return cls.KEY.format(patient_id=patient_id, section=section)
+
+    def get_overview(self, patient_id, sections=None):
+        """
+        Trả về dict {section: data} theo thứ tự của SECTIONS; None nếu bệnh nhân không tồn tại
+        """
+        sections = [section for section in self.SECTIONS if not sections or section in sections]
+        keys = {section: self.make_key(patient_id, section) for section in sections}
+        cached = cache.get_many(list(keys.values()))
+        data = {section: cached[key] for section, key in keys.items() if key in cached}
+        missing = [section for section in sections if section not in data]
+
+        if missing:
+            if 'profile' not in data and 'profile' not in missing and not Patient.objects.filter(pk=patient_id).exists():
+                return None
+            for section in missing:
+                data[section] = getattr(self, f"_load_{section}")(patient_id)
+            if 'profile' in missing and data['profile'] is None:
+                return None
+            cache.set_many(
+                {keys[section]: data[section] for section in missing}, settings.PATIENT_OVERVIEW['cache_ttl']
+            )
+        return {section: data[section] for section in sections}
+
+    @classmethod
+    def invalidate(cls, patient_id, *sections):
+        """Xóa cache các phần (mặc định: tất cả) sau khi transaction hiện tại commit"""
+        if patient_id is None:
+            return
+        keys = [cls.make_key(patient_id, section) for section in (sections or cls.SECTIONS)]
+        # Xóa sau commit để request đọc song song không cache lại dữ liệu cũ
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+    @staticmethod
+    def _limit(section):
+        return settings.PATIENT_OVERVIEW[section]
+
+    def _load_profile(self, patient_id):
+        patient = Patient.objects.select_related('user').prefetch_related('emergencycontact_set').filter(
+            pk=patient_id
+        ).first()
+        return PatientSerializer(patient).data if patient else None
+
+    def _load_appointments(self, patient_id):
+        from appointments.models import Appointment
+        appointments = Appointment.objects.filter(patient_id=patient_id).select_related(
+            'schedule', 'doctor__department'
+        ).order_by('-schedule__work_date', '-slot_start', '-id')[:self._limit('appointments')]
+        return OverviewAppointmentSerializer(appointments, many=True).data
+
+    def _load_prescriptions(self, patient_id):
+        from pharmacy.models import Prescription, PrescriptionDetail
+        prescriptions = Prescription.objects.filter(patient_id=patient_id, is_deleted=False).prefetch_related(
+            Prefetch(
+                'prescription_details',
+                queryset=PrescriptionDetail.objects.select_related('medicine').order_by('id')
+            )
+        ).order_by('-created_at', '-id')[:self._limit('prescriptions')]
+        return OverviewPrescriptionSerializer(prescriptions, many=True).data
+
+    def _load_bills(self, patient_id):
+        from payments.models import Bill, BillDetail
+        from common.enums import PaymentStatus
+        bills = Bill.objects.filter(
+            patient_id=patient_id, status__in=[PaymentStatus.UNPAID.value, PaymentStatus.BOOKING_PAID.value]
+        ).prefetch_related(
+            Prefetch('details', queryset=BillDetail.objects.order_by('id'))
+        ).order_by('-created_at', '-id')[:self._limit('bills')]
+        return OverviewBillSerializer(bills, many=True).data
+
+    def _load_results(self, patient_id):
+        from appointments.models import ServiceOrder
+        from common.enums import OrderStatus
+        orders = ServiceOrder.objects.filter(
+            appointment__patient_id=patient_id, status=OrderStatus.COMPLETED.value
+        ).select_related('service').order_by(F('result_time').desc(nulls_last=True), '-id')[:self._limit('results')]
+        return OverviewResultSerializer(orders, many=True).data
@@ -0,0 +1,64 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from appointments.models import Appointment, ServiceOrder
+from payments.models import Bill, BillDetail
+from pharmacy.models import Prescription, PrescriptionDetail
+from common.enums import UserRole
+from users.models import User
+from .models import Patient, EmergencyContact
+from .services import PatientOverviewService
+
+
+@receiver([post_save, post_delete], sender=Patient)
+def invalidate_patient_overview(sender, instance, **kwargs):
+    PatientOverviewService.invalidate(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=EmergencyContact)
+def invalidate_overview_profile(sender, instance, **kwargs):
+    PatientOverviewService.invalidate(instance.patient_id, 'profile')
+
+
+@receiver(post_save, sender=User)
+def invalidate_overview_user(sender, instance, created=False, update_fields=None, **kwargs):
+    # Email, số điện thoại nằm trong phần profile; bỏ qua các lần lưu khác (last_login, password)
+    if created or instance.role != UserRole.PATIENT.value:
+        return
+    if update_fields is not None and not {'email', 'phone', 'is_deleted'} & set(update_fields):
+        return
+    patient_id = Patient.objects.filter(user_id=instance.pk).values_list('id', flat=True).first()
+    PatientOverviewService.invalidate(patient_id, 'profile')
+
+
+@receiver([post_save, post_delete], sender=Appointment)
+def invalidate_overview_appointments(sender, instance, **kwargs):
+    PatientOverviewService.invalidate(instance.patient_id, 'appointments')
+
+
+@receiver([post_save, post_delete], sender=ServiceOrder)
+def invalidate_overview_results(sender, instance, **kwargs):
+    patient_id = Appointment.objects.filter(pk=instance.appointment_id).values_list('patient_id', flat=True).first()
+    PatientOverviewService.invalidate(patient_id, 'results')
+
+
+@receiver([post_save, post_delete], sender=Prescription)
+def invalidate_overview_prescriptions(sender, instance, **kwargs):
+    PatientOverviewService.invalidate(instance.patient_id, 'prescriptions')
+
+
+@receiver([post_save, post_delete], sender=PrescriptionDetail)
+def invalidate_overview_prescription_details(sender, instance, **kwargs):
+    patient_id = Prescription.objects.filter(pk=instance.prescription_id).values_list('patient_id', flat=True).first()
+    PatientOverviewService.invalidate(patient_id, 'prescriptions')
+
+
+@receiver([post_save, post_delete], sender=Bill)
+def invalidate_overview_bills(sender, instance, **kwargs):
+    PatientOverviewService.invalidate(instance.patient_id, 'bills')
+
+
+@receiver([post_save, post_delete], sender=BillDetail)
+def invalidate_overview_bill_details(sender, instance, **kwargs):
+    patient_id = Bill.objects.filter(pk=instance.bill_id).values_list('patient_id', flat=True).first()
+    PatientOverviewService.invalidate(patient_id, 'bills')
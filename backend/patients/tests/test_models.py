@@ -32,6 +32,13 @@ class PatientModelTest(TestCase):
     def test_patient_str(self):
         self.assertEqual(str(self.patient), "John Doe")
 
+    def test_search_name_normalized_on_save(self):
+        self.patient.first_name = "Đức"
+        self.patient.last_name = "Nguyễn  Văn"
+        self.patient.save(update_fields=['first_name', 'last_name'])
+        self.patient.refresh_from_db()
+        self.assertEqual(self.patient.search_name, "duc nguyen van")
+
     def test_patient_creation(self):
         self.assertEqual(self.patient.first_name, "John")
         self.assertEqual(self.patient.last_name, "Doe")
@@ -1,11 +1,21 @@
 # test_services.py
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import is_password_usable
 from ..models import Patient, EmergencyContact
-from ..services import PatientService, EmergencyContactService
-from common.enums import Gender
+from ..services import PatientService, EmergencyContactService, PatientImportService, PatientOverviewService
+from common.enums import (
+    Gender, AcademicDegree, DoctorType, RoomType, Shift, AppointmentStatus, PaymentStatus, ServiceType, OrderStatus
+)
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from datetime import date, time
+from decimal import Decimal
 from users.services import UserService
 from unittest.mock import patch
+import csv
+import io
 
 User = get_user_model()
 
@@ -69,6 +79,35 @@ class PatientServiceTest(TestCase):
         self.assertFalse(Patient.objects.filter(id=patient.id).exists())
         self.assertFalse(User.objects.filter(id=patient.user.id).exists())
 
+class PatientDirectoryServiceTest(TestCase):
+    def setUp(self):
+        self.service = PatientService()
+        for i, (first_name, last_name) in enumerate([("Đức", "Nguyễn Văn"), ("An", "Trần"), ("Duc", "Lê")]):
+            user = User.objects.create_user(
+                email=f"patient{i}@example.com", phone=f"090000000{i}", password="testpass123", role="P"
+            )
+            Patient.objects.create(
+                user=user, identity_number=f"ID{i}", insurance_number=f"INS{i}",
+                first_name=first_name, last_name=last_name, birthday="1990-01-01", gender=Gender.MALE.value
+            )
+
+    def test_search_by_name_ignores_accents_and_case(self):
+        names = set(self.service.search_patients(name="  DUC ").values_list('first_name', flat=True))
+        self.assertEqual(names, {"Đức", "Duc"})
+        self.assertEqual(self.service.search_patients(name="nguyen van").count(), 1)
+
+    def test_search_by_exact_fields(self):
+        self.assertEqual(self.service.search_patients(identity_number="ID1").get().first_name, "An")
+        self.assertEqual(self.service.search_patients(insurance_number="INS2").get().first_name, "Duc")
+        self.assertEqual(self.service.search_patients(phone="0900000000").get().first_name, "Đức")
+        self.assertFalse(self.service.search_patients(identity_number="ID").exists())
+
+    def test_summary_directory_is_single_query(self):
+        with self.assertNumQueries(1):
+            rows = list(self.service.get_directory('summary', name='an tran'))
+        self.assertEqual(rows[0]['phone'], "0900000001")
+        self.assertEqual(rows[0]['email'], "patient1@example.com")
+
 class EmergencyContactServiceTest(TestCase):
     def setUp(self):
         self.user = User.objects.create(
@@ -108,3 +147,195 @@ class EmergencyContactServiceTest(TestCase):
         contacts = self.emergency_contact_service.get_all_emergency_contacts(self.patient.id)
         self.assertEqual(contacts.count(), 1)
         self.assertEqual(contacts[0].contact_name, "Jane Doe")
+
+
+class PatientImportServiceTest(TestCase):
+    HEADER = 'email,phone,password,identity_number,insurance_number,first_name,last_name,birthday,gender,contact_name,contact_phone,relationship\n'
+
+    def setUp(self):
+        User.objects.create_user(email='existing@example.com', phone='0900000000', password='Existing@123', role='P')
+
+    def _import(self, *rows, chunk_size=2):
+        content = self.HEADER + ''.join(row + '\n' for row in rows)
+        return PatientImportService(chunk_size=chunk_size, workers=1).import_csv(io.StringIO(content))
+
+    def test_import_creates_users_patients_and_contacts(self):
+        result = self._import(
+            f'A1@Example.com,0911111111,Strong@Pass1,111111111111,INS1,An,Nguyen,1990-01-01,{Gender.MALE.value},Binh,0922222222,Brother',
+            f'a2@example.com,0911111112,,111111111112,INS2,Chi,Tran,1991-02-02,{Gender.FEMALE.value},,,',
+            f'a3@example.com,0911111113,Strong@Pass3,111111111113,INS3,Dung,Le,1992-03-03,{Gender.MALE.value},,,',
+        )
+        self.assertEqual(result, {'created': 3, 'failed': 0, 'errors': []})
+        patient = Patient.objects.select_related('user').get(identity_number='111111111111')
+        self.assertEqual(patient.user.email, 'a1@example.com')
+        self.assertTrue(patient.user.check_password('Strong@Pass1'))
+        self.assertEqual(EmergencyContact.objects.get(patient=patient).contact_name, 'Binh')
+        self.assertFalse(is_password_usable(User.objects.get(email='a2@example.com').password))
+
+    def test_import_reports_row_errors(self):
+        result = self._import(
+            f'existing@example.com,0911111111,,111111111111,INS1,An,Nguyen,1990-01-01,{Gender.MALE.value},,,',
+            f'b2@example.com,0911111112,,111111111112,INS2,Chi,Tran,not-a-date,{Gender.FEMALE.value},,,',
+            f'b3@example.com,0911111113,,111111111113,INS3,Dung,Le,1992-03-03,{Gender.MALE.value},,,',
+            f'b4@example.com,0911111114,,111111111113,INS4,Em,Pham,1993-04-04,{Gender.MALE.value},Giang,,',
+            f'b5@example.com,0911111115,,111111111115,INS3,Hoa,Vo,1994-05-05,{Gender.FEMALE.value},,,',
+        )
+        self.assertEqual(result['created'], 1)
+        self.assertEqual(result['failed'], 4)
+        errors = {error['row']: error['errors'] for error in result['errors']}
+        self.assertIn('email', errors[2])
+        self.assertIn('birthday', errors[3])
+        self.assertIn('contact', errors[5])
+        # Dòng 6 trùng BHYT với dòng 4 (lô trước) đã được ghi
+        self.assertIn('insurance_number', errors[6])
+        self.assertTrue(Patient.objects.filter(identity_number='111111111113').exists())
+
+    def test_import_reports_duplicates_within_chunk(self):
+        result = self._import(
+            f'c1@example.com,0911111111,,111111111111,INS1,An,Nguyen,1990-01-01,{Gender.MALE.value},,,',
+            f'C1@example.com,0911111112,,111111111112,INS2,Chi,Tran,1991-02-02,{Gender.FEMALE.value},,,',
+        )
+        self.assertEqual(result['created'], 1)
+        self.assertEqual(result['errors'][0]['row'], 3)
+        self.assertIn('email', result['errors'][0]['errors'])
+
+    def test_import_query_count_per_chunk(self):
+        rows = [
+            f'd{i}@example.com,091111112{i},,11111111112{i},INS{i},An,Nguyen,1990-01-01,{Gender.MALE.value},Binh,0922222222,Brother'
+            for i in range(5)
+        ]
+        # 4 truy vấn kiểm tra trùng + savepoint + 3 bulk_create (user, patient, contact) + release
+        with self.assertNumQueries(9):
+            result = self._import(*rows, chunk_size=5)
+        self.assertEqual(result['created'], 5)
+
+
+    def test_import_stops_at_malformed_csv(self):
+        result = self._import(
+            f'e1@example.com,0911111111,,111111111111,INS1,An,Nguyen,1990-01-01,{Gender.MALE.value},,,',
+            'e2@example.com,' + 'x' * (csv.field_size_limit() + 1),
+            f'e3@example.com,0911111113,,111111111113,INS3,Dung,Le,1992-03-03,{Gender.MALE.value},,,',
+        )
+        self.assertEqual(result['created'], 1)
+        self.assertEqual(result['failed'], 0)
+        self.assertEqual(result['errors'][0]['row'], 3)
+        self.assertIn('file', result['errors'][0]['errors'])
+        self.assertFalse(User.objects.filter(email='e3@example.com').exists())
+
+class PatientOverviewServiceTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from doctors.models import Department, Doctor, ExaminationRoom, Schedule
+        from appointments.models import Appointment, Service, ServiceOrder
+        from pharmacy.models import Medicine, Prescription, PrescriptionDetail
+        from payments.models import Bill, BillDetail
+
+        patient_user = User.objects.create_user(email="patient@example.com", phone="0900000001", password="testpass123", role="P")
+        doctor_user = User.objects.create_user(email="doctor@example.com", phone="0900000002", password="testpass123", role="D")
+        cls.patient = Patient.objects.create(
+            user=patient_user, identity_number="123456789", insurance_number="INS123456",
+            first_name="John", last_name="Doe", birthday="1990-01-01", gender=Gender.MALE.value
+        )
+        EmergencyContact.objects.create(
+            patient=cls.patient, contact_name="Jane Doe", contact_phone="0987654321", relationship="Sister"
+        )
+        department = Department.objects.create(department_name="Cardiology")
+        doctor = Doctor.objects.create(
+            user=doctor_user, first_name="Gregory", last_name="House", identity_number="987654321",
+            gender=Gender.MALE.value, academic_degree=AcademicDegree.BS_CKI.value, specialization="Cardiologist",
+            type=DoctorType.EXAMINATION.value, department=department
+        )
+        room = ExaminationRoom.objects.create(department=department, type=RoomType.EXAMINATION.value, building="A", floor=1)
+        schedule = Schedule.objects.create(
+            doctor=doctor, room=room, work_date=date(2025, 8, 26), start_time=time(8, 0), end_time=time(12, 0),
+            shift=Shift.MORNING.value
+        )
+        appointments = [
+            Appointment.objects.create(
+                doctor=doctor, patient=cls.patient, schedule=schedule, slot_start=time(8 + i, 0),
+                slot_end=time(8 + i, 30), status=AppointmentStatus.COMPLETED.value
+            )
+            for i in range(2)
+        ]
+        cls.appointment = appointments[0]
+        medicine = Medicine.objects.create(
+            medicine_name="Paracetamol", category="Pain Relief", usage="Oral", unit="Tablet",
+            price=Decimal('10.00'), quantity=100
+        )
+        for appointment in appointments:
+            prescription = Prescription.objects.create(appointment=appointment, patient=cls.patient, diagnosis="Flu")
+            PrescriptionDetail.objects.create(
+                prescription=prescription, medicine=medicine, dosage="1", frequency="2/day", duration="5 days", quantity=10
+            )
+        for appointment, bill_status in zip(appointments, [PaymentStatus.UNPAID.value, PaymentStatus.PAID.value]):
+            bill = Bill.objects.create(
+                appointment=appointment, patient=cls.patient, total_cost=Decimal('100.00'),
+                amount=Decimal('100.00'), status=bill_status
+            )
+            BillDetail.objects.create(
+                bill=bill, item_type="CONSULTATION", quantity=1, unit_price=Decimal('100.00'),
+                total_price=Decimal('100.00')
+            )
+        service = Service.objects.create(service_name="Blood test", service_type=ServiceType.TEST.value, price=Decimal('50.00'))
+        for order_status in (OrderStatus.COMPLETED.value, OrderStatus.ORDERED.value):
+            ServiceOrder.objects.create(
+                appointment=cls.appointment, room=room, service=service, status=order_status,
+                result="Normal" if order_status == OrderStatus.COMPLETED.value else None,
+                result_time=timezone.now() if order_status == OrderStatus.COMPLETED.value else None
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.service = PatientOverviewService()
+
+    def test_full_overview_uses_fixed_queries(self):
+        # profile 2 + lịch hẹn 1 + đơn thuốc 2 + hóa đơn 2 + kết quả 1
+        with self.assertNumQueries(8):
+            overview = self.service.get_overview(self.patient.id)
+        self.assertEqual(list(overview), list(PatientOverviewService.SECTIONS))
+        self.assertEqual(overview['profile']['emergency_contacts'][0]['contact_name'], "Jane Doe")
+        self.assertEqual(len(overview['appointments']), 2)
+        self.assertEqual(overview['appointments'][0]['doctor_name'], "Gregory House")
+        self.assertEqual(overview['appointments'][0]['department_name'], "Cardiology")
+        self.assertEqual(overview['prescriptions'][0]['prescription_details'][0]['medicine_name'], "Paracetamol")
+        self.assertEqual([bill['status'] for bill in overview['bills']], [PaymentStatus.UNPAID.value])
+        self.assertEqual(len(overview['bills'][0]['details']), 1)
+        self.assertEqual([result['result'] for result in overview['results']], ["Normal"])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.service.get_overview(self.patient.id), overview)
+
+    def test_selected_sections(self):
+        # kiểm tra bệnh nhân tồn tại + hóa đơn 2 + kết quả 1
+        with self.assertNumQueries(4):
+            overview = self.service.get_overview(self.patient.id, ['bills', 'results'])
+        self.assertEqual(list(overview), ['bills', 'results'])
+
+    def test_write_invalidates_only_affected_section(self):
+        from payments.models import Bill
+        self.service.get_overview(self.patient.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            Bill.objects.create(
+                appointment=self.appointment, patient=self.patient, total_cost=Decimal('20.00'),
+                amount=Decimal('20.00'), status=PaymentStatus.BOOKING_PAID.value
+            )
+        with self.assertNumQueries(2):
+            overview = self.service.get_overview(self.patient.id)
+        self.assertEqual(len(overview['bills']), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.patient.user.phone = "0911111111"
+            self.patient.user.save()
+        overview = self.service.get_overview(self.patient.id, ['profile'])
+        self.assertEqual(overview['profile']['phone'], "0911111111")
+
+    def test_sections_expire_after_configured_ttl(self):
+        with override_settings(PATIENT_OVERVIEW={**settings.PATIENT_OVERVIEW, 'cache_ttl': 42}):
+            with patch.object(cache, 'set_many', wraps=cache.set_many) as set_many:
+                self.service.get_overview(self.patient.id, ['results'])
+        self.assertEqual(set_many.call_args.args[1], 42)
+
+    def test_missing_patient(self):
+        self.assertIsNone(self.service.get_overview(999999))
+        self.assertIsNone(self.service.get_overview(999999, ['bills']))
+
@@ -4,6 +4,7 @@ from django.contrib.auth import get_user_model
 from django.utils.translation import gettext as _
 from rest_framework import status
 from rest_framework.test import APIClient
+from django.core.cache import cache
 from ..models import Patient, EmergencyContact
 from ..serializers import PatientSerializer, CreatePatientRequestSerializer, EmergencyContactSerializer
 from common.enums import Gender
@@ -13,6 +14,7 @@ User = get_user_model()
 
 class PatientViewSetTest(TestCase):
     def setUp(self):
+        cache.clear()
         self.client = APIClient()
         self.user = User.objects.create_user(
             email="testuser@example.com",
@@ -77,12 +79,75 @@ class PatientViewSetTest(TestCase):
         self.assertIn('email', response.data)
 
     def test_list_patients(self):
-        """Test listing all patients"""
+        """Test listing patients: không tham số vẫn trả trang đầu của danh bạ"""
         url = reverse('patient-list')
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertGreaterEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['first_name'], "John")
+        self.assertEqual(response.data['pageSize'], 20)
+        self.assertIsNone(response.data['previous'])
+        self.assertEqual(response.data['content'][0]['first_name'], "John")
+
+    def test_directory_paginates_with_cursor(self):
+        for i in range(3):
+            user = User.objects.create_user(
+                email=f"patient{i}@example.com", phone=f"090000000{i}", password="testpass123", role="P"
+            )
+            Patient.objects.create(
+                user=user, identity_number=f"ID{i}", insurance_number=f"INS{i}",
+                first_name=f"Bình {i}", last_name="Phạm", birthday="1990-01-01", gender=Gender.MALE.value
+            )
+        url = reverse('patient-list')
+        response = self.client.get(url, {'name': 'binh', 'sort': 'name', 'pageSize': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([p['first_name'] for p in response.data['content']], ["Bình 0", "Bình 1"])
+        self.assertNotIn('emergency_contacts', response.data['content'][0])
+        self.assertEqual(response.data['content'][0]['phone'], "0900000000")
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual([p['first_name'] for p in response.data['content']], ["Bình 2"])
+        self.assertIsNone(response.data['next'])
+
+    def test_directory_full_view(self):
+        EmergencyContact.objects.create(
+            patient=self.patient, contact_name="Jane Doe", contact_phone="0987654321", relationship="Sister"
+        )
+        response = self.client.get(reverse('patient-list'), {'view': 'full', 'identityNumber': '123456789'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['content']), 1)
+        self.assertEqual(response.data['content'][0]['emergency_contacts'][0]['contact_name'], "Jane Doe")
+
+    def test_directory_invalid_sort(self):
+        response = self.client.get(reverse('patient-list'), {'sort': 'password'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('sort', response.data)
+
+    def test_overview_own_profile(self):
+        response = self.client.get(f"/api/v1/patients/{self.patient.id}/overview/", {'sections': 'profile,bills'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['patientId'], self.patient.id)
+        self.assertEqual(response.data['profile']['first_name'], "John")
+        self.assertEqual(response.data['bills'], [])
+        self.assertNotIn('appointments', response.data)
+
+    def test_overview_permissions(self):
+        other_user = User.objects.create_user(email="other@example.com", phone="0911111111", password="testpass123", role="P")
+        other = Patient.objects.create(
+            user=other_user, identity_number="555555555", insurance_number="INS555555",
+            first_name="Other", last_name="Patient", birthday="1990-01-01", gender=Gender.MALE.value
+        )
+        response = self.client.get(f"/api/v1/patients/{other.id}/overview/")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=self.admin_user)
+        response = self.client.get(f"/api/v1/patients/{other.id}/overview/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get("/api/v1/patients/999999/overview/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_overview_invalid_sections(self):
+        response = self.client.get(f"/api/v1/patients/{self.patient.id}/overview/", {'sections': 'profile,password'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('sections', response.data)
 
     def test_list_patients_by_user_id(self):
         """Test listing patients by user_id"""
@@ -257,3 +322,57 @@ class PatientViewSetTest(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['message'], str(_("Liên hệ được xóa thành công")))
         self.assertFalse(EmergencyContact.objects.filter(id=contact.id).exists())
+
+
+class PatientImportViewTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin_user = User.objects.create_user(
+            email="admin@example.com",
+            phone="9876543210",
+            password="adminpass123",
+            role="A"
+        )
+        self.patient_user = User.objects.create_user(
+            email="testuser@example.com",
+            phone="1234567890",
+            password="testpass123",
+            role="P"
+        )
+
+    def _upload(self, encoding='utf-8'):
+        content = (
+            'email,phone,identity_number,insurance_number,first_name,last_name,birthday,gender\n'
+            f'new@example.com,0911111111,111111111111,INS1,An,Nguyễn,1990-01-01,{Gender.MALE.value}\n'
+            f'testuser@example.com,0911111112,111111111112,INS2,Chi,Trần,1991-02-02,{Gender.FEMALE.value}\n'
+        ).encode(encoding)
+        file = io.BytesIO(content)
+        file.name = 'patients.csv'
+        return self.client.post('/api/v1/patients/import/', {'file': file}, format='multipart')
+
+    def test_import_as_admin(self):
+        self.client.force_authenticate(user=self.admin_user)
+        response = self._upload()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['failed'], 1)
+        self.assertEqual(response.data['errors'][0]['row'], 3)
+        self.assertTrue(Patient.objects.filter(user__email='new@example.com').exists())
+
+    def test_import_requires_admin(self):
+        self.client.force_authenticate(user=self.patient_user)
+        response = self._upload()
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_import_without_file(self):
+        self.client.force_authenticate(user=self.admin_user)
+        response = self.client.post('/api/v1/patients/import/', {}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_import_non_utf8_file(self):
+        self.client.force_authenticate(user=self.admin_user)
+        response = self._upload(encoding='utf-16')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['created'], 0)
+        self.assertIn('file', response.data['errors'][0]['errors'])
+        self.assertFalse(Patient.objects.exists())
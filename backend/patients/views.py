@@ -2,12 +2,17 @@ from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
 from django.shortcuts import get_object_or_404
 from django.utils.translation import gettext_lazy as _
 from urllib3 import request
 from .models import Patient, EmergencyContact
-from .serializers import PatientSerializer, CreatePatientRequestSerializer, EmergencyContactSerializer
-from .services import PatientService, EmergencyContactService
+from .serializers import (
+    PatientSerializer, CreatePatientRequestSerializer, EmergencyContactSerializer,
+    PatientDirectoryFilterSerializer, PatientSummarySerializer, PatientCursorPagination, PatientOverviewQuerySerializer
+)
+from .services import PatientService, EmergencyContactService, PatientImportService, PatientOverviewService
+from users.authentication import get_auth_context
 
 class PatientViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
@@ -30,9 +35,24 @@ class PatientViewSet(viewsets.ViewSet):
                         {"error": _("Không tìm thấy bệnh nhân với user_id này")},
                         status=status.HTTP_404_NOT_FOUND
                     )
-            patients = Patient.objects.select_related('user').all()
-            serializer = PatientSerializer(patients, many=True)
-            return Response(serializer.data)
+            # Không trả toàn bộ bảng bệnh nhân: luôn phân trang theo con trỏ
+            return self._directory(request)
+
+    def _directory(self, request):
+        """
+        Danh bạ bệnh nhân phân trang theo con trỏ: lọc ?name (không dấu), ?identityNumber, ?insuranceNumber, ?phone;
+        ?sort=name|createdAt|birthday (thêm '-' để giảm dần); ?view=summary (mặc định, vài cột) | full
+        """
+        query_serializer = PatientDirectoryFilterSerializer(data=request.query_params.dict())
+        query_serializer.is_valid(raise_exception=True)
+        filters = dict(query_serializer.validated_data)
+        sort, view = filters.pop('sort'), filters.pop('view')
+
+        patients = PatientService().get_directory(view, **filters)
+        paginator = PatientCursorPagination(sort)
+        page = paginator.paginate_queryset(patients, request, view=self)
+        serializer_class = PatientSerializer if view == 'full' else PatientSummarySerializer
+        return paginator.get_paginated_response(serializer_class(page, many=True).data)
 
     def retrieve(self, request, pk=None):
         patient = Patient.objects.select_related('user').get(pk=pk)
@@ -49,7 +69,7 @@ class PatientViewSet(viewsets.ViewSet):
     def update(self, request, pk=None):
         try:
             patient = self.get_object(pk)
-            if patient.user != request.user and not request.user.role == "A":
+            if patient.user_id != request.user.id and not request.user.role == "A":
                 return Response({"error": _("Không có quyền cập nhật")}, status=status.HTTP_403_FORBIDDEN)
 
 
@@ -70,10 +90,48 @@ class PatientViewSet(viewsets.ViewSet):
         PatientService().delete_patient(patient)
         return Response({"message": _("Bệnh nhân được xóa thành công")}, status=status.HTTP_200_OK)
 
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def import_patients(self, request):
+        """
+        Nhập bệnh nhân từ file CSV (trường `file`); file rất lớn nên dùng lệnh `manage.py import_patients`
+        """
+        if request.user.role != "A":
+            return Response({"error": _("Không có quyền nhập bệnh nhân")}, status=status.HTTP_403_FORBIDDEN)
+        file = request.FILES.get('file')
+        if not file:
+            return Response({"error": _("Thiếu file CSV")}, status=status.HTTP_400_BAD_REQUEST)
+        # Không tạo process pool trong request; nhập song song dùng lệnh manage.py
+        result = PatientImportService(workers=1).import_csv(file)
+        return Response(result, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['get'], url_path='overview')
+    def overview(self, request, pk=None):
+        """
+        Hồ sơ tổng hợp trong một request; ?sections=profile,appointments,prescriptions,bills,results (mặc định: tất cả).
+        Bệnh nhân chỉ xem được hồ sơ của mình, bác sĩ và quản trị viên xem được mọi bệnh nhân.
+        """
+        query_serializer = PatientOverviewQuerySerializer(data=request.query_params.dict())
+        query_serializer.is_valid(raise_exception=True)
+        try:
+            patient_id = int(pk)
+        except (TypeError, ValueError):
+            return Response({"error": _("Không tìm thấy bệnh nhân")}, status=status.HTTP_404_NOT_FOUND)
+
+        context = get_auth_context(request.user)
+        if context.role not in ("A", "D") and context.patient_id != patient_id:
+            return Response({"error": _("Không có quyền xem hồ sơ")}, status=status.HTTP_403_FORBIDDEN)
+
+        overview = PatientOverviewService().get_overview(
+            patient_id, query_serializer.validated_data.get('sections')
+        )
+        if overview is None:
+            return Response({"error": _("Không tìm thấy bệnh nhân")}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"patientId": patient_id, **overview})
+
     @action(detail=False, methods=['get'], url_path='me')
     def get_current_patient(self, request):
         try:
-            patient = Patient.objects.get(user=request.user)
+            patient = Patient.objects.get(user_id=request.user.id)
         except Patient.DoesNotExist:
             return Response({"error": _("Không tìm thấy bệnh nhân")},
                             status=status.HTTP_404_NOT_FOUND)
@@ -87,7 +145,7 @@ class PatientViewSet(viewsets.ViewSet):
             if not file:
                 return Response({"error": _("Thiếu file avatar")}, status=status.HTTP_400_BAD_REQUEST)
             patient = self.get_object(pk)
-            if patient.user != request.user:
+            if patient.user_id != request.user.id:
                 return Response({"error": _("Không có quyền cập nhật")}, status=status.HTTP_403_FORBIDDEN)
             updated_patient = PatientService().upload_avatar(patient, file)
             return Response({"avatar": updated_patient.avatar}, status=status.HTTP_200_OK)
@@ -98,7 +156,7 @@ class PatientViewSet(viewsets.ViewSet):
     def delete_avatar(self, request, pk=None):
         try:
             patient = self.get_object(pk)
-            if patient.user != request.user:
+            if patient.user_id != request.user.id:
                 return Response({"error": _("Không có quyền xóa")}, status=status.HTTP_403_FORBIDDEN)
             updated_patient = PatientService().delete_avatar(patient)
             return Response({"avatar": updated_patient.avatar or ""}, status=status.HTTP_200_OK)
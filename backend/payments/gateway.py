@@ -0,0 +1,249 @@
+"""Client HTTP dùng chung cho cổng thanh toán PayOS: pool kết nối, timeout, retry và circuit breaker."""
+import hashlib
+import hmac
+import json
+import logging
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {429, 502, 503, 504}
+
+
+class GatewayError(Exception):
+    """Lỗi khi gọi cổng thanh toán (mạng, HTTP hoặc mã lỗi nghiệp vụ của PayOS)."""
+
+
+class GatewayUnavailableError(GatewayError):
+    """Không kết nối được hoặc PayOS trả lỗi phía máy chủ; được tính vào circuit breaker."""
+
+
+class CircuitOpenError(GatewayUnavailableError):
+    """Cổng thanh toán đang bị ngắt tạm thời sau nhiều lỗi liên tiếp."""
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            # Hết thời gian chờ: cho một request thử (half-open), các request khác vẫn bị chặn
+            if not self._trial_in_flight and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+def _signature_value(value):
+    # Giống SDK payOS: bool viết thường như JSON, list thành JSON giữ nguyên ký tự Unicode
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, list):
+        items = [dict(sorted(item.items())) if isinstance(item, dict) else item for item in value]
+        return json.dumps(items, separators=(",", ":"), ensure_ascii=False)
+    if value is None or value in ("undefined", "null"):
+        return ""
+    return str(value)
+
+
+def create_signature(data, checksum_key):
+    """Chữ ký HMAC-SHA256 theo định dạng của PayOS: các cặp key=value sắp xếp theo key, nối bằng &."""
+    message = "&".join(f"{key}={_signature_value(value)}" for key, value in sorted(data.items()))
+    return hmac.new(checksum_key.encode("utf-8"), msg=message.encode("utf-8"), digestmod=hashlib.sha256).hexdigest()
+
+
+def verify_signature(data, signature, checksum_key):
+    return signature is not None and hmac.compare_digest(create_signature(data, checksum_key), signature)
+
+
+class BasePayOSGateway:
+    def __init__(self, client_id, api_key, checksum_key, base_url, timeout=10.0, connect_timeout=3.0,
+                 max_retries=2, backoff=0.2, pool_size=20, keepalive_expiry=30.0,
+                 breaker_threshold=5, breaker_reset=30.0, transport=None):
+        self.checksum_key = checksum_key
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset)
+        self._client_options = {
+            'base_url': base_url,
+            'headers': {'x-client-id': client_id, 'x-api-key': api_key},
+            'timeout': httpx.Timeout(timeout, connect=connect_timeout),
+            'limits': httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size,
+                keepalive_expiry=keepalive_expiry
+            ),
+        }
+        if transport is not None:
+            self._client_options['transport'] = transport
+
+    @classmethod
+    def from_settings(cls, **overrides):
+        options = {
+            'client_id': settings.PAYOS['client_id'],
+            'api_key': settings.PAYOS['api_key'],
+            'checksum_key': settings.PAYOS['checksum_key'],
+            **settings.PAYOS_HTTP,
+        }
+        options.update(overrides)
+        return cls(**options)
+
+    def verify_webhook(self, webhook_body):
+        """Kiểm tra chữ ký webhook và trả về phần data (orderCode, amount, code, ...)."""
+        data = webhook_body.get('data')
+        signature = webhook_body.get('signature')
+        if data is None:
+            raise ValueError(_("Webhook không có dữ liệu"))
+        if signature is None:
+            raise ValueError(_("Webhook không có chữ ký"))
+        if not verify_signature(data, signature, self.checksum_key):
+            raise ValueError(_("Chữ ký webhook không hợp lệ"))
+        return SimpleNamespace(**data)
+
+    def _payment_request(self, order_code, amount, description, items, cancel_url, return_url):
+        body = {
+            'orderCode': order_code,
+            'amount': amount,
+            'description': description,
+            'cancelUrl': cancel_url,
+            'returnUrl': return_url,
+        }
+        body['signature'] = create_signature(body, self.checksum_key)
+        body['items'] = items
+        return body
+
+    def _delay(self, attempt):
+        return self.backoff * (2 ** attempt) * (1 + random.random() / 2)
+
+    def _should_retry(self, attempt, idempotent, error=None, response=None):
+        if attempt >= self.max_retries:
+            return False
+        if error is not None:
+            # Request tạo link chỉ thử lại khi chưa gửi được (lỗi kết nối) để tránh tạo trùng
+            return idempotent or isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout))
+        return idempotent and response.status_code in RETRYABLE_STATUS_CODES
+
+    def _parse(self, response):
+        if response.status_code >= 500 or response.status_code in RETRYABLE_STATUS_CODES:
+            raise GatewayUnavailableError(_("Cổng thanh toán trả về lỗi HTTP {status}").format(status=response.status_code))
+        if response.status_code >= 400:
+            raise GatewayError(_("Cổng thanh toán trả về lỗi HTTP {status}").format(status=response.status_code))
+        try:
+            payload = response.json()
+        except ValueError:
+            raise GatewayUnavailableError(_("Phản hồi từ cổng thanh toán không hợp lệ"))
+        if payload.get('code') != '00' or payload.get('data') is None:
+            raise GatewayError(payload.get('desc') or _("Cổng thanh toán trả về lỗi"))
+        # PayOS ký phần data của mọi phản hồi payment-requests; không khớp thì không tin kết quả
+        if not verify_signature(payload['data'], payload.get('signature'), self.checksum_key):
+            raise GatewayError(_("Chữ ký phản hồi từ cổng thanh toán không hợp lệ"))
+        return SimpleNamespace(**payload['data'])
+
+    def _check_breaker(self):
+        if not self.breaker.allow():
+            raise CircuitOpenError(_("Cổng thanh toán tạm thời không khả dụng, vui lòng thử lại sau"))
+
+    def _record(self, error):
+        # Lỗi nghiệp vụ (code khác "00") không phải sự cố của cổng nên không tính vào circuit breaker
+        if isinstance(error, GatewayUnavailableError):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+
+class PayOSGateway(BasePayOSGateway):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.client = httpx.Client(**self._client_options)
+
+    def _request(self, method, path, json=None, idempotent=True):
+        self._check_breaker()
+        attempt = 0
+        error = None
+        try:
+            while True:
+                try:
+                    response = self.client.request(method, path, json=json)
+                except httpx.TransportError as e:
+                    if self._should_retry(attempt, idempotent, error=e):
+                        time.sleep(self._delay(attempt))
+                        attempt += 1
+                        continue
+                    raise GatewayUnavailableError(_("Không kết nối được cổng thanh toán: {error}").format(error=str(e))) from e
+                if self._should_retry(attempt, idempotent, response=response):
+                    time.sleep(self._delay(attempt))
+                    attempt += 1
+                    continue
+                return self._parse(response)
+        except GatewayError as e:
+            error = e
+            raise
+        finally:
+            self._record(error)
+
+    def create_payment_link(self, order_code, amount, description, items, cancel_url, return_url):
+        body = self._payment_request(order_code, amount, description, items, cancel_url, return_url)
+        return self._request('POST', '/v2/payment-requests', json=body, idempotent=False)
+
+    def get_payment_link_information(self, order_code):
+        return self._request('GET', f'/v2/payment-requests/{order_code}')
+
+    def cancel_payment_link(self, order_code, reason=None):
+        return self._request('POST', f'/v2/payment-requests/{order_code}/cancel', json={'cancellationReason': reason})
+
+    def close(self):
+        self.client.close()
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_payos_gateway():
+    """Client dùng chung cho cả process để tái sử dụng kết nối keep-alive tới PayOS."""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = PayOSGateway.from_settings()
+    return _gateway
+
+
+def reset_payos_gateway():
+    global _gateway
+    with _gateway_lock:
+        if _gateway is not None:
+            _gateway.close()
+        _gateway = None
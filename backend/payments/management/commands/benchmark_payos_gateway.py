@@ -0,0 +1,50 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from payments.gateway import PayOSGateway
+from payments.stub_gateway import StubPayOSServer
+
+
+class Command(BaseCommand):
+    help = "So sánh client PayOS dùng chung (keep-alive) với client tạo mới mỗi request, chạy trên máy chủ giả lập"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--latency-ms', type=float, default=20)
+
+    def handle(self, *args, **options):
+        server = StubPayOSServer(latency=options['latency_ms'] / 1000, checksum_key='bench').start()
+        try:
+            order_code = 1
+            gateway = self._gateway(server, options['concurrency'])
+            gateway.create_payment_link(order_code, 1000, "Benchmark", [], "http://cancel", "http://return")
+
+            def fresh(_):
+                client = self._gateway(server, 1)
+                try:
+                    return client.get_payment_link_information(order_code)
+                finally:
+                    client.close()
+
+            def pooled(_):
+                return gateway.get_payment_link_information(order_code)
+
+            for label, call in (("new client per request", fresh), ("shared pooled client", pooled)):
+                connections = server.connection_count
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+                    list(pool.map(call, range(options['requests'])))
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"{label}: {options['requests'] / elapsed:.0f} req/s, "
+                    f"{server.connection_count - connections} connection(s)"
+                )
+            gateway.close()
+        finally:
+            server.stop()
+
+    @staticmethod
+    def _gateway(server, pool_size):
+        return PayOSGateway('bench', 'bench', 'bench', server.base_url, pool_size=pool_size, max_retries=0)
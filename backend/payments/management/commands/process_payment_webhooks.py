@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+from payments.services import PaymentWebhookService
+
+
+class Command(BaseCommand):
+    help = "Xử lý hàng đợi webhook PayOS và cập nhật trạng thái hóa đơn, giao dịch"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--watch', action='store_true', help="Chạy liên tục, chờ webhook mới")
+        parser.add_argument('--interval', type=float, default=1.0, help="Số giây chờ khi hàng đợi rỗng")
+        parser.add_argument('--retry-failed', action='store_true', help="Đưa các webhook lỗi về trạng thái chờ trước khi xử lý")
+
+    def handle(self, *args, **options):
+        service = PaymentWebhookService()
+        if options['retry_failed']:
+            self.stdout.write(f"Requeued {service.retry_failed_events()} failed webhook(s)")
+
+        while True:
+            result = service.process_pending_events(batch_size=options['batch_size'])
+            if result['processed'] or result['retried'] or result['failed']:
+                self.stdout.write(
+                    f"Processed {result['processed']} webhook(s), {result['retried']} scheduled for retry, {result['failed']} failed"
+                )
+                continue
+            if not options['watch']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,31 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from payments.services import ReconciliationService
+
+
+class Command(BaseCommand):
+    help = "Đối soát các giao dịch PENDING quá hạn với PayOS và cập nhật trạng thái"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-minutes', type=int, default=30)
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=8, help="Số request tới PayOS chạy song song")
+        parser.add_argument('--expire-after-hours', type=int, default=24, help="Giao dịch vẫn PENDING sau số giờ này được chuyển FAILED (0 để tắt)")
+        parser.add_argument('--reset', action='store_true', help="Quét lại từ đầu thay vì tiếp tục từ checkpoint")
+
+    def handle(self, *args, **options):
+        service = ReconciliationService()
+        if options['reset']:
+            service.reset_checkpoint()
+        expire_after = timedelta(hours=options['expire_after_hours']) if options['expire_after_hours'] else None
+        totals = service.reconcile(
+            older_than=timedelta(minutes=options['older_than_minutes']),
+            batch_size=options['batch_size'],
+            concurrency=options['concurrency'],
+            expire_after=expire_after,
+        )
+        self.stdout.write(
+            f"Checked {totals['checked']} transaction(s): {totals['paid']} paid, {totals['failed']} failed, "
+            f"{totals['pending']} still pending, {totals['errors']} error(s)"
+        )
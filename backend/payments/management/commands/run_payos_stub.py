@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from payments.stub_gateway import StubPayOSServer
+
+
+class Command(BaseCommand):
+    help = "Chạy máy chủ PayOS giả lập để phát triển và đo hiệu năng (đặt PAYOS_BASE_URL trỏ tới địa chỉ này)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency-ms', type=float, default=0, help="Độ trễ giả lập cho mỗi request")
+
+    def handle(self, *args, **options):
+        server = StubPayOSServer(
+            (options['host'], options['port']),
+            latency=options['latency_ms'] / 1000,
+            checksum_key=settings.PAYOS['checksum_key']
+        )
+        self.stdout.write(f"PayOS stub listening on {server.base_url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payments", "0005_alter_bill_status"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PaymentWebhookEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("order_code", models.BigIntegerField()),
+                (
+                    "event",
+                    models.CharField(
+                        choices=[("S", "SUCCESS"), ("F", "FAILED"), ("P", "PENDING")],
+                        max_length=20,
+                    ),
+                ),
+                ("payload", models.JSONField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("P", "PENDING"), ("S", "PROCESSED"), ("F", "FAILED")],
+                        default="P",
+                        max_length=20,
+                    ),
+                ),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                ("last_error", models.TextField(blank=True, null=True)),
+                ("processed_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["status", "id"], name="payments_pa_status_c06087_idx"
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("order_code", "event"),
+                        name="unique_webhook_order_code_event",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payments", "0006_webhook_inbox"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OrderCodeSequence",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="transaction",
+            name="order_code",
+            field=models.BigIntegerField(blank=True, null=True, unique=True),
+        ),
+    ]
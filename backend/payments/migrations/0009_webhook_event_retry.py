@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-19 18:00
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payments", "0008_reconciliation_checkpoint"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="paymentwebhookevent",
+            name="payments_pa_status_c06087_idx",
+        ),
+        migrations.AddField(
+            model_name="paymentwebhookevent",
+            name="next_attempt_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name="paymentwebhookevent",
+            index=models.Index(
+                fields=["status", "next_attempt_at"],
+                name="payments_pa_status_5f7201_idx",
+            ),
+        ),
+    ]
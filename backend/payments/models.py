@@ -1,9 +1,10 @@
 from django.db import models
+from django.utils import timezone
 from core.models import BaseModel
 from appointments.models import Appointment
 from patients.models import Patient
-from common.enums import PaymentStatus, PaymentMethod, TransactionStatus
-from common.constants import PAYMENT_LENGTH, DECIMAL_MAX_DIGITS, DECIMAL_DECIMAL_PLACES, ENUM_LENGTH
+from common.enums import PaymentStatus, PaymentMethod, TransactionStatus, WebhookEventStatus
+from common.constants import PAYMENT_LENGTH, DECIMAL_MAX_DIGITS, DECIMAL_DECIMAL_PLACES, ENUM_LENGTH, COMMON_LENGTH
 
 class Bill(BaseModel):
     appointment = models.ForeignKey(Appointment, on_delete=models.RESTRICT)
@@ -35,6 +36,49 @@ class Transaction(BaseModel):
     payment_method = models.CharField(max_length=ENUM_LENGTH["DEFAULT"], choices=[(m.value, m.name) for m in PaymentMethod])
     transaction_date = models.DateTimeField()
     status = models.CharField(max_length=ENUM_LENGTH["DEFAULT"], choices=[(t.value, t.name) for t in TransactionStatus])
+    order_code = models.BigIntegerField(unique=True, blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # Job đối soát quét các giao dịch PENDING theo id
+            models.Index(fields=['status', 'id']),
+        ]
 
     def __str__(self):
         return f"Transaction {self.pk}"
+
+
+class OrderCodeSequence(models.Model):
+    """Mỗi dòng cấp một mã đơn PayOS duy nhất (PAYMENT_ORDER_CODE_OFFSET + id)."""
+    id = models.BigAutoField(primary_key=True)
+
+
+class PaymentWebhookEvent(BaseModel):
+    order_code = models.BigIntegerField()
+    event = models.CharField(max_length=ENUM_LENGTH["DEFAULT"], choices=[(t.value, t.name) for t in TransactionStatus])
+    payload = models.JSONField()
+    status = models.CharField(max_length=ENUM_LENGTH["DEFAULT"], choices=[(s.value, s.name) for s in WebhookEventStatus], default=WebhookEventStatus.PENDING.value)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, null=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['order_code', 'event'], name='unique_webhook_order_code_event'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"PaymentWebhookEvent {self.order_code} ({self.event})"
+
+
+class ReconciliationCheckpoint(BaseModel):
+    """Vị trí (id giao dịch) đã quét tới của job đối soát, để chạy lại thì tiếp tục thay vì quét từ đầu."""
+    name = models.CharField(max_length=COMMON_LENGTH["NAME"], unique=True)
+    last_transaction_id = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"ReconciliationCheckpoint {self.name}: {self.last_transaction_id}"
@@ -1,12 +1,45 @@
 from rest_framework import serializers
 from .models import Bill, BillDetail, Transaction
-from common.enums import PaymentStatus, ServiceType
+from django.utils.translation import gettext_lazy as _
+from common.enums import PaymentStatus, ServiceType, TransactionStatus, PaymentMethod
 from common.constants import PAYMENT_LENGTH, DECIMAL_MAX_DIGITS, DECIMAL_DECIMAL_PLACES, COMMON_LENGTH
 
 class TransactionDTOSerializer(serializers.ModelSerializer):
     class Meta:
         model = Transaction
-        fields = ['id', 'bill_id', 'amount', 'payment_method', 'transaction_date', 'status', 'created_at', 'updated_at']
+        fields = ['id', 'bill_id', 'order_code', 'amount', 'payment_method', 'transaction_date', 'status', 'created_at', 'updated_at']
+
+class FinanceExportQuerySerializer(serializers.Serializer):
+    dataset = serializers.ChoiceField(choices=['bills', 'details', 'transactions'], default='bills')
+    output = serializers.ChoiceField(choices=['csv', 'ndjson'], default='csv')
+    date_from = serializers.DateField()
+    date_to = serializers.DateField()
+    status = serializers.CharField(required=False)
+    payment_method = serializers.ChoiceField(choices=[(m.value, m.name) for m in PaymentMethod], required=False)
+    department_id = serializers.IntegerField(required=False)
+
+    def validate(self, data):
+        if data['date_from'] > data['date_to']:
+            raise serializers.ValidationError(_("date_from phải trước hoặc bằng date_to"))
+        status_enum = TransactionStatus if data['dataset'] == 'transactions' else PaymentStatus
+        if data.get('status') and data['status'] not in [s.value for s in status_enum]:
+            raise serializers.ValidationError({"status": _("Trạng thái không hợp lệ")})
+        return data
+
+class RevenueAnalyticsQuerySerializer(serializers.Serializer):
+    MAX_DAYS = {'day': 366, 'week': 5 * 366, 'month': 10 * 366}
+
+    period = serializers.ChoiceField(choices=['day', 'week', 'month'], default='day')
+    date_from = serializers.DateField()
+    date_to = serializers.DateField()
+    group_by = serializers.ChoiceField(choices=['department', 'doctor', 'payment_method', 'payment_status'], required=False)
+
+    def validate(self, data):
+        if data['date_from'] > data['date_to']:
+            raise serializers.ValidationError(_("date_from phải trước hoặc bằng date_to"))
+        if (data['date_to'] - data['date_from']).days > self.MAX_DAYS[data['period']]:
+            raise serializers.ValidationError(_("Khoảng thời gian quá dài cho đơn vị thống kê đã chọn"))
+        return data
 
 class NewBillDetailRequestSerializer(serializers.Serializer):
     item_type = serializers.ChoiceField(choices=[(i.value, i.name) for i in ServiceType])
@@ -1,18 +1,26 @@
-import payos
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from django.conf import settings
+from django.core.cache import cache
 from django.db import transaction as django_transaction
+from django.db.models import Count, DateField, DecimalField, Exists, F, OuterRef, Sum, Value
+from django.db.models.functions import Coalesce, Concat, Trunc
 from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
-from appointments.models import Appointment 
+from appointments.models import Appointment, ServiceOrder
 
-from .models import Bill, BillDetail, Transaction
+from .models import Bill, BillDetail, Transaction, PaymentWebhookEvent, OrderCodeSequence, ReconciliationCheckpoint
 from .serializers import TransactionDTOSerializer
-from common.enums import PaymentStatus, TransactionStatus, ServiceType, PaymentMethod, AppointmentStatus # THÊM AppointmentStatus
+from .gateway import get_payos_gateway, GatewayError
+from common.enums import PaymentStatus, TransactionStatus, ServiceType, PaymentMethod, AppointmentStatus, WebhookEventStatus # THÊM AppointmentStatus
 from appointments.serializers import AppointmentSerializer
+from common.constants import PAYMENT_ORDER_CODE_OFFSET
+from common.utils import stream_csv, stream_ndjson
 
 logger = logging.getLogger(__name__)
 
@@ -55,11 +63,10 @@ class BillService:
             ]
             BillDetail.objects.bulk_create(bill_details)
 
-            # ✅ Tính lại tổng tiền từ bill_details
-            bill_details_qs = bill.details.all()
-            bill.total_cost = sum(d.total_price for d in bill_details_qs)
-            bill.insurance_discount = sum(d.insurance_discount or 0 for d in bill_details_qs)
-            bill.amount = bill.total_cost - (bill.insurance_discount or 0)
+            # ✅ Bill mới chỉ có các dòng vừa tạo nên cộng trực tiếp, không cần đọc lại từ DB
+            bill.total_cost = sum(d.total_price for d in bill_details)
+            bill.insurance_discount = sum(d.insurance_discount for d in bill_details)
+            bill.amount = bill.total_cost - bill.insurance_discount
 
         else:
             # ✅ Luồng booking (bệnh nhân đặt lịch, chưa có service)
@@ -83,6 +90,7 @@ class BillService:
             if value is not None:
                 setattr(bill, key, value)
         bill.save()
+        RevenueAnalyticsService.invalidate(bill.created_at)
         return bill
 
     def get_bill_by_id(self, id):
@@ -91,10 +99,12 @@ class BillService:
     def delete_bill(self, id):
         bill = get_object_or_404(Bill, pk=id)
         bill.delete()
+        RevenueAnalyticsService.invalidate(bill.created_at)
 
     @django_transaction.atomic
     def create_bill_detail(self, bill_id, data):
-        bill = get_object_or_404(Bill, pk=bill_id)
+        # Khóa bill để hai lần thêm chi tiết đồng thời không ghi đè tổng tiền của nhau
+        bill = get_object_or_404(Bill.objects.select_for_update(), pk=bill_id)
         bill_details = [
             BillDetail(
                 bill=bill,
@@ -108,13 +118,29 @@ class BillService:
         ]
         if bill_details:
             BillDetail.objects.bulk_create(bill_details)
-        bill_details_qs = bill.details.all()
-        bill.total_cost = sum(d.total_price for d in bill_details_qs)
-        bill.insurance_discount = sum(d.insurance_discount or 0 for d in bill_details_qs)
-        bill.amount = bill.total_cost - (bill.insurance_discount or 0)
-        bill.save()
+        self.refresh_totals(bill)
         return bill
 
+    def refresh_totals(self, bill):
+        """Tính lại tổng tiền của bill từ các dòng chi tiết bằng một truy vấn SUM"""
+        totals = bill.details.aggregate(
+            total_cost=Coalesce(Sum('total_price'), Value(0, output_field=DecimalField())),
+            insurance_discount=Coalesce(Sum('insurance_discount'), Value(0, output_field=DecimalField())),
+        )
+        bill.total_cost = totals['total_cost']
+        bill.insurance_discount = totals['insurance_discount']
+        bill.amount = bill.total_cost - bill.insurance_discount
+        bill.save(update_fields=['total_cost', 'insurance_discount', 'amount', 'updated_at'])
+        RevenueAnalyticsService.invalidate(bill.created_at)
+        return bill
+
+    @staticmethod
+    def get_service_fee(appointment_id):
+        """Tổng giá các dịch vụ đã chỉ định cho lịch khám, tính bằng một truy vấn JOIN"""
+        return ServiceOrder.objects.filter(appointment_id=appointment_id).aggregate(
+            total=Coalesce(Sum('service__price'), Value(0, output_field=DecimalField()))
+        )['total']
+
     def get_detail_by_bill(self, bill_id):
         bill = get_object_or_404(Bill, pk=bill_id)
         details = bill.details.all()
@@ -127,10 +153,7 @@ class BillService:
 
 class PayOSService:
     def __init__(self):
-        payos_config = settings.PAYOS
-        self.payos = payos.PayOS(client_id=payos_config['client_id'], 
-                            api_key=payos_config['api_key'], 
-                            checksum_key=payos_config['checksum_key'])
+        self.gateway = get_payos_gateway()
 
     def create_payment_link(self, bill_id):
         bill = get_object_or_404(Bill, pk=bill_id)
@@ -145,73 +168,58 @@ class PayOSService:
             raise ValueError(_("Số tiền thanh toán không hợp lệ"))
 
 
-        item = payos.ItemData(name=f"Hóa đơn #{bill_id}", quantity=1, price=amount)
-        order_code = int(bill_id) * 1000 + (int(timezone.now().timestamp()) % 1000)
+        order_code = self.next_order_code()
 
-        payment_data = payos.PaymentData(
-            orderCode=order_code,
-            description=f"Thanh toán hóa đơn #{bill_id}",
-            amount=amount,
-            cancelUrl=f"{settings.PAYMENT_CANCEL_URL}/{bill_id}/cancel",
-            returnUrl=f"{settings.PAYMENT_SUCCESS_URL}/{bill_id}/success",
-            items=[item]
-        )
-
-        response = self.payos.createPaymentLink(paymentData=payment_data)
-
-        # Ghi transaction với số tiền đúng
+        # Ghi transaction trước khi gọi PayOS để webhook luôn tìm thấy giao dịch theo order_code
         transaction = Transaction.objects.create(
             bill=bill,
             amount=amount,
             payment_method=PaymentMethod.ONLINE_BANKING.value,
             transaction_date=timezone.now(),
-            status=TransactionStatus.PENDING.value
+            status=TransactionStatus.PENDING.value,
+            order_code=order_code
         )
 
+        try:
+            response = self.gateway.create_payment_link(
+                order_code=order_code,
+                amount=amount,
+                description=f"Thanh toán hóa đơn #{bill_id}",
+                items=[{'name': f"Hóa đơn #{bill_id}", 'quantity': 1, 'price': amount}],
+                # Trang success/cancel nhận lại order_code để tìm đúng giao dịch bằng index unique
+                cancel_url=f"{settings.PAYMENT_CANCEL_URL}/{order_code}/cancel",
+                return_url=f"{settings.PAYMENT_SUCCESS_URL}/{order_code}/success"
+            )
+        except Exception:
+            transaction.status = TransactionStatus.FAILED.value
+            transaction.save(update_fields=['status', 'updated_at'])
+            raise
+
         return response.checkoutUrl
 
+    @staticmethod
+    def next_order_code():
+        return PAYMENT_ORDER_CODE_OFFSET + OrderCodeSequence.objects.create().pk
+
 
     def handle_payment_callback(self, webhook_data):
+        """Xác thực webhook và ghi vào hàng đợi; worker sẽ áp dụng thay đổi trạng thái sau."""
         try:
-            data = self.payos.verifyPaymentWebhookData(webhook_data)
-    
-            bill_id = data.orderCode // 1000
-            bill = get_object_or_404(Bill, pk=bill_id)
-            transaction = Transaction.objects.filter(bill=bill).order_by('-created_at').first()
-
-            logger.info(f"Processing webhook for bill_id: {bill_id}, orderCode: {data.orderCode}")
+            data = self.gateway.verify_webhook(webhook_data)
 
             is_success = (
                 webhook_data.get('success') is True or 
                 getattr(data, 'status', '') == 'PAID' or
                 webhook_data.get('status') == 'PAID'
             )
+            event = TransactionStatus.SUCCESS.value if is_success else TransactionStatus.FAILED.value
 
-            paid_amount = int(transaction.amount or 0)
-
-            if is_success:
-                if paid_amount == int(bill.amount) and bill.details.count() == 0:
-                    bill.status = PaymentStatus.BOOKING_PAID.value
-                    if bill.appointment_id:
-                        appointment = get_object_or_404(Appointment, pk=bill.appointment_id)
-                        appointment.status = AppointmentStatus.CONFIRMED.value
-                        appointment.save()
-                    logger.info(f"Bill {bill_id} set to BOOKING_PAID and appointment confirmed.")
-                elif paid_amount >= int(bill.amount):
-                    bill.status = PaymentStatus.PAID.value
-                    logger.info(f"Bill {bill_id} set to PAID.")
-
-                if transaction:
-                    transaction.status = TransactionStatus.SUCCESS.value
-            else:
-                if transaction:
-                    transaction.status = TransactionStatus.FAILED.value
-                logger.info(f"Payment failed for bill {bill_id}")
-
-            bill.save()
-            if transaction:
-                transaction.save()
-
+            # PayOS gửi lại cùng một webhook nhiều lần: ràng buộc unique (order_code, event) loại bỏ bản trùng
+            PaymentWebhookEvent.objects.bulk_create(
+                [PaymentWebhookEvent(order_code=data.orderCode, event=event, payload=webhook_data)],
+                ignore_conflicts=True
+            )
+            logger.info(f"Queued webhook for orderCode: {data.orderCode}, event: {event}")
             return data
         except Exception as e:
             logger.error(f"Error in handle_payment_callback: {str(e)}")
@@ -221,12 +229,14 @@ class PayOSService:
     def get_payment_info(self, order_id):
             try:
                 logger.info(f"Retrieving payment info for order_id {order_id}")
-                result = self.payos.getPaymentLinkInformation(orderId=order_id)
+                result = self.gateway.get_payment_link_information(order_id)
 
-                # Trích xuất bill_id từ order_id
-                bill_id_from_order = int(order_id) // 1000
-                
-                bill = get_object_or_404(Bill, id=bill_id_from_order) 
+                transaction = TransactionService().get_transaction_by_order_code(
+                    order_id, legacy_bill_id=TransactionService.legacy_bill_id(order_id)
+                )
+                if transaction is None:
+                    raise Http404(_("Không tìm thấy giao dịch"))
+                bill = transaction.bill
                 appointment = Appointment.objects.filter(id=bill.appointment_id).first()
                 
                 result_dict = {
@@ -234,7 +244,7 @@ class PayOSService:
                     'status': getattr(result, 'status', None),
                     'amount': bill.amount,
                     # Lấy description từ đối tượng result của PayOS
-                    'description': getattr(result, 'description', f"Thanh toán hóa đơn #{bill_id_from_order}"), 
+                    'description': getattr(result, 'description', f"Thanh toán hóa đơn #{bill.id}"), 
                     'createdAt': bill.created_at.isoformat(),
                     'appointment': AppointmentSerializer(appointment).data if appointment else None
                 }
@@ -246,7 +256,7 @@ class PayOSService:
 
     def cancel_payment(self, order_id):
         try:
-            result = self.payos.cancelPaymentLink(orderId=order_id)
+            result = self.gateway.cancel_payment_link(order_id)
             result_dict = {
                 'orderCode': getattr(result, 'orderCode', None),
                 'status': getattr(result, 'status', None),
@@ -263,14 +273,9 @@ class TransactionService:
 
     @django_transaction.atomic
     def process_cash_payment(self, bill_id):
-        bill = get_object_or_404(Bill, pk=bill_id)
+        bill = get_object_or_404(Bill.objects.select_for_update(), pk=bill_id)
 
-        booking_fee = int(getattr(bill.appointment, "booking_fee", 0) or 0)
-        service_fee = int(sum(
-            float(o.service.price)
-            for o in bill.appointment.serviceorder_set.all()
-            if o.service and o.service.price
-        ))
+        service_fee = int(BillService.get_service_fee(bill.appointment_id))
 
         # 🔹 Nếu bill chưa trả booking thì không cho thanh toán cash
         if bill.status == PaymentStatus.UNPAID.value:
@@ -296,6 +301,7 @@ class TransactionService:
             # Cập nhật bill thành PAID
             bill.status = PaymentStatus.PAID.value
             bill.save(update_fields=["status"])
+            RevenueAnalyticsService.invalidate(bill.created_at)
             return bill
 
         # 🔹 Nếu status khác thì báo lỗi
@@ -303,13 +309,51 @@ class TransactionService:
 
     @django_transaction.atomic
     def handle_payment_success(self, order_id):
-        bill_id = int(order_id) // 1000 if int(order_id) > 1000 else int(order_id)
-        bill = get_object_or_404(Bill, pk=bill_id)
-        transaction = Transaction.objects.filter(bill=bill).order_by('-created_at').first()
-
-        if not transaction or transaction.status != TransactionStatus.PENDING.value:
+        if not self.apply_payment_result(order_id, True):
             logger.warning(f"Payment success handler called for order {order_id} but transaction not in PENDING state or not found.")
-            return
+
+    def get_transaction_by_order_code(self, order_code, legacy_bill_id=None, lock=False):
+        """Tìm giao dịch theo order_code bằng index unique, kèm bill trong cùng một truy vấn."""
+        transactions = Transaction.objects.select_related('bill')
+        if lock:
+            transactions = transactions.select_for_update()
+        transaction = transactions.filter(order_code=int(order_code)).first()
+        if transaction is None and legacy_bill_id is not None:
+            # Giao dịch tạo trước khi có cột order_code: lấy giao dịch cũ mới nhất của hóa đơn như trước.
+            # Giao dịch đã có order_code chỉ được tìm theo order_code, không bao giờ qua phép giải mã cũ
+            transaction = (
+                transactions.filter(bill_id=legacy_bill_id, order_code__isnull=True).order_by('-created_at').first()
+            )
+        return transaction
+
+    @staticmethod
+    def legacy_bill_id(order_code):
+        """
+        bill_id của mã cũ (link tạo trước khi có order_code: bill_id * 1000 + x, hoặc bill_id trong URL trả về);
+        None với mã mới, vốn luôn >= PAYMENT_ORDER_CODE_OFFSET
+        """
+        order_code = int(order_code)
+        if order_code >= PAYMENT_ORDER_CODE_OFFSET:
+            return None
+        return order_code // 1000 if order_code > 1000 else order_code
+
+    def apply_payment_result(self, order_code, is_success):
+        """Chuyển giao dịch PENDING của order_code sang SUCCESS/FAILED; trả về False nếu không có gì để cập nhật."""
+        # Khóa bill và transaction để webhook worker và trang success không áp dụng trùng
+        transaction = self.get_transaction_by_order_code(
+            order_code, legacy_bill_id=self.legacy_bill_id(order_code), lock=True
+        )
+        if transaction is None:
+            raise Http404(_("Không tìm thấy giao dịch"))
+        if transaction.status != TransactionStatus.PENDING.value:
+            return False
+        bill = transaction.bill
+
+        if not is_success:
+            transaction.status = TransactionStatus.FAILED.value
+            transaction.save()
+            logger.info(f"Payment failed for bill {bill.id}")
+            return True
 
         paid_amount = int(transaction.amount or 0)
 
@@ -328,12 +372,18 @@ class TransactionService:
         transaction.status = TransactionStatus.SUCCESS.value
         bill.save()
         transaction.save()
+        RevenueAnalyticsService.invalidate(transaction.transaction_date, bill.created_at)
+        return True
 
 
+    @django_transaction.atomic
     def handle_payment_cancel(self, order_id):
-        bill = get_object_or_404(Bill, pk=order_id)
-        transaction = Transaction.objects.filter(bill=bill).order_by('-created_at').first()
-        if transaction and transaction.status == TransactionStatus.PENDING.value:
+        transaction = self.get_transaction_by_order_code(
+            order_id, legacy_bill_id=self.legacy_bill_id(order_id), lock=True
+        )
+        if transaction is None:
+            raise Http404(_("Không tìm thấy giao dịch"))
+        if transaction.status == TransactionStatus.PENDING.value:
             transaction.status = TransactionStatus.FAILED.value
             transaction.save()
 
@@ -356,3 +406,365 @@ class TransactionService:
         except ValueError as e:
             logger.error(f"Error retrieving transactions for bill_id={bill_id}: {str(e)}")
             raise ValueError(_("Lỗi khi lấy giao dịch: {error}").format(error=str(e)))
+
+
+class PaymentWebhookService:
+    def __init__(self):
+        self.max_attempts = settings.PAYMENT_WEBHOOKS['max_attempts']
+        self.backoff = settings.PAYMENT_WEBHOOKS['backoff']
+
+    def process_pending_events(self, batch_size=100):
+        """
+        Xử lý một lô webhook đến hạn theo thứ tự nhận, bỏ qua các dòng đang bị worker khác khóa.
+        Webhook lỗi (vd. tới trước khi giao dịch được tạo) được thử lại với backoff lũy thừa,
+        quá max_attempts lần mới chuyển sang FAILED.
+        """
+        result = {'processed': 0, 'retried': 0, 'failed': 0}
+        with django_transaction.atomic():
+            now = timezone.now()
+            events = list(
+                PaymentWebhookEvent.objects.select_for_update(skip_locked=True)
+                .filter(status=WebhookEventStatus.PENDING.value, next_attempt_at__lte=now)
+                .order_by('next_attempt_at', 'id')[:batch_size]
+            )
+            for event in events:
+                event.attempts += 1
+                event.updated_at = now
+                try:
+                    with django_transaction.atomic():
+                        self.apply_event(event)
+                except Exception as e:
+                    logger.error(f"Error processing webhook {event.id} (orderCode: {event.order_code}): {str(e)}")
+                    self._record_failure(event, e, now, result)
+                else:
+                    event.status = WebhookEventStatus.PROCESSED.value
+                    event.last_error = None
+                    event.processed_at = now
+                    result['processed'] += 1
+            if events:
+                PaymentWebhookEvent.objects.bulk_update(
+                    events, ['status', 'attempts', 'next_attempt_at', 'last_error', 'processed_at', 'updated_at']
+                )
+        return result
+
+    def _record_failure(self, event, error, now, result):
+        event.last_error = str(error)
+        if event.attempts < self.max_attempts:
+            event.next_attempt_at = now + timedelta(seconds=self.backoff * 2 ** (event.attempts - 1))
+            result['retried'] += 1
+        else:
+            event.status = WebhookEventStatus.FAILED.value
+            result['failed'] += 1
+
+    def apply_event(self, event):
+        is_success = event.event == TransactionStatus.SUCCESS.value
+        if not TransactionService().apply_payment_result(event.order_code, is_success):
+            logger.info(f"Webhook {event.id} for orderCode {event.order_code} already applied, skipping.")
+
+    def retry_failed_events(self):
+        now = timezone.now()
+        return PaymentWebhookEvent.objects.filter(status=WebhookEventStatus.FAILED.value).update(
+            status=WebhookEventStatus.PENDING.value, attempts=0, next_attempt_at=now, updated_at=now
+        )
+
+
+class FinanceExportService:
+    CHUNK_SIZE = 2000
+
+    # dataset -> (model, tiền tố tới Bill, trường ngày để lọc, trường trạng thái, [(tên cột, lookup hoặc biểu thức)])
+    DATASETS = {
+        'bills': (Bill, '', 'created_at', 'status', [
+            ('id', 'id'),
+            ('created_at', 'created_at'),
+            ('status', 'status'),
+            ('patient_id', 'patient_id'),
+            ('patient_name', Concat('patient__last_name', Value(' '), 'patient__first_name')),
+            ('appointment_id', 'appointment_id'),
+            ('doctor_id', 'appointment__doctor_id'),
+            ('department_id', 'appointment__doctor__department_id'),
+            ('department_name', 'appointment__doctor__department__department_name'),
+            ('total_cost', 'total_cost'),
+            ('insurance_discount', 'insurance_discount'),
+            ('amount', 'amount'),
+        ]),
+        'details': (BillDetail, 'bill__', 'bill__created_at', 'bill__status', [
+            ('id', 'id'),
+            ('bill_id', 'bill_id'),
+            ('bill_created_at', 'bill__created_at'),
+            ('bill_status', 'bill__status'),
+            ('department_id', 'bill__appointment__doctor__department_id'),
+            ('item_type', 'item_type'),
+            ('quantity', 'quantity'),
+            ('unit_price', 'unit_price'),
+            ('total_price', 'total_price'),
+            ('insurance_discount', 'insurance_discount'),
+        ]),
+        'transactions': (Transaction, 'bill__', 'transaction_date', 'status', [
+            ('id', 'id'),
+            ('bill_id', 'bill_id'),
+            ('order_code', 'order_code'),
+            ('transaction_date', 'transaction_date'),
+            ('status', 'status'),
+            ('payment_method', 'payment_method'),
+            ('amount', 'amount'),
+            ('patient_id', 'bill__patient_id'),
+            ('department_id', 'bill__appointment__doctor__department_id'),
+            ('department_name', 'bill__appointment__doctor__department__department_name'),
+        ]),
+    }
+
+    def get_columns(self, dataset):
+        return [name for name, _lookup in self.DATASETS[dataset][4]]
+
+    def get_rows(self, dataset, date_from, date_to, status=None, payment_method=None, department_id=None):
+        """
+        Trả về iterator các dict (values()) theo thứ tự id; dữ liệu được đọc theo từng khúc
+        CHUNK_SIZE dòng (server-side cursor trên PostgreSQL) nên bộ nhớ không tăng theo số dòng.
+        """
+        model, bill_prefix, date_field, status_field, columns = self.DATASETS[dataset]
+        queryset = model.objects.filter(**{
+            f"{date_field}__date__gte": date_from,
+            f"{date_field}__date__lte": date_to,
+        })
+        if status:
+            queryset = queryset.filter(**{status_field: status})
+        if payment_method:
+            if model is Transaction:
+                queryset = queryset.filter(payment_method=payment_method)
+            else:
+                bill_ref = OuterRef(f"{bill_prefix}id" if bill_prefix else 'id')
+                queryset = queryset.filter(Exists(
+                    Transaction.objects.filter(bill_id=bill_ref, payment_method=payment_method)
+                ))
+        if department_id:
+            queryset = queryset.filter(**{f"{bill_prefix}appointment__doctor__department_id": department_id})
+
+        fields = [name for name, lookup in columns if name == lookup]
+        expressions = {
+            name: F(lookup) if isinstance(lookup, str) else lookup
+            for name, lookup in columns if name != lookup
+        }
+        return queryset.order_by('id').values(*fields, **expressions).iterator(chunk_size=self.CHUNK_SIZE)
+
+    def stream(self, dataset, output='csv', **filters):
+        columns = self.get_columns(dataset)
+        rows = self.get_rows(dataset, **filters)
+        if output == 'ndjson':
+            return stream_ndjson({name: row[name] for name in columns} for row in rows)
+        return stream_csv(columns, rows)
+
+
+class RevenueAnalyticsService:
+    PERIODS = ['day', 'week', 'month']
+    VERSION_KEY = 'revenue_analytics:version'
+
+    # group_by -> (model, trường ngày, khóa nhóm, nhãn); không group_by thì chỉ tính tổng
+    DIMENSIONS = {
+        None: (Transaction, 'transaction_date', None, None),
+        'department': (
+            Transaction, 'transaction_date',
+            'bill__appointment__doctor__department_id',
+            F('bill__appointment__doctor__department__department_name'),
+        ),
+        'doctor': (
+            Transaction, 'transaction_date',
+            'bill__appointment__doctor_id',
+            Concat('bill__appointment__doctor__last_name', Value(' '), 'bill__appointment__doctor__first_name'),
+        ),
+        'payment_method': (Transaction, 'transaction_date', 'payment_method', None),
+        'payment_status': (Bill, 'created_at', 'status', None),
+    }
+    ENUM_LABELS = {
+        'payment_method': PaymentMethod,
+        'payment_status': PaymentStatus,
+    }
+
+    @staticmethod
+    def bucket_start(day, period):
+        if period == 'week':
+            return day - timedelta(days=day.weekday())
+        if period == 'month':
+            return day.replace(day=1)
+        return day
+
+    @staticmethod
+    def next_bucket(start, period):
+        if period == 'week':
+            return start + timedelta(days=7)
+        if period == 'month':
+            return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+        return start + timedelta(days=1)
+
+    def get_buckets(self, period, date_from, date_to):
+        buckets = []
+        start = self.bucket_start(date_from, period)
+        while start <= date_to:
+            buckets.append(start)
+            start = self.next_bucket(start, period)
+        return buckets
+
+    def get_revenue(self, period, date_from, date_to, group_by=None):
+        """
+        Doanh thu theo từng khoảng thời gian (ngày/tuần/tháng), có thể tách theo khoa, bác sĩ,
+        phương thức hoặc trạng thái thanh toán. Khoảng đã đóng được lưu cache REVENUE_ANALYTICS_CACHE_TTL giây;
+        chỉ khoảng hiện tại (và khoảng chưa có trong cache) được tính lại bằng một truy vấn GROUP BY.
+        """
+        buckets = self.get_buckets(period, date_from, date_to)
+        open_bucket = self.bucket_start(timezone.localdate(), period)
+        version = cache.get(self.VERSION_KEY, 0)
+        keys = {
+            bucket: f"revenue_analytics:{version}:{period}:{group_by or 'total'}:{bucket.isoformat()}"
+            for bucket in buckets if bucket < open_bucket
+        }
+        cached = cache.get_many(list(keys.values()))
+        rows_by_bucket = {bucket: cached[key] for bucket, key in keys.items() if key in cached}
+        missing = [bucket for bucket in buckets if bucket not in rows_by_bucket]
+        if missing:
+            computed = self._aggregate(period, group_by, missing[0], self.next_bucket(missing[-1], period))
+            for bucket in missing:
+                rows_by_bucket[bucket] = computed.get(bucket, [])
+            cache.set_many(
+                {keys[bucket]: rows_by_bucket[bucket] for bucket in missing if bucket in keys},
+                settings.REVENUE_ANALYTICS_CACHE_TTL
+            )
+        return self._to_series(period, group_by, buckets, rows_by_bucket)
+
+    def _aggregate(self, period, group_by, start, end):
+        model, date_field, key_field, label = self.DIMENSIONS[group_by]
+        queryset = model.objects.filter(**{
+            f"{date_field}__gte": timezone.make_aware(datetime.combine(start, datetime.min.time())),
+            f"{date_field}__lt": timezone.make_aware(datetime.combine(end, datetime.min.time())),
+        })
+        if model is Transaction:
+            queryset = queryset.filter(status=TransactionStatus.SUCCESS.value)
+
+        group = {'bucket': Trunc(date_field, period, output_field=DateField())}
+        if key_field:
+            group['key'] = F(key_field)
+        if label is not None:
+            group['label'] = label
+        rows = queryset.values(**group).annotate(total=Sum('amount'), count=Count('id')).order_by('bucket')
+
+        result = {}
+        enum_class = self.ENUM_LABELS.get(group_by)
+        for row in rows:
+            key = row.get('key')
+            if enum_class is not None:
+                row['label'] = enum_class(key).name if key in {e.value for e in enum_class} else key
+            result.setdefault(row['bucket'], []).append(
+                [key, row.get('label'), float(row['total'] or 0), row['count']]
+            )
+        return result
+
+    @staticmethod
+    def _to_series(period, group_by, buckets, rows_by_bucket):
+        """Chuyển về dạng mảng song song theo buckets để frontend vẽ biểu đồ trực tiếp."""
+        index = {bucket: i for i, bucket in enumerate(buckets)}
+        total = {'amount': [0.0] * len(buckets), 'count': [0] * len(buckets)}
+        series = {}
+        for bucket, rows in rows_by_bucket.items():
+            i = index[bucket]
+            for key, label, amount, count in rows:
+                total['amount'][i] += amount
+                total['count'][i] += count
+                if group_by:
+                    item = series.setdefault(key, {
+                        'key': key, 'label': label,
+                        'amount': [0.0] * len(buckets), 'count': [0] * len(buckets)
+                    })
+                    item['amount'][i] += amount
+                    item['count'][i] += count
+        return {
+            'period': period,
+            'group_by': group_by,
+            'buckets': [bucket.isoformat() for bucket in buckets],
+            'total': total,
+            'series': sorted(series.values(), key=lambda item: -sum(item['amount'])),
+        }
+
+    @classmethod
+    def invalidate(cls, *moments):
+        """
+        Bỏ cache của các khoảng đã đóng khi dữ liệu thuộc ngày trước hôm nay bị thay đổi.
+        Version nằm trong cache nên chỉ áp dụng cho mọi worker khi dùng cache chung (Redis).
+        """
+        today = timezone.localdate()
+        if any(moment is not None and timezone.localdate(moment) < today for moment in moments):
+            # Đổi version sau commit để request đọc song song không cache lại dữ liệu cũ
+            django_transaction.on_commit(lambda: cache.set(cls.VERSION_KEY, time.time_ns(), None))
+
+
+class ReconciliationService:
+    CHECKPOINT_NAME = 'pending_transactions'
+    FAILED_STATUSES = {'CANCELLED', 'EXPIRED', 'FAILED'}
+
+    def __init__(self, gateway=None):
+        self.gateway = gateway or get_payos_gateway()
+
+    def reconcile(self, older_than, batch_size=200, concurrency=8, expire_after=None):
+        """Đối soát toàn bộ giao dịch PENDING quá hạn theo từng lô, tiếp tục từ checkpoint của lần chạy trước."""
+        totals = {'checked': 0, 'paid': 0, 'failed': 0, 'pending': 0, 'errors': 0}
+        while True:
+            result = self.reconcile_batch(older_than, batch_size, concurrency, expire_after)
+            for key in totals:
+                totals[key] += result[key]
+            if result['done']:
+                return totals
+
+    def reconcile_batch(self, older_than, batch_size=200, concurrency=8, expire_after=None):
+        """
+        Hỏi PayOS trạng thái của một lô giao dịch PENDING (tối đa `concurrency` request song song)
+        rồi cập nhật DB: link đã hủy/hết hạn chuyển FAILED bằng một câu UPDATE, link đã thanh toán
+        đi qua apply_payment_result như webhook. Checkpoint lưu id cuối của lô.
+        """
+        now = timezone.now()
+        checkpoint, _created = ReconciliationCheckpoint.objects.get_or_create(name=self.CHECKPOINT_NAME)
+        batch = list(
+            Transaction.objects.filter(
+                status=TransactionStatus.PENDING.value,
+                order_code__isnull=False,
+                id__gt=checkpoint.last_transaction_id,
+                created_at__lt=now - older_than,
+            ).order_by('id').values('id', 'order_code', 'created_at')[:batch_size]
+        )
+        result = {'checked': len(batch), 'paid': 0, 'failed': 0, 'pending': 0, 'errors': 0, 'done': len(batch) < batch_size}
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            gateway_statuses = list(pool.map(self._fetch_status, [row['order_code'] for row in batch]))
+
+        paid, failed = [], []
+        for row, gateway_status in zip(batch, gateway_statuses):
+            if gateway_status is None:
+                result['errors'] += 1
+            elif gateway_status == 'PAID':
+                paid.append(row['order_code'])
+            elif gateway_status in self.FAILED_STATUSES or (expire_after and row['created_at'] < now - expire_after):
+                failed.append(row['id'])
+            else:
+                result['pending'] += 1
+
+        with django_transaction.atomic():
+            if failed:
+                result['failed'] = Transaction.objects.filter(
+                    id__in=failed, status=TransactionStatus.PENDING.value
+                ).update(status=TransactionStatus.FAILED.value, updated_at=now)
+            transaction_service = TransactionService()
+            for order_code in paid:
+                if transaction_service.apply_payment_result(order_code, True):
+                    result['paid'] += 1
+            # Hết một vòng quét thì lần sau bắt đầu lại từ đầu cho các giao dịch vẫn đang chờ
+            checkpoint.last_transaction_id = 0 if result['done'] else batch[-1]['id']
+            checkpoint.save(update_fields=['last_transaction_id', 'updated_at'])
+
+        logger.info(f"Reconciled {result['checked']} pending transaction(s): {result}")
+        return result
+
+    def _fetch_status(self, order_code):
+        try:
+            return self.gateway.get_payment_link_information(order_code).status
+        except GatewayError as e:
+            logger.warning(f"Cannot reconcile orderCode {order_code}: {str(e)}")
+            return None
+
+    def reset_checkpoint(self):
+        ReconciliationCheckpoint.objects.filter(name=self.CHECKPOINT_NAME).update(last_transaction_id=0)
@@ -0,0 +1,160 @@
+"""Máy chủ PayOS giả lập chạy cục bộ, dùng cho test và đo hiệu năng client thanh toán."""
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .gateway import create_signature
+
+PAYMENT_REQUEST_PATH = re.compile(r'^/v2/payment-requests/(?P<order_code>\d+)(?P<cancel>/cancel)?/?$')
+
+
+class StubPayOSHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 để client có thể giữ kết nối keep-alive như với PayOS thật
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        match = PAYMENT_REQUEST_PATH.match(self.path)
+        if not match or match.group('cancel'):
+            return self._send(404, {'code': '404', 'desc': 'Not found', 'data': None})
+        self._handle(lambda: self.server.get_link(int(match.group('order_code'))))
+
+    def do_POST(self):
+        body = self._read_body()
+        if self.path.rstrip('/') == '/v2/payment-requests':
+            return self._handle(lambda: self.server.create_link(body))
+        match = PAYMENT_REQUEST_PATH.match(self.path)
+        if not match or not match.group('cancel'):
+            return self._send(404, {'code': '404', 'desc': 'Not found', 'data': None})
+        self._handle(lambda: self.server.cancel_link(int(match.group('order_code')), body.get('cancellationReason')))
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _handle(self, action):
+        server = self.server
+        server.record_request()
+        if server.latency:
+            time.sleep(server.latency)
+        if server.take_failure():
+            return self._send(503, {'code': '503', 'desc': 'Service unavailable', 'data': None})
+        code, desc, data = action()
+        payload = {'code': code, 'desc': desc, 'data': data}
+        if data is not None and server.checksum_key:
+            payload['signature'] = create_signature(data, server.checksum_key)
+        self._send(200, payload)
+
+    def _send(self, status_code, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StubPayOSServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), latency=0.0, checksum_key=None):
+        super().__init__(address, StubPayOSHandler)
+        self.latency = latency
+        self.checksum_key = checksum_key
+        self.links = {}
+        self.connection_count = 0
+        self.request_count = 0
+        self._failures_left = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def process_request(self, request, client_address):
+        with self._lock:
+            self.connection_count += 1
+        super().process_request(request, client_address)
+
+    def record_request(self):
+        with self._lock:
+            self.request_count += 1
+
+    def fail_next(self, count):
+        """Trả 503 cho `count` request tiếp theo."""
+        with self._lock:
+            self._failures_left = count
+
+    def take_failure(self):
+        with self._lock:
+            if self._failures_left > 0:
+                self._failures_left -= 1
+                return True
+            return False
+
+    def set_status(self, order_code, status):
+        with self._lock:
+            self.links[order_code]['status'] = status
+
+    def create_link(self, body):
+        if self.checksum_key:
+            signed = {key: body.get(key) for key in ('amount', 'cancelUrl', 'description', 'orderCode', 'returnUrl')}
+            if create_signature(signed, self.checksum_key) != body.get('signature'):
+                return '201', 'Invalid signature', None
+        order_code = body['orderCode']
+        with self._lock:
+            if order_code in self.links:
+                return '231', 'Đơn thanh toán đã tồn tại', None
+            link_id = uuid.uuid4().hex
+            self.links[order_code] = {
+                'id': link_id,
+                'orderCode': order_code,
+                'amount': body['amount'],
+                'amountPaid': 0,
+                'amountRemaining': body['amount'],
+                'description': body.get('description'),
+                'status': 'PENDING',
+                'createdAt': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'cancellationReason': None,
+            }
+        return '00', 'success', {
+            'paymentLinkId': link_id,
+            'orderCode': order_code,
+            'amount': body['amount'],
+            'description': body.get('description'),
+            'status': 'PENDING',
+            'checkoutUrl': f"{self.base_url}/web/{link_id}",
+        }
+
+    def get_link(self, order_code):
+        with self._lock:
+            link = self.links.get(order_code)
+            if link is None:
+                return '101', 'Không tìm thấy đơn thanh toán', None
+            return '00', 'success', dict(link)
+
+    def cancel_link(self, order_code, reason):
+        with self._lock:
+            link = self.links.get(order_code)
+            if link is None:
+                return '101', 'Không tìm thấy đơn thanh toán', None
+            if link['status'] == 'PENDING':
+                link['status'] = 'CANCELLED'
+                link['cancellationReason'] = reason
+            return '00', 'success', dict(link)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
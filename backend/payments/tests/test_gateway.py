@@ -0,0 +1,154 @@
+from django.test import SimpleTestCase
+from payments.gateway import PayOSGateway, GatewayError, GatewayUnavailableError, CircuitOpenError, create_signature
+from payments.stub_gateway import StubPayOSServer
+
+CHECKSUM_KEY = 'test-checksum-key'
+
+
+class PayOSGatewayTest(SimpleTestCase):
+    def setUp(self):
+        self.server = StubPayOSServer(checksum_key=CHECKSUM_KEY).start()
+        self.gateway = self._gateway()
+
+    def tearDown(self):
+        self.gateway.close()
+        self.server.stop()
+
+    def _gateway(self, gateway_class=PayOSGateway, **options):
+        options.setdefault('backoff', 0)
+        return gateway_class('client', 'api-key', CHECKSUM_KEY, self.server.base_url, **options)
+
+    def _create(self, gateway, order_code=1001):
+        return gateway.create_payment_link(
+            order_code, 150000, "Thanh toán hóa đơn #1",
+            [{'name': "Hóa đơn #1", 'quantity': 1, 'price': 150000}],
+            "http://localhost/cancel", "http://localhost/success"
+        )
+
+    def test_create_get_and_cancel_payment_link(self):
+        created = self._create(self.gateway)
+        self.assertEqual(created.orderCode, 1001)
+        self.assertTrue(created.checkoutUrl.startswith(self.server.base_url))
+
+        info = self.gateway.get_payment_link_information(1001)
+        self.assertEqual(info.status, 'PENDING')
+        self.assertEqual(info.amount, 150000)
+
+        cancelled = self.gateway.cancel_payment_link(1001, reason="Người dùng hủy")
+        self.assertEqual(cancelled.status, 'CANCELLED')
+
+    def test_business_error_is_raised(self):
+        self._create(self.gateway)
+        with self.assertRaises(GatewayError) as context:
+            self._create(self.gateway)
+        self.assertNotIsInstance(context.exception, GatewayUnavailableError)
+        self.assertFalse(self.gateway.breaker.is_open)
+
+    def test_connections_are_reused(self):
+        self._create(self.gateway)
+        for _ in range(10):
+            self.gateway.get_payment_link_information(1001)
+        self.assertEqual(self.server.connection_count, 1)
+
+    def test_idempotent_request_is_retried(self):
+        self._create(self.gateway)
+        self.server.fail_next(2)
+        info = self.gateway.get_payment_link_information(1001)
+        self.assertEqual(info.orderCode, 1001)
+        self.assertEqual(self.server.request_count, 4)
+
+    def test_create_is_not_retried_after_server_error(self):
+        self.server.fail_next(1)
+        with self.assertRaises(GatewayUnavailableError):
+            self._create(self.gateway)
+        self.assertEqual(self.server.request_count, 1)
+
+    def test_circuit_breaker_opens_after_failures(self):
+        gateway = self._gateway(max_retries=0, breaker_threshold=2, breaker_reset=60)
+        self.server.fail_next(5)
+        for _ in range(2):
+            with self.assertRaises(GatewayUnavailableError):
+                gateway.get_payment_link_information(1001)
+        with self.assertRaises(CircuitOpenError):
+            gateway.get_payment_link_information(1001)
+        self.assertEqual(self.server.request_count, 2)
+        gateway.close()
+
+    def test_circuit_breaker_half_open_recovers(self):
+        gateway = self._gateway(max_retries=0, breaker_threshold=1, breaker_reset=0)
+        self._create(gateway)
+        self.server.fail_next(1)
+        with self.assertRaises(GatewayUnavailableError):
+            gateway.get_payment_link_information(1001)
+        self.assertTrue(gateway.breaker.is_open)
+        gateway.get_payment_link_information(1001)
+        self.assertFalse(gateway.breaker.is_open)
+        gateway.close()
+
+    def test_connection_error_is_unavailable(self):
+        gateway = PayOSGateway('client', 'api-key', CHECKSUM_KEY, 'http://127.0.0.1:1', max_retries=1, backoff=0)
+        with self.assertRaises(GatewayUnavailableError):
+            gateway.get_payment_link_information(1001)
+        gateway.close()
+
+    def test_verify_webhook(self):
+        data = {'orderCode': 1001, 'amount': 150000, 'code': '00', 'desc': 'success', 'reference': None}
+        body = {'code': '00', 'success': True, 'data': data, 'signature': create_signature(data, CHECKSUM_KEY)}
+        self.assertEqual(self.gateway.verify_webhook(body).orderCode, 1001)
+
+        body['signature'] = 'invalid'
+        with self.assertRaises(ValueError):
+            self.gateway.verify_webhook(body)
+        with self.assertRaises(ValueError):
+            self.gateway.verify_webhook({'signature': 'x'})
+
+    def test_unsigned_or_tampered_response_is_rejected(self):
+        gateway = PayOSGateway('client', 'api-key', 'other-key', self.server.base_url, backoff=0)
+        self._create(self.gateway)
+        with self.assertRaises(GatewayError) as context:
+            gateway.get_payment_link_information(1001)
+        self.assertNotIsInstance(context.exception, GatewayUnavailableError)
+        gateway.close()
+
+
+class SignatureTest(SimpleTestCase):
+    # Chữ ký mẫu tạo bằng CryptoProvider của SDK payOS (payos 1.1.0) với CHECKSUM_KEY
+    def test_webhook_data(self):
+        data = {
+            'orderCode': 123, 'amount': 3000, 'description': 'VQRIO123', 'accountNumber': '12345678',
+            'reference': 'TF230204212323', 'transactionDateTime': '2023-02-04 18:25:00', 'currency': 'VND',
+            'paymentLinkId': '124c33293c43417ab7879e14c8d9eb18', 'code': '00', 'desc': 'Thành công',
+            'counterAccountBankId': '', 'counterAccountBankName': '', 'counterAccountName': None,
+            'counterAccountNumber': None, 'virtualAccountName': '', 'virtualAccountNumber': '',
+        }
+        self.assertEqual(
+            create_signature(data, CHECKSUM_KEY), '15cd38e52473536ad13caec70a9d5fd6446d63812d84e3ab2af193feb5dded64'
+        )
+
+    def test_nested_list_keeps_unicode(self):
+        data = {
+            'id': 'abc', 'orderCode': 1001, 'amount': 150000, 'amountPaid': 0, 'amountRemaining': 150000,
+            'status': 'PENDING', 'createdAt': '2025-01-01T10:00:00+07:00',
+            'transactions': [
+                {'reference': 'FT1', 'amount': 150000, 'description': 'Thanh toán hóa đơn #1', 'virtualAccountName': None}
+            ],
+            'cancellationReason': None, 'canceledAt': None,
+        }
+        self.assertEqual(
+            create_signature(data, CHECKSUM_KEY), 'a77db52d4a234dd421b4e6e7d63b5bcd234f6d3756b7432946a14b59ebc99195'
+        )
+
+    def test_booleans_are_lowercase(self):
+        data = {'orderCode': 1001, 'success': True, 'isTest': False}
+        self.assertEqual(
+            create_signature(data, CHECKSUM_KEY), 'a93e91f372d990e430abb105e6c02370272d5e63eec6c721957983e8bc7d1d1c'
+        )
+
+    def test_payment_request(self):
+        data = {
+            'orderCode': 1001, 'amount': 150000, 'description': 'Thanh toán hóa đơn #1',
+            'cancelUrl': 'http://localhost/cancel', 'returnUrl': 'http://localhost/success',
+        }
+        self.assertEqual(
+            create_signature(data, CHECKSUM_KEY), '10f09ac76f3d1e13a0bd64a16159ff6587481522a2c90bf15966fa7be44a7cc0'
+        )
@@ -1,17 +1,23 @@
-from django.test import TestCase
+from concurrent.futures import ThreadPoolExecutor
+from django.db import connection
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
 from unittest.mock import patch, MagicMock
 from django.http import Http404
 from django.utils import timezone
-from datetime import date, time
+from datetime import date, time, datetime, timedelta
 from decimal import Decimal
-from payments.services import BillService, PayOSService, TransactionService
-from payments.models import Bill, BillDetail, Transaction
+from payments.services import BillService, PayOSService, TransactionService, PaymentWebhookService, RevenueAnalyticsService, ReconciliationService
+from payments.gateway import PayOSGateway, create_signature
+from payments.stub_gateway import StubPayOSServer
+from payments.models import Bill, BillDetail, Transaction, PaymentWebhookEvent, ReconciliationCheckpoint
 from appointments.models import Appointment, Service, ServiceOrder
 from patients.models import Patient
 from users.models import User
 from doctors.models import Doctor, Department, ExaminationRoom, Schedule
-from common.enums import DoctorType, PaymentStatus, PaymentMethod, TransactionStatus, ServiceType, Gender, AcademicDegree, UserRole, AppointmentStatus, OrderStatus, RoomType, Shift
-from common.constants import DECIMAL_MAX_DIGITS, DECIMAL_DECIMAL_PLACES, SCHEDULE_DEFAULTS
+from common.enums import DoctorType, PaymentStatus, PaymentMethod, TransactionStatus, ServiceType, Gender, AcademicDegree, UserRole, AppointmentStatus, OrderStatus, RoomType, Shift, WebhookEventStatus
+from common.constants import DECIMAL_MAX_DIGITS, DECIMAL_DECIMAL_PLACES, SCHEDULE_DEFAULTS, PAYMENT_ORDER_CODE_OFFSET
 import logging
 
 class BillServiceTest(TestCase):
@@ -180,6 +186,29 @@ class BillServiceTest(TestCase):
         with self.assertRaises(Http404):
             service.create_bill_detail(999, data)
 
+    def test_create_bill_detail_query_count_is_constant(self):
+        service = BillService()
+        line = {'item_type': ServiceType.TEST.value, 'quantity': 2, 'unit_price': Decimal('10.00'), 'insurance_discount': Decimal('1.00')}
+        with CaptureQueriesContext(connection) as small:
+            service.create_bill_detail(self.bill.id, [line] * 2)
+        with CaptureQueriesContext(connection) as large:
+            bill = service.create_bill_detail(self.bill.id, [line] * 40)
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(bill.total_cost, Decimal('840.00'))
+        self.assertEqual(bill.insurance_discount, Decimal('42.00'))
+        self.assertEqual(bill.amount, Decimal('798.00'))
+        bill.refresh_from_db()
+        self.assertEqual(bill.amount, Decimal('798.00'))
+
+    def test_get_service_fee(self):
+        room = ExaminationRoom.objects.create(department=self.department, type=RoomType.TEST.value, building="B", floor=2)
+        for price in ('30.00', '20.50'):
+            service = Service.objects.create(service_name=f"Service {price}", service_type=ServiceType.TEST.value, price=Decimal(price))
+            ServiceOrder.objects.create(appointment=self.appointment, room=room, service=service, status=OrderStatus.ORDERED.value)
+        with self.assertNumQueries(1):
+            self.assertEqual(BillService.get_service_fee(self.appointment.id), Decimal('50.50'))
+        self.assertEqual(BillService.get_service_fee(self.appointment2.id), 0)
+
     def test_get_detail_by_bill(self):
         # First add detail
         BillDetail.objects.create(
@@ -285,27 +314,27 @@ class PayOSServiceTest(TestCase):
             status=PaymentStatus.UNPAID.value
         )
 
-    @patch('payments.services.payos.PayOS')
+    @patch('payments.services.get_payos_gateway')
     def test_create_payment_link(self, mock_payos_class):
         mock_payos = mock_payos_class.return_value
         mock_response = MagicMock()
         mock_response.checkoutUrl = 'http://test.url'
-        mock_payos.createPaymentLink.return_value = mock_response
+        mock_payos.create_payment_link.return_value = mock_response
         service = PayOSService()
         url = service.create_payment_link(self.bill.id)
         self.assertEqual(url, 'http://test.url')
-        mock_payos.createPaymentLink.assert_called_once()
+        mock_payos.create_payment_link.assert_called_once()
         # Test paid bill
         self.bill.status = PaymentStatus.PAID.value
         self.bill.save()
         with self.assertRaises(ValueError):
             service.create_payment_link(self.bill.id)
 
-    @patch('payments.services.payos.PayOS')
+    @patch('payments.services.get_payos_gateway')
     def test_cancel_payment(self, mock_payos_class):
         mock_payos = mock_payos_class.return_value
         mock_response = MagicMock(orderCode=123, status='CANCELLED')
-        mock_payos.cancelPaymentLink.return_value = mock_response
+        mock_payos.cancel_payment_link.return_value = mock_response
         service = PayOSService()
         result = service.cancel_payment(123)
         self.assertEqual(result['status'], 'CANCELLED')
@@ -508,3 +537,459 @@ class TransactionServiceTest(TestCase):
         # No bill
         with self.assertRaises(Http404):
             service.get_transactions_by_bill_id(999)
+
+
+class PaymentFixtureMixin:
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='webhook@example.com',
+            password='testpass123',
+            role=UserRole.PATIENT.value
+        )
+        cls.patient = Patient.objects.create(
+            user=cls.user,
+            first_name='Test',
+            last_name='Patient',
+            identity_number='444555666',
+            insurance_number='INS654321',
+            birthday=date(1990, 1, 1),
+            gender=Gender.FEMALE.value
+        )
+        cls.department = Department.objects.create(department_name="Cardiology")
+        cls.doctor = Doctor.objects.create(
+            user=cls.user,
+            first_name="John",
+            last_name="Doe",
+            identity_number="987654321",
+            birthday=date(1980, 1, 1),
+            gender=Gender.MALE.value,
+            academic_degree=AcademicDegree.BS_CKI.value,
+            specialization="Cardiologist",
+            type=DoctorType.EXAMINATION.value,
+            department=cls.department,
+            price=Decimal('100.00')
+        )
+        cls.room = ExaminationRoom.objects.create(
+            department=cls.department,
+            type=RoomType.EXAMINATION.value,
+            building="A",
+            floor=1
+        )
+        cls.schedule = Schedule.objects.create(
+            doctor=cls.doctor,
+            room=cls.room,
+            work_date=date(2025, 8, 26),
+            start_time=time(8, 0),
+            end_time=time(12, 0),
+            shift=Shift.MORNING.value,
+            status="AVAILABLE"
+        )
+        cls.appointment = Appointment.objects.create(
+            doctor=cls.doctor,
+            patient=cls.patient,
+            schedule=cls.schedule,
+            symptoms="Fever",
+            slot_start=time(8, 0),
+            slot_end=time(8, 30),
+            status=AppointmentStatus.PENDING.value
+        )
+        cls.bill = Bill.objects.create(
+            appointment=cls.appointment,
+            patient=cls.patient,
+            total_cost=Decimal('100.00'),
+            insurance_discount=Decimal('0.00'),
+            amount=Decimal('100.00'),
+            status=PaymentStatus.UNPAID.value
+        )
+        cls.transaction = Transaction.objects.create(
+            bill=cls.bill,
+            amount=Decimal('100.00'),
+            payment_method=PaymentMethod.ONLINE_BANKING.value,
+            transaction_date=timezone.now(),
+            status=TransactionStatus.PENDING.value
+        )
+
+
+class PaymentWebhookServiceTest(PaymentFixtureMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.order_code = cls.bill.id * 1000 + 1
+
+    def _webhook(self, success=True):
+        return {'code': '00' if success else '01', 'success': success, 'data': {'orderCode': self.order_code}, 'signature': 'sig'}
+
+    def _queue(self, mock_get_gateway, success=True):
+        mock_get_gateway.return_value.verify_webhook.return_value = MagicMock(orderCode=self.order_code, status='')
+        PayOSService().handle_payment_callback(self._webhook(success))
+
+    @patch('payments.services.get_payos_gateway')
+    def test_callback_only_queues_event(self, mock_get_gateway):
+        mock_get_gateway.return_value.verify_webhook.return_value = MagicMock(orderCode=self.order_code, status='')
+        service = PayOSService()
+        with self.assertNumQueries(1):
+            service.handle_payment_callback(self._webhook())
+        event = PaymentWebhookEvent.objects.get()
+        self.assertEqual(event.order_code, self.order_code)
+        self.assertEqual(event.event, TransactionStatus.SUCCESS.value)
+        self.assertEqual(event.status, WebhookEventStatus.PENDING.value)
+        self.transaction.refresh_from_db()
+        self.assertEqual(self.transaction.status, TransactionStatus.PENDING.value)
+
+    @patch('payments.services.get_payos_gateway')
+    def test_duplicate_callbacks_are_deduplicated(self, mock_get_gateway):
+        for _ in range(3):
+            self._queue(mock_get_gateway)
+        self._queue(mock_get_gateway, success=False)
+        self.assertEqual(PaymentWebhookEvent.objects.count(), 2)
+
+    @patch('payments.services.get_payos_gateway')
+    def test_process_pending_events_applies_once(self, mock_get_gateway):
+        self._queue(mock_get_gateway)
+        self._queue(mock_get_gateway, success=False)
+        result = PaymentWebhookService().process_pending_events()
+        self.assertEqual(result, {'processed': 2, 'retried': 0, 'failed': 0})
+
+        self.transaction.refresh_from_db()
+        self.assertEqual(self.transaction.status, TransactionStatus.SUCCESS.value)
+        self.bill.refresh_from_db()
+        self.assertEqual(self.bill.status, PaymentStatus.BOOKING_PAID.value)
+        self.appointment.refresh_from_db()
+        self.assertEqual(self.appointment.status, AppointmentStatus.CONFIRMED.value)
+        self.assertFalse(PaymentWebhookEvent.objects.exclude(status=WebhookEventStatus.PROCESSED.value).exists())
+
+        # Webhook gửi lại sau khi đã xử lý không tạo thay đổi mới
+        self._queue(mock_get_gateway)
+        self.assertEqual(PaymentWebhookService().process_pending_events(), {'processed': 0, 'retried': 0, 'failed': 0})
+
+    @patch('payments.services.get_payos_gateway')
+    def test_success_page_after_webhook_is_noop(self, mock_get_gateway):
+        self._queue(mock_get_gateway)
+        PaymentWebhookService().process_pending_events()
+        with patch('payments.services.logger.warning') as mock_logger:
+            TransactionService().handle_payment_success(self.order_code)
+            mock_logger.assert_called()
+
+    @patch('payments.services.get_payos_gateway')
+    def test_payment_links_get_distinct_order_codes(self, mock_get_gateway):
+        mock_get_gateway.return_value.create_payment_link.return_value = MagicMock(checkoutUrl='http://test.url')
+        service = PayOSService()
+        for _ in range(5):
+            service.create_payment_link(self.bill.id)
+
+        order_codes = list(
+            Transaction.objects.filter(order_code__isnull=False).order_by('id').values_list('order_code', flat=True)
+        )
+        self.assertEqual(len(set(order_codes)), 5)
+        self.assertTrue(all(code >= PAYMENT_ORDER_CODE_OFFSET for code in order_codes))
+        sent_codes = [call.kwargs['order_code'] for call in mock_get_gateway.return_value.create_payment_link.call_args_list]
+        self.assertEqual(sent_codes, order_codes)
+
+        # Webhook của link thứ ba chỉ cập nhật đúng giao dịch đó
+        PaymentWebhookEvent.objects.create(order_code=order_codes[2], event=TransactionStatus.SUCCESS.value, payload={})
+        PaymentWebhookService().process_pending_events()
+        statuses = dict(Transaction.objects.filter(order_code__in=order_codes).values_list('order_code', 'status'))
+        self.assertEqual(statuses.pop(order_codes[2]), TransactionStatus.SUCCESS.value)
+        self.assertEqual(set(statuses.values()), {TransactionStatus.PENDING.value})
+
+    @patch('payments.services.get_payos_gateway')
+    def test_return_urls_carry_order_code(self, mock_get_gateway):
+        mock_get_gateway.return_value.create_payment_link.return_value = MagicMock(checkoutUrl='http://test.url')
+        PayOSService().create_payment_link(self.bill.id)
+        transaction = Transaction.objects.get(order_code__isnull=False)
+        kwargs = mock_get_gateway.return_value.create_payment_link.call_args.kwargs
+        self.assertTrue(kwargs['return_url'].endswith(f"/{transaction.order_code}/success"))
+        self.assertTrue(kwargs['cancel_url'].endswith(f"/{transaction.order_code}/cancel"))
+
+        # Trang cancel tìm đúng giao dịch theo order_code, giao dịch cũ của hóa đơn không bị đụng tới
+        TransactionService().handle_payment_cancel(transaction.order_code)
+        transaction.refresh_from_db()
+        self.assertEqual(transaction.status, TransactionStatus.FAILED.value)
+        self.transaction.refresh_from_db()
+        self.assertEqual(self.transaction.status, TransactionStatus.PENDING.value)
+
+    @patch('payments.services.get_payos_gateway')
+    def test_legacy_code_never_resolves_new_transaction(self, mock_get_gateway):
+        mock_get_gateway.return_value.create_payment_link.return_value = MagicMock(checkoutUrl='http://test.url')
+        self.transaction.delete()
+        PayOSService().create_payment_link(self.bill.id)
+        service = TransactionService()
+        # Mã cũ giải mã ra đúng hóa đơn này nhưng giao dịch mới chỉ tìm được qua order_code
+        for handler in (service.handle_payment_success, service.handle_payment_cancel):
+            with self.assertRaises(Http404):
+                handler(self.order_code)
+        self.assertEqual(Transaction.objects.get().status, TransactionStatus.PENDING.value)
+
+    @patch('payments.services.get_payos_gateway')
+    def test_gateway_error_marks_transaction_failed(self, mock_get_gateway):
+        mock_get_gateway.return_value.create_payment_link.side_effect = Exception('Gateway down')
+        with self.assertRaises(Exception):
+            PayOSService().create_payment_link(self.bill.id)
+        transaction = Transaction.objects.get(order_code__isnull=False)
+        self.assertEqual(transaction.status, TransactionStatus.FAILED.value)
+
+    def test_get_transaction_by_order_code(self):
+        self.transaction.order_code = PAYMENT_ORDER_CODE_OFFSET + 7
+        self.transaction.save()
+        service = TransactionService()
+        with self.assertNumQueries(1):
+            transaction = service.get_transaction_by_order_code(self.transaction.order_code)
+            self.assertEqual(transaction.bill, self.bill)
+        self.assertIsNone(service.get_transaction_by_order_code(PAYMENT_ORDER_CODE_OFFSET + 8))
+        self.assertIsNone(TransactionService.legacy_bill_id(PAYMENT_ORDER_CODE_OFFSET + 8))
+        self.assertEqual(TransactionService.legacy_bill_id(self.order_code), self.bill.id)
+
+    def test_event_before_transaction_is_retried_with_backoff(self):
+        order_code = PAYMENT_ORDER_CODE_OFFSET + 11
+        event = PaymentWebhookEvent.objects.create(order_code=order_code, event=TransactionStatus.SUCCESS.value, payload={})
+        service = PaymentWebhookService()
+        self.assertEqual(service.process_pending_events(), {'processed': 0, 'retried': 1, 'failed': 0})
+        event.refresh_from_db()
+        self.assertEqual(event.status, WebhookEventStatus.PENDING.value)
+        self.assertEqual(event.attempts, 1)
+        self.assertIsNotNone(event.last_error)
+        self.assertGreater(event.next_attempt_at, timezone.now())
+
+        # Chưa đến hạn thì không xử lý lại
+        self.assertEqual(service.process_pending_events(), {'processed': 0, 'retried': 0, 'failed': 0})
+
+        # Giao dịch được commit sau webhook: lần thử tiếp theo áp dụng thành công
+        self.transaction.order_code = order_code
+        self.transaction.save()
+        PaymentWebhookEvent.objects.filter(pk=event.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(service.process_pending_events(), {'processed': 1, 'retried': 0, 'failed': 0})
+        event.refresh_from_db()
+        self.assertEqual(event.status, WebhookEventStatus.PROCESSED.value)
+        self.assertEqual(event.attempts, 2)
+        self.transaction.refresh_from_db()
+        self.assertEqual(self.transaction.status, TransactionStatus.SUCCESS.value)
+
+    @override_settings(PAYMENT_WEBHOOKS={'max_attempts': 2, 'backoff': 0.0})
+    def test_failed_event_can_be_retried(self):
+        event = PaymentWebhookEvent.objects.create(order_code=999001, event=TransactionStatus.SUCCESS.value, payload={})
+        service = PaymentWebhookService()
+        self.assertEqual(service.process_pending_events(), {'processed': 0, 'retried': 1, 'failed': 0})
+        self.assertEqual(service.process_pending_events(), {'processed': 0, 'retried': 0, 'failed': 1})
+        event.refresh_from_db()
+        self.assertEqual(event.status, WebhookEventStatus.FAILED.value)
+        self.assertEqual(event.attempts, 2)
+        self.assertIsNotNone(event.last_error)
+
+        self.assertEqual(service.retry_failed_events(), 1)
+        event.refresh_from_db()
+        self.assertEqual(event.status, WebhookEventStatus.PENDING.value)
+        self.assertEqual(event.attempts, 0)
+
+
+class PaymentLinkLoadTest(PaymentFixtureMixin, TransactionTestCase):
+    """Nhiều link thanh toán tạo đồng thời cho cùng một hóa đơn, sau đó webhook và trang cancel về cùng lúc."""
+    LINKS = 12
+    CHECKSUM_KEY = 'load-checksum'
+
+    def setUp(self):
+        self.setUpTestData()
+        self.server = StubPayOSServer(checksum_key=self.CHECKSUM_KEY).start()
+        self.gateway = PayOSGateway(
+            'client', 'api-key', self.CHECKSUM_KEY, self.server.base_url, backoff=0, pool_size=self.LINKS
+        )
+        patcher = patch('payments.services.get_payos_gateway', return_value=self.gateway)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.gateway.close()
+        self.server.stop()
+
+    def _run_concurrently(self, func, items):
+        def run(item):
+            try:
+                return func(item)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.LINKS) as pool:
+            return list(pool.map(run, items))
+
+    def _webhook(self, order_code):
+        data = {'orderCode': order_code, 'amount': int(self.bill.amount), 'code': '00', 'desc': 'success'}
+        return {'code': '00', 'success': True, 'data': data, 'signature': create_signature(data, self.CHECKSUM_KEY)}
+
+    @skipUnlessDBFeature('test_db_allows_multiple_connections')
+    def test_concurrent_links_then_callbacks(self):
+        checkout_urls = self._run_concurrently(lambda _: PayOSService().create_payment_link(self.bill.id), range(self.LINKS))
+        self.assertEqual(len(set(checkout_urls)), self.LINKS)
+
+        order_codes = list(
+            Transaction.objects.filter(bill=self.bill, order_code__isnull=False).values_list('order_code', flat=True)
+        )
+        self.assertEqual(len(set(order_codes)), self.LINKS)
+        self.assertEqual(set(self.server.links), set(order_codes))
+
+        # Link đầu được thanh toán (PayOS gửi webhook 3 lần), khách hủy các link còn lại cùng lúc
+        paid, *cancelled = order_codes
+
+        def callback(item):
+            kind, order_code = item
+            if kind == 'cancel':
+                TransactionService().handle_payment_cancel(order_code)
+            else:
+                PayOSService().handle_payment_callback(self._webhook(order_code))
+
+        self._run_concurrently(callback, [('cancel', code) for code in cancelled] + [('paid', paid)] * 3)
+        self.assertEqual(PaymentWebhookService().process_pending_events(), {'processed': 1, 'retried': 0, 'failed': 0})
+        # Trang success về sau webhook không áp dụng lại
+        TransactionService().handle_payment_success(paid)
+
+        statuses = dict(Transaction.objects.filter(order_code__in=order_codes).values_list('order_code', 'status'))
+        self.assertEqual(statuses.pop(paid), TransactionStatus.SUCCESS.value)
+        self.assertEqual(set(statuses.values()), {TransactionStatus.FAILED.value})
+        self.bill.refresh_from_db()
+        self.assertIn(self.bill.status, {PaymentStatus.BOOKING_PAID.value, PaymentStatus.PAID.value})
+        # Giao dịch cũ (chưa có order_code) của hóa đơn không bị đụng tới
+        self.transaction.refresh_from_db()
+        self.assertEqual(self.transaction.status, TransactionStatus.PENDING.value)
+
+
+class RevenueAnalyticsServiceTest(PaymentFixtureMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.today = timezone.localdate()
+        self.transaction.delete()
+        self.other_department = Department.objects.create(department_name="Neurology")
+        other_doctor = Doctor.objects.create(
+            user=self.user, first_name="Jane", last_name="Roe", identity_number="555666777",
+            birthday=date(1985, 1, 1), gender=Gender.FEMALE.value, academic_degree=AcademicDegree.BS_CKI.value,
+            specialization="Neurologist", type=DoctorType.EXAMINATION.value, department=self.other_department
+        )
+        other_appointment = Appointment.objects.create(
+            doctor=other_doctor, patient=self.patient, schedule=self.schedule,
+            slot_start=time(9, 0), slot_end=time(9, 30), status=AppointmentStatus.PENDING.value
+        )
+        self.other_bill = Bill.objects.create(
+            appointment=other_appointment, patient=self.patient, total_cost=Decimal('300.00'),
+            insurance_discount=Decimal('0.00'), amount=Decimal('300.00'), status=PaymentStatus.PAID.value
+        )
+        self._pay(self.bill, '100.00', days_ago=10)
+        self._pay(self.bill, '50.00', days_ago=10, method=PaymentMethod.CASH.value)
+        self._pay(self.other_bill, '300.00', days_ago=3)
+        self._pay(self.other_bill, '999.00', days_ago=3, status=TransactionStatus.FAILED.value)
+        self._pay(self.bill, '20.00', days_ago=0)
+
+    def _pay(self, bill, amount, days_ago, method=PaymentMethod.ONLINE_BANKING.value, status=TransactionStatus.SUCCESS.value):
+        moment = timezone.make_aware(datetime.combine(self.today - timedelta(days=days_ago), time(10, 0)))
+        return Transaction.objects.create(
+            bill=bill, amount=Decimal(amount), payment_method=method, transaction_date=moment, status=status
+        )
+
+    def test_daily_revenue_by_department(self):
+        service = RevenueAnalyticsService()
+        result = service.get_revenue('day', self.today - timedelta(days=10), self.today, group_by='department')
+        self.assertEqual(len(result['buckets']), 11)
+        self.assertEqual(result['buckets'][0], (self.today - timedelta(days=10)).isoformat())
+        self.assertEqual(result['total']['amount'][0], 150.0)
+        self.assertEqual(result['total']['count'][0], 2)
+        self.assertEqual(result['total']['amount'][7], 300.0)
+        self.assertEqual(result['total']['amount'][10], 20.0)
+        self.assertEqual(sum(result['total']['amount']), 470.0)
+        series = {item['label']: item for item in result['series']}
+        self.assertEqual(set(series), {"Cardiology", "Neurology"})
+        self.assertEqual(series["Neurology"]['amount'][7], 300.0)
+        self.assertEqual(series["Cardiology"]['key'], self.department.id)
+
+    def test_monthly_revenue_by_payment_method_and_status(self):
+        service = RevenueAnalyticsService()
+        date_from = self.today - timedelta(days=10)
+        result = service.get_revenue('month', date_from, self.today, group_by='payment_method')
+        self.assertEqual(result['buckets'][0], date_from.replace(day=1).isoformat())
+        labels = {item['label']: sum(item['amount']) for item in result['series']}
+        self.assertEqual(labels, {'ONLINE_BANKING': 420.0, 'CASH': 50.0})
+
+        result = service.get_revenue('week', date_from, self.today, group_by='payment_status')
+        labels = {item['label']: sum(item['count']) for item in result['series']}
+        self.assertEqual(labels, {'UNPAID': 1, 'PAID': 1})
+
+    def test_closed_buckets_are_cached(self):
+        service = RevenueAnalyticsService()
+        date_from = self.today - timedelta(days=10)
+        service.get_revenue('day', date_from, self.today)
+        # Chỉ ngày hôm nay (khoảng đang mở) được tính lại
+        with self.assertNumQueries(1):
+            result = service.get_revenue('day', date_from, self.today)
+        self.assertEqual(sum(result['total']['amount']), 470.0)
+        with self.assertNumQueries(0):
+            service.get_revenue('day', date_from, self.today - timedelta(days=1))
+
+    @override_settings(REVENUE_ANALYTICS_CACHE_TTL=42)
+    def test_closed_buckets_expire_after_configured_ttl(self):
+        with patch.object(cache, 'set_many', wraps=cache.set_many) as set_many:
+            RevenueAnalyticsService().get_revenue('day', self.today - timedelta(days=10), self.today)
+        self.assertEqual(set_many.call_args.args[1], 42)
+
+    def test_late_update_invalidates_closed_buckets(self):
+        service = RevenueAnalyticsService()
+        date_from = self.today - timedelta(days=10)
+        service.get_revenue('day', date_from, self.today)
+        late = self._pay(self.bill, '5.00', days_ago=3, status=TransactionStatus.PENDING.value)
+        late.order_code = 10 ** 12 + 99
+        late.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            TransactionService().apply_payment_result(late.order_code, True)
+        result = service.get_revenue('day', date_from, self.today)
+        self.assertEqual(result['total']['amount'][7], 305.0)
+
+
+class ReconciliationServiceTest(PaymentFixtureMixin, TestCase):
+    def setUp(self):
+        self.server = StubPayOSServer(checksum_key='checksum').start()
+        self.gateway = PayOSGateway('client', 'api-key', 'checksum', self.server.base_url, backoff=0, max_retries=0)
+        self.service = ReconciliationService(gateway=self.gateway)
+        self.transaction.delete()
+        self.transactions = {}
+        for offset, gateway_status in enumerate(['PAID', 'CANCELLED', 'PENDING', 'EXPIRED', None]):
+            order_code = PAYMENT_ORDER_CODE_OFFSET + offset
+            self.transactions[gateway_status] = Transaction.objects.create(
+                bill=self.bill, amount=Decimal('100.00'), payment_method=PaymentMethod.ONLINE_BANKING.value,
+                transaction_date=timezone.now(), status=TransactionStatus.PENDING.value, order_code=order_code
+            )
+            if gateway_status:
+                self.gateway.create_payment_link(order_code, 100, "Test", [], "http://cancel", "http://return")
+                self.server.set_status(order_code, gateway_status)
+        Transaction.objects.update(created_at=timezone.now() - timedelta(hours=1))
+
+    def tearDown(self):
+        self.gateway.close()
+        self.server.stop()
+
+    def _status(self, key):
+        self.transactions[key].refresh_from_db()
+        return self.transactions[key].status
+
+    def test_reconcile_applies_gateway_statuses(self):
+        totals = self.service.reconcile(older_than=timedelta(minutes=30), batch_size=2, concurrency=4)
+        self.assertEqual(totals, {'checked': 5, 'paid': 1, 'failed': 2, 'pending': 1, 'errors': 1})
+        self.assertEqual(self._status('PAID'), TransactionStatus.SUCCESS.value)
+        self.assertEqual(self._status('CANCELLED'), TransactionStatus.FAILED.value)
+        self.assertEqual(self._status('EXPIRED'), TransactionStatus.FAILED.value)
+        self.assertEqual(self._status('PENDING'), TransactionStatus.PENDING.value)
+        self.assertEqual(self._status(None), TransactionStatus.PENDING.value)
+        self.bill.refresh_from_db()
+        self.assertEqual(self.bill.status, PaymentStatus.BOOKING_PAID.value)
+        # Hết vòng quét thì checkpoint quay về đầu
+        self.assertEqual(ReconciliationCheckpoint.objects.get().last_transaction_id, 0)
+
+    def test_batches_resume_from_checkpoint(self):
+        result = self.service.reconcile_batch(older_than=timedelta(minutes=30), batch_size=2)
+        self.assertFalse(result['done'])
+        self.assertEqual(ReconciliationCheckpoint.objects.get().last_transaction_id, self.transactions['CANCELLED'].id)
+        result = self.service.reconcile_batch(older_than=timedelta(minutes=30), batch_size=2)
+        self.assertEqual(result['checked'], 2)
+        self.assertEqual(self.server.request_count, 4 + 4)
+
+    def test_recent_and_expired_transactions(self):
+        Transaction.objects.filter(pk=self.transactions['PAID'].pk).update(created_at=timezone.now())
+        Transaction.objects.filter(pk=self.transactions['PENDING'].pk).update(created_at=timezone.now() - timedelta(days=2))
+        totals = self.service.reconcile(older_than=timedelta(minutes=30), expire_after=timedelta(hours=24))
+        self.assertEqual(totals['checked'], 4)
+        self.assertEqual(self._status('PAID'), TransactionStatus.PENDING.value)
+        self.assertEqual(self._status('PENDING'), TransactionStatus.FAILED.value)
@@ -1,3 +1,5 @@
+import csv
+import json
 from rest_framework.test import APITestCase
 from unittest.mock import patch, MagicMock
 from django.urls import reverse
@@ -225,7 +227,7 @@ class MockPaymentResponse:
         self.checkoutUrl = url
 
 class TransactionViewSetTest(BaseTestCase):
-    @patch('payos.PayOS.createPaymentLink')
+    @patch('payments.gateway.PayOSGateway.create_payment_link')
     def test_create_payment(self, mock_create):
         mock_create.return_value = MockPaymentResponse('https://pay.test.com')
         url = reverse('transaction-create-payment', kwargs={'bill_id': self.bill_unpaid.id})
@@ -234,7 +236,7 @@ class TransactionViewSetTest(BaseTestCase):
         self.assertIn('data', response.data)
         self.assertEqual(response.data['data'], 'https://pay.test.com')
 
-    @patch('payos.PayOS.createPaymentLink')
+    @patch('payments.gateway.PayOSGateway.create_payment_link')
     def test_create_payment_error(self, mock_create):
         mock_create.side_effect = Exception('Test error')
         url = reverse('transaction-create-payment', kwargs={'bill_id': self.bill_unpaid.id})
@@ -260,7 +262,7 @@ class TransactionViewSetTest(BaseTestCase):
         response = self.client.post(url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
-    @patch('payos.PayOS.cancelPaymentLink')
+    @patch('payments.gateway.PayOSGateway.cancel_payment_link')
     def test_cancel_payment(self, mock_cancel):
         mock_cancel.return_value = {'status': 'CANCELLED'}
         url = reverse('transaction-cancel-payment', kwargs={'order_id': 123})
@@ -295,3 +297,101 @@ class TransactionViewSetTest(BaseTestCase):
         url = reverse('transaction-get-transactions-by-bill-id', kwargs={'bill_id': 999})
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+class FinanceExportViewTest(BaseTestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(email='admin@example.com', password='adminpass123', role=UserRole.ADMIN.value)
+        self.client.force_authenticate(self.admin)
+        self.url = reverse('bill-export')
+        today = timezone.localdate()
+        self.params = {'date_from': today.isoformat(), 'date_to': today.isoformat()}
+
+    def _rows(self, response):
+        content = b''.join(response.streaming_content).decode('utf-8')
+        return list(csv.DictReader(content.splitlines()))
+
+    def test_export_bills_csv(self):
+        response = self.client.get(self.url, self.params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+        rows = self._rows(response)
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]['id'], str(self.bill_unpaid.id))
+        self.assertEqual(rows[0]['patient_name'], 'Patient Test')
+        self.assertEqual(rows[0]['department_name'], 'Cardiology')
+        self.assertEqual(rows[0]['amount'], '150.00')
+
+    def test_export_filters(self):
+        response = self.client.get(self.url, {**self.params, 'status': PaymentStatus.PAID.value})
+        self.assertEqual([r['id'] for r in self._rows(response)], [str(self.bill_paid.id)])
+
+        response = self.client.get(self.url, {**self.params, 'payment_method': PaymentMethod.ONLINE_BANKING.value})
+        self.assertEqual([r['id'] for r in self._rows(response)], [str(self.bill_unpaid.id)])
+
+        response = self.client.get(self.url, {**self.params, 'department_id': self.department.id + 1})
+        self.assertEqual(self._rows(response), [])
+
+        response = self.client.get(self.url, {'date_from': '2020-01-01', 'date_to': '2020-01-31'})
+        self.assertEqual(self._rows(response), [])
+
+    def test_export_details_and_transactions(self):
+        response = self.client.get(self.url, {**self.params, 'dataset': 'details', 'status': PaymentStatus.UNPAID.value})
+        rows = self._rows(response)
+        self.assertEqual([r['id'] for r in rows], [str(self.bill_detail.id)])
+        self.assertEqual(rows[0]['total_price'], '200.00')
+
+        response = self.client.get(self.url, {**self.params, 'dataset': 'transactions', 'output': 'ndjson'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(len(lines), 1)
+        row = json.loads(lines[0])
+        self.assertEqual(row['id'], self.transaction_pending.id)
+        self.assertEqual(row['status'], TransactionStatus.PENDING.value)
+        self.assertEqual(row['amount'], '150.00')
+
+    def test_export_query_count_is_constant(self):
+        for _ in range(20):
+            Bill.objects.create(
+                appointment=self.appointment, patient=self.patient, total_cost=Decimal('10.00'),
+                insurance_discount=Decimal('0.00'), amount=Decimal('10.00'), status=PaymentStatus.UNPAID.value
+            )
+        response = self.client.get(self.url, self.params)
+        with self.assertNumQueries(1):
+            rows = self._rows(response)
+        self.assertEqual(len(rows), 23)
+
+    def test_export_validation_and_permission(self):
+        response = self.client.get(self.url, {'date_from': '2025-02-01', 'date_to': '2025-01-01'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(self.url, {**self.params, 'dataset': 'transactions', 'status': PaymentStatus.BOOKING_PAID.value})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.client.force_authenticate(self.user)
+        response = self.client.get(self.url, self.params)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+class RevenueAnalyticsViewTest(BaseTestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(email='finance@example.com', password='adminpass123', role=UserRole.ADMIN.value)
+        self.client.force_authenticate(self.admin)
+        self.url = reverse('transaction-get-revenue')
+
+    def test_get_revenue(self):
+        Transaction.objects.create(
+            bill=self.bill_paid, amount=Decimal('150.00'), payment_method=PaymentMethod.CASH.value,
+            transaction_date=timezone.now(), status=TransactionStatus.SUCCESS.value
+        )
+        today = timezone.localdate().isoformat()
+        response = self.client.get(self.url, {'date_from': today, 'date_to': today, 'group_by': 'department'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.data['data']
+        self.assertEqual(data['buckets'], [today])
+        self.assertEqual(data['total']['amount'], [150.0])
+        self.assertEqual(data['series'][0]['label'], 'Cardiology')
+
+    def test_get_revenue_validation_and_permission(self):
+        response = self.client.get(self.url, {'date_from': '2024-01-01', 'date_to': '2025-06-01', 'period': 'day'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.client.force_authenticate(self.user)
+        response = self.client.get(self.url, {'date_from': '2025-01-01', 'date_to': '2025-01-31'})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
@@ -2,12 +2,12 @@ from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
-from django.http import Http404
+from django.http import Http404, StreamingHttpResponse
 from django.utils.translation import gettext_lazy as _
 from django.shortcuts import get_object_or_404
 from .models import Bill, BillDetail, Transaction
-from .serializers import NewBillRequestSerializer, UpdateBillRequestSerializer, BillResponseSerializer, NewBillDetailRequestSerializer, BillDetailResponseSerializer, BillSerializer, TransactionDTOSerializer
-from .services import BillService, PayOSService, TransactionService
+from .serializers import NewBillRequestSerializer, UpdateBillRequestSerializer, BillResponseSerializer, NewBillDetailRequestSerializer, BillDetailResponseSerializer, BillSerializer, TransactionDTOSerializer, FinanceExportQuerySerializer, RevenueAnalyticsQuerySerializer
+from .services import BillService, PayOSService, TransactionService, FinanceExportService, RevenueAnalyticsService
 from rest_framework.exceptions import ValidationError
 from rest_framework.pagination import PageNumberPagination
 
@@ -82,6 +82,22 @@ class BillViewSet(viewsets.ViewSet):
         except ValueError as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['get'], url_path='export')
+    def export(self, request):
+        if request.user.role != 'A':
+            return Response({"error": _("Bạn không có quyền xuất báo cáo tài chính")}, status=status.HTTP_403_FORBIDDEN)
+        serializer = FinanceExportQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        filters = dict(serializer.validated_data)
+        dataset = filters.pop('dataset')
+        output = filters.pop('output')
+        content_type = 'application/x-ndjson' if output == 'ndjson' else 'text/csv; charset=utf-8'
+        response = StreamingHttpResponse(FinanceExportService().stream(dataset, output, **filters), content_type=content_type)
+        filename = f"{dataset}_{filters['date_from']:%Y%m%d}_{filters['date_to']:%Y%m%d}.{output}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
     @action(detail=False, methods=['get'], url_path=r'patient/(?P<patient_id>\d+)')
     def get_bills_by_patient_id(self, request, patient_id=None):
         bills = BillService().get_bills_by_patient_id(patient_id)
@@ -162,6 +178,16 @@ class TransactionViewSet(viewsets.ViewSet):
         except Exception as e:
             return Response({"error": -1, "message": str(e), "status": "error", "order_id": order_id}, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['get'], url_path='revenue')
+    def get_revenue(self, request):
+        if request.user.role != 'A':
+            return Response({"error": -1, "message": _("Bạn không có quyền xem thống kê doanh thu"), "data": None}, status=status.HTTP_403_FORBIDDEN)
+        serializer = RevenueAnalyticsQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response({"error": -1, "message": serializer.errors, "data": None}, status=status.HTTP_400_BAD_REQUEST)
+        revenue = RevenueAnalyticsService().get_revenue(**serializer.validated_data)
+        return Response({"error": 0, "message": _("Thành công"), "data": revenue})
+
     @action(detail=False, methods=['get'], url_path=r'bill/(?P<bill_id>\d+)')
     def get_transactions_by_bill_id(self, request, bill_id=None):
         try:
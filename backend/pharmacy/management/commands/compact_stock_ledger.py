@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from pharmacy.services import InventoryService
+
+
+class Command(BaseCommand):
+    help = "Gộp sổ cái tồn kho vào StockSnapshot và báo cáo các thuốc bị lệch số lượng"
+
+    def handle(self, *args, **options):
+        result = InventoryService.compact_snapshots()
+        self.stdout.write(f"Updated {result['updated']} stock snapshot(s)")
+        for row in result['drift']:
+            self.stdout.write(self.style.WARNING(
+                f"Medicine {row['medicine_id']}: ledger={row['available']} quantity={row['quantity']}"
+            ))
@@ -0,0 +1,191 @@
+# Generated by Django 5.2.4 on 2026-10-19 16:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def record_opening_balances(apps, schema_editor):
+    Medicine = apps.get_model("pharmacy", "Medicine")
+    StockMovement = apps.get_model("pharmacy", "StockMovement")
+    StockMovement.objects.bulk_create(
+        [
+            StockMovement(medicine_id=medicine_id, movement_type="O", quantity=quantity)
+            for medicine_id, quantity in Medicine.objects.values_list("id", "quantity")
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("appointments", "0007_appointment_note_alter_appointment_symptoms"),
+        ("patients", "0003_patient_avatar_alter_patient_gender"),
+        ("pharmacy", "0003_prescription_is_deleted_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StockMovement",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "movement_type",
+                    models.CharField(
+                        choices=[
+                            ("O", "OPENING"),
+                            ("R", "RECEIPT"),
+                            ("S", "RESERVE"),
+                            ("L", "RELEASE"),
+                            ("A", "ADJUSTMENT"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("quantity", models.IntegerField()),
+                (
+                    "batch_number",
+                    models.CharField(blank=True, max_length=50, null=True),
+                ),
+                ("expiry_date", models.DateField(blank=True, null=True)),
+                ("note", models.CharField(blank=True, max_length=255, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="StockReservation",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("quantity", models.IntegerField()),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+        migrations.CreateModel(
+            name="StockSnapshot",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("available", models.IntegerField(default=0)),
+                ("reserved", models.IntegerField(default=0)),
+                ("last_movement_id", models.BigIntegerField(default=0)),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+        migrations.AlterField(
+            model_name="prescription",
+            name="appointment",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.RESTRICT,
+                to="appointments.appointment",
+                unique=True,
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="prescription",
+            constraint=models.UniqueConstraint(
+                fields=("appointment",), name="unique_prescription_per_appointment"
+            ),
+        ),
+        migrations.AddField(
+            model_name="stockmovement",
+            name="medicine",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.RESTRICT,
+                related_name="stock_movements",
+                to="pharmacy.medicine",
+            ),
+        ),
+        migrations.AddField(
+            model_name="stockmovement",
+            name="prescription",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                to="pharmacy.prescription",
+            ),
+        ),
+        migrations.AddField(
+            model_name="stockmovement",
+            name="prescription_detail",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                to="pharmacy.prescriptiondetail",
+            ),
+        ),
+        migrations.AddField(
+            model_name="stockreservation",
+            name="medicine",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.RESTRICT,
+                related_name="stock_reservations",
+                to="pharmacy.medicine",
+            ),
+        ),
+        migrations.AddField(
+            model_name="stockreservation",
+            name="prescription_detail",
+            field=models.OneToOneField(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="stock_reservation",
+                to="pharmacy.prescriptiondetail",
+            ),
+        ),
+        migrations.AddField(
+            model_name="stocksnapshot",
+            name="medicine",
+            field=models.OneToOneField(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="stock_snapshot",
+                to="pharmacy.medicine",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="stockmovement",
+            index=models.Index(
+                fields=["medicine", "id"], name="pharmacy_st_medicin_9cf96c_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="stockmovement",
+            index=models.Index(
+                fields=["medicine", "expiry_date"],
+                name="pharmacy_st_medicin_bd13b6_idx",
+            ),
+        ),
+        migrations.RunPython(record_opening_balances, migrations.RunPython.noop),
+    ]
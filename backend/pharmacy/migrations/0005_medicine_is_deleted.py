@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pharmacy", "0004_stock_ledger"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="medicine",
+            name="is_deleted",
+            field=models.BooleanField(default=False),
+        ),
+    ]
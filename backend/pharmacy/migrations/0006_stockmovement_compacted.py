@@ -0,0 +1,34 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:58
+
+from django.db import migrations, models
+
+
+def mark_compacted(apps, schema_editor):
+    StockMovement = apps.get_model("pharmacy", "StockMovement")
+    StockSnapshot = apps.get_model("pharmacy", "StockSnapshot")
+    last_compacted = StockSnapshot.objects.filter(medicine_id=models.OuterRef("medicine_id")).values("last_movement_id")
+    StockMovement.objects.filter(id__lte=models.Subquery(last_compacted)).update(compacted=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pharmacy", "0005_medicine_is_deleted"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="stockmovement",
+            name="compacted",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name="stockmovement",
+            index=models.Index(
+                condition=models.Q(("compacted", False)),
+                fields=["medicine", "id"],
+                name="stockmovement_pending_idx",
+            ),
+        ),
+        migrations.RunPython(mark_compacted, migrations.RunPython.noop),
+    ]
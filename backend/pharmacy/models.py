@@ -3,7 +3,16 @@ from django.db import models
 from core.models import BaseModel
 from patients.models import Patient
 from appointments.models import Appointment
-from common.constants import COMMON_LENGTH, PHARMACY_LENGTH, DECIMAL_MAX_DIGITS, DECIMAL_DECIMAL_PLACES
+from common.enums import StockMovementType
+from common.constants import COMMON_LENGTH, PHARMACY_LENGTH, DECIMAL_MAX_DIGITS, DECIMAL_DECIMAL_PLACES, ENUM_LENGTH
+
+
+class MedicineManager(models.Manager):
+    def get_queryset(self):
+        return super().get_queryset().filter(is_deleted=False)
+
+    def all_with_deleted(self):
+        return super().get_queryset()
 
 
 class Medicine(BaseModel):
@@ -31,6 +40,10 @@ class Medicine(BaseModel):
         decimal_places=DECIMAL_DECIMAL_PLACES
     )
     quantity = models.IntegerField()
+    # Thuốc đã có lịch sử tồn kho (StockMovement) không xóa hẳn được, chỉ ẩn khỏi danh mục
+    is_deleted = models.BooleanField(default=False)
+
+    objects = MedicineManager()
 
     def __str__(self):
         return self.medicine_name
@@ -74,3 +87,51 @@ class PrescriptionDetail(BaseModel):
 
     def __str__(self):
         return f"Detail {self.id} for {self.medicine.medicine_name}"
+
+
+class StockMovement(BaseModel):
+    """
+    Sổ cái tồn kho chỉ ghi thêm: mỗi dòng là một thay đổi (có dấu) của số lượng khả dụng
+    """
+    medicine = models.ForeignKey(Medicine, on_delete=models.RESTRICT, related_name="stock_movements")
+    movement_type = models.CharField(max_length=ENUM_LENGTH["DEFAULT"], choices=[(t.value, t.name) for t in StockMovementType])
+    quantity = models.IntegerField()
+    batch_number = models.CharField(max_length=PHARMACY_LENGTH["BATCH_NUMBER"], blank=True, null=True)
+    expiry_date = models.DateField(blank=True, null=True)
+    prescription = models.ForeignKey(Prescription, on_delete=models.SET_NULL, blank=True, null=True)
+    prescription_detail = models.ForeignKey(PrescriptionDetail, on_delete=models.SET_NULL, blank=True, null=True)
+    note = models.CharField(max_length=COMMON_LENGTH["NOTE"], blank=True, null=True)
+    # Đã được gộp vào StockSnapshot. Không dùng mốc id vì id cấp từ sequence không theo thứ tự commit
+    compacted = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['medicine', 'id']),
+            models.Index(fields=['medicine', 'expiry_date']),
+            models.Index(fields=['medicine', 'id'], condition=models.Q(compacted=False), name='stockmovement_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"StockMovement {self.pk} ({self.movement_type} {self.quantity})"
+
+
+class StockReservation(BaseModel):
+    prescription_detail = models.OneToOneField(PrescriptionDetail, on_delete=models.CASCADE, related_name="stock_reservation")
+    medicine = models.ForeignKey(Medicine, on_delete=models.RESTRICT, related_name="stock_reservations")
+    quantity = models.IntegerField()
+
+    def __str__(self):
+        return f"Reservation {self.pk} for Detail {self.prescription_detail_id}"
+
+
+class StockSnapshot(BaseModel):
+    """
+    Số dư đã gộp của các dòng sổ cái compacted=True, được cập nhật định kỳ; last_movement_id là id lớn nhất đã gộp
+    """
+    medicine = models.OneToOneField(Medicine, on_delete=models.CASCADE, related_name="stock_snapshot")
+    available = models.IntegerField(default=0)
+    reserved = models.IntegerField(default=0)
+    last_movement_id = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Snapshot for {self.medicine_id}"
@@ -0,0 +1,185 @@
+# pharmacy/pdf_utils.py
+
+import os
+from functools import lru_cache
+from io import BytesIO
+from django.utils.translation import gettext as _, override
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Table, TableStyle, Spacer
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from common.constants import HOSPITAL_INFO
+
+PDF_FONT_NAME = 'NotoSans'
+PDF_FONT_PATH = os.path.join(os.path.dirname(__file__), 'static', 'fonts', 'NotoSans-Regular.ttf')
+
+
+@lru_cache(maxsize=None)
+def register_pdf_fonts():
+    """
+    Đăng ký font cho reportlab một lần cho mỗi tiến trình
+    """
+    pdfmetrics.registerFont(TTFont(PDF_FONT_NAME, PDF_FONT_PATH))
+
+
+@lru_cache(maxsize=None)
+def get_pdf_styles():
+    """
+    Các ParagraphStyle/TableStyle dùng chung cho mọi đơn thuốc, chỉ khởi tạo một lần
+    """
+    register_pdf_fonts()
+    styles = getSampleStyleSheet()
+    info_table = TableStyle([
+        ('FONTNAME', (0, 0), (-1, -1), PDF_FONT_NAME),
+        ('FONTSIZE', (0, 0), (0, -1), 11),  # Left column (labels) slightly larger
+        ('FONTSIZE', (1, 0), (1, -1), 10),  # Right column (data)
+        ('TEXTCOLOR', (0, 0), (0, -1), colors.black),
+        ('TEXTCOLOR', (1, 0), (1, -1), colors.black),
+        ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
+        ('ALIGN', (1, 0), (1, -1), 'LEFT'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+        ('BOX', (0, 0), (-1, -1), 1, colors.black),
+        ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
+        ('BACKGROUND', (1, 0), (1, -1), colors.white),
+        ('LEFTPADDING', (0, 0), (-1, -1), 6),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 6),
+        ('TOPPADDING', (0, 0), (-1, -1), 4),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+    ])
+    detail_table = TableStyle([
+        ('FONTNAME', (0, 0), (-1, -1), PDF_FONT_NAME),
+        ('FONTSIZE', (0, 0), (-1, 0), 11),
+        ('FONTSIZE', (0, 1), (-1, -1), 10),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+        ('BOX', (0, 0), (-1, -1), 1, colors.black),
+        ('LEFTPADDING', (0, 0), (-1, -1), 6),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 6),
+        ('TOPPADDING', (0, 0), (-1, -1), 4),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+    ])
+    return {
+        'header': ParagraphStyle(name='Header', fontName=PDF_FONT_NAME, fontSize=12, alignment=1, spaceAfter=10),
+        'title': ParagraphStyle(name='Title', fontName=PDF_FONT_NAME, fontSize=16, alignment=1, spaceAfter=20),
+        'section': styles['Heading3'].clone('SectionHeader', fontName=PDF_FONT_NAME, spaceAfter=8),
+        'follow_up': ParagraphStyle(name='FollowUp', fontName=PDF_FONT_NAME, fontSize=10, spaceBefore=10),
+        'doctor': ParagraphStyle(name='Doctor', fontName=PDF_FONT_NAME, fontSize=10, alignment=2, spaceBefore=20),
+        'doctor_name': ParagraphStyle(name='DoctorName', fontName=PDF_FONT_NAME, fontSize=12, fontWeight='bold', alignment=2, spaceBefore=5),
+        'footer': ParagraphStyle(name='Footer', fontName=PDF_FONT_NAME, fontSize=9, alignment=1, spaceBefore=20),
+        'info_table': info_table,
+        'detail_table': detail_table,
+    }
+
+
+def render_prescription_pdf(pdf_dto):
+    """
+    Dựng PDF đơn thuốc từ pdf_dto (dict thuần, có thể gửi sang tiến trình khác)
+    """
+    styles = get_pdf_styles()
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=20, bottomMargin=20, leftMargin=30, rightMargin=30)
+    elements = []
+
+    # Hospital Header
+    elements.append(Paragraph(HOSPITAL_INFO["NAME"], styles['header']))
+    elements.append(Paragraph(f"Địa chỉ: {HOSPITAL_INFO['ADDRESS']}", styles['header']))
+    elements.append(Paragraph(f"Điện thoại: {HOSPITAL_INFO['PHONE']} | Email: {HOSPITAL_INFO['EMAIL']}", styles['header']))
+    elements.append(Spacer(1, 12))
+
+    # Prescription Title
+    elements.append(Paragraph(_("ĐƠN THUỐC"), styles['title']))
+
+    # Patient Information
+    elements.append(Paragraph(_("Thông tin bệnh nhân"), styles['section']))
+    data = [
+        [_('Họ và tên:'), pdf_dto['patient_name']],
+        [_('Giới tính:'), pdf_dto['patient_gender']],
+        [_('Ngày sinh:'), pdf_dto['patient_birthday'].strftime('%d/%m/%Y')],
+        [_('Số điện thoại:'), pdf_dto['patient_phone']],
+        [_('Email:'), pdf_dto['patient_email']],
+        [_('Địa chỉ:'), pdf_dto['patient_address']],
+        [_('CMND/CCCD:'), pdf_dto['patient_identity_number']],
+        [_('Số BHYT:'), pdf_dto['patient_insurance_number']],
+        [_('Ngày kê đơn:'), pdf_dto['prescription_date'].strftime('%d/%m/%Y')]
+    ]
+    table = Table(data, colWidths=[150, 380])
+    table.setStyle(styles['info_table'])
+    elements.append(table)
+    elements.append(Spacer(1, 12))
+
+    # Medical Examination Information
+    elements.append(Paragraph(_("Thông tin khám bệnh"), styles['section']))
+    data = [
+        [_('Chẩn đoán:'), pdf_dto['diagnosis']],
+        [_('Huyết áp:'), f"{pdf_dto['systolic_blood_pressure']}/{pdf_dto['diastolic_blood_pressure']} mmHg"],
+        [_('Nhịp tim:'), f"{pdf_dto['heart_rate']} bpm"],
+        [_('Đường huyết:'), f"{pdf_dto['blood_sugar']} mg/dL"]
+    ]
+    if pdf_dto['note']:
+        data.append([_('Ghi chú:'), pdf_dto['note']])
+    table = Table(data, colWidths=[150, 380])
+    table.setStyle(styles['info_table'])
+    elements.append(table)
+    elements.append(Spacer(1, 12))
+
+    # Prescription Details
+    elements.append(Paragraph(_("Chi tiết đơn thuốc"), styles['section']))
+    data = [[_('STT'), _('Tên thuốc'), _('Đơn vị'), _('Liều dùng'), _('Tần suất'), _('Thời gian'), _('Số lượng')]]
+    for i, detail in enumerate(pdf_dto['prescription_details'], 1):
+        data.append([
+            str(i), detail['medicine_name'], detail['unit'], detail['dosage'],
+            detail['frequency'], detail['duration'], str(detail['quantity'])
+        ])
+    table = Table(data, colWidths=[40, 120, 60, 80, 95, 80, 60])
+    table.setStyle(styles['detail_table'])
+    elements.append(table)
+    elements.append(Spacer(1, 12))
+
+    # Follow-up Information
+    if pdf_dto['follow_up'] and pdf_dto['follow_up_date']:
+        elements.append(Paragraph(_("Lịch tái khám: {date}").format(date=pdf_dto['follow_up_date'].strftime('%d/%m/%Y')), styles['follow_up']))
+    elements.append(Spacer(1, 12))
+
+    # Doctor Information
+    elements.append(Paragraph(_("Bác sĩ kê đơn"), styles['doctor']))
+    elements.append(Paragraph(pdf_dto['doctor_name'], styles['doctor_name']))
+    doctor_info = pdf_dto['doctor_specialization']
+    if pdf_dto['doctor_academic_degree']:
+        doctor_info += f", {pdf_dto['doctor_academic_degree']}"
+    if pdf_dto['doctor_department']:
+        doctor_info += f" - {pdf_dto['doctor_department']}"
+    elements.append(Paragraph(doctor_info, styles['doctor']))
+
+    # Footer
+    elements.append(Paragraph("Vui lòng mang đơn thuốc này khi tái khám. Thuốc chỉ được cấp theo đơn.", styles['footer']))
+
+    doc.build(elements)
+    buffer.seek(0)
+    return buffer
+
+
+def init_pdf_worker():
+    """
+    Khởi tạo tiến trình con của pool dựng PDF (cần thiết khi pool dùng spawn thay vì fork)
+    """
+    from django.apps import apps
+    if not apps.ready:
+        import django
+        django.setup()
+    register_pdf_fonts()
+
+
+def render_prescription_pdf_bytes(pdf_dto, language):
+    """
+    Dựng PDF trong tiến trình con; trả về bytes để truyền ngược lại tiến trình cha
+    """
+    with override(language):
+        return render_prescription_pdf(pdf_dto).getvalue()
@@ -1,9 +1,11 @@
 from rest_framework import serializers
+from django.utils.translation import gettext_lazy as _
 from .models import Prescription, PrescriptionDetail, Medicine
 from patients.models import Patient
 from doctors.models import Doctor
 from common.enums import Gender, AcademicDegree
 from common.constants import PHARMACY_LENGTH, COMMON_LENGTH, USER_LENGTH, PATIENT_LENGTH, DOCTOR_LENGTH, MIN_VALUE, DECIMAL_MAX_DIGITS, DECIMAL_DECIMAL_PLACES
+from common.pagination import KeysetPagination
 
 
 class PrescriptionDetailInfoSerializer(serializers.Serializer):
@@ -143,6 +145,23 @@ class PrescriptionSerializer(serializers.ModelSerializer):
         ]
 
 
+class PrescriptionSummarySerializer(serializers.ModelSerializer):
+    detail_count = serializers.IntegerField(read_only=True)
+    total_quantity = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Prescription
+        fields = [
+            'id', 'patient', 'appointment', 'follow_up_date',
+            'is_follow_up', 'diagnosis', 'note',
+            'detail_count', 'total_quantity', 'created_at'
+        ]
+
+
+class PrescriptionCursorPagination(KeysetPagination):
+    pass
+
+
 class NewMedicineRequestSerializer(serializers.Serializer):
     medicine_name = serializers.CharField(max_length=COMMON_LENGTH["NAME"])
     manufactor = serializers.CharField(
@@ -209,3 +228,26 @@ class MedicineSerializer(serializers.ModelSerializer):
             'insurance_discount_percent', 'insurance_discount', 'side_effects',
             'price', 'quantity', 'created_at'
         ]
+
+
+class ReceiveStockRequestSerializer(serializers.Serializer):
+    quantity = serializers.IntegerField(min_value=MIN_VALUE)
+    batch_number = serializers.CharField(max_length=PHARMACY_LENGTH["BATCH_NUMBER"], required=False, allow_null=True)
+    expiry_date = serializers.DateField(required=False, allow_null=True)
+    note = serializers.CharField(max_length=COMMON_LENGTH["NOTE"], required=False, allow_blank=True)
+
+
+class PrescriptionPdfExportQuerySerializer(serializers.Serializer):
+    patient_id = serializers.IntegerField(required=False)
+    date = serializers.DateField(required=False)
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+
+    def validate(self, data):
+        if data.get('date'):
+            data['date_from'] = data['date_to'] = data.pop('date')
+        if not data.get('patient_id') and not data.get('date_from'):
+            raise serializers.ValidationError(_("Cần chọn bệnh nhân hoặc ngày kê đơn"))
+        if data.get('date_from') and data.get('date_to') and data['date_from'] > data['date_to']:
+            raise serializers.ValidationError(_("date_from phải trước hoặc bằng date_to"))
+        return data
@@ -1,29 +1,36 @@
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
 from django.shortcuts import get_object_or_404
-from django.utils.translation import gettext as _
-from django.db import transaction
-from django.db.models import Q
-from .models import Prescription, PrescriptionDetail, Medicine
-from patients.models import Patient
-from doctors.models import Doctor
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Table, TableStyle, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from common.constants import HOSPITAL_INFO
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from io import BytesIO
+from django.http import Http404
+from django.utils import timezone
+from django.utils.translation import gettext as _, get_language
+from django.db import transaction, connection
+from django.db.models import Q, F, Case, When, Value, Sum, Max, Count, Prefetch
+from django.db.models.functions import Coalesce
+from .models import Prescription, PrescriptionDetail, Medicine, StockMovement, StockReservation, StockSnapshot
+from .pdf_utils import register_pdf_fonts, render_prescription_pdf, render_prescription_pdf_bytes, init_pdf_worker
+from common.utils import stream_zip
+from common.enums import StockMovementType
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
+
 class PharmacyService:
     def __init__(self):
-        font_path = os.path.join(os.path.dirname(__file__), 'static', 'fonts', 'NotoSans-Regular.ttf')
-        pdfmetrics.registerFont(TTFont('NotoSans', font_path))
+        register_pdf_fonts()
 
     def create_prescription(self, data):
         with transaction.atomic():
             if Prescription.objects.filter(appointment_id=data['appointment_id'], is_deleted=False).exists():
                 raise ValueError(_("Đã tồn tại đơn thuốc cho lịch khám này"))
+            details_data = data.get('prescription_details') or []
+            medicines = self._resolve_medicines(details_data)
+
             prescription = Prescription(
                 appointment_id=data['appointment_id'],
                 patient_id=data['patient_id'],
@@ -38,22 +45,10 @@ class PharmacyService:
             )
             prescription.save()
 
-            prescription_details = []
-            for detail_data in data.get('prescription_details', []):
-                medicine = get_object_or_404(Medicine, pk=detail_data['medicine_id'])
-                prescription_details.append(
-                    PrescriptionDetail(
-                        prescription=prescription,
-                        medicine=medicine,
-                        dosage=detail_data['dosage'],
-                        frequency=detail_data['frequency'],
-                        duration=detail_data['duration'],
-                        prescription_notes=detail_data.get('prescription_notes', ''),
-                        quantity=detail_data['quantity']
-                    )
-                )
+            prescription_details = self._build_prescription_details(prescription, details_data, medicines)
             if prescription_details:
                 PrescriptionDetail.objects.bulk_create(prescription_details)
+                InventoryService.reserve_stock(prescription_details)
 
             return prescription
 
@@ -64,66 +59,112 @@ class PharmacyService:
                 if key != 'prescription_details' and value is not None and getattr(prescription, key) != value:
                     setattr(prescription, key, value)
             if 'prescription_details' in data and data['prescription_details']:
-                prescription.prescription_details.all().delete()
-                prescription_details = []
-                for detail_data in data['prescription_details']:
-                    medicine = get_object_or_404(Medicine, pk=detail_data['medicine_id'])
-                    prescription_details.append(
-                        PrescriptionDetail(
-                            prescription=prescription,
-                            medicine=medicine,
-                            dosage=detail_data['dosage'],
-                            frequency=detail_data['frequency'],
-                            duration=detail_data['duration'],
-                            prescription_notes=detail_data.get('prescription_notes', ''),
-                            quantity=detail_data['quantity']
-                        )
-                    )
-                if prescription_details:
-                    PrescriptionDetail.objects.bulk_create(prescription_details)
+                details_data = data['prescription_details']
+                medicines = self._resolve_medicines(details_data)
+                old_detail_ids = list(prescription.prescription_details.values_list('id', flat=True))
+                prescription_details = self._build_prescription_details(prescription, details_data, medicines)
+                PrescriptionDetail.objects.bulk_create(prescription_details)
+                InventoryService.reserve_stock(prescription_details, released_detail_ids=old_detail_ids)
+                PrescriptionDetail.objects.filter(id__in=old_detail_ids).delete()
             prescription.save()
             return prescription
 
+    def _resolve_medicines(self, details_data):
+        """
+        Lấy toàn bộ thuốc trong đơn bằng một truy vấn, báo lỗi tất cả id không tồn tại
+        """
+        medicine_ids = {detail_data['medicine_id'] for detail_data in details_data}
+        medicines = Medicine.objects.in_bulk(medicine_ids)
+        missing_ids = sorted(medicine_ids - medicines.keys())
+        if missing_ids:
+            raise Http404(_("Không tìm thấy thuốc với id: {ids}").format(ids=", ".join(map(str, missing_ids))))
+        return medicines
+
+    def _build_prescription_details(self, prescription, details_data, medicines):
+        return [
+            PrescriptionDetail(
+                prescription=prescription,
+                medicine=medicines[detail_data['medicine_id']],
+                dosage=detail_data['dosage'],
+                frequency=detail_data['frequency'],
+                duration=detail_data['duration'],
+                prescription_notes=detail_data.get('prescription_notes', ''),
+                quantity=detail_data['quantity']
+            )
+            for detail_data in details_data
+        ]
+
     def delete_prescription(self, id):
         with transaction.atomic():
             prescription = self.get_prescription_by_id(id)
             prescription.is_deleted = True
             prescription.save()
+            InventoryService.release_stock(prescription.prescription_details.values_list('id', flat=True))
             return prescription
 
     def add_medicine_to_prescription(self, data):
-        prescription = self.get_prescription_by_id(data['prescription_id'])
-        medicine = get_object_or_404(Medicine, pk=data['medicine_id'])
-        detail = PrescriptionDetail(
-            prescription=prescription,
-            medicine=medicine,
-            dosage=data['dosage'],
-            frequency=data['frequency'],
-            duration=data['duration'],
-            prescription_notes=data.get('prescription_notes', ''),
-            quantity=data['quantity']
-        )
-        detail.save()
-        return detail
+        with transaction.atomic():
+            prescription = self.get_prescription_by_id(data['prescription_id'])
+            medicine = get_object_or_404(Medicine, pk=data['medicine_id'])
+            detail = PrescriptionDetail(
+                prescription=prescription,
+                medicine=medicine,
+                dosage=data['dosage'],
+                frequency=data['frequency'],
+                duration=data['duration'],
+                prescription_notes=data.get('prescription_notes', ''),
+                quantity=data['quantity']
+            )
+            detail.save()
+            InventoryService.reserve_stock([detail])
+            self._touch_prescription(prescription.id)
+            return detail
 
     def get_prescription_details(self, prescription_id):
         prescription = self.get_prescription_by_id(prescription_id)
         return prescription.prescription_details.all()
 
     def update_prescription_detail(self, detail_id, data):
-        detail = self.get_prescription_detail_by_id(detail_id)
-        for key, value in data.items():
-            if key != 'detail_id' and value is not None and getattr(detail, key) != value:
-                setattr(detail, key, value)
-        detail.save()
-        return detail
+        with transaction.atomic():
+            detail = self.get_prescription_detail_by_id(detail_id)
+            reserved = (detail.medicine_id, detail.quantity)
+            if data.get('medicine_id') is not None:
+                data = {**data, 'medicine': get_object_or_404(Medicine, pk=data['medicine_id'])}
+                data.pop('medicine_id')
+            for key, value in data.items():
+                if key != 'detail_id' and value is not None and getattr(detail, key) != value:
+                    setattr(detail, key, value)
+            detail.save()
+            # Đổi thuốc hoặc số lượng: nhả phần giữ cũ (theo thuốc cũ) và giữ lại theo thuốc, số lượng mới
+            if (detail.medicine_id, detail.quantity) != reserved:
+                InventoryService.reserve_stock([detail], released_detail_ids=[detail.id])
+            self._touch_prescription(detail.prescription_id)
+            return detail
 
     def delete_prescription_detail(self, detail_id):
-        detail = self.get_prescription_detail_by_id(detail_id)
-        detail.delete()
+        with transaction.atomic():
+            detail = self.get_prescription_detail_by_id(detail_id)
+            InventoryService.release_stock([detail.id])
+            detail.delete()
+            self._touch_prescription(detail.prescription_id)
 
-    def get_prescriptions_by_patient_id(self, patient_id):
-        return Prescription.objects.filter(patient_id=patient_id, is_deleted=False)
+    def with_listing_data(self, prescriptions, summary=False):
+        """
+        Chế độ đầy đủ: prefetch chi tiết kèm thuốc (2 truy vấn cho cả danh sách).
+        Chế độ tóm tắt: chỉ đếm số dòng và tổng số lượng thuốc bằng annotate (1 truy vấn).
+        """
+        if summary:
+            return prescriptions.annotate(
+                detail_count=Count('prescription_details'),
+                total_quantity=Coalesce(Sum('prescription_details__quantity'), 0)
+            )
+        return prescriptions.prefetch_related(
+            Prefetch('prescription_details', queryset=PrescriptionDetail.objects.select_related('medicine'))
+        )
+
+    def get_prescriptions_by_patient_id(self, patient_id, summary=False):
+        prescriptions = Prescription.objects.filter(patient_id=patient_id, is_deleted=False)
+        return self.with_listing_data(prescriptions, summary).order_by('-created_at', '-id')
 
     def get_prescriptions_by_appointment_id(self, appointment_id):
         return Prescription.objects.filter(appointment_id=appointment_id)
@@ -149,7 +190,14 @@ class PharmacyService:
             quantity=data.get('quantity'),
             side_effects=data.get('side_effects')
         )
-        medicine.save()
+        with transaction.atomic():
+            medicine.save()
+            if medicine.quantity:
+                StockMovement.objects.create(
+                    medicine=medicine,
+                    movement_type=StockMovementType.RECEIPT.value,
+                    quantity=medicine.quantity
+                )
         return medicine
 
     def get_all_medicines(self):
@@ -169,27 +217,44 @@ class PharmacyService:
     def update_medicine(self, id, data):
         medicine = self.get_medicine_by_id(id)
         for key, value in data.items():
-            if value is not None and getattr(medicine, key) != value:
+            if key != 'quantity' and value is not None and getattr(medicine, key) != value:
                 setattr(medicine, key, value)
         if 'insurance_discount_percent' in data and data['insurance_discount_percent'] is not None:
             if data['insurance_discount_percent'] < 0 or data['insurance_discount_percent'] > 100:
                 raise ValueError(_("Phần trăm giảm giá phải từ 0 đến 100"))
             medicine.insurance_discount = medicine.price * medicine.insurance_discount_percent / 100
-        medicine.save()
+        with transaction.atomic():
+            if data.get('quantity') is not None and data['quantity'] != medicine.quantity:
+                delta = data['quantity'] - medicine.quantity
+                medicine.quantity = InventoryService.adjust_stock(medicine.id, delta).quantity
+            # quantity chỉ được thay đổi qua sổ cái tồn kho
+            medicine.save(update_fields=[
+                field.name for field in Medicine._meta.concrete_fields
+                if field.name not in ('id', 'quantity', 'created_at')
+            ])
         return medicine
 
     def delete_medicine(self, id):
         medicine = self.get_medicine_by_id(id)
         if PrescriptionDetail.objects.filter(medicine=medicine).exists():
             raise ValueError(_("Không thể xóa thuốc đã được kê trong đơn thuốc"))
-        medicine.delete()
+        # Sổ cái tồn kho tham chiếu thuốc (RESTRICT) và phải được giữ nguyên: chỉ đánh dấu đã xóa
+        medicine.is_deleted = True
+        medicine.save(update_fields=['is_deleted', 'updated_at'])
 
-    def generate_prescription_pdf(self, prescription_id):
-        prescription = self.get_prescription_by_id(prescription_id)
-        patient = get_object_or_404(Patient, pk=prescription.patient_id)
-        doctor = get_object_or_404(Doctor, pk=prescription.appointment.doctor_id)
-        
-        pdf_dto = {
+    def _prescriptions_for_pdf(self):
+        details = Prefetch('prescription_details', queryset=PrescriptionDetail.objects.select_related('medicine'))
+        return Prescription.objects.select_related(
+            'patient__user', 'appointment__doctor__department'
+        ).prefetch_related(details)
+
+    def get_prescription_for_pdf(self, prescription_id):
+        return get_object_or_404(self._prescriptions_for_pdf(), pk=prescription_id)
+
+    def build_pdf_dto(self, prescription):
+        patient = prescription.patient
+        doctor = prescription.appointment.doctor
+        return {
             'patient_id': patient.id,
             'patient_name': f"{patient.first_name} {patient.last_name}",
             'patient_gender': "Nữ" if patient.gender == "F" else "Nam",
@@ -202,7 +267,7 @@ class PharmacyService:
             'doctor_name': f"{doctor.first_name} {doctor.last_name}",
             'doctor_specialization': doctor.specialization,
             'doctor_academic_degree': doctor.academic_degree or '',
-            'doctor_department': getattr(doctor, 'department', ''),
+            'doctor_department': doctor.department.department_name,
             'prescription_date': prescription.created_at.date(),
             'diagnosis': prescription.diagnosis,
             'systolic_blood_pressure': prescription.systolic_blood_pressure,
@@ -225,140 +290,332 @@ class PharmacyService:
             ]
         }
 
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=20, bottomMargin=20, leftMargin=30, rightMargin=30)
-        elements = []
-        styles = getSampleStyleSheet()
-
-        # Hospital Header
-        header_style = ParagraphStyle(name='Header', fontName='NotoSans', fontSize=12, alignment=1, spaceAfter=10)
-        elements.append(Paragraph(HOSPITAL_INFO["NAME"], header_style))
-        elements.append(Paragraph(f"Địa chỉ: {HOSPITAL_INFO['ADDRESS']}", header_style))
-        elements.append(Paragraph(f"Điện thoại: {HOSPITAL_INFO['PHONE']} | Email: {HOSPITAL_INFO['EMAIL']}", header_style))
-        elements.append(Spacer(1, 12))
-
-        # Prescription Title
-        title_style = ParagraphStyle(name='Title', fontName='NotoSans', fontSize=16, alignment=1, spaceAfter=20)
-        elements.append(Paragraph(_("ĐƠN THUỐC"), title_style))
-
-        # Patient Information
-        elements.append(Paragraph(_("Thông tin bệnh nhân"), styles['Heading3'].clone('SectionHeader', fontName='NotoSans', spaceAfter=8)))
-        data = [
-            [_('Họ và tên:'), pdf_dto['patient_name']],
-            [_('Giới tính:'), pdf_dto['patient_gender']],
-            [_('Ngày sinh:'), pdf_dto['patient_birthday'].strftime('%d/%m/%Y')],
-            [_('Số điện thoại:'), pdf_dto['patient_phone']],
-            [_('Email:'), pdf_dto['patient_email']],
-            [_('Địa chỉ:'), pdf_dto['patient_address']],
-            [_('CMND/CCCD:'), pdf_dto['patient_identity_number']],
-            [_('Số BHYT:'), pdf_dto['patient_insurance_number']],
-            [_('Ngày kê đơn:'), pdf_dto['prescription_date'].strftime('%d/%m/%Y')]
-        ]
-        table = Table(data, colWidths=[150, 380])
-        table.setStyle(TableStyle([
-            ('FONTNAME', (0, 0), (-1, -1), 'NotoSans'),
-            ('FONTSIZE', (0, 0), (0, -1), 11),  # Left column (labels) slightly larger
-            ('FONTSIZE', (1, 0), (1, -1), 10),  # Right column (data)
-            ('TEXTCOLOR', (0, 0), (0, -1), colors.black),
-            ('TEXTCOLOR', (1, 0), (1, -1), colors.black),
-            ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
-            ('ALIGN', (1, 0), (1, -1), 'LEFT'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-            ('BOX', (0, 0), (-1, -1), 1, colors.black),
-            ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
-            ('BACKGROUND', (1, 0), (1, -1), colors.white),
-            ('LEFTPADDING', (0, 0), (-1, -1), 6),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 6),
-            ('TOPPADDING', (0, 0), (-1, -1), 4),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
-        ]))
-        elements.append(table)
-        elements.append(Spacer(1, 12))
-
-        # Medical Examination Information
-        elements.append(Paragraph(_("Thông tin khám bệnh"), styles['Heading3'].clone('SectionHeader', fontName='NotoSans', spaceAfter=8)))
-        data = [
-            [_('Chẩn đoán:'), pdf_dto['diagnosis']],
-            [_('Huyết áp:'), f"{pdf_dto['systolic_blood_pressure']}/{pdf_dto['diastolic_blood_pressure']} mmHg"],
-            [_('Nhịp tim:'), f"{pdf_dto['heart_rate']} bpm"],
-            [_('Đường huyết:'), f"{pdf_dto['blood_sugar']} mg/dL"]
+    def generate_prescription_pdf(self, prescription_id):
+        prescription = self.get_prescription_for_pdf(prescription_id)
+        return render_prescription_pdf(self.build_pdf_dto(prescription))
+
+    def pdf_cache_name(self, prescription_id, updated_at):
+        language = get_language() or settings.LANGUAGE_CODE
+        return f"prescription_{prescription_id}/{updated_at:%Y%m%d%H%M%S%f}_{language}.pdf"
+
+    def get_cached_prescription_pdf(self, prescription_id, updated_at):
+        storage = storages['prescription_pdfs']
+        name = self.pdf_cache_name(prescription_id, updated_at)
+        return storage.open(name, 'rb') if storage.exists(name) else None
+
+    def store_prescription_pdf(self, prescription_id, updated_at, pdf_bytes):
+        """
+        Lưu PDF đã dựng và xoá các bản cũ của cùng đơn thuốc
+        """
+        storage = storages['prescription_pdfs']
+        name = self.pdf_cache_name(prescription_id, updated_at)
+        folder = os.path.dirname(name)
+        if storage.exists(folder):
+            for filename in storage.listdir(folder)[1]:
+                if f"{folder}/{filename}" != name:
+                    storage.delete(f"{folder}/{filename}")
+        if not storage.exists(name):
+            storage.save(name, ContentFile(pdf_bytes))
+
+    def get_prescription_pdf(self, prescription_id):
+        """
+        Trả về PDF từ bộ nhớ đệm (khoá theo updated_at của đơn thuốc), chỉ dựng lại khi đơn đã thay đổi
+        """
+        updated_at = Prescription.objects.filter(pk=prescription_id).values_list('updated_at', flat=True).first()
+        if updated_at is None:
+            raise Http404(_("Không tìm thấy đơn thuốc"))
+        cached = self.get_cached_prescription_pdf(prescription_id, updated_at)
+        if cached is not None:
+            return cached
+        prescription = self.get_prescription_for_pdf(prescription_id)
+        buffer = render_prescription_pdf(self.build_pdf_dto(prescription))
+        self.store_prescription_pdf(prescription.id, prescription.updated_at, buffer.getvalue())
+        return buffer
+
+    def get_prescriptions_for_export(self, patient_id=None, date_from=None, date_to=None):
+        prescriptions = Prescription.objects.filter(is_deleted=False)
+        if patient_id:
+            prescriptions = prescriptions.filter(patient_id=patient_id)
+        if date_from:
+            prescriptions = prescriptions.filter(created_at__date__gte=date_from)
+        if date_to:
+            prescriptions = prescriptions.filter(created_at__date__lte=date_to)
+        return prescriptions.order_by('created_at', 'id')
+
+    def iter_prescription_pdfs(self, prescriptions, workers=None, chunk_size=None):
+        """
+        Sinh (prescription_id, created_at, pdf_bytes) theo đúng thứ tự của queryset.
+        PDF đã có trong bộ nhớ đệm được đọc lại; phần còn thiếu được dựng theo từng lô
+        bằng process pool (reportlab tốn CPU) rồi ghi vào bộ nhớ đệm.
+        """
+        workers = workers or settings.PDF_EXPORT_WORKERS
+        chunk_size = chunk_size or workers * 4
+        language = get_language() or settings.LANGUAGE_CODE
+        rows = list(prescriptions.values_list('id', 'updated_at', 'created_at'))
+        pool = None
+        try:
+            for start in range(0, len(rows), chunk_size):
+                chunk = rows[start:start + chunk_size]
+                pdfs = {}
+                for prescription_id, updated_at, _created_at in chunk:
+                    cached = self.get_cached_prescription_pdf(prescription_id, updated_at)
+                    if cached is not None:
+                        with cached:
+                            pdfs[prescription_id] = cached.read()
+
+                missing = [row[0] for row in chunk if row[0] not in pdfs]
+                if missing:
+                    fetched = list(self._prescriptions_for_pdf().filter(pk__in=missing).order_by('id'))
+                    dtos = [self.build_pdf_dto(prescription) for prescription in fetched]
+                    if workers > 1 and len(dtos) > 1:
+                        if pool is None:
+                            pool = ProcessPoolExecutor(max_workers=workers, initializer=init_pdf_worker)
+                        rendered = pool.map(render_prescription_pdf_bytes, dtos, [language] * len(dtos))
+                    else:
+                        rendered = (render_prescription_pdf_bytes(dto, language) for dto in dtos)
+                    for prescription, pdf_bytes in zip(fetched, rendered):
+                        self.store_prescription_pdf(prescription.id, prescription.updated_at, pdf_bytes)
+                        pdfs[prescription.id] = pdf_bytes
+
+                for prescription_id, _updated_at, created_at in chunk:
+                    yield prescription_id, created_at, pdfs[prescription_id]
+                logger.info("Exported %d/%d prescription PDFs", min(start + chunk_size, len(rows)), len(rows))
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    def export_prescription_pdfs_zip(self, prescriptions, workers=None):
+        """
+        Generator trả về từng khúc của file ZIP chứa PDF các đơn thuốc
+        """
+        def entries():
+            for prescription_id, created_at, pdf_bytes in self.iter_prescription_pdfs(prescriptions, workers=workers):
+                created_at = timezone.localtime(created_at)
+                yield f"{created_at:%Y%m%d}_prescription_{prescription_id}.pdf", created_at.timetuple()[:6], pdf_bytes
+        return stream_zip(entries())
+
+    def _touch_prescription(self, prescription_id):
+        Prescription.objects.filter(pk=prescription_id).update(updated_at=timezone.now())
+
+
+class InventoryService:
+    """
+    Medicine.quantity là số lượng khả dụng (đã trừ phần giữ cho đơn thuốc), chỉ thay đổi bằng
+    UPDATE có điều kiện; mọi thay đổi đều được ghi thêm vào sổ cái StockMovement.
+    """
+
+    @staticmethod
+    def _apply_stock_changes(stock_changes):
+        """
+        Trừ (số dương) hoặc hoàn (số âm) tồn kho bằng một câu UPDATE có điều kiện,
+        chỉ thành công khi mọi thuốc cần trừ còn đủ số lượng
+        """
+        stock_changes = {medicine_id: qty for medicine_id, qty in stock_changes.items() if qty}
+        if not stock_changes:
+            return
+        condition = Q()
+        for medicine_id, qty in stock_changes.items():
+            if qty > 0:
+                condition |= Q(pk=medicine_id, quantity__gte=qty)
+            else:
+                condition |= Q(pk=medicine_id)
+        # Gồm cả thuốc đã xóa: vẫn phải hoàn tồn kho khi hủy đơn thuốc cũ
+        updated = Medicine.objects.all_with_deleted().filter(condition).update(
+            quantity=Case(
+                *[When(pk=medicine_id, then=F('quantity') - Value(qty)) for medicine_id, qty in stock_changes.items()],
+                default=F('quantity')
+            )
+        )
+        if updated != len(stock_changes):
+            current = Medicine.objects.all_with_deleted().in_bulk([medicine_id for medicine_id, qty in stock_changes.items() if qty > 0])
+            short_ids = sorted(
+                medicine_id for medicine_id, qty in stock_changes.items()
+                if qty > 0 and (medicine_id not in current or current[medicine_id].quantity < qty)
+            )
+            raise ValueError(_("Không đủ số lượng tồn kho cho thuốc với id: {ids}").format(ids=", ".join(map(str, short_ids))))
+
+    @staticmethod
+    def reserve_stock(details, released_detail_ids=()):
+        """
+        Giữ tồn kho cho các chi tiết đơn thuốc (đã lưu) và nhả phần giữ của released_detail_ids,
+        áp dụng phần chênh lệch bằng một câu UPDATE
+        """
+        released = list(
+            StockReservation.objects.select_related('prescription_detail')
+            .filter(prescription_detail_id__in=list(released_detail_ids))
+        )
+        stock_changes = defaultdict(int)
+        for detail in details:
+            stock_changes[detail.medicine_id] += detail.quantity
+        for reservation in released:
+            stock_changes[reservation.medicine_id] -= reservation.quantity
+        InventoryService._apply_stock_changes(stock_changes)
+
+        movements = [
+            StockMovement(
+                medicine_id=reservation.medicine_id,
+                movement_type=StockMovementType.RELEASE.value,
+                quantity=reservation.quantity,
+                prescription_id=reservation.prescription_detail.prescription_id,
+                prescription_detail_id=reservation.prescription_detail_id
+            ) for reservation in released
         ]
-        if pdf_dto['note']:
-            data.append([_('Ghi chú:'), pdf_dto['note']])
-        table = Table(data, colWidths=[150, 380])
-        table.setStyle(TableStyle([
-            ('FONTNAME', (0, 0), (-1, -1), 'NotoSans'),
-            ('FONTSIZE', (0, 0), (0, -1), 11),
-            ('FONTSIZE', (1, 0), (1, -1), 10),
-            ('TEXTCOLOR', (0, 0), (0, -1), colors.black),
-            ('TEXTCOLOR', (1, 0), (1, -1), colors.black),
-            ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
-            ('ALIGN', (1, 0), (1, -1), 'LEFT'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-            ('BOX', (0, 0), (-1, -1), 1, colors.black),
-            ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
-            ('BACKGROUND', (1, 0), (1, -1), colors.white),
-            ('LEFTPADDING', (0, 0), (-1, -1), 6),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 6),
-            ('TOPPADDING', (0, 0), (-1, -1), 4),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
-        ]))
-        elements.append(table)
-        elements.append(Spacer(1, 12))
-
-        # Prescription Details
-        elements.append(Paragraph(_("Chi tiết đơn thuốc"), styles['Heading3'].clone('SectionHeader', fontName='NotoSans', spaceAfter=8)))
-        data = [[_('STT'), _('Tên thuốc'), _('Đơn vị'), _('Liều dùng'), _('Tần suất'), _('Thời gian'), _('Số lượng')]]
-        for i, detail in enumerate(pdf_dto['prescription_details'], 1):
-            data.append([
-                str(i), detail['medicine_name'], detail['unit'], detail['dosage'],
-                detail['frequency'], detail['duration'], str(detail['quantity'])
+        if released:
+            StockReservation.objects.filter(id__in=[reservation.id for reservation in released]).delete()
+        if details:
+            StockReservation.objects.bulk_create([
+                StockReservation(prescription_detail=detail, medicine_id=detail.medicine_id, quantity=detail.quantity)
+                for detail in details
             ])
-        table = Table(data, colWidths=[40, 120, 60, 80, 95, 80, 60])
-        table.setStyle(TableStyle([
-            ('FONTNAME', (0, 0), (-1, -1), 'NotoSans'),
-            ('FONTSIZE', (0, 0), (-1, 0), 11),
-            ('FONTSIZE', (0, 1), (-1, -1), 10),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-            ('BOX', (0, 0), (-1, -1), 1, colors.black),
-            ('LEFTPADDING', (0, 0), (-1, -1), 6),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 6),
-            ('TOPPADDING', (0, 0), (-1, -1), 4),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
-        ]))
-        elements.append(table)
-        elements.append(Spacer(1, 12))
-
-        # Follow-up Information
-        if pdf_dto['follow_up'] and pdf_dto['follow_up_date']:
-            follow_up_style = ParagraphStyle(name='FollowUp', fontName='NotoSans', fontSize=10, spaceBefore=10)
-            elements.append(Paragraph(_("Lịch tái khám: {date}").format(date=pdf_dto['follow_up_date'].strftime('%d/%m/%Y')), follow_up_style))
-        elements.append(Spacer(1, 12))
-
-        # Doctor Information
-        doctor_style = ParagraphStyle(name='Doctor', fontName='NotoSans', fontSize=10, alignment=2, spaceBefore=20)
-        elements.append(Paragraph(_("Bác sĩ kê đơn"), doctor_style))
-        doctor_name_style = ParagraphStyle(name='DoctorName', fontName='NotoSans', fontSize=12, fontWeight='bold', alignment=2, spaceBefore=5)
-        elements.append(Paragraph(pdf_dto['doctor_name'], doctor_name_style))
-        doctor_info = pdf_dto['doctor_specialization']
-        if pdf_dto['doctor_academic_degree']:
-            doctor_info += f", {pdf_dto['doctor_academic_degree']}"
-        if pdf_dto['doctor_department']:
-            doctor_info += f" - {pdf_dto['doctor_department']}"
-        elements.append(Paragraph(doctor_info, doctor_style))
-
-        # Footer
-        footer_style = ParagraphStyle(name='Footer', fontName='NotoSans', fontSize=9, alignment=1, spaceBefore=20)
-        elements.append(Paragraph("Vui lòng mang đơn thuốc này khi tái khám. Thuốc chỉ được cấp theo đơn.", footer_style))
-
-        doc.build(elements)
-        buffer.seek(0)
-        return buffer
+            movements.extend(
+                StockMovement(
+                    medicine_id=detail.medicine_id,
+                    movement_type=StockMovementType.RESERVE.value,
+                    quantity=-detail.quantity,
+                    prescription_id=detail.prescription_id,
+                    prescription_detail_id=detail.id
+                ) for detail in details
+            )
+        if movements:
+            StockMovement.objects.bulk_create(movements)
+
+    @staticmethod
+    def release_stock(detail_ids):
+        InventoryService.reserve_stock([], released_detail_ids=detail_ids)
+
+    @staticmethod
+    def receive_stock(medicine_id, quantity, batch_number=None, expiry_date=None, note=None):
+        if quantity <= 0:
+            raise ValueError(_("Số lượng nhập kho phải lớn hơn 0"))
+        with transaction.atomic():
+            medicine = get_object_or_404(Medicine, pk=medicine_id)
+            Medicine.objects.filter(pk=medicine_id).update(quantity=F('quantity') + quantity)
+            StockMovement.objects.create(
+                medicine_id=medicine_id,
+                movement_type=StockMovementType.RECEIPT.value,
+                quantity=quantity,
+                batch_number=batch_number,
+                expiry_date=expiry_date,
+                note=note
+            )
+            medicine.refresh_from_db(fields=['quantity'])
+            return medicine
+
+    @staticmethod
+    def adjust_stock(medicine_id, delta, note=None):
+        with transaction.atomic():
+            medicine = get_object_or_404(Medicine, pk=medicine_id)
+            InventoryService._apply_stock_changes({medicine_id: -delta})
+            StockMovement.objects.create(
+                medicine_id=medicine_id,
+                movement_type=StockMovementType.ADJUSTMENT.value,
+                quantity=delta,
+                note=note
+            )
+            medicine.refresh_from_db(fields=['quantity'])
+            return medicine
+
+    @staticmethod
+    def get_stock_level(medicine_id):
+        """
+        Số lượng khả dụng đọc trực tiếp từ Medicine.quantity; số đang giữ lấy từ snapshot
+        cộng các dòng sổ cái phát sinh sau lần gộp gần nhất
+        """
+        medicine = get_object_or_404(Medicine.objects.select_related('stock_snapshot'), pk=medicine_id)
+        snapshot = getattr(medicine, 'stock_snapshot', None)
+        reserved = snapshot.reserved if snapshot else 0
+        pending = StockMovement.objects.filter(
+            medicine_id=medicine_id,
+            compacted=False,
+            movement_type__in=[StockMovementType.RESERVE.value, StockMovementType.RELEASE.value]
+        ).aggregate(total=Sum('quantity'))['total'] or 0
+        reserved -= pending
+        return {
+            'medicine_id': medicine.id,
+            'available': medicine.quantity,
+            'reserved': reserved,
+            'on_hand': medicine.quantity + reserved,
+        }
+
+    @staticmethod
+    def get_batches(medicine_id):
+        """
+        Các lô đã nhập của thuốc, sắp xếp theo hạn dùng gần nhất trước (FEFO)
+        """
+        return list(
+            StockMovement.objects.filter(
+                medicine_id=medicine_id,
+                movement_type=StockMovementType.RECEIPT.value,
+                batch_number__isnull=False
+            ).values('batch_number', 'expiry_date')
+            .annotate(received=Sum('quantity'))
+            .order_by(F('expiry_date').asc(nulls_last=True), 'batch_number')
+        )
+
+    COMPACTION_BATCH_SIZE = 5000
+    # Khóa advisory (PostgreSQL) để hai lần gộp chạy song song không cộng trùng cùng một dòng sổ cái
+    COMPACTION_LOCK_ID = 7300127
+
+    @staticmethod
+    def _lock_compaction():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(%s)", [InventoryService.COMPACTION_LOCK_ID])
+        # SQLite chỉ cho một transaction ghi tại một thời điểm nên không cần khóa riêng
+
+    @staticmethod
+    def compact_snapshots(batch_size=None):
+        """
+        Gộp các dòng sổ cái chưa gộp (compacted=False) vào StockSnapshot của từng thuốc, theo từng lô.
+        Mỗi lô: giữ khóa, chọn id, cộng dồn và đánh dấu đúng các id đó trong cùng một transaction;
+        dòng của transaction chưa commit (kể cả id nhỏ hơn) được gộp ở lần chạy sau.
+        Trả về số snapshot đã cập nhật và danh sách thuốc lệch giữa sổ cái và Medicine.quantity.
+        """
+        batch_size = batch_size or InventoryService.COMPACTION_BATCH_SIZE
+        updated = set()
+        while True:
+            with transaction.atomic():
+                InventoryService._lock_compaction()
+                ids = list(
+                    StockMovement.objects.filter(compacted=False).order_by('id').values_list('id', flat=True)[:batch_size]
+                )
+                if not ids:
+                    break
+                deltas = (
+                    StockMovement.objects.filter(id__in=ids)
+                    .values('medicine_id')
+                    .annotate(
+                        available=Sum('quantity'),
+                        reserved=Sum(Case(
+                            When(movement_type__in=[StockMovementType.RESERVE.value, StockMovementType.RELEASE.value],
+                                 then=-F('quantity')),
+                            default=Value(0)
+                        )),
+                        last_id=Max('id')
+                    )
+                )
+                deltas = {row['medicine_id']: row for row in deltas}
+                snapshots = StockSnapshot.objects.select_for_update().in_bulk(list(deltas), field_name='medicine_id')
+                to_create, to_update = [], []
+                for medicine_id, row in deltas.items():
+                    snapshot = snapshots.get(medicine_id)
+                    if snapshot is None:
+                        snapshot = StockSnapshot(medicine_id=medicine_id)
+                        to_create.append(snapshot)
+                    else:
+                        to_update.append(snapshot)
+                    snapshot.available += row['available']
+                    snapshot.reserved += row['reserved']
+                    snapshot.last_movement_id = max(snapshot.last_movement_id, row['last_id'])
+                StockSnapshot.objects.bulk_create(to_create)
+                StockSnapshot.objects.bulk_update(to_update, ['available', 'reserved', 'last_movement_id'])
+                StockMovement.objects.filter(id__in=ids).update(compacted=True)
+                updated.update(deltas)
+            if len(ids) < batch_size:
+                break
+
+        drift = list(
+            StockSnapshot.objects.exclude(available=F('medicine__quantity'))
+            .values('medicine_id', 'available', quantity=F('medicine__quantity'))
+        )
+        return {'updated': len(updated), 'drift': drift}
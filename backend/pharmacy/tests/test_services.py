@@ -1,20 +1,38 @@
-from django.test import TestCase
+from django.conf import settings
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
 from django.shortcuts import get_object_or_404
+from django.http import Http404
 from django.db import transaction, IntegrityError
 from django.utils.translation import gettext as _
 from decimal import Decimal
 from datetime import date, time
 from io import BytesIO
-from pharmacy.services import PharmacyService
-from pharmacy.models import Medicine, Prescription, PrescriptionDetail
+from unittest import mock
+import os
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pharmacy.services import PharmacyService, InventoryService
+from pharmacy.models import Medicine, Prescription, PrescriptionDetail, StockMovement, StockReservation, StockSnapshot
 from patients.models import Patient
 from appointments.models import Appointment
 from doctors.models import Doctor, Department, Schedule, ExaminationRoom
 from users.models import User
-from common.enums import AppointmentStatus, Gender, AcademicDegree, DoctorType, RoomType, Shift, UserRole
+from common.enums import AppointmentStatus, Gender, AcademicDegree, DoctorType, RoomType, Shift, UserRole, StockMovementType
 from common.constants import SCHEDULE_DEFAULTS, PHARMACY_LENGTH, COMMON_LENGTH, MIN_VALUE
 
-class PharmacyServiceTest(TestCase):
+
+def pdf_storages(location):
+    return {
+        **settings.STORAGES,
+        'prescription_pdfs': {
+            'BACKEND': 'django.core.files.storage.FileSystemStorage',
+            'OPTIONS': {'location': location},
+        },
+    }
+
+
+class PharmacyFixtureMixin:
     @classmethod
     def setUpTestData(cls):
         cls.service = PharmacyService()
@@ -110,6 +128,8 @@ class PharmacyServiceTest(TestCase):
             prescription_notes="Take after meals"
         )
 
+
+class PharmacyServiceTest(PharmacyFixtureMixin, TestCase):
     def test_create_prescription(self):
         # create a fresh appointment
         new_appointment = Appointment.objects.create(
@@ -151,6 +171,93 @@ class PharmacyServiceTest(TestCase):
         self.assertEqual(detail.dosage, "1000mg")
         self.assertEqual(detail.quantity, 21)
 
+    def _new_prescription_data(self, details):
+        new_appointment = Appointment.objects.create(
+            doctor=self.doctor,
+            patient=self.patient,
+            schedule=self.schedule,
+            symptoms="Cough",
+            slot_start=time(8, 30),
+            slot_end=time(9, 0),
+            status=AppointmentStatus.CONFIRMED.value
+        )
+        return {
+            'appointment_id': new_appointment.id,
+            'patient_id': self.patient.id,
+            'diagnosis': "Bacterial infection",
+            'systolic_blood_pressure': 130,
+            'diastolic_blood_pressure': 85,
+            'heart_rate': 75,
+            'blood_sugar': 95,
+            'prescription_details': [
+                {
+                    'medicine_id': medicine_id,
+                    'dosage': "1000mg",
+                    'frequency': "Every 8 hours",
+                    'duration': "7 days",
+                    'quantity': quantity
+                } for medicine_id, quantity in details
+            ]
+        }
+
+    def test_create_prescription_decrements_stock(self):
+        data = self._new_prescription_data([(self.medicine.id, 21), (self.medicine.id, 4)])
+        self.service.create_prescription(data)
+        self.medicine.refresh_from_db()
+        self.assertEqual(self.medicine.quantity, 75)
+
+    def test_create_prescription_constant_queries(self):
+        medicines = [
+            Medicine.objects.create(
+                medicine_name=f"Medicine {i}", category="Test", usage="Test usage",
+                unit="Tablet", price=Decimal('5.00'), quantity=10
+            ) for i in range(15)
+        ]
+        data = self._new_prescription_data([(m.id, 1) for m in medicines])
+        # exists, in_bulk, insert prescription, bulk_create details, stock update,
+        # bulk_create reservations, bulk_create movements (+ savepoint)
+        with self.assertNumQueries(9):
+            self.service.create_prescription(data)
+
+    def test_create_prescription_reports_all_missing_medicines(self):
+        data = self._new_prescription_data([(self.medicine.id, 1), (999998, 1), (999999, 1)])
+        with self.assertRaisesMessage(Http404, "999998, 999999"):
+            self.service.create_prescription(data)
+        self.medicine.refresh_from_db()
+        self.assertEqual(self.medicine.quantity, 100)
+
+    def test_create_prescription_insufficient_stock(self):
+        data = self._new_prescription_data([(self.medicine.id, 101)])
+        with self.assertRaises(ValueError):
+            self.service.create_prescription(data)
+        self.medicine.refresh_from_db()
+        self.assertEqual(self.medicine.quantity, 100)
+        self.assertFalse(Prescription.objects.filter(appointment_id=data['appointment_id']).exists())
+
+    def test_update_prescription_adjusts_stock_by_difference(self):
+        other = Medicine.objects.create(
+            medicine_name="Ibuprofen", category="Test", usage="Test usage",
+            unit="Tablet", price=Decimal('5.00'), quantity=10
+        )
+        InventoryService.reserve_stock([self.prescription_detail])
+        data = {
+            'prescription_details': [
+                {
+                    'medicine_id': other.id,
+                    'dosage': "200mg",
+                    'frequency': "Every 8 hours",
+                    'duration': "3 days",
+                    'quantity': 6
+                }
+            ]
+        }
+        self.service.update_prescription(self.prescription.id, data)
+        self.medicine.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.medicine.quantity, 100)
+        self.assertEqual(other.quantity, 4)
+        self.assertEqual(StockReservation.objects.filter(prescription_detail__prescription=self.prescription).count(), 1)
+
     def test_update_prescription(self):
         data = {
             'follow_up_date': date(2025, 9, 4),
@@ -202,6 +309,25 @@ class PharmacyServiceTest(TestCase):
         self.assertEqual(updated_detail.dosage, "750mg")
         self.assertEqual(updated_detail.quantity, 30)
 
+    def test_update_prescription_detail_swaps_medicine_reservation(self):
+        other = Medicine.objects.create(
+            medicine_name="Ibuprofen", category="Test", usage="Test usage",
+            unit="Tablet", price=Decimal('5.00'), quantity=30
+        )
+        InventoryService.reserve_stock([self.prescription_detail])
+        self.medicine.refresh_from_db()
+        reserved_quantity = self.prescription_detail.quantity
+        self.assertEqual(self.medicine.quantity, 100 - reserved_quantity)
+
+        # Chỉ đổi thuốc, giữ nguyên số lượng
+        self.service.update_prescription_detail(self.prescription_detail.id, {'medicine_id': other.id, 'quantity': reserved_quantity})
+        self.medicine.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.medicine.quantity, 100)
+        self.assertEqual(other.quantity, 30 - reserved_quantity)
+        reservation = StockReservation.objects.get(prescription_detail=self.prescription_detail)
+        self.assertEqual((reservation.medicine_id, reservation.quantity), (other.id, reserved_quantity))
+
     def test_delete_prescription_detail(self):
         self.service.delete_prescription_detail(self.prescription_detail.id)
         self.assertEqual(self.prescription.prescription_details.count(), 0)
@@ -303,6 +429,18 @@ class PharmacyServiceTest(TestCase):
         with self.assertRaises(Exception):
             get_object_or_404(Medicine, pk=new_medicine.id)
 
+    def test_delete_medicine_with_stock_history(self):
+        medicine = self.service.add_new_medicine({
+            'medicine_name': "Stocked Medicine", 'category': "Test", 'usage': "Test usage", 'unit': "Tablet",
+            'insurance_discount_percent': 0, 'price': Decimal('5.00'), 'quantity': 10
+        })
+        self.service.delete_medicine(medicine.id)
+        self.assertFalse(Medicine.objects.filter(pk=medicine.id).exists())
+        self.assertTrue(Medicine.objects.all_with_deleted().get(pk=medicine.id).is_deleted)
+        self.assertEqual(StockMovement.objects.filter(medicine_id=medicine.id).count(), 1)
+        with self.assertRaises(Http404):
+            self.service.get_medicine_by_id(medicine.id)
+
     def test_delete_medicine_with_prescription(self):
         with self.assertRaises(ValueError):
             self.service.delete_medicine(self.medicine.id)
@@ -311,3 +449,220 @@ class PharmacyServiceTest(TestCase):
         buffer = self.service.generate_prescription_pdf(self.prescription.id)
         self.assertIsInstance(buffer, BytesIO)
         self.assertGreater(buffer.getbuffer().nbytes, 0)
+
+    def test_generate_prescription_pdf_fetches_in_two_queries(self):
+        with self.assertNumQueries(2):
+            self.service.generate_prescription_pdf(self.prescription.id)
+
+    def test_get_prescription_pdf_reuses_cached_file(self):
+        with tempfile.TemporaryDirectory() as cache_dir, self.settings(STORAGES=pdf_storages(cache_dir)):
+            first = self.service.get_prescription_pdf(self.prescription.id).read()
+            with mock.patch('pharmacy.services.render_prescription_pdf') as render, self.assertNumQueries(1):
+                cached = self.service.get_prescription_pdf(self.prescription.id)
+                self.assertEqual(cached.read(), first)
+                cached.close()
+            render.assert_not_called()
+
+    def test_get_prescription_pdf_rerenders_after_change(self):
+        with tempfile.TemporaryDirectory() as cache_dir, self.settings(STORAGES=pdf_storages(cache_dir)):
+            self.service.get_prescription_pdf(self.prescription.id)
+            self.service.update_prescription_detail(self.prescription_detail.id, {'dosage': "250mg"})
+            with mock.patch('pharmacy.services.render_prescription_pdf', return_value=BytesIO(b'%PDF')) as render:
+                self.service.get_prescription_pdf(self.prescription.id)
+            render.assert_called_once()
+            folder = os.path.join(cache_dir, f"prescription_{self.prescription.id}")
+            self.assertEqual(len(os.listdir(folder)), 1)
+
+
+    def test_export_prescription_pdfs_zip(self):
+        other_appointment = Appointment.objects.create(
+            doctor=self.doctor,
+            patient=self.patient,
+            schedule=self.schedule,
+            symptoms="Headache",
+            slot_start=time(9, 0),
+            slot_end=time(9, 30),
+            status=AppointmentStatus.CONFIRMED.value
+        )
+        other = Prescription.objects.create(appointment=other_appointment, patient=self.patient, diagnosis="Migraine")
+        with tempfile.TemporaryDirectory() as cache_dir, self.settings(STORAGES=pdf_storages(cache_dir)):
+            cached = self.service.get_prescription_pdf(self.prescription.id).read()
+            prescriptions = self.service.get_prescriptions_for_export(patient_id=self.patient.id)
+            with mock.patch('pharmacy.services.render_prescription_pdf_bytes', return_value=b'%PDF-other') as render:
+                archive = b''.join(self.service.export_prescription_pdfs_zip(prescriptions, workers=1))
+            render.assert_called_once()
+
+            with zipfile.ZipFile(BytesIO(archive)) as zf:
+                names = zf.namelist()
+                self.assertEqual(len(names), 2)
+                self.assertTrue(names[0].endswith(f"prescription_{self.prescription.id}.pdf"))
+                self.assertTrue(names[1].endswith(f"prescription_{other.id}.pdf"))
+                self.assertEqual(zf.read(names[0]), cached)
+                self.assertEqual(zf.read(names[1]), b'%PDF-other')
+
+    def test_iter_prescription_pdfs_with_process_pool(self):
+        other_appointment = Appointment.objects.create(
+            doctor=self.doctor,
+            patient=self.patient,
+            schedule=self.schedule,
+            symptoms="Headache",
+            slot_start=time(9, 0),
+            slot_end=time(9, 30),
+            status=AppointmentStatus.CONFIRMED.value
+        )
+        Prescription.objects.create(appointment=other_appointment, patient=self.patient, diagnosis="Migraine")
+        with tempfile.TemporaryDirectory() as cache_dir, self.settings(STORAGES=pdf_storages(cache_dir)):
+            prescriptions = self.service.get_prescriptions_for_export(patient_id=self.patient.id)
+            results = list(self.service.iter_prescription_pdfs(prescriptions, workers=2))
+        self.assertEqual([r[0] for r in results], list(prescriptions.values_list('id', flat=True)))
+        self.assertTrue(all(pdf.startswith(b'%PDF') for _, _, pdf in results))
+
+class InventoryServiceTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.medicine = Medicine.objects.create(
+            medicine_name="Amoxicillin",
+            category="Antibiotic",
+            usage="Take 1 capsule every 8 hours",
+            unit="Capsule",
+            price=Decimal('8.00'),
+            quantity=0
+        )
+
+    def test_receive_stock_records_batch(self):
+        InventoryService.receive_stock(self.medicine.id, 50, batch_number="B2", expiry_date=date(2027, 1, 1))
+        medicine = InventoryService.receive_stock(self.medicine.id, 30, batch_number="B1", expiry_date=date(2026, 6, 1))
+        self.assertEqual(medicine.quantity, 80)
+        batches = InventoryService.get_batches(self.medicine.id)
+        self.assertEqual([b['batch_number'] for b in batches], ["B1", "B2"])
+        self.assertEqual(batches[0]['received'], 30)
+
+    def test_receive_stock_invalid_quantity(self):
+        with self.assertRaises(ValueError):
+            InventoryService.receive_stock(self.medicine.id, 0)
+
+    def test_adjust_stock_cannot_go_negative(self):
+        InventoryService.receive_stock(self.medicine.id, 5)
+        with self.assertRaises(ValueError):
+            InventoryService.adjust_stock(self.medicine.id, -6)
+        medicine = InventoryService.adjust_stock(self.medicine.id, -5)
+        self.assertEqual(medicine.quantity, 0)
+
+    def test_compact_snapshots_and_stock_level(self):
+        InventoryService.receive_stock(self.medicine.id, 40)
+        StockMovement.objects.create(
+            medicine=self.medicine,
+            movement_type=StockMovementType.RESERVE.value,
+            quantity=-10
+        )
+        Medicine.objects.filter(pk=self.medicine.id).update(quantity=30)
+
+        result = InventoryService.compact_snapshots()
+        self.assertEqual(result['updated'], 1)
+        self.assertEqual(result['drift'], [])
+        snapshot = StockSnapshot.objects.get(medicine=self.medicine)
+        self.assertEqual((snapshot.available, snapshot.reserved), (30, 10))
+
+        StockMovement.objects.create(
+            medicine=self.medicine,
+            movement_type=StockMovementType.RELEASE.value,
+            quantity=4
+        )
+        Medicine.objects.filter(pk=self.medicine.id).update(quantity=34)
+        level = InventoryService.get_stock_level(self.medicine.id)
+        self.assertEqual(level, {'medicine_id': self.medicine.id, 'available': 34, 'reserved': 6, 'on_hand': 40})
+
+    def test_compact_snapshots_reports_drift(self):
+        InventoryService.receive_stock(self.medicine.id, 10)
+        Medicine.objects.filter(pk=self.medicine.id).update(quantity=7)
+        result = InventoryService.compact_snapshots()
+        self.assertEqual(result['drift'], [{'medicine_id': self.medicine.id, 'available': 10, 'quantity': 7}])
+
+    def test_compact_snapshots_includes_late_committed_lower_id(self):
+        InventoryService.receive_stock(self.medicine.id, 5)
+        late = StockMovement.objects.latest('id')
+        late_id = late.id
+        late.delete()  # giả lập transaction cấp id nhỏ hơn nhưng chưa commit khi gộp
+        InventoryService.receive_stock(self.medicine.id, 10)
+        InventoryService.compact_snapshots()
+        self.assertEqual(StockSnapshot.objects.get(medicine=self.medicine).available, 10)
+
+        StockMovement.objects.create(
+            id=late_id, medicine=self.medicine, movement_type=StockMovementType.RECEIPT.value, quantity=5
+        )
+        InventoryService.compact_snapshots()
+        self.assertEqual(StockSnapshot.objects.get(medicine=self.medicine).available, 15)
+
+    def test_compact_snapshots_in_batches(self):
+        for quantity in (1, 2, 3, 4, 5):
+            InventoryService.receive_stock(self.medicine.id, quantity)
+        result = InventoryService.compact_snapshots(batch_size=2)
+        self.assertEqual(result['updated'], 1)
+        self.assertEqual(StockSnapshot.objects.get(medicine=self.medicine).available, 15)
+        self.assertFalse(StockMovement.objects.filter(compacted=False).exists())
+
+
+class InventoryConcurrencyTest(PharmacyFixtureMixin, TransactionTestCase):
+    WORKERS = 8
+    ATTEMPTS = 40
+
+    def setUp(self):
+        self.setUpTestData()
+
+    def _run_concurrently(self, func, items):
+        from django.db import connection
+
+        def run(item):
+            try:
+                return func(item)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.WORKERS) as pool:
+            return list(pool.map(run, items))
+
+    # Cần nhiều kết nối tới cùng CSDL test; SQLite trong bộ nhớ chỉ có một kết nối
+    @skipUnlessDBFeature('test_db_allows_multiple_connections')
+    def test_concurrent_reserve_and_release(self):
+        details = [
+            PrescriptionDetail.objects.create(
+                prescription=self.prescription, medicine=self.medicine, dosage="1", frequency="1", duration="1", quantity=3
+            ) for _ in range(self.ATTEMPTS)
+        ]
+
+        def reserve(detail):
+            try:
+                with transaction.atomic():
+                    InventoryService.reserve_stock([detail])
+                return detail.id
+            except ValueError:
+                return None
+
+        reserved = [detail_id for detail_id in self._run_concurrently(reserve, details) if detail_id]
+        self.medicine.refresh_from_db()
+        # 100 viên, mỗi chi tiết giữ 3: đúng 33 chi tiết được giữ, không mất cập nhật nào
+        self.assertEqual(len(reserved), 33)
+        self.assertEqual(self.medicine.quantity, 1)
+        self.assertEqual(StockReservation.objects.count(), 33)
+
+        def release(detail_id):
+            with transaction.atomic():
+                InventoryService.release_stock([detail_id])
+
+        self._run_concurrently(release, reserved)
+        self.medicine.refresh_from_db()
+        self.assertEqual(self.medicine.quantity, 100)
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(InventoryService.get_stock_level(self.medicine.id)['reserved'], 0)
+
+    @skipUnlessDBFeature('test_db_allows_multiple_connections')
+    def test_concurrent_compactions_apply_each_movement_once(self):
+        for _ in range(20):
+            InventoryService.receive_stock(self.medicine.id, 1)
+
+        self._run_concurrently(lambda _: InventoryService.compact_snapshots(batch_size=3), range(self.WORKERS))
+
+        snapshot = StockSnapshot.objects.get(medicine=self.medicine)
+        # Medicine tạo trực tiếp (100) không có dòng sổ cái: snapshot chỉ gồm 20 lần nhập
+        self.assertEqual(snapshot.available, 20)
+        self.assertFalse(StockMovement.objects.filter(compacted=False).exists())
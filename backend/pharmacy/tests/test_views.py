@@ -14,6 +14,10 @@ from common.enums import AppointmentStatus, Gender, AcademicDegree, DoctorType,
 from common.constants import SCHEDULE_DEFAULTS
 from decimal import Decimal
 from datetime import date, time, datetime
+import tempfile
+import zipfile
+from io import BytesIO
+from pharmacy.tests.test_services import pdf_storages
 
 User = get_user_model()
 
@@ -325,6 +329,69 @@ class PharmacyViewSetTest(TestCase):
         self.assertEqual(len(response.data), 1)
         self.assertEqual(response.data[0]['id'], self.prescription.id)
 
+    def _create_history(self, count):
+        for i in range(count):
+            appointment = Appointment.objects.create(
+                doctor=self.doctor,
+                patient=self.patient,
+                schedule=self.schedule,
+                symptoms="Cough",
+                slot_start=time(9, i),
+                slot_end=time(9, i + 1),
+                status=AppointmentStatus.COMPLETED.value
+            )
+            prescription = Prescription.objects.create(appointment=appointment, patient=self.patient, diagnosis="Flu")
+            PrescriptionDetail.objects.bulk_create([
+                PrescriptionDetail(
+                    prescription=prescription, medicine=self.medicine, dosage="500mg",
+                    frequency="Daily", duration="3 days", quantity=q
+                ) for q in (1, 2, 3)
+            ])
+
+    def test_get_prescriptions_by_patient_id_constant_queries(self):
+        self.client.force_authenticate(user=self.patient_user)
+        url = reverse('prescription-get-prescriptions-by-patient-id', kwargs={'patient_id': self.patient.id})
+        with self.assertNumQueries(2):
+            self.client.get(url)
+        self._create_history(5)
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data), 6)
+        self.assertEqual(len(response.data[0]['prescription_details']), 3)
+        self.assertEqual(response.data[0]['prescription_details'][0]['medicine']['medicine_name'], "Paracetamol")
+
+    def test_list_prescriptions_newest_first(self):
+        self._create_history(3)
+        self.client.force_authenticate(user=self.patient_user)
+        expected = list(Prescription.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        for params in ({}, {'mode': 'summary'}):
+            response = self.client.get(reverse('prescription-list'), params)
+            self.assertEqual([p['id'] for p in response.data], expected)
+
+    def test_get_prescriptions_by_patient_id_summary(self):
+        self._create_history(5)
+        self.client.force_authenticate(user=self.patient_user)
+        url = reverse('prescription-get-prescriptions-by-patient-id', kwargs={'patient_id': self.patient.id})
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'mode': 'summary'})
+        self.assertEqual(len(response.data), 6)
+        self.assertNotIn('prescription_details', response.data[0])
+        self.assertEqual(response.data[0]['detail_count'], 3)
+        self.assertEqual(response.data[0]['total_quantity'], 6)
+
+    def test_get_prescriptions_by_patient_id_cursor_pagination(self):
+        self._create_history(5)
+        self.client.force_authenticate(user=self.patient_user)
+        url = reverse('prescription-get-prescriptions-by-patient-id', kwargs={'patient_id': self.patient.id})
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'pageSize': 4})
+        self.assertEqual(len(response.data['content']), 4)
+        self.assertIsNotNone(response.data['next'])
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['content']), 2)
+        self.assertEqual(response.data['content'][-1]['id'], self.prescription.id)
+        self.assertIsNone(response.data['next'])
+
     def test_get_prescriptions_by_appointment_id(self):
         self.client.force_authenticate(user=self.patient_user)
         
@@ -352,10 +419,31 @@ class PharmacyViewSetTest(TestCase):
 
     def test_get_prescription_pdf(self):
         self.client.force_authenticate(user=self.patient_user)
-        response = self.client.get(reverse('prescription-get-prescription-pdf', kwargs={'pk': self.prescription.id}))
-        self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response['Content-Type'], 'application/pdf')
-        self.assertIn(f'prescription_{self.prescription.id}.pdf', response['Content-Disposition'])
+        with tempfile.TemporaryDirectory() as cache_dir, self.settings(STORAGES=pdf_storages(cache_dir)):
+            response = self.client.get(reverse('prescription-get-prescription-pdf', kwargs={'pk': self.prescription.id}))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response['Content-Type'], 'application/pdf')
+            self.assertIn(f'prescription_{self.prescription.id}.pdf', response['Content-Disposition'])
+            self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+
+    def test_export_prescription_pdfs(self):
+        self.client.force_authenticate(user=self.doctor_user)
+        with tempfile.TemporaryDirectory() as cache_dir, self.settings(STORAGES=pdf_storages(cache_dir), PDF_EXPORT_WORKERS=1):
+            response = self.client.get(reverse('prescription-export-prescription-pdfs'), {'patient_id': self.patient.id})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response['Content-Type'], 'application/zip')
+            with zipfile.ZipFile(BytesIO(b''.join(response.streaming_content))) as zf:
+                self.assertEqual(len(zf.namelist()), 1)
+
+    def test_export_prescription_pdfs_requires_filter(self):
+        self.client.force_authenticate(user=self.doctor_user)
+        response = self.client.get(reverse('prescription-export-prescription-pdfs'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_prescription_pdfs_forbidden_for_patient(self):
+        self.client.force_authenticate(user=self.patient_user)
+        response = self.client.get(reverse('prescription-export-prescription-pdfs'), {'date': "2025-08-26"})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
 class MedicineViewSetTest(TestCase):
     @classmethod
@@ -496,3 +584,20 @@ class MedicineViewSetTest(TestCase):
         response = self.client.get(reverse('medicine-search-medicine') + '?name=Nonexistent')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 0)
+
+    def test_receive_stock(self):
+        self.client.force_authenticate(user=self.admin_user)
+        data = {'quantity': 20, 'batch_number': "LOT-01", 'expiry_date': "2027-01-31"}
+        response = self.client.post(reverse('medicine-receive-stock', kwargs={'pk': self.medicine.id}), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['quantity'], 120)
+
+        response = self.client.get(reverse('medicine-get-stock', kwargs={'pk': self.medicine.id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['available'], 120)
+        self.assertEqual(response.data['batches'][0]['batch_number'], "LOT-01")
+
+    def test_receive_stock_forbidden_for_patient(self):
+        self.client.force_authenticate(user=self.patient_user)
+        response = self.client.post(reverse('medicine-receive-stock', kwargs={'pk': self.medicine.id}), {'quantity': 5}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
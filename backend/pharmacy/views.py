@@ -2,17 +2,18 @@ from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.decorators import action
-from django.http import FileResponse
+from django.http import FileResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils.translation import gettext as _
 from .models import Prescription, PrescriptionDetail, Medicine
-from .services import PharmacyService
+from .services import PharmacyService, InventoryService
 from .serializers import (
     PrescriptionSerializer, PrescriptionDetailSerializer, MedicineSerializer,
     NewMedicineRequestSerializer, UpdateMedicineRequestSerializer,
     CreatePrescriptionRequestSerializer, UpdatePrescriptionRequestSerializer,
     AddMedicineToPrescriptionRequestSerializer, UpdatePrescriptionDetailRequestSerializer,
-    PrescriptionPdfDtoSerializer
+    PrescriptionPdfDtoSerializer, ReceiveStockRequestSerializer, PrescriptionPdfExportQuerySerializer,
+    PrescriptionSummarySerializer, PrescriptionCursorPagination
 )
 
 
@@ -30,10 +31,26 @@ class PrescriptionViewSet(viewsets.ViewSet):
     def get_object(self, pk):
         return get_object_or_404(Prescription, pk=pk)
 
+    def _is_summary(self, request):
+        return request.query_params.get('mode') == 'summary'
+
+    def _list_response(self, request, prescriptions, summary):
+        """
+        ?mode=summary trả số lượng thay vì mảng chi tiết, ?cursor / ?pageSize bật phân trang theo con trỏ
+        """
+        serializer_class = PrescriptionSummarySerializer if summary else PrescriptionSerializer
+        if 'cursor' in request.query_params or 'pageSize' in request.query_params:
+            paginator = PrescriptionCursorPagination()
+            page = paginator.paginate_queryset(prescriptions, request, view=self)
+            return paginator.get_paginated_response(serializer_class(page, many=True).data)
+        # Cùng thứ tự với phân trang con trỏ để kết quả ổn định giữa các lần gọi
+        prescriptions = prescriptions.order_by(*PrescriptionCursorPagination.ordering)
+        return Response(serializer_class(prescriptions, many=True).data)
+
     def list(self, request):
-        prescriptions = Prescription.objects.all()
-        serializer = PrescriptionSerializer(prescriptions, many=True)
-        return Response(serializer.data)
+        summary = self._is_summary(request)
+        prescriptions = PharmacyService().with_listing_data(Prescription.objects.all(), summary)
+        return self._list_response(request, prescriptions, summary)
 
     def retrieve(self, request, pk=None):
         prescription = self.get_object(pk)
@@ -43,14 +60,20 @@ class PrescriptionViewSet(viewsets.ViewSet):
     def create(self, request):
         serializer = CreatePrescriptionRequestSerializer(data=request.data)
         if serializer.is_valid():
-            prescription = PharmacyService().create_prescription(serializer.validated_data)
+            try:
+                prescription = PharmacyService().create_prescription(serializer.validated_data)
+            except ValueError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
             return Response(PrescriptionSerializer(prescription).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def update(self, request, pk=None):
         serializer = UpdatePrescriptionRequestSerializer(data=request.data)
         if serializer.is_valid():
-            prescription = PharmacyService().update_prescription(pk, serializer.validated_data)
+            try:
+                prescription = PharmacyService().update_prescription(pk, serializer.validated_data)
+            except ValueError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
             return Response(PrescriptionSerializer(prescription).data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -93,9 +116,9 @@ class PrescriptionViewSet(viewsets.ViewSet):
 
     @action(detail=False, methods=['get'], url_path='patient/(?P<patient_id>\d+)')
     def get_prescriptions_by_patient_id(self, request, patient_id=None):
-        prescriptions = PharmacyService().get_prescriptions_by_patient_id(patient_id)
-        serializer = PrescriptionSerializer(prescriptions, many=True)
-        return Response(serializer.data)
+        summary = self._is_summary(request)
+        prescriptions = PharmacyService().get_prescriptions_by_patient_id(patient_id, summary)
+        return self._list_response(request, prescriptions, summary)
 
     @action(detail=False, methods=['get'], url_path='appointment/(?P<appointment_id>\d+)')
     def get_prescriptions_by_appointment_id(self, request, appointment_id=None):
@@ -107,11 +130,24 @@ class PrescriptionViewSet(viewsets.ViewSet):
 
     @action(detail=True, methods=['get'], url_path='pdf')
     def get_prescription_pdf(self, request, pk=None):
-        pdf_buffer = PharmacyService().generate_prescription_pdf(pk)
-        response = FileResponse(pdf_buffer, as_attachment=True, filename=f'prescription_{pk}.pdf')
+        pdf_file = PharmacyService().get_prescription_pdf(pk)
+        response = FileResponse(pdf_file, as_attachment=True, filename=f'prescription_{pk}.pdf')
         response['Content-Type'] = 'application/pdf'
         return response
 
+    @action(detail=False, methods=['get'], url_path='pdf/export')
+    def export_prescription_pdfs(self, request):
+        if request.user.role not in ['A', 'D']:
+            return Response({"error": _("Bạn không có quyền xuất đơn thuốc")}, status=status.HTTP_403_FORBIDDEN)
+        serializer = PrescriptionPdfExportQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        service = PharmacyService()
+        prescriptions = service.get_prescriptions_for_export(**serializer.validated_data)
+        response = StreamingHttpResponse(service.export_prescription_pdfs_zip(prescriptions), content_type='application/zip')
+        response['Content-Disposition'] = 'attachment; filename="prescriptions.zip"'
+        return response
+
 
 class MedicineViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
@@ -143,7 +179,10 @@ class MedicineViewSet(viewsets.ViewSet):
     def destroy(self, request, pk=None):
         if not request.user.groups.filter(name='ADMIN').exists():
             return Response({"error": _("Chỉ admin mới có quyền xóa")}, status=status.HTTP_403_FORBIDDEN)
-        PharmacyService().delete_medicine(pk)
+        try:
+            PharmacyService().delete_medicine(pk)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         return Response({"message": _("Thuốc được xóa thành công")}, status=status.HTTP_200_OK)
 
     @action(detail=False, methods=['get'], url_path='search')
@@ -153,3 +192,19 @@ class MedicineViewSet(viewsets.ViewSet):
         medicines = PharmacyService().search_medicine(name, category)
         serializer = MedicineSerializer(medicines, many=True)
         return Response(serializer.data)
+
+    @action(detail=True, methods=['get'], url_path='stock')
+    def get_stock(self, request, pk=None):
+        stock = InventoryService.get_stock_level(pk)
+        stock['batches'] = InventoryService.get_batches(pk)
+        return Response(stock)
+
+    @action(detail=True, methods=['post'], url_path='stock/receive')
+    def receive_stock(self, request, pk=None):
+        if request.user.role not in ['A', 'D']:
+            return Response({"error": _("Bạn không có quyền nhập kho")}, status=status.HTTP_403_FORBIDDEN)
+        serializer = ReceiveStockRequestSerializer(data=request.data)
+        if serializer.is_valid():
+            medicine = InventoryService.receive_stock(pk, **serializer.validated_data)
+            return Response(MedicineSerializer(medicine).data, status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
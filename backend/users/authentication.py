@@ -0,0 +1,203 @@
+"""Xác thực JWT: danh tính (role, patient_id, doctor_id) lấy từ claim của token, User đầy đủ chỉ nạp khi view cần."""
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from common.enums import UserRole
+from .models import User
+
+AuthContext = namedtuple('AuthContext', ['user_id', 'role', 'patient_id', 'doctor_id'])
+
+# Tên claim chứa danh tính trong access/refresh token
+ROLE_CLAIM = 'role'
+PATIENT_ID_CLAIM = 'patientId'
+DOCTOR_ID_CLAIM = 'doctorId'
+
+
+class AuthContextService:
+    KEY = 'auth_context:{user_id}'
+    REVOKED_KEY = 'auth_revoked:{user_id}'
+
+    @classmethod
+    def get_user(cls, user_id):
+        """
+        Người dùng kèm auth_patient_id, auth_doctor_id; đọc từ cache, nếu chưa có thì nạp bằng một truy vấn
+        """
+        key = cls.KEY.format(user_id=user_id)
+        user = cache.get(key)
+        if user is None:
+            user = cls.load(user_id)
+            if user is not None:
+                cache.set(key, user, timeout=settings.AUTH_CONTEXT_CACHE_TTL)
+        return user
+
+    @staticmethod
+    def load(user_id):
+        from patients.models import Patient
+        from doctors.models import Doctor
+        return User.objects.annotate(
+            auth_patient_id=Subquery(Patient.objects.filter(user_id=OuterRef('pk')).values('id')[:1]),
+            auth_doctor_id=Subquery(Doctor.objects.filter(user_id=OuterRef('pk')).order_by('id').values('id')[:1]),
+        ).filter(pk=user_id).first()
+
+    @classmethod
+    def invalidate(cls, user_id):
+        cache.delete(cls.KEY.format(user_id=user_id))
+
+    @classmethod
+    def revoke_tokens(cls, user_id):
+        """
+        Token cấp trước thời điểm này không còn dùng được (khóa, xóa tài khoản, đổi vai trò).
+        Mốc lưu ở User.tokens_valid_after; iat tính theo giây nên token cấp trong cùng giây cũng bị từ chối.
+        """
+        revoked_at = timezone.now()
+        User.objects.all_with_deleted().filter(pk=user_id).update(tokens_valid_after=revoked_at)
+        cls._cache_revocation(user_id, revoked_at)
+
+    @classmethod
+    def tokens_revoked_before(cls, user_id):
+        """
+        Mốc thu hồi (giây) cho xác thực access token. Giữ trong cache AUTH_CONTEXT_CACHE_TTL giây: với cache riêng
+        từng process (LocMem), process khác thấy thu hồi chậm nhất sau chừng đó thời gian; refresh luôn đọc từ DB.
+        """
+        revoked_before = cache.get(cls.REVOKED_KEY.format(user_id=user_id))
+        if revoked_before is None:
+            rows = list(User.objects.all_with_deleted().filter(pk=user_id).values_list('tokens_valid_after', flat=True))
+            if not rows:
+                # Người dùng đã bị xóa hẳn: từ chối mọi token đã cấp
+                revoked_before = int(time.time())
+                cache.set(cls.REVOKED_KEY.format(user_id=user_id), revoked_before,
+                          timeout=settings.AUTH_CONTEXT_CACHE_TTL)
+            else:
+                revoked_before = cls._cache_revocation(user_id, rows[0])
+        return revoked_before or None
+
+    @classmethod
+    def prime_revocation(cls, user):
+        """Ghi mốc thu hồi đã biết của user vào cache khi cấp token, để request đầu tiên không phải truy vấn."""
+        cls._cache_revocation(user.pk, getattr(user, 'tokens_valid_after', None))
+
+    @classmethod
+    def _cache_revocation(cls, user_id, valid_after):
+        revoked_before = int(valid_after.timestamp()) if valid_after else 0
+        cache.set(cls.REVOKED_KEY.format(user_id=user_id), revoked_before, timeout=settings.AUTH_CONTEXT_CACHE_TTL)
+        return revoked_before
+
+    @staticmethod
+    def is_revoked(token, revoked_before):
+        return revoked_before is not None and token.get('iat', 0) <= revoked_before
+
+
+def _context_from_user(user):
+    if not hasattr(user, 'auth_patient_id'):
+        user = AuthContextService.get_user(user.id) or user
+    return AuthContext(user.id, user.role, getattr(user, 'auth_patient_id', None), getattr(user, 'auth_doctor_id', None))
+
+
+class TokenIdentityUser:
+    """
+    Người dùng dựng từ claim của access token, không truy vấn cơ sở dữ liệu.
+    Thuộc tính không có trong token (email, phone, ...) được đọc từ User thật, nạp qua cache ở lần truy cập đầu.
+    """
+    is_authenticated = True
+    is_anonymous = False
+    is_active = True
+
+    def __init__(self, token):
+        self.token = token
+        self.id = self.pk = int(token[api_settings.USER_ID_CLAIM])
+
+    def __str__(self):
+        return f"TokenIdentityUser {self.id}"
+
+    def __eq__(self, other):
+        if isinstance(other, (User, TokenIdentityUser)):
+            return self.id == other.pk
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __getattr__(self, name):
+        if name.startswith('_') or name in ('token', 'instance', 'context'):
+            raise AttributeError(name)
+        return getattr(self.instance, name)
+
+    @cached_property
+    def instance(self):
+        user = AuthContextService.get_user(self.id)
+        if user is None:
+            raise AuthenticationFailed(_("Không tìm thấy người dùng"), code="user_not_found")
+        return user
+
+    @cached_property
+    def context(self):
+        payload = self.token.payload
+        role = payload.get(ROLE_CLAIM)
+        patient_id = payload.get(PATIENT_ID_CLAIM)
+        doctor_id = payload.get(DOCTOR_ID_CLAIM)
+        # Token cũ chưa có claim, hoặc hồ sơ được tạo sau khi cấp token: lấy từ User
+        if (role is None or PATIENT_ID_CLAIM not in payload
+                or (role == UserRole.PATIENT.value and patient_id is None)
+                or (role == UserRole.DOCTOR.value and doctor_id is None)):
+            return _context_from_user(self.instance)
+        return AuthContext(self.id, role, patient_id, doctor_id)
+
+    @property
+    def role(self):
+        return self.context.role
+
+
+def get_auth_context(user) -> AuthContext:
+    """
+    Danh tính của người dùng trong request hiện tại; tính một lần rồi giữ trên đối tượng user của request.
+    """
+    if isinstance(user, TokenIdentityUser):
+        return user.context
+    context = getattr(user, '_auth_context', None)
+    if context is None:
+        context = user._auth_context = _context_from_user(user)
+    return context
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication nhưng lấy người dùng từ cache thay vì truy vấn cơ sở dữ liệu ở mỗi request."""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token không chứa thông tin người dùng"))
+
+        user = AuthContextService.get_user(user_id)
+        if user is None:
+            raise AuthenticationFailed(_("Không tìm thấy người dùng"), code="user_not_found")
+        if not user.is_active:
+            raise AuthenticationFailed(_("Tài khoản đã bị vô hiệu hóa"), code="user_inactive")
+        return user
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    Dựng TokenIdentityUser từ claim, không truy vấn cơ sở dữ liệu. Tài khoản bị khóa, xóa hoặc đổi vai trò
+    bị từ chối qua mốc thu hồi User.tokens_valid_after (AuthContextService.revoke_tokens).
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token không chứa thông tin người dùng"))
+
+        if AuthContextService.is_revoked(validated_token, AuthContextService.tokens_revoked_before(user_id)):
+            raise AuthenticationFailed(_("Token đã bị thu hồi"), code="token_revoked")
+        return TokenIdentityUser(validated_token)
@@ -14,10 +14,7 @@ class EmailPhoneBackend(BaseBackend):
             return None
         
         try:
-            if '@' in username:
-                user = User.objects.get(email=username)
-            else:
-                user = User.objects.get(phone=username)
+            user = User.objects.get_by_identifier(username)
         except User.DoesNotExist:
             User().set_password(password)
             return None
@@ -0,0 +1,64 @@
+"""
+Chính sách băm mật khẩu: Argon2, bcrypt hoặc PBKDF2 với tham số lấy từ settings.PASSWORD_HASHING.
+
+Các hasher giữ nguyên tên thuật toán của Django nên hash cũ vẫn kiểm tra được. Khi đổi thuật toán
+hoặc tham số, hash được băm lại ở lần đăng nhập thành công tiếp theo (must_update/check_password setter).
+"""
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    Argon2PasswordHasher, BCryptSHA256PasswordHasher, PBKDF2PasswordHasher
+)
+
+
+def _policy(name, default):
+    return getattr(settings, 'PASSWORD_HASHING', {}).get(name, default)
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    @property
+    def time_cost(self):
+        return _policy('argon2_time_cost', 2)
+
+    @property
+    def memory_cost(self):
+        return _policy('argon2_memory_cost', 19456)
+
+    @property
+    def parallelism(self):
+        return _policy('argon2_parallelism', 1)
+
+
+class TunedBCryptSHA256PasswordHasher(BCryptSHA256PasswordHasher):
+    @property
+    def rounds(self):
+        return _policy('bcrypt_rounds', 12)
+
+
+class TunedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return _policy('pbkdf2_iterations', 600000)
+
+
+# Tên thuật toán trong settings.PASSWORD_HASHING['algorithm'] -> hasher
+HASHERS = {
+    'argon2': TunedArgon2PasswordHasher,
+    'bcrypt': TunedBCryptSHA256PasswordHasher,
+    'pbkdf2': TunedPBKDF2PasswordHasher,
+}
+
+
+def init_hash_worker():
+    """
+    Khởi tạo tiến trình con của pool băm mật khẩu (cần thiết khi pool dùng spawn thay vì fork)
+    """
+    from django.apps import apps
+    if not apps.ready:
+        import django
+        django.setup()
+
+
+def hash_password(raw_password):
+    """make_password theo chính sách hiện tại; mật khẩu rỗng -> mật khẩu không dùng được (không tốn chi phí băm)"""
+    from django.contrib.auth.hashers import make_password
+    return make_password(raw_password or None)
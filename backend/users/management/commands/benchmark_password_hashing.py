@@ -0,0 +1,61 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from users.hashers import HASHERS
+
+PASSWORD = 'Benchmark@123'
+
+
+def _verify(algorithm, encoded, count):
+    hasher = HASHERS[algorithm]()
+    started = time.perf_counter()
+    for _ in range(count):
+        hasher.verify(PASSWORD, encoded)
+    return time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = "Đo số lần đăng nhập (kiểm tra mật khẩu) mỗi giây trên một core cho từng thuật toán băm theo PASSWORD_HASHING"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--algorithms', nargs='+', default=list(HASHERS), choices=list(HASHERS))
+        parser.add_argument('--logins', type=int, default=20, help="Số lần kiểm tra mật khẩu mỗi process")
+        parser.add_argument('--processes', type=int, default=1, help="Đo thêm thông lượng khi chạy song song nhiều process")
+
+    def handle(self, *args, **options):
+        count = options['logins']
+        if count < 1 or options['processes'] < 1:
+            raise CommandError("--logins và --processes phải lớn hơn 0")
+
+        current = settings.PASSWORD_HASHING['algorithm']
+        for algorithm in options['algorithms']:
+            hasher = HASHERS[algorithm]()
+            try:
+                started = time.perf_counter()
+                encoded = hasher.encode(PASSWORD, hasher.salt())
+                encode = time.perf_counter() - started
+            except ValueError as e:
+                # Thiếu thư viện (argon2-cffi, bcrypt)
+                self.stdout.write(f"{algorithm}: {e}")
+                continue
+
+            verify = _verify(algorithm, encoded, count) / count
+            marker = " (current)" if algorithm == current else ""
+            params = ', '.join(
+                f"{key}={value}" for key, value in hasher.safe_summary(encoded).items()
+                if key not in ('algorithm', 'salt', 'hash', 'checksum')
+            )
+            self.stdout.write(
+                f"{algorithm}{marker} [{params}]: "
+                f"hash {encode * 1000:.1f} ms, verify {verify * 1000:.1f} ms, {1 / verify:.1f} logins/s/core"
+            )
+
+            if options['processes'] > 1:
+                processes = options['processes']
+                with ProcessPoolExecutor(max_workers=processes) as executor:
+                    started = time.perf_counter()
+                    list(executor.map(_verify, [algorithm] * processes, [encoded] * processes, [count] * processes))
+                    elapsed = time.perf_counter() - started
+                self.stdout.write(f"  {processes} processes: {processes * count / elapsed:.1f} logins/s")
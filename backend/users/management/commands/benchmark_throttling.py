@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+from core.throttling import CacheBucketStore, LocalBucketStore, TokenBucketThrottle
+import core.throttling as throttling
+
+
+class BenchmarkView(APIView):
+    authentication_classes = []
+    permission_classes = [AllowAny]
+    throttle_scope = 'login'
+
+    def post(self, request):
+        return Response({})
+
+
+class Command(BaseCommand):
+    help = "Đo chi phí throttle trên mỗi request (không throttle, bucket cục bộ, bucket trong cache)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5000)
+        parser.add_argument('--clients', type=int, default=1000, help="Số IP/email khác nhau gửi request")
+
+    def _run(self, view, count, clients):
+        factory = APIRequestFactory()
+        requests = [
+            factory.post('/benchmark/', {'email': f"user{i % clients}@example.com"}, format='json',
+                         REMOTE_ADDR=f"10.0.{i % clients // 256}.{i % clients % 256}")
+            for i in range(count)
+        ]
+        started = time.perf_counter()
+        for request in requests:
+            view(request)
+        return (time.perf_counter() - started) / count
+
+    def handle(self, *args, **options):
+        count, clients = options['requests'], options['clients']
+        if count < 1 or clients < 1:
+            raise CommandError("--requests và --clients phải lớn hơn 0")
+
+        baseline = self._run(BenchmarkView.as_view(throttle_classes=[]), count, clients)
+        self.stdout.write(f"no throttle: {baseline * 1e6:.0f} µs/request")
+
+        throttled = BenchmarkView.as_view(throttle_classes=[TokenBucketThrottle])
+        original = throttling._store
+        try:
+            for name, store in (('local buckets', LocalBucketStore()), ('cache buckets', CacheBucketStore())):
+                throttling._store = store
+                elapsed = self._run(throttled, count, clients)
+                self.stdout.write(
+                    f"{name}: {elapsed * 1e6:.0f} µs/request (+{(elapsed - baseline) * 1e6:.0f} µs)"
+                )
+        finally:
+            throttling._store = original
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from users.stores import get_expiring_store
+
+
+class Command(BaseCommand):
+    help = "Xóa theo lô các OTP, đăng ký chờ xác thực và mã đặt lại mật khẩu đã hết hạn"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        deleted = get_expiring_store().cleanup(batch_size=options['batch_size'])
+        self.stdout.write(f"Removed {deleted} expired key(s)")
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0005_expiring_value"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="user",
+            index=models.Index(
+                fields=["is_deleted", "-created_at", "-id"], name="user_listing_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0006_user_listing_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="tokens_valid_after",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+from django.db.models import F
+from django.db.models.functions import Lower
+
+
+def lowercase_emails(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    users = User.objects.annotate(email_lower=Lower('email')).exclude(email=F('email_lower'))
+    for user in users.iterator():
+        # Hai tài khoản chỉ khác hoa/thường: giữ nguyên để không vi phạm unique, cần xử lý thủ công
+        if User.objects.filter(email=user.email_lower).exists():
+            continue
+        User.objects.filter(pk=user.pk).update(email=user.email_lower)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0007_user_tokens_valid_after"),
+    ]
+
+    operations = [
+        migrations.RunPython(lowercase_emails, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,11 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.contrib.auth.hashers import make_password, check_password
 from django.utils.translation import gettext_lazy as _
 from django.core.validators import RegexValidator
 from core.models import BaseModel
 from common.enums import UserRole
-from common.constants import USER_LENGTH, ENUM_LENGTH, REGEX_PATTERNS
+from common.constants import USER_LENGTH, ENUM_LENGTH, REGEX_PATTERNS, COMMON_LENGTH
 
 class UserManager(models.Manager):
     def get_queryset(self):
@@ -30,6 +31,16 @@ class UserManager(models.Manager):
         if email:
             return email.lower().strip()
         return email
+
+    def get_by_identifier(self, identifier):
+        """
+        Tìm người dùng theo email hoặc số điện thoại đã chuẩn hóa; một truy vấn theo index (email|phone, is_deleted)
+        """
+        identifier = (identifier or '').strip()
+        if '@' in identifier:
+            return self.get(email=self.normalize_email(identifier))
+        return self.get(phone=identifier)
+
     def get_by_natural_key(self, username):
         return self.get(email=username)
 
@@ -52,6 +63,8 @@ class User(BaseModel):
     is_verified = models.BooleanField(default=False)
     is_deleted = models.BooleanField(default=False, db_index=True) 
     deleted_at = models.DateTimeField(null=True, blank=True)  
+    # Token (access và refresh) cấp tại hoặc trước thời điểm này bị từ chối: khóa, xóa tài khoản, đổi vai trò
+    tokens_valid_after = models.DateTimeField(null=True, blank=True)
     
     objects = UserManager()
     
@@ -63,7 +76,12 @@ class User(BaseModel):
             self.password = make_password(raw_password)
     
     def check_password(self, raw_password):
-        return check_password(raw_password, self.password)
+        def setter(raw_password):
+            # Hash theo thuật toán hoặc tham số cũ: băm lại theo chính sách hiện tại
+            self.set_password(raw_password)
+            if self.pk:
+                self.save(update_fields=['password'])
+        return check_password(raw_password, self.password, setter)
     
     def has_perm(self, perm, obj=None):
         return True
@@ -119,4 +137,16 @@ class User(BaseModel):
             models.Index(fields=['deleted_at']),
             models.Index(fields=['email', 'is_deleted']),
             models.Index(fields=['phone', 'is_deleted']),
+            # Danh sách người dùng cho admin, phân trang theo (created_at, id)
+            models.Index(fields=['is_deleted', '-created_at', '-id'], name='user_listing_idx'),
         ]
+
+
+class ExpiringValue(BaseModel):
+    """Giá trị tạm có thời hạn (OTP, đăng ký chờ xác thực, mã đặt lại mật khẩu), dùng chung giữa các worker."""
+    key = models.CharField(max_length=COMMON_LENGTH["STORE_KEY"], unique=True)
+    value = models.JSONField(encoder=DjangoJSONEncoder)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.key
@@ -4,6 +4,7 @@ from django.utils.translation import gettext as _
 from .models import User
 from common.constants import USER_LENGTH, COMMON_LENGTH, REGEX_PATTERNS
 from common.enums import Gender, UserRole
+from common.pagination import KeysetPagination
 
 class UserRequestSerializer(serializers.Serializer):
     email = serializers.EmailField(max_length=USER_LENGTH["EMAIL"], required=False)
@@ -53,8 +54,23 @@ class UserResponseSerializer(serializers.ModelSerializer):
         model = User
         fields = ['id', 'created_at', 'updated_at', 'email', 'password', 'phone', 'role', 'is_active', 'is_verified', 'is_deleted', 'deleted_at']
 
+class UserListItemSerializer(serializers.ModelSerializer):
+    """Dòng trong danh sách người dùng; nhận cả dict từ values(), không trả mật khẩu"""
+    class Meta:
+        model = User
+        fields = ['id', 'created_at', 'updated_at', 'email', 'phone', 'role', 'is_active', 'is_verified']
+
+class UserListFilterSerializer(serializers.Serializer):
+    role = serializers.ChoiceField(choices=[r.value for r in UserRole], required=False)
+    isActive = serializers.BooleanField(required=False, source='is_active')
+    isVerified = serializers.BooleanField(required=False, source='is_verified')
+    count = serializers.ChoiceField(choices=['exact', 'approx'], required=False)
+
+class UserCursorPagination(KeysetPagination):
+    pass
+
 class PagedResponseSerializer(serializers.Serializer):
-    content = UserResponseSerializer(many=True)
+    content = UserListItemSerializer(many=True)
     page = serializers.IntegerField()
     size = serializers.IntegerField()
     totalElements = serializers.IntegerField()
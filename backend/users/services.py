@@ -1,41 +1,41 @@
 from django.db.models import Q
-from django.core.mail import send_mail
-from django.conf import settings
 from django.db import transaction, connection
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from rest_framework.exceptions import ValidationError
-from rest_framework_simplejwt.tokens import RefreshToken
-from datetime import datetime, timedelta
 from django.utils.translation import gettext as _
 from .models import User
+from .authentication import AuthContextService
+from .tokens import IdentityRefreshToken
+from .hashers import hash_password
+from .stores import get_expiring_store
+from notifications.services import EmailOutboxService
 from patients.models import Patient 
 from doctors.models import Doctor
 from common.enums import UserRole, Gender
 from common.constants import COMMON_LENGTH
+from common.utils import estimate_count
 
 class JwtService:
     @staticmethod
     def generate_token(user):
-        refresh = RefreshToken.for_user(user)
-        refresh['role'] = user.role
-        refresh['userId'] = str(user.id)
-        
+        refresh = IdentityRefreshToken.for_user(user)
+
         return {
             'access': str(refresh.access_token),
             'refresh': str(refresh)
         }
 
 class AuthService:
-    pending_registrations = {}
-    pending_expirations = {}
+    REGISTRATION_NAMESPACE = 'registration'
+    REGISTRATION_TTL = 10 * 60
     
     @transaction.atomic
     def pre_register(self, data):
         email = data.get('email')
         phone = data.get('phone')
         
-        if email and User.objects.filter(email=email, is_deleted=False).exists():
+        if email and User.objects.filter(email=User.objects.normalize_email(email), is_deleted=False).exists():
             raise ValidationError(_("Email đã được sử dụng"))
             
         if phone and User.objects.filter(phone=phone, is_deleted=False).exists():
@@ -46,9 +46,10 @@ class AuthService:
             raise ValidationError(_("Giới tính không hợp lệ. Chỉ chấp nhận: M, F, O"))
         
         identifier = email
+        # Chỉ lưu mã băm: dữ liệu chờ xác thực nằm trong cơ sở dữ liệu (DatabaseExpiringStore)
+        pending = {**data, 'password': hash_password(data.get('password'))}
         
-        AuthService.pending_registrations[identifier] = data
-        AuthService.pending_expirations[identifier] = datetime.now() + timedelta(minutes=10)
+        get_expiring_store().set(AuthService.REGISTRATION_NAMESPACE, identifier, pending, AuthService.REGISTRATION_TTL)
         
         OtpService().send_otp_to_email(email)
         
@@ -58,22 +59,17 @@ class AuthService:
     def complete_registration(cls, data):
         email = data['email']
     
-        cls._cleanup_expired_registrations()
-    
-        if email not in cls.pending_registrations:
-            raise ValidationError(_("Thông tin đăng ký không tìm thấy hoặc đã hết hạn")) 
-    
-        register_data = cls.pending_registrations.get(email)
+        register_data = get_expiring_store().get(cls.REGISTRATION_NAMESPACE, email)
         if not register_data:
-            raise ValidationError(_("Không tìm thấy thông tin đăng ký hoặc đã hết hạn"))
+            raise ValidationError(_("Thông tin đăng ký không tìm thấy hoặc đã hết hạn")) 
     
         otp_response = OtpService().validate_otp_by_email(email, data['otp'])
 
         if otp_response.get('resetToken') != 'SUCCESS':
             raise ValidationError(otp_response.get('resetToken', _('Xác thực OTP thất bại')))
     
-        user = User.objects.create_user(
-            email=register_data.get('email'),
+        user = User.objects.create(
+            email=User.objects.normalize_email(register_data.get('email')),
             phone=register_data.get('phone'),
             password=register_data['password'],
             role=UserRole.PATIENT.value,
@@ -96,19 +92,10 @@ class AuthService:
             address=register_data['address']
         )
     
-        cls.pending_registrations.pop(email, None)
-        cls.pending_expirations.pop(email, None)
+        get_expiring_store().delete(cls.REGISTRATION_NAMESPACE, email)
     
         return {'id': user.id, 'role': user.role}
     
-    @classmethod
-    def _cleanup_expired_registrations(cls):
-        current_time = datetime.now()
-        expired_keys = [key for key, exp_time in cls.pending_expirations.items() if exp_time < current_time]
-        for key in expired_keys:
-            cls.pending_registrations.pop(key, None)
-            cls.pending_expirations.pop(key, None)
-    
     def login(self, data):
         identifier = data.get('email') or data.get('phone')
         password = data['password']
@@ -117,11 +104,10 @@ class AuthService:
             raise ValidationError(_("Vui lòng cung cấp email hoặc số điện thoại"))
         
         try:
-            if '@' in identifier:
-                user = User.objects.get(email=identifier, is_deleted=False)
-            else:
-                user = User.objects.get(phone=identifier, is_deleted=False)
+            user = User.objects.get_by_identifier(identifier)
         except User.DoesNotExist:
+            # Vẫn băm mật khẩu để thời gian phản hồi không tiết lộ tài khoản có tồn tại hay không
+            User().set_password(password)
             raise ValidationError(_("Email/Số điện thoại hoặc mật khẩu không chính xác"))
         
         if user.check_password(password):
@@ -131,30 +117,26 @@ class AuthService:
         raise ValidationError(_("Email/Số điện thoại hoặc mật khẩu không chính xác"))
 
     def send_reset_password_email(self, email):
-        user = get_object_or_404(User, email=email, is_deleted=False)
+        user = get_object_or_404(User, email=User.objects.normalize_email(email), is_deleted=False)
         reset_token = ResetTokenService.generate_reset_token(user)
         
-        send_mail(
+        EmailOutboxService.queue(
             _('Đặt lại mật khẩu'),
             _('Mã đặt lại mật khẩu của bạn là: %(token)s') % {'token': reset_token},
-            settings.EMAIL_HOST_USER,
-            [email],
-            fail_silently=False,
+            [email]
         )
         
         return {'message': _('Email đặt lại mật khẩu đã được gửi')}
     
     def send_reset_password_otp(self, email):
-        user = get_object_or_404(User, email=email, is_deleted=False)
+        user = get_object_or_404(User, email=User.objects.normalize_email(email), is_deleted=False)
 
         OtpService.send_otp_to_email(email)
 
         return {'message': _('Mã OTP đã được gửi đến email của bạn')}
 
     def resend_otp(self, email):
-        self._cleanup_expired_registrations()
-
-        if email not in self.pending_registrations:
+        if get_expiring_store().get(self.REGISTRATION_NAMESPACE, email) is None:
             raise ValidationError(_("Không tìm thấy thông tin đăng ký hoặc đã hết hạn"))
 
         OtpService().send_otp_to_email(email)
@@ -177,114 +159,99 @@ class AuthService:
         return {'message': _("Đặt lại mật khẩu thành công")}
 
 class ResetTokenService:
-    reset_tokens = {}  
+    NAMESPACE = 'reset_token'
+    TTL = 10 * 60
 
     @staticmethod
     def generate_reset_token(user):
         import random
         token = ''.join(random.choices('0123456789', k=COMMON_LENGTH["RESET_TOKEN"]))
         
-        ResetTokenService.reset_tokens[token] = {
-            'user_id': user.id,
-            'expires': datetime.now() + timedelta(minutes=10)
-        }
+        get_expiring_store().set(ResetTokenService.NAMESPACE, token, {'user_id': user.id}, ResetTokenService.TTL)
         
         return token
 
     @staticmethod
     def validate_reset_token(token):
-        current_time = datetime.now()
-        expired_tokens = [t for t, data in ResetTokenService.reset_tokens.items() 
-                            if data['expires'] < current_time]
-        for expired_token in expired_tokens:
-            ResetTokenService.reset_tokens.pop(expired_token, None)
-        
-        token_data = ResetTokenService.reset_tokens.get(token)
+        token_data = get_expiring_store().get(ResetTokenService.NAMESPACE, token)
         if not token_data:
             return None
         
         try:
             return get_object_or_404(User, id=token_data['user_id'], is_deleted=False)
         except:
-            ResetTokenService.reset_tokens.pop(token, None)
+            ResetTokenService.remove_reset_token(token)
             return None
 
     @staticmethod
     def remove_reset_token(token):
-        ResetTokenService.reset_tokens.pop(token, None)
+        get_expiring_store().delete(ResetTokenService.NAMESPACE, token)
 
 class OtpService:
-    otp_storage = {}  
+    NAMESPACE = 'otp'
+    TTL = 10 * 60
 
     @staticmethod
     def generate_otp():
         import random
         return ''.join(random.choices('0123456789', k=6))
 
-    @staticmethod
-    def _cleanup_expired_otps():
-        current_time = datetime.now()
-        expired_keys = [key for key, data in OtpService.otp_storage.items() 
-                        if data['expires'] < current_time]
-        for key in expired_keys:
-            OtpService.otp_storage.pop(key, None)
-
     @staticmethod
     def send_otp_to_email(email):
-        OtpService._cleanup_expired_otps()
         otp = OtpService.generate_otp()
         
-        send_mail(
+        EmailOutboxService.queue(
             _('Xác nhận email'),
             _('Mã OTP của bạn là: %(otp)s. Mã này có hiệu lực trong 10 phút.') % {'otp': otp},
-            settings.EMAIL_HOST_USER,
-            [email],
-            fail_silently=True,
+            [email]
         )
         
-        OtpService.otp_storage[email] = {
-            'otp': otp,
-            'expires': datetime.now() + timedelta(minutes=10)
-        }
+        get_expiring_store().set(OtpService.NAMESPACE, email, otp, OtpService.TTL)
         
 
     @staticmethod
     def validate_otp_by_email(email, user_input_otp):
-        OtpService._cleanup_expired_otps()
-        
-        otp_data = OtpService.otp_storage.get(email)
+        store = get_expiring_store()
+        otp = store.get(OtpService.NAMESPACE, email)
     
-        if not otp_data:
+        if not otp:
             return {'resetToken': _('OTP đã hết hạn hoặc không tồn tại')}
     
-        if otp_data['otp'] != user_input_otp:
+        if otp != user_input_otp:
             return {'resetToken': _('Mã OTP không đúng')}
     
-        del OtpService.otp_storage[email]
+        # Chỉ một request dùng được mã OTP nếu có nhiều request xác thực cùng lúc
+        if store.pop(OtpService.NAMESPACE, email) is None:
+            return {'resetToken': _('OTP đã hết hạn hoặc không tồn tại')}
         return {'resetToken': 'SUCCESS'}
 
 class UserService:
-    @transaction.atomic
-    def get_all_users(self, page, size):
-        from django.core.paginator import Paginator
-        users = User.objects.filter(is_deleted=False).order_by('-created_at') 
-        paginator = Paginator(users, size)
-        page_obj = paginator.get_page(page + 1)  
-        return {
-            'content': [self.map_to_user_response(user) for user in page_obj.object_list],
-            'page': page,
-            'size': size,
-            'totalElements': paginator.count,
-            'totalPages': paginator.num_pages,
-            'last': not page_obj.has_next()
-        }
+    LIST_FIELDS = ('id', 'created_at', 'updated_at', 'email', 'phone', 'role', 'is_active', 'is_verified')
+
+    def get_all_users(self, role=None, is_active=None, is_verified=None):
+        """
+        Người dùng chưa xóa, chỉ lấy các cột hiển thị trong danh sách (dict qua values());
+        view phân trang theo con trỏ trên (created_at, id), không dùng COUNT + OFFSET
+        """
+        users = User.objects.all()
+        if role is not None:
+            users = users.filter(role=role)
+        if is_active is not None:
+            users = users.filter(is_active=is_active)
+        if is_verified is not None:
+            users = users.filter(is_verified=is_verified)
+        return users.values(*self.LIST_FIELDS)
+
+    def count_users(self, users, approximate=False):
+        return estimate_count(users) if approximate else users.count()
 
-    @transaction.atomic
     def get_user_by_id(self, user_id):
         return self.map_to_user_response(get_object_or_404(User, id=user_id, is_deleted=False))
 
     @transaction.atomic
     def add_user(self, data):
+        # Email luôn lưu chữ thường để đăng nhập tra cứu chính xác theo index
+        data = {**data, 'email': User.objects.normalize_email(data.get('email'))}
         if data.get('phone') and User.objects.filter(phone=data['phone'], is_deleted=False).exists():
             raise ValidationError(_("Số điện thoại đã được sử dụng"))
         if data.get('email') and User.objects.filter(email=data['email'], is_deleted=False).exists():
@@ -301,17 +268,23 @@ class UserService:
     @transaction.atomic
     def edit_user(self, user_id, data):
         user = get_object_or_404(User, id=user_id, is_deleted=False)
+        if data.get('email'):
+            data = {**data, 'email': User.objects.normalize_email(data['email'])}
         if data.get('email') and user.email != data['email'] and User.objects.filter(email=data['email'], is_deleted=False).exists():
             raise ValidationError(_("Email đã được sử dụng"))
         if data.get('phone') and user.phone != data['phone'] and User.objects.filter(phone=data['phone'], is_deleted=False).exists():
             raise ValidationError(_("Số điện thoại đã được sử dụng"))
         
+        role = user.role
         for key, value in data.items():
             if key == 'password' and value:
                 user.set_password(value)
             elif value is not None and hasattr(user, key):
                 setattr(user, key, value)
         user.save()
+        if user.role != role:
+            # Vai trò nằm trong token: buộc đăng nhập lại để nhận token mới
+            AuthContextService.revoke_tokens(user.id)
         return self.map_to_user_response(user)
 
     @transaction.atomic
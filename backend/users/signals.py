@@ -0,0 +1,22 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from doctors.models import Doctor
+from patients.models import Patient
+from .authentication import AuthContextService
+from .models import User
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_user_auth_context(sender, instance, **kwargs):
+    AuthContextService.invalidate(instance.pk)
+    if kwargs.get('created'):
+        return
+    if kwargs.get('signal') is post_delete or not instance.is_active or instance.is_deleted:
+        AuthContextService.revoke_tokens(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Patient)
+@receiver([post_save, post_delete], sender=Doctor)
+def invalidate_profile_auth_context(sender, instance, **kwargs):
+    AuthContextService.invalidate(instance.user_id)
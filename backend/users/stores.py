@@ -0,0 +1,111 @@
+"""Kho key-value có thời hạn, dùng chung giữa các worker: OTP, đăng ký chờ xác thực, mã đặt lại mật khẩu."""
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+
+class BaseExpiringStore:
+    def make_key(self, namespace, key):
+        return f"{namespace}:{key}"
+
+    def set(self, namespace, key, value, ttl):
+        """Lưu `value` (dữ liệu JSON được) trong `ttl` giây, ghi đè giá trị cũ."""
+        raise NotImplementedError
+
+    def get(self, namespace, key):
+        """Giá trị còn hạn hoặc None."""
+        raise NotImplementedError
+
+    def delete(self, namespace, key):
+        """Xóa key, trả về True nếu key còn tồn tại."""
+        raise NotImplementedError
+
+    def pop(self, namespace, key):
+        """Lấy và xóa key; khi nhiều request cùng pop, chỉ một request nhận được giá trị."""
+        value = self.get(namespace, key)
+        if value is None or not self.delete(namespace, key):
+            return None
+        return value
+
+    def cleanup(self, batch_size=1000):
+        """Xóa các key đã hết hạn, trả về số key đã xóa."""
+        return 0
+
+
+class CacheExpiringStore(BaseExpiringStore):
+    """Dùng cache của Django (Redis, Memcached, ...); cache tự xóa key khi hết hạn."""
+
+    def __init__(self, alias='default'):
+        self.cache = caches[alias]
+
+    def set(self, namespace, key, value, ttl):
+        self.cache.set(self.make_key(namespace, key), value, timeout=ttl)
+
+    def get(self, namespace, key):
+        return self.cache.get(self.make_key(namespace, key))
+
+    def delete(self, namespace, key):
+        return self.cache.delete(self.make_key(namespace, key))
+
+
+class DatabaseExpiringStore(BaseExpiringStore):
+    """
+    Lưu trong bảng ExpiringValue cho môi trường không có Redis. Đọc theo unique index của key,
+    key hết hạn bị bỏ qua khi đọc và được xóa theo lô bằng cleanup() nhờ index trên expires_at.
+    """
+
+    def set(self, namespace, key, value, ttl):
+        from .models import ExpiringValue
+        ExpiringValue.objects.update_or_create(
+            key=self.make_key(namespace, key),
+            defaults={'value': value, 'expires_at': timezone.now() + timedelta(seconds=ttl)}
+        )
+
+    def get(self, namespace, key):
+        from .models import ExpiringValue
+        return ExpiringValue.objects.filter(
+            key=self.make_key(namespace, key), expires_at__gt=timezone.now()
+        ).values_list('value', flat=True).first()
+
+    def delete(self, namespace, key):
+        from .models import ExpiringValue
+        return ExpiringValue.objects.filter(
+            key=self.make_key(namespace, key), expires_at__gt=timezone.now()
+        ).delete()[0] > 0
+
+    def cleanup(self, batch_size=1000):
+        from .models import ExpiringValue
+        deleted = 0
+        now = timezone.now()
+        while True:
+            with transaction.atomic():
+                ids = list(ExpiringValue.objects.filter(expires_at__lte=now).values_list('id', flat=True)[:batch_size])
+                if not ids:
+                    return deleted
+                deleted += ExpiringValue.objects.filter(id__in=ids).delete()[0]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_expiring_store():
+    """Kho dùng chung cho cả process, chọn theo EXPIRING_STORE['backend']."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                options = dict(settings.EXPIRING_STORE)
+                _store = import_string(options.pop('backend'))(**options)
+    return _store
+
+
+def reset_expiring_store():
+    global _store
+    with _store_lock:
+        _store = None
@@ -0,0 +1,193 @@
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIClient
+from rest_framework import status
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
+from users.authentication import (
+    AuthContextService, CachedJWTAuthentication, StatelessJWTAuthentication, TokenIdentityUser, get_auth_context
+)
+from users.services import JwtService, UserService
+from users.models import User
+from patients.models import Patient
+from common.enums import UserRole, Gender
+
+
+class CachedJWTAuthenticationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='patient@example.com',
+            phone='0112233445',
+            password='PatientPass123!',
+            role=UserRole.PATIENT.value,
+            is_active=True,
+            is_verified=True
+        )
+        self.authentication = CachedJWTAuthentication()
+        self.token = AccessToken.for_user(self.user)
+
+    def _create_patient(self):
+        return Patient.objects.create(
+            user=self.user,
+            first_name='Test',
+            last_name='Patient',
+            identity_number='123456789012',
+            insurance_number='INS123456',
+            birthday='1990-01-01',
+            gender=Gender.MALE.value,
+        )
+
+    def test_get_user_cached_after_first_request(self):
+        with self.assertNumQueries(1):
+            user = self.authentication.get_user(self.token)
+        with self.assertNumQueries(0):
+            cached = self.authentication.get_user(self.token)
+        self.assertEqual(user.id, self.user.id)
+        self.assertEqual(cached.id, self.user.id)
+        self.assertIsNone(cached.auth_patient_id)
+
+    def test_patient_created_invalidates_context(self):
+        self.authentication.get_user(self.token)
+        patient = self._create_patient()
+        with self.assertNumQueries(1):
+            user = self.authentication.get_user(self.token)
+        context = get_auth_context(user)
+        self.assertEqual(context.patient_id, patient.id)
+        self.assertIsNone(context.doctor_id)
+        self.assertEqual(context.role, UserRole.PATIENT.value)
+
+    def test_deactivated_user_rejected(self):
+        self.authentication.get_user(self.token)
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.get_user(self.token)
+
+    def test_deleted_user_rejected(self):
+        AuthContextService.invalidate(self.user.id)
+        User.objects.filter(pk=self.user.pk).update(is_deleted=True)
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.get_user(self.token)
+
+    def test_get_auth_context_without_cached_user(self):
+        patient = self._create_patient()
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(get_auth_context(user).patient_id, patient.id)
+
+    def test_upcoming_appointments_without_patient_profile(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        response = client.get('/api/v1/appointments/upcoming/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_login_normalizes_email(self):
+        client = APIClient()
+        response = client.post('/api/v1/auth/login/', {
+            'email': '  Patient@EXAMPLE.com ',
+            'password': 'PatientPass123!'
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class StatelessJWTAuthenticationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='patient@example.com',
+            phone='0112233445',
+            password='PatientPass123!',
+            role=UserRole.PATIENT.value,
+            is_active=True,
+            is_verified=True
+        )
+        self.patient = Patient.objects.create(
+            user=self.user,
+            first_name='Test',
+            last_name='Patient',
+            identity_number='123456789012',
+            insurance_number='INS123456',
+            birthday='1990-01-01',
+            gender=Gender.MALE.value,
+        )
+        self.authentication = StatelessJWTAuthentication()
+
+    def _access_token(self):
+        return AccessToken(JwtService.generate_token(self.user)['access'])
+
+    def test_token_carries_identity_claims(self):
+        token = self._access_token()
+        self.assertEqual(token['role'], UserRole.PATIENT.value)
+        self.assertEqual(token['patientId'], self.patient.id)
+        self.assertIsNone(token['doctorId'])
+
+    def test_identity_from_claims_without_queries(self):
+        token = self._access_token()
+        with self.assertNumQueries(0):
+            user = self.authentication.get_user(token)
+            context = get_auth_context(user)
+        self.assertIsInstance(user, TokenIdentityUser)
+        self.assertEqual(user, self.user)
+        self.assertEqual(context.patient_id, self.patient.id)
+        self.assertEqual(user.role, UserRole.PATIENT.value)
+
+    def test_other_attributes_loaded_from_user(self):
+        user = self.authentication.get_user(self._access_token())
+        self.assertEqual(user.email, 'patient@example.com')
+
+    def test_token_without_claims_falls_back_to_user(self):
+        user = self.authentication.get_user(AccessToken.for_user(self.user))
+        self.assertEqual(get_auth_context(user).patient_id, self.patient.id)
+
+    def test_deactivated_user_token_revoked(self):
+        token = self._access_token()
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.get_user(token)
+
+    def test_role_change_revokes_token(self):
+        token = self._access_token()
+        UserService().edit_user(self.user.id, {'role': UserRole.DOCTOR.value})
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.get_user(token)
+
+    def test_revocation_survives_cache_loss(self):
+        token = self._access_token()
+        UserService().edit_user(self.user.id, {'role': UserRole.DOCTOR.value})
+        cache.clear()
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.get_user(token)
+
+    def test_refresh_after_role_change_rejected(self):
+        admin = User.objects.create_user(
+            email='admin@example.com', phone='0998877665', password='AdminPass123!', role=UserRole.ADMIN.value
+        )
+        refresh = JwtService.generate_token(admin)['refresh']
+        UserService().edit_user(admin.id, {'role': UserRole.PATIENT.value})
+
+        response = APIClient().post('/api/v1/auth/token/refresh/', {'refresh': refresh}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_refresh_reloads_identity_from_database(self):
+        user = User.objects.create_user(
+            email='late@example.com', phone='0998877666', password='PatientPass123!', role=UserRole.PATIENT.value
+        )
+        refresh = JwtService.generate_token(user)['refresh']
+        patient = Patient.objects.create(
+            user=user, first_name='Late', last_name='Patient', identity_number='999999999999',
+            insurance_number='INS999999', birthday='1990-01-01', gender=Gender.MALE.value,
+        )
+        response = APIClient().post('/api/v1/auth/token/refresh/', {'refresh': refresh}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        access = AccessToken(response.data['access'])
+        self.assertEqual(access['patientId'], patient.id)
+        self.assertEqual(access['role'], UserRole.PATIENT.value)
+        self.assertIn('refresh', response.data)
+
+    def test_patient_me_with_claims_token(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {self._access_token()}')
+        response = client.get('/api/v1/patients/me/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['id'], self.patient.id)
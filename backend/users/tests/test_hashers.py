@@ -0,0 +1,60 @@
+from django.contrib.auth.hashers import make_password
+from django.test import TestCase, override_settings
+from users.models import User
+from users.services import AuthService
+from common.enums import UserRole
+
+
+PASSWORD_HASHING = {
+    'algorithm': 'argon2',
+    'argon2_time_cost': 2,
+    'argon2_memory_cost': 19456,
+    'argon2_parallelism': 1,
+}
+PASSWORD_HASHERS = [
+    'users.hashers.TunedArgon2PasswordHasher',
+    'users.hashers.TunedPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+]
+
+
+@override_settings(PASSWORD_HASHING=PASSWORD_HASHING, PASSWORD_HASHERS=PASSWORD_HASHERS)
+class PasswordHashingPolicyTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='patient@example.com',
+            phone='0112233445',
+            password='PatientPass123!',
+            role=UserRole.PATIENT.value,
+            is_active=True,
+            is_verified=True
+        )
+
+    def test_new_password_uses_policy_algorithm(self):
+        self.assertTrue(self.user.password.startswith('argon2$'))
+        self.assertIn('m=19456,t=2,p=1', self.user.password)
+
+    def test_legacy_hash_upgraded_on_login(self):
+        User.objects.filter(pk=self.user.pk).update(
+            password=make_password('PatientPass123!', hasher='pbkdf2_sha1')
+        )
+        AuthService().login({'email': 'patient@example.com', 'password': 'PatientPass123!'})
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('argon2$'))
+        self.assertTrue(self.user.check_password('PatientPass123!'))
+
+    def test_parameter_change_rehashes_on_check(self):
+        policy = {**PASSWORD_HASHING, 'argon2_time_cost': 3}
+        with override_settings(PASSWORD_HASHING=policy):
+            self.assertTrue(self.user.check_password('PatientPass123!'))
+        self.user.refresh_from_db()
+        self.assertIn('t=3', self.user.password)
+
+    def test_wrong_password_not_rehashed(self):
+        User.objects.filter(pk=self.user.pk).update(
+            password=make_password('PatientPass123!', hasher='pbkdf2_sha1')
+        )
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.check_password('WrongPass123!'))
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha1$'))
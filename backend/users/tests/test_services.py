@@ -1,7 +1,8 @@
 from django.test import TestCase
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import check_password
 from django.utils import timezone
-from django.core.mail import send_mail
+from django.core import mail
 from django.core.exceptions import ObjectDoesNotExist
 from django.http import Http404
 from django.utils.translation import gettext as _
@@ -9,7 +10,12 @@ from rest_framework.exceptions import ValidationError
 from rest_framework_simplejwt.tokens import AccessToken
 from unittest.mock import patch
 from datetime import datetime, timedelta, date
+import json
 from users.services import JwtService, AuthService, ResetTokenService, OtpService, UserService
+from users.stores import get_expiring_store
+from users.models import ExpiringValue
+from notifications.models import EmailOutbox
+from notifications.services import EmailOutboxService
 from patients.models import Patient
 from doctors.models import Doctor
 from common.enums import UserRole, Gender
@@ -17,20 +23,6 @@ from common.constants import COMMON_LENGTH
 
 User = get_user_model()
 
-class MockEmailSend:
-    def __init__(self):
-        self.sent_emails = []
-
-    def __call__(self, subject, message, from_email, recipient_list, fail_silently=False):
-        self.sent_emails.append({
-            'subject': subject,
-            'message': message,
-            'from_email': from_email,
-            'recipient_list': recipient_list,
-            'fail_silently': fail_silently
-        })
-        return 1
-
 class ServicesTest(TestCase):
     @classmethod
     def setUpTestData(cls):
@@ -59,10 +51,12 @@ class ServicesTest(TestCase):
         cls.service = UserService()
 
     def setUp(self):
-        AuthService.pending_registrations = {}
-        AuthService.pending_expirations = {}
-        OtpService.otp_storage = {}
-        ResetTokenService.reset_tokens = {}
+        self.store = get_expiring_store()
+
+    def _expire(self, namespace, key):
+        ExpiringValue.objects.filter(key=self.store.make_key(namespace, key)).update(
+            expires_at=timezone.now() - timedelta(minutes=1)
+        )
 
     def test_jwt_service_generate_token(self):
         token_data = JwtService.generate_token(self.user)
@@ -72,7 +66,6 @@ class ServicesTest(TestCase):
         self.assertEqual(refresh['role'], self.user.role)
         self.assertEqual(refresh['userId'], str(self.user.id))
 
-    @patch('users.services.send_mail', new=MockEmailSend())
     def test_auth_service_pre_register_valid(self):
         data = {
             'email': 'newuser@example.com',
@@ -87,13 +80,14 @@ class ServicesTest(TestCase):
         }
         message = AuthService().pre_register(data)
         self.assertEqual(message, _("Mã OTP đã được gửi đến email của bạn"))
-        self.assertIn('newuser@example.com', AuthService.pending_registrations)
-        self.assertEqual(AuthService.pending_registrations['newuser@example.com'], data)
-        self.assertTrue(AuthService.pending_expirations['newuser@example.com'] > datetime.now())
-        self.assertEqual(len(OtpService.otp_storage), 1)
-        self.assertIn('newuser@example.com', OtpService.otp_storage)
+        pending = self.store.get(AuthService.REGISTRATION_NAMESPACE, 'newuser@example.com')
+        self.assertEqual({**pending, 'password': None}, {**data, 'birthday': '1995-05-05', 'password': None})
+        self.assertNotIn('NewPass123!', json.dumps(ExpiringValue.objects.get(key__startswith='registration:').value))
+        self.assertTrue(check_password('NewPass123!', pending['password']))
+        self.assertTrue(ExpiringValue.objects.get(key__startswith='registration:').expires_at > timezone.now())
+        self.assertEqual(ExpiringValue.objects.filter(key__startswith='otp:').count(), 1)
+        self.assertIsNotNone(self.store.get(OtpService.NAMESPACE, 'newuser@example.com'))
 
-    @patch('users.services.send_mail', new=MockEmailSend())
     def test_auth_service_pre_register_duplicate_email(self):
         data = {
             'email': 'test@example.com',  # Existing email
@@ -109,7 +103,6 @@ class ServicesTest(TestCase):
         with self.assertRaisesMessage(ValidationError, _("Email đã được sử dụng")):
             AuthService().pre_register(data)
 
-    @patch('users.services.send_mail', new=MockEmailSend())
     def test_auth_service_pre_register_duplicate_phone(self):
         data = {
             'email': 'newuser@example.com',
@@ -125,7 +118,6 @@ class ServicesTest(TestCase):
         with self.assertRaisesMessage(ValidationError, _("Số điện thoại đã được sử dụng")):
             AuthService().pre_register(data)
 
-    @patch('users.services.send_mail', new=MockEmailSend())
     def test_auth_service_pre_register_invalid_gender(self):
         data = {
             'email': 'newuser@example.com',
@@ -141,7 +133,6 @@ class ServicesTest(TestCase):
         with self.assertRaisesMessage(ValidationError, _("Giới tính không hợp lệ. Chỉ chấp nhận: M, F, O")):
             AuthService().pre_register(data)
 
-    @patch('users.services.send_mail', new=MockEmailSend())
     def test_auth_service_complete_registration_valid(self):
         data = {
             'email': 'newuser@example.com',
@@ -157,22 +148,22 @@ class ServicesTest(TestCase):
         AuthService().pre_register(data)
         complete_data = {
             'email': 'newuser@example.com',
-            'otp': OtpService.otp_storage['newuser@example.com']['otp']
+            'otp': self.store.get(OtpService.NAMESPACE, 'newuser@example.com')
         }
         result = AuthService.complete_registration(complete_data)
         self.assertEqual(result['role'], UserRole.PATIENT.value)
         user = User.objects.get(email='newuser@example.com')
         self.assertTrue(user.is_verified)
+        self.assertTrue(user.check_password('NewPass123!'))
         self.assertEqual(user.phone, '0112233445')
         patient = Patient.objects.get(user=user)
         self.assertEqual(patient.first_name, 'New')
         self.assertEqual(patient.last_name, 'User')
         self.assertEqual(patient.identity_number, '987654321012')
         self.assertEqual(patient.gender, Gender.FEMALE.value)
-        self.assertNotIn('newuser@example.com', AuthService.pending_registrations)
-        self.assertNotIn('newuser@example.com', OtpService.otp_storage)
+        self.assertIsNone(self.store.get(AuthService.REGISTRATION_NAMESPACE, 'newuser@example.com'))
+        self.assertIsNone(self.store.get(OtpService.NAMESPACE, 'newuser@example.com'))
 
-    @patch('users.services.send_mail', new=MockEmailSend())
     def test_auth_service_complete_registration_invalid_otp(self):
         data = {
             'email': 'newuser@example.com',
@@ -193,7 +184,6 @@ class ServicesTest(TestCase):
         with self.assertRaisesMessage(ValidationError, _("Mã OTP không đúng")):
             AuthService.complete_registration(complete_data)
 
-    @patch('users.services.send_mail', new=MockEmailSend())
     def test_auth_service_complete_registration_expired(self):
         data = {
             'email': 'newuser@example.com',
@@ -207,10 +197,10 @@ class ServicesTest(TestCase):
             'address': '456 Elm St'
         }
         AuthService().pre_register(data)
-        AuthService.pending_expirations['newuser@example.com'] = datetime.now() - timedelta(minutes=1)
+        self._expire(AuthService.REGISTRATION_NAMESPACE, 'newuser@example.com')
         complete_data = {
             'email': 'newuser@example.com',
-            'otp': OtpService.otp_storage['newuser@example.com']['otp']
+            'otp': self.store.get(OtpService.NAMESPACE, 'newuser@example.com')
         }
         with self.assertRaisesMessage(ValidationError, _("Thông tin đăng ký không tìm thấy hoặc đã hết hạn")):
             AuthService.complete_registration(complete_data)
@@ -228,10 +218,10 @@ class ServicesTest(TestCase):
             'address': '456 Elm St'
         }
         AuthService().pre_register(data)
-        AuthService.pending_expirations['newuser@example.com'] = datetime.now() - timedelta(minutes=1)
-        AuthService._cleanup_expired_registrations()
-        self.assertNotIn('newuser@example.com', AuthService.pending_registrations)
-        self.assertNotIn('newuser@example.com', AuthService.pending_expirations)
+        self._expire(AuthService.REGISTRATION_NAMESPACE, 'newuser@example.com')
+        self.assertIsNone(self.store.get(AuthService.REGISTRATION_NAMESPACE, 'newuser@example.com'))
+        self.assertEqual(self.store.cleanup(), 1)
+        self.assertFalse(ExpiringValue.objects.filter(key__startswith='registration:').exists())
 
     def test_auth_service_login_valid_email(self):
         data = {
@@ -270,33 +260,30 @@ class ServicesTest(TestCase):
         with self.assertRaisesMessage(ValidationError, _("Vui lòng cung cấp email hoặc số điện thoại")):
             AuthService().login(data)
 
-    @patch('users.services.send_mail', new=MockEmailSend())
     def test_auth_service_send_reset_password_email(self):
         result = AuthService().send_reset_password_email('test@example.com')
         self.assertEqual(result['message'], _("Email đặt lại mật khẩu đã được gửi"))
-        self.assertEqual(len(ResetTokenService.reset_tokens), 1)
-        token = list(ResetTokenService.reset_tokens.keys())[0]
-        token_data = ResetTokenService.reset_tokens[token]
-        self.assertEqual(token_data['user_id'], self.user.id)
-        self.assertTrue(token_data['expires'] > datetime.now())
+        entry = ExpiringValue.objects.get(key__startswith='reset_token:')
+        self.assertEqual(entry.value['user_id'], self.user.id)
+        self.assertTrue(entry.expires_at > timezone.now())
+        email = EmailOutbox.objects.get()
+        self.assertEqual(email.recipients, ['test@example.com'])
+        self.assertIn(entry.key.split(':')[1], email.body)
+        self.assertEqual(len(mail.outbox), 0)
 
-    @patch('users.services.send_mail', new=MockEmailSend())
     def test_auth_service_send_reset_password_email_nonexistent_user(self):
         with self.assertRaises(Http404):
             AuthService().send_reset_password_email('nonexistent@example.com')
 
-    @patch('users.services.send_mail', new=MockEmailSend())
     def test_auth_service_send_reset_password_otp(self):
         result = AuthService().send_reset_password_otp('test@example.com')
         self.assertEqual(result['message'], _("Mã OTP đã được gửi đến email của bạn"))
-        self.assertIn('test@example.com', OtpService.otp_storage)
+        self.assertIsNotNone(self.store.get(OtpService.NAMESPACE, 'test@example.com'))
 
-    @patch('users.services.send_mail', new=MockEmailSend())
     def test_auth_service_send_reset_password_otp_nonexistent_user(self):
         with self.assertRaises(Http404):
             AuthService().send_reset_password_otp('nonexistent@example.com')
 
-    @patch('users.services.send_mail', new=MockEmailSend())
     def test_auth_service_resend_otp(self):
         data = {
             'email': 'newuser@example.com',
@@ -312,14 +299,12 @@ class ServicesTest(TestCase):
         AuthService().pre_register(data)
         message = AuthService().resend_otp('newuser@example.com')
         self.assertEqual(message, _("Mã OTP đã được gửi lại đến email của bạn"))
-        self.assertIn('newuser@example.com', OtpService.otp_storage)
+        self.assertIsNotNone(self.store.get(OtpService.NAMESPACE, 'newuser@example.com'))
 
-    @patch('users.services.send_mail', new=MockEmailSend())
     def test_auth_service_resend_otp_no_pending_registration(self):
         with self.assertRaisesMessage(ValidationError, _("Không tìm thấy thông tin đăng ký hoặc đã hết hạn")):
             AuthService().resend_otp('newuser@example.com')
 
-    @patch('users.services.send_mail', new=MockEmailSend())
     def test_auth_service_reset_password_valid(self):
         token = ResetTokenService.generate_reset_token(self.user)
         data = {
@@ -330,7 +315,7 @@ class ServicesTest(TestCase):
         self.assertEqual(result['message'], _("Đặt lại mật khẩu thành công"))
         user = User.objects.get(id=self.user.id)
         self.assertTrue(user.check_password('NewPass123!'))
-        self.assertNotIn(token, ResetTokenService.reset_tokens)
+        self.assertIsNone(self.store.get(ResetTokenService.NAMESPACE, token))
 
     def test_auth_service_reset_password_invalid_token(self):
         data = {
@@ -342,9 +327,8 @@ class ServicesTest(TestCase):
 
     def test_reset_token_service_generate_reset_token(self):
         token = ResetTokenService.generate_reset_token(self.user)
-        self.assertIn(token, ResetTokenService.reset_tokens)
-        self.assertEqual(ResetTokenService.reset_tokens[token]['user_id'], self.user.id)
-        self.assertTrue(ResetTokenService.reset_tokens[token]['expires'] > datetime.now())
+        self.assertEqual(self.store.get(ResetTokenService.NAMESPACE, token), {'user_id': self.user.id})
+        self.assertTrue(ExpiringValue.objects.get(key=f'reset_token:{token}').expires_at > timezone.now())
 
     def test_reset_token_service_validate_reset_token_valid(self):
         token = ResetTokenService.generate_reset_token(self.user)
@@ -353,30 +337,40 @@ class ServicesTest(TestCase):
 
     def test_reset_token_service_validate_reset_token_expired(self):
         token = ResetTokenService.generate_reset_token(self.user)
-        ResetTokenService.reset_tokens[token]['expires'] = datetime.now() - timedelta(minutes=1)
+        self._expire(ResetTokenService.NAMESPACE, token)
         user = ResetTokenService.validate_reset_token(token)
         self.assertIsNone(user)
-        self.assertNotIn(token, ResetTokenService.reset_tokens)
+        self.assertIsNone(self.store.get(ResetTokenService.NAMESPACE, token))
 
     def test_reset_token_service_remove_reset_token(self):
         token = ResetTokenService.generate_reset_token(self.user)
         ResetTokenService.remove_reset_token(token)
-        self.assertNotIn(token, ResetTokenService.reset_tokens)
+        self.assertIsNone(self.store.get(ResetTokenService.NAMESPACE, token))
 
-    @patch('users.services.send_mail', new=MockEmailSend())
     def test_otp_service_generate_and_send_otp(self):
         OtpService.send_otp_to_email('test@example.com')
-        self.assertIn('test@example.com', OtpService.otp_storage)
-        otp_data = OtpService.otp_storage['test@example.com']
-        self.assertEqual(len(otp_data['otp']), 6)
-        self.assertTrue(otp_data['expires'] > datetime.now())
+        otp = self.store.get(OtpService.NAMESPACE, 'test@example.com')
+        self.assertEqual(len(otp), 6)
+        self.assertTrue(ExpiringValue.objects.get(key='otp:test@example.com').expires_at > timezone.now())
+
+    def test_otp_service_code_not_kept_in_outbox_after_send(self):
+        OtpService.send_otp_to_email('test@example.com')
+        otp = self.store.get(OtpService.NAMESPACE, 'test@example.com')
+        self.assertIn(otp, EmailOutbox.objects.get().body)
+
+        EmailOutboxService().send_pending()
+        self.assertIn(otp, mail.outbox[0].body)
+        self.assertNotIn(otp, EmailOutbox.objects.get().body)
 
     def test_otp_service_validate_otp_valid(self):
         OtpService.send_otp_to_email('test@example.com')
-        otp = OtpService.otp_storage['test@example.com']['otp']
+        otp = self.store.get(OtpService.NAMESPACE, 'test@example.com')
         result = OtpService.validate_otp_by_email('test@example.com', otp)
         self.assertEqual(result['resetToken'], 'SUCCESS')
-        self.assertNotIn('test@example.com', OtpService.otp_storage)
+        self.assertIsNone(self.store.get(OtpService.NAMESPACE, 'test@example.com'))
+        # Mã OTP chỉ dùng được một lần
+        result = OtpService.validate_otp_by_email('test@example.com', otp)
+        self.assertEqual(result['resetToken'], _('OTP đã hết hạn hoặc không tồn tại'))
 
     def test_otp_service_validate_otp_invalid(self):
         OtpService.send_otp_to_email('test@example.com')
@@ -385,19 +379,24 @@ class ServicesTest(TestCase):
 
     def test_otp_service_cleanup_expired_otps(self):
         OtpService.send_otp_to_email('test@example.com')
-        OtpService.otp_storage['test@example.com']['expires'] = datetime.now() - timedelta(minutes=1)
-        OtpService._cleanup_expired_otps()
-        self.assertNotIn('test@example.com', OtpService.otp_storage)
+        self._expire(OtpService.NAMESPACE, 'test@example.com')
+        self.assertIsNone(self.store.get(OtpService.NAMESPACE, 'test@example.com'))
+        self.assertEqual(self.store.cleanup(batch_size=1), 1)
+        self.assertFalse(ExpiringValue.objects.exists())
 
     def test_user_service_get_all_users(self):
-        result = self.service.get_all_users(page=0, size=10)
-        self.assertEqual(len(result['content']), 2)
-        self.assertEqual(result['page'], 0)
-        self.assertEqual(result['size'], 10)
-        self.assertEqual(result['totalElements'], 2)
-        self.assertEqual(result['totalPages'], 1)
-        self.assertTrue(result['last'])
-        self.assertEqual(result['content'][0]['id'], self.admin_user.id)  # Ordered by -created_at
+        users = list(self.service.get_all_users().order_by('-created_at', '-id'))
+        self.assertEqual(len(users), 2)
+        self.assertEqual(users[0]['id'], self.admin_user.id)  # Ordered by -created_at
+        self.assertNotIn('password', users[0])
+
+    def test_user_service_get_all_users_filtered(self):
+        users = self.service.get_all_users(role=UserRole.ADMIN.value, is_active=True)
+        self.assertEqual([user['id'] for user in users], [self.admin_user.id])
+
+    def test_user_service_count_users_approximate(self):
+        users = self.service.get_all_users()
+        self.assertEqual(self.service.count_users(users, approximate=True), 2)
 
     def test_user_service_get_user_by_id(self):
         result = self.service.get_user_by_id(self.user.id)
@@ -458,6 +457,32 @@ class ServicesTest(TestCase):
         with self.assertRaisesMessage(ValidationError, _("Email đã được sử dụng")):
             self.service.edit_user(self.user.id, data)
 
+    def test_user_service_add_and_edit_user_lowercase_email(self):
+        result = self.service.add_user({
+            'email': 'Mixed.Case@Example.com', 'phone': '0112233448', 'password': 'NewPass123!', 'role': UserRole.DOCTOR.value
+        })
+        self.assertEqual(result['email'], 'mixed.case@example.com')
+        with self.assertRaisesMessage(ValidationError, _("Email đã được sử dụng")):
+            self.service.add_user({'email': 'TEST@example.com', 'password': 'NewPass123!', 'role': UserRole.PATIENT.value})
+
+        self.service.edit_user(self.user.id, {'email': 'Renamed@Example.com'})
+        self.assertEqual(User.objects.get(id=self.user.id).email, 'renamed@example.com')
+        self.assertIn('token', AuthService().login({'email': 'RENAMED@example.com', 'password': 'TestPass123!'}))
+
+    def test_lowercase_emails_migration(self):
+        from importlib import import_module
+        from django.apps import apps
+        migration = import_module('users.migrations.0008_lowercase_emails')
+        User.objects.filter(id=self.user.id).update(email='Test@Example.com')
+        clash = User.objects.create(email='Other@Example.com', password='x')
+        User.objects.create(email='other@example.com', password='x')
+
+        migration.lowercase_emails(apps, None)
+        self.assertEqual(User.objects.get(id=self.user.id).email, 'test@example.com')
+        # Trùng khi chuyển chữ thường: giữ nguyên để không vi phạm unique
+        self.assertEqual(User.objects.get(id=clash.id).email, 'Other@Example.com')
+        self.assertIn('token', AuthService().login({'email': 'Test@Example.com', 'password': 'TestPass123!'}))
+
     def test_user_service_edit_user_password(self):
         data = {
             'password': 'UpdatedPass123!'
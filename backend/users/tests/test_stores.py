@@ -0,0 +1,62 @@
+from datetime import date, timedelta
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from users.models import ExpiringValue
+from users.stores import CacheExpiringStore, DatabaseExpiringStore, get_expiring_store, reset_expiring_store
+
+
+class ExpiringStoreTestMixin:
+    def test_set_get_and_overwrite(self):
+        self.store.set('otp', 'a@example.com', '123456', 60)
+        self.assertEqual(self.store.get('otp', 'a@example.com'), '123456')
+        self.store.set('otp', 'a@example.com', '654321', 60)
+        self.assertEqual(self.store.get('otp', 'a@example.com'), '654321')
+        self.assertIsNone(self.store.get('registration', 'a@example.com'))
+
+    def test_pop_returns_value_once(self):
+        self.store.set('reset_token', '123456', {'user_id': 1}, 60)
+        self.assertEqual(self.store.pop('reset_token', '123456'), {'user_id': 1})
+        self.assertIsNone(self.store.pop('reset_token', '123456'))
+
+    def test_delete(self):
+        self.store.set('otp', 'a@example.com', '123456', 60)
+        self.assertTrue(self.store.delete('otp', 'a@example.com'))
+        self.assertFalse(self.store.delete('otp', 'a@example.com'))
+
+
+class CacheExpiringStoreTest(ExpiringStoreTestMixin, TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.store = CacheExpiringStore()
+
+    def test_expired_key_is_not_returned(self):
+        self.store.set('otp', 'a@example.com', '123456', 0)
+        self.assertIsNone(self.store.get('otp', 'a@example.com'))
+
+
+class DatabaseExpiringStoreTest(ExpiringStoreTestMixin, TestCase):
+    def setUp(self):
+        self.store = DatabaseExpiringStore()
+
+    def test_values_are_json_encoded(self):
+        self.store.set('registration', 'a@example.com', {'birthday': date(1995, 5, 5)}, 60)
+        self.assertEqual(self.store.get('registration', 'a@example.com'), {'birthday': '1995-05-05'})
+
+    def test_expired_key_is_ignored_and_cleaned_up_in_batches(self):
+        for i in range(5):
+            self.store.set('otp', f'user{i}@example.com', '123456', 60)
+        self.store.set('otp', 'live@example.com', '123456', 60)
+        ExpiringValue.objects.exclude(key='otp:live@example.com').update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertIsNone(self.store.get('otp', 'user0@example.com'))
+        self.assertIsNone(self.store.pop('otp', 'user0@example.com'))
+        self.assertEqual(self.store.cleanup(batch_size=2), 5)
+        self.assertEqual(list(ExpiringValue.objects.values_list('key', flat=True)), ['otp:live@example.com'])
+
+    def test_backend_is_selected_from_settings(self):
+        with override_settings(EXPIRING_STORE={'backend': 'users.stores.CacheExpiringStore', 'alias': 'default'}):
+            reset_expiring_store()
+            self.assertIsInstance(get_expiring_store(), CacheExpiringStore)
+        reset_expiring_store()
+        self.assertIsInstance(get_expiring_store(), DatabaseExpiringStore)
@@ -0,0 +1,108 @@
+from unittest.mock import patch
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework import status
+from core.throttling import CacheBucketStore, LocalBucketStore, take_token, reset_bucket_store
+from users.models import User
+from common.enums import UserRole
+
+THROTTLING = {
+    'enabled': True,
+    'backend': 'core.throttling.CacheBucketStore',
+    'policies': {
+        'login': {'ip': '100/min', 'identifier': '2/min'},
+        'public': {'ip': '3/min'},
+    },
+}
+
+
+class TokenBucketTest(TestCase):
+    def test_take_token_refills_over_time(self):
+        state, wait = take_token(None, 2, 1.0, 100.0)
+        self.assertEqual(wait, 0)
+        state, wait = take_token(state, 2, 1.0, 100.0)
+        self.assertEqual(wait, 0)
+        state, wait = take_token(state, 2, 1.0, 100.0)
+        self.assertAlmostEqual(wait, 1.0)
+        state, wait = take_token(state, 2, 1.0, 101.0)
+        self.assertEqual(wait, 0)
+
+    def test_local_store_evicts_oldest_keys(self):
+        store = LocalBucketStore(max_keys=2)
+        for key in ('a', 'b', 'c'):
+            store.consume(key, 1, 1.0)
+        self.assertEqual(list(store.buckets), ['b', 'c'])
+
+    def test_consume_all_takes_nothing_when_any_bucket_is_empty(self):
+        for store in (LocalBucketStore(), CacheBucketStore()):
+            cache.clear()
+            buckets = [('ip', 2, 1.0), ('identifier', 1, 0.1)]
+            self.assertEqual(store.consume_all(buckets), 0)
+            self.assertAlmostEqual(store.consume_all(buckets), 10.0, places=2)
+            # Bucket 'ip' không bị trừ ở lần bị từ chối nên vẫn còn một token
+            self.assertEqual(store.consume('ip', 2, 1.0), 0)
+
+    def test_consume_all_returns_longest_wait(self):
+        store = LocalBucketStore()
+        buckets = [('a', 1, 1.0), ('b', 1, 0.1)]
+        store.consume_all(buckets)
+        self.assertAlmostEqual(store.consume_all(buckets), 10.0, places=2)
+
+    def test_cache_store_falls_back_to_local(self):
+        store = CacheBucketStore()
+        with patch.object(store.cache, 'get', side_effect=ConnectionError), self.assertLogs('core.throttling', 'WARNING'):
+            self.assertEqual(store.consume('key', 1, 0.1), 0)
+            self.assertGreater(store.consume('key', 1, 0.1), 0)
+        self.assertIn('key', store.fallback.buckets)
+
+
+@override_settings(THROTTLING=THROTTLING)
+class ThrottledEndpointTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        reset_bucket_store()
+        self.client = APIClient()
+        User.objects.create_user(
+            email='patient@example.com',
+            phone='0112233445',
+            password='PatientPass123!',
+            role=UserRole.PATIENT.value,
+            is_active=True,
+            is_verified=True
+        )
+
+    def _login(self, email):
+        return self.client.post('/api/v1/auth/login/', {'email': email, 'password': 'WrongPass123!'}, format='json')
+
+    def test_login_throttled_per_identifier(self):
+        self.assertEqual(self._login('patient@example.com').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self._login('Patient@Example.com ').status_code, status.HTTP_400_BAD_REQUEST)
+        response = self._login('patient@example.com')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(self._login('other@example.com').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_public_endpoint_throttled_per_ip(self):
+        for _ in range(3):
+            self.assertEqual(self.client.get('/api/v1/doctors/').status_code, status.HTTP_200_OK)
+        response = self.client.get('/api/v1/doctors/')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        other = APIClient(REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(other.get('/api/v1/doctors/').status_code, status.HTTP_200_OK)
+
+    @override_settings(THROTTLING={**THROTTLING, 'policies': {'login': {'ip': '3/min', 'identifier': '1/min'}}})
+    def test_rejected_request_does_not_drain_ip_bucket(self):
+        self.assertEqual(self._login('patient@example.com').status_code, status.HTTP_400_BAD_REQUEST)
+        for _ in range(3):
+            response = self._login('patient@example.com')
+            self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+            self.assertEqual(response['Retry-After'], '60')
+        self.assertEqual(self._login('a@example.com').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self._login('b@example.com').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self._login('c@example.com').status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    @override_settings(THROTTLING={**THROTTLING, 'enabled': False})
+    def test_disabled(self):
+        for _ in range(4):
+            self.assertEqual(self.client.get('/api/v1/doctors/').status_code, status.HTTP_200_OK)
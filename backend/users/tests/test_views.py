@@ -8,26 +8,13 @@ from unittest.mock import patch
 from datetime import datetime, timedelta, date
 from users.models import User
 from users.services import UserService, AuthService, OtpService, ResetTokenService
+from users.stores import get_expiring_store
 from patients.models import Patient
 from common.enums import UserRole, Gender
 from common.constants import PAGE_NO_DEFAULT, PAGE_SIZE_DEFAULT
 
 User = get_user_model()
 
-class MockEmailSend:
-    def __init__(self):
-        self.sent_emails = []
-
-    def __call__(self, subject, message, from_email, recipient_list, fail_silently=False):
-        self.sent_emails.append({
-            'subject': subject,
-            'message': message,
-            'from_email': from_email,
-            'recipient_list': recipient_list,
-            'fail_silently': fail_silently
-        })
-        return 1
-
 class UserViewSetTest(APITestCase):
     def setUp(self):
         self.client = APIClient()
@@ -107,11 +94,39 @@ class UserViewSetTest(APITestCase):
 
     def test_get_all_users_as_admin(self):
         self.authenticate_client(self.admin_user)
-        response = self.client.get(f'/api/v1/users/all/?page={PAGE_NO_DEFAULT}&size={PAGE_SIZE_DEFAULT}')
+        response = self.client.get('/api/v1/users/all/')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data['content']), 3)  # admin, doctor, patient
-        self.assertEqual(response.data['page'], PAGE_NO_DEFAULT)
-        self.assertEqual(response.data['size'], PAGE_SIZE_DEFAULT)
+        # Mặc định phân trang theo con trỏ, không đếm tổng số
+        self.assertEqual(response.data['pageSize'], 20)
+        self.assertIsNone(response.data['next'])
+        self.assertNotIn('totalElements', response.data)
+
+    def test_get_all_users_filtered_by_role(self):
+        self.authenticate_client(self.admin_user)
+        response = self.client.get(f'/api/v1/users/all/?role={UserRole.DOCTOR.value}&count=exact')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([user['id'] for user in response.data['content']], [self.doctor_user.id])
+        self.assertEqual(response.data['totalElements'], 1)
+        self.assertNotIn('password', response.data['content'][0])
+
+    def test_get_all_users_keyset_pagination(self):
+        self.authenticate_client(self.admin_user)
+        response = self.client.get('/api/v1/users/all/?pageSize=2&count=exact')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['content']), 2)
+        self.assertEqual(response.data['totalElements'], 3)
+        self.assertIsNotNone(response.data['next'])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['content']), 1)
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(response.data['totalElements'], 3)
+
+    def test_get_all_users_invalid_filter(self):
+        self.authenticate_client(self.admin_user)
+        response = self.client.get('/api/v1/users/all/?isActive=maybe')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
     def test_get_all_users_non_admin(self):
         self.authenticate_client(self.patient_user)
@@ -293,10 +308,9 @@ class UserViewSetTest(APITestCase):
             'gender': Gender.FEMALE.value,
             'address': '456 Elm St'
         }
-        with patch('users.services.send_mail', new=MockEmailSend()):
-            response = self.client.post('/api/v1/auth/register/', data, format='json')
-            self.assertEqual(response.status_code, status.HTTP_200_OK)
-        otp = OtpService.otp_storage['newuser@example.com']['otp']
+        response = self.client.post('/api/v1/auth/register/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        otp = get_expiring_store().get(OtpService.NAMESPACE, 'newuser@example.com')
         verify_data = {
             'email': 'newuser@example.com',
             'otp': otp
@@ -317,9 +331,8 @@ class UserViewSetTest(APITestCase):
             'gender': Gender.FEMALE.value,
             'address': '456 Elm St'
         }
-        with patch('users.services.send_mail', new=MockEmailSend()):
-            response = self.client.post('/api/v1/auth/register/', data, format='json')
-            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.post('/api/v1/auth/register/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
         verify_data = {
             'email': 'newuser@example.com',
             'otp': 'wrong_otp'
@@ -354,7 +367,6 @@ class UserViewSetTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertEqual(str(response.data[0]), _('Email/Số điện thoại hoặc mật khẩu không chính xác'))
 
-    @patch('users.services.send_mail', new=MockEmailSend())
     def test_forgot_password_email(self):
         data = {
             'email': 'patient@example.com'
@@ -370,7 +382,6 @@ class UserViewSetTest(APITestCase):
         response = self.client.post('/api/v1/auth/forgot-password/', data, format='json')
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
-    @patch('users.services.send_mail', new=MockEmailSend())
     def test_forgot_password_otp(self):
         data = {
             'email': 'patient@example.com'
@@ -379,7 +390,6 @@ class UserViewSetTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['message'], _('Mã OTP đã được gửi đến email của bạn'))
 
-    @patch('users.services.send_mail', new=MockEmailSend())
     def test_resend_otp(self):
         data = {
             'email': 'newuser@example.com',
@@ -392,9 +402,8 @@ class UserViewSetTest(APITestCase):
             'gender': Gender.FEMALE.value,
             'address': '456 Elm St'
         }
-        with patch('users.services.send_mail', new=MockEmailSend()):
-            response = self.client.post('/api/v1/auth/register/', data, format='json')
-            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.post('/api/v1/auth/register/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
         resend_data = {
             'email': 'newuser@example.com'
         }
@@ -402,14 +411,13 @@ class UserViewSetTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['message'], _('OTP đã được gửi lại tới %(email)s') % {'email': 'newuser@example.com'})
 
-    @patch('users.services.send_mail', new=MockEmailSend())
     def test_verify_otp(self):
         data = {
             'email': 'patient@example.com'
         }
         response = self.client.post('/api/v1/auth/forgot-password/', data, format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        otp = OtpService.otp_storage['patient@example.com']['otp']
+        otp = get_expiring_store().get(OtpService.NAMESPACE, 'patient@example.com')
         verify_data = {
             'email': 'patient@example.com',
             'otp': otp
@@ -419,7 +427,6 @@ class UserViewSetTest(APITestCase):
         self.assertEqual(response.data['message'], _('Xác minh OTP thành công'))
         self.assertIn('resetToken', response.data)
 
-    @patch('users.services.send_mail', new=MockEmailSend())
     def test_verify_otp_invalid(self):
         data = {
             'email': 'patient@example.com'
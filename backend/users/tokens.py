@@ -0,0 +1,72 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .authentication import (
+    DOCTOR_ID_CLAIM, PATIENT_ID_CLAIM, ROLE_CLAIM, AuthContextService, get_auth_context
+)
+
+
+class IdentityRefreshToken(RefreshToken):
+    """Refresh token (và access token sinh từ nó) mang role, patientId, doctorId để xác thực không cần truy vấn."""
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token.set_identity(user)
+        AuthContextService.prime_revocation(user)
+        return token
+
+    def set_identity(self, user):
+        context = get_auth_context(user)
+        self[ROLE_CLAIM] = context.role
+        self['userId'] = str(user.id)
+        self[PATIENT_ID_CLAIM] = context.patient_id
+        self[DOCTOR_ID_CLAIM] = context.doctor_id
+
+
+class IdentityTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = IdentityRefreshToken
+
+
+class IdentityTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Làm mới token: danh tính được nạp lại từ cơ sở dữ liệu thay vì chép từ refresh token cũ, và refresh token
+    cấp tại hoặc trước mốc thu hồi (User.tokens_valid_after) bị từ chối.
+    """
+    token_class = IdentityRefreshToken
+
+    default_error_messages = {
+        "no_active_account": _("Không tìm thấy tài khoản đang hoạt động cho token này"),
+        "token_revoked": _("Token đã bị thu hồi"),
+    }
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs["refresh"])
+
+        user = AuthContextService.load(refresh.payload.get(api_settings.USER_ID_CLAIM))
+        if user is None or not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(self.error_messages["no_active_account"], "no_active_account")
+        valid_after = user.tokens_valid_after
+        if AuthContextService.is_revoked(refresh, int(valid_after.timestamp()) if valid_after else None):
+            raise AuthenticationFailed(self.error_messages["token_revoked"], "token_revoked")
+
+        refresh.set_identity(user)
+        AuthContextService.prime_revocation(user)
+        data = {"access": str(refresh.access_token)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                try:
+                    refresh.blacklist()
+                except AttributeError:
+                    # Chưa cài app token_blacklist
+                    pass
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            refresh.outstand()
+            data["refresh"] = str(refresh)
+        return data
@@ -8,14 +8,14 @@ from django.utils.translation import gettext as _
 from .models import User
 from .serializers import (
     UserRequestSerializer, UserUpdateRequestSerializer, UserResponseSerializer,
-    PagedResponseSerializer, ChangePasswordRequestSerializer, RegisterRequestSerializer,
+    ChangePasswordRequestSerializer, RegisterRequestSerializer,
+    UserListFilterSerializer, UserListItemSerializer, UserCursorPagination,
     RegisterVerifyRequestSerializer, LoginFlexibleRequestSerializer, 
     ResetPasswordRequestSerializer, ForgotPasswordEmailRequestSerializer,
     ResendOtpRequestSerializer, VerifyOtpRequestSerializer
 )
 from .services import AuthService, UserService, OtpService, ResetTokenService
 from common.enums import UserRole
-from common.constants import PAGE_NO_DEFAULT, PAGE_SIZE_DEFAULT
 
 class IsAdminUser(permissions.BasePermission):
     def has_permission(self, request, view):
@@ -60,10 +60,23 @@ class UserViewSet(viewsets.ViewSet):
 
     @action(detail=False, methods=['get'], url_path='all')
     def get_all_users(self, request):
-        page = int(request.query_params.get('page', PAGE_NO_DEFAULT))
-        size = int(request.query_params.get('size', PAGE_SIZE_DEFAULT))
-        data = UserService().get_all_users(page, size)
-        return Response(PagedResponseSerializer(data).data)
+        """
+        Lọc theo ?role, ?isActive, ?isVerified; phân trang theo con trỏ (keyset) qua ?cursor / ?pageSize.
+        ?count=exact|approx trả thêm tổng số (approx: ước lượng của PostgreSQL, không quét bảng)
+        """
+        query_serializer = UserListFilterSerializer(data=request.query_params.dict())
+        query_serializer.is_valid(raise_exception=True)
+        validated = query_serializer.validated_data
+        filters = {key: validated[key] for key in ('role', 'is_active', 'is_verified') if key in validated}
+        service = UserService()
+
+        users = service.get_all_users(**filters)
+        paginator = UserCursorPagination()
+        page = paginator.paginate_queryset(users, request, view=self)
+        response = paginator.get_paginated_response(UserListItemSerializer(page, many=True).data)
+        if 'count' in validated:
+            response.data['totalElements'] = service.count_users(users, approximate=validated['count'] == 'approx')
+        return response
 
     @action(detail=True, methods=['get'])
     def get_user_by_id(self, request, pk=None):
@@ -189,6 +202,15 @@ class UserViewSet(viewsets.ViewSet):
 
 class AuthViewSet(viewsets.ViewSet):
     permission_classes = [AllowAny]
+    throttle_scopes = {
+        'register': 'register',
+        'verify_registration': 'otp_verify',
+        'login_flexible': 'login',
+        'forgot_password_email': 'otp',
+        'reset_password': 'otp_verify',
+        'resend_otp': 'otp',
+        'verify_otp': 'otp_verify',
+    }
 
     @action(detail=False, methods=['post'], url_path='register')
     def register(self, request):
@@ -274,6 +296,7 @@ class TempAdminCreationViewSet(viewsets.ViewSet):
     XÓA SAU KHI ĐÃ TẠO ADMIN THÀNH CÔNG
     """
     permission_classes = [AllowAny]  # Cho phép ai cũng truy cập
+    throttle_scope = 'register'
 
     @action(detail=False, methods=['post'], url_path='create-first-admin')
     def create_first_admin(self, request):